@@ -0,0 +1,702 @@
+#!/usr/bin/env python3
+"""LLM呼び出し周りのベンチマーク (CLI)
+
+録画フィクスチャ + 擬似LLMサーバー（mock_llm_server.py）で generate_pipeline を
+オフライン実行し、スケジューラー・リトライ・後処理の変更を再現性のある条件で計測する。
+gui.pyのGUIを起動せずに関数のみインポートする。
+
+使い方:
+  # 1. 実APIで1回生成してトラフィックを録画（課金あり）
+  python bench_llm.py record --fixtures fixtures/run1 --concept "..." --characters "..." --scenes 15
+
+  # 2. 録画を擬似サーバーで再生して計測（課金・ネットワークなし）
+  python bench_llm.py pipeline --fixtures fixtures/run1 --scenes 15 --latency 1.5 --jitter 1.0 --p529 0.03
+  python bench_llm.py pipeline --fixtures fixtures/run1 --local --token-rate 40   # ハイブリッド（ローカル側も擬似）
+  python bench_llm.py pipeline --fixtures fixtures/run1 --scenes 100 --token-rate 20 --cancel-after 10  # 停止の応答時間
+  python bench_llm.py pipeline --scenes 30 --latency 0.3 --prefill-rate 20000 --no-prewarm  # キャッシュ予熱なしと比較
+  python bench_llm.py pipeline --scenes 30 --latency 0.3 --p-batch-short 0.3 --no-scene-batch  # 低intensityバッチなしと比較
+
+  # JSON抽出のマイクロベンチ（合成した長大な思考テキスト付き応答、旧実装との比較）
+  python bench_llm.py json --sizes 10000,100000,1000000
+
+  # アウトラインのチャンクプロンプト: シーン数に対する入力トークン・チャンクあたりの遅延（旧実装との比較）
+  python bench_llm.py outline --sizes 50,100,300 --latency 0.3 --prefill-rate 2000
+
+  # シーン応答の wire 形式: 録画したシーン応答の出力トークン・遅延（従来形式との比較、展開結果の一致確認）
+  python bench_llm.py wire --fixtures fixtures/run1 --latency 0.5 --token-rate 60
+
+  # 清書・修正の編集操作（scene_patch）: シーン全体の出し直しとの出力トークン・遅延の比較
+  python bench_llm.py patch --fixtures fixtures/run1 --latency 0.5 --token-rate 40
+"""
+import sys
+import os
+import json
+import time
+import re
+import random
+import argparse
+import threading
+import importlib.util
+from pathlib import Path
+
+from mock_llm_server import MockLLMServer, FixtureStore, add_simulation_args, config_from_args
+from llm_recorder import RECORD_DIR_ENV, load_fixtures, fixture_key, system_hash
+from json_extract import extract_json, loads_tolerant
+from llm_cancel import CancelToken
+from llm_rate_limit import estimate_tokens
+from outline_digest import OutlineDigest, POSITION_KEYWORDS
+from scene_wire import compact_scene
+from scene_patch import apply_patch
+
+# Windows console encoding fix
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+    sys.stderr.reconfigure(encoding="utf-8", errors="replace")
+    os.environ.setdefault("PYTHONIOENCODING", "utf-8")
+
+DEFAULT_CONCEPT = "幼馴染と放課後の教室で二人きりになり、告白から関係が進展する"
+
+
+def _import_gui():
+    """gui.pyからGUIを起動せずに必要な関数のみインポート"""
+    gui_path = Path(__file__).parent / "gui.py"
+    spec = importlib.util.spec_from_file_location("gui_module", gui_path)
+    gui_mod = importlib.util.module_from_spec(spec)
+    gui_mod.__name__ = "gui_module"
+    spec.loader.exec_module(gui_mod)
+    return gui_mod
+
+
+def _emit(lines: list, out_path: str = None):
+    text = "\n".join(lines)
+    print(text)
+    if out_path:
+        with open(out_path, "a", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+def _run_pipeline(gui, args, callback, local_url: str = "", api_key: str = "", cancel_token=None):
+    return gui.generate_pipeline(
+        api_key, args.concept, args.characters, args.scenes, args.theme, callback,
+        quality_priority=args.serial,
+        local_llm_enabled=bool(local_url),
+        local_llm_url=local_url,
+        cancel_token=cancel_token,
+    )
+
+
+# ============================================================
+# record: 実APIで生成して録画
+# ============================================================
+
+def cmd_record(args):
+    api_key = args.api_key or os.environ.get("ANTHROPIC_API_KEY", "")
+    if not api_key:
+        print("[ERROR] --api-key または環境変数 ANTHROPIC_API_KEY が必要です")
+        sys.exit(1)
+    os.environ[RECORD_DIR_ENV] = args.fixtures
+    gui = _import_gui()
+
+    start = time.time()
+    results, cost_tracker, _meta = _run_pipeline(
+        gui, args, lambda msg: print(f"  {msg}"), args.local_url, api_key
+    )
+    n = len(list(Path(args.fixtures).glob("*.json")))
+    _emit([
+        f"録画完了: {n}件 → {args.fixtures} ({time.time() - start:.1f}秒, {len(results)}シーン)",
+        cost_tracker.summary(),
+    ], args.out)
+
+
+# ============================================================
+# pipeline: 擬似サーバーで再生して計測
+# ============================================================
+
+_SCENE_START_RE = re.compile(r"^シーン (\d+) 生成中 \(([^,]+),")
+_SCENE_DONE_RE = re.compile(r"^\[OK\]シーン (\d+)/")
+
+
+def _first_scene_latency(events: list) -> dict:
+    """コールバックの記録から、モデルごとに最初に始まったシーンの所要秒数を返す"""
+    started, first = {}, {}
+    for t, msg in events:
+        m = _SCENE_START_RE.match(msg)
+        if m:
+            started.setdefault(int(m.group(1)), (t, m.group(2)))
+            continue
+        m = _SCENE_DONE_RE.match(msg)
+        if m and int(m.group(1)) in started:
+            t0, model = started[int(m.group(1))]
+            if model not in first or t0 < first[model][0]:
+                first[model] = (t0, t - t0)
+    return {model: dt for model, (_t0, dt) in first.items()}
+
+
+def cmd_pipeline(args):
+    server = MockLLMServer(args.fixtures, config=config_from_args(args)).start()
+    os.environ["ANTHROPIC_BASE_URL"] = server.anthropic_base_url
+    gui = _import_gui()
+    gui.RESPONSE_CACHE_ENABLED = args.cache and not args.no_cache
+    if args.no_prewarm:
+        gui.PROMPT_PREWARM_ENABLED = False
+    if args.no_scene_batch:
+        gui.SCENE_BATCH_ENABLED = False
+
+    lines = [
+        f"=== pipeline bench: {args.scenes}シーン × {args.runs}回 ===",
+        f"fixtures={args.fixtures or '(なし)'} ({len(server.store)}件) latency={args.latency}+{args.jitter}s "
+        f"token_rate={args.token_rate or '∞'} p429={args.p429} p529={args.p529} rpm={args.rpm or '∞'} "
+        f"{'local=mock ' if args.local else ''}{'serial' if args.serial else 'parallel'}"
+        f"{' no-prewarm' if args.no_prewarm else ''}{' no-scene-batch' if args.no_scene_batch else ''}",
+    ]
+    walls = []
+    for run in range(1, args.runs + 1):
+        before = dict(server.stats)
+        events = []
+        start = time.time()
+
+        def _callback(msg, _events=events, _start=start):
+            _events.append((time.time() - _start, msg))
+            if args.verbose:
+                print(f"  [{time.time() - _start:7.2f}s] {msg}")
+
+        token = CancelToken()
+        cancelled_at = []
+        timer = None
+        if args.cancel_after:
+            timer = threading.Timer(args.cancel_after, lambda: (cancelled_at.append(time.time()), token.cancel()))
+            timer.daemon = True
+            timer.start()
+        try:
+            results, cost_tracker, _meta = _run_pipeline(
+                gui, args, _callback, server.openai_base_url if args.local else "", "mock-key", token
+            )
+        except InterruptedError:
+            if not cancelled_at:
+                raise
+            stopped = time.time() - cancelled_at[0]
+            time.sleep(1.0)   # 切断がサーバー側の統計に反映されるのを待つ
+            delta = {k: server.stats[k] - before.get(k, 0) for k in server.stats}
+            lines.append(
+                f"run {run}: {args.cancel_after:.1f}秒後に停止 → {stopped:.2f}秒で復帰, "
+                f"messages={delta['messages']} chat={delta['chat_completions']} "
+                f"stream_aborted={delta['stream_aborted']}"
+            )
+            continue
+        finally:
+            if timer is not None:
+                timer.cancel()
+        wall = time.time() - start
+        walls.append(wall)
+        delta = {k: server.stats[k] - before.get(k, 0) for k in server.stats}
+        lines.append(
+            f"run {run}: {wall:.2f}s, {len(results)}シーン, "
+            f"messages={delta['messages']} chat={delta['chat_completions']} "
+            f"429={delta['injected_429'] + delta['rpm_429']} 529={delta['injected_529']} "
+            f"match(exact/system/any/none)={delta['match_exact']}/{delta['match_system']}/"
+            f"{delta['match_any']}/{delta['match_none']}"
+            f"{' batch_short=' + str(delta['batch_short']) if delta['batch_short'] else ''}"
+        )
+        lines.append("  " + cost_tracker.summary().replace("\n", " | "))
+        lines.extend("  " + line for line in cost_tracker.cache_report())
+        first = _first_scene_latency(events)
+        if first:
+            lines.append("  最初のシーン（生成開始→完了）: " + " / ".join(f"{m} {t:.2f}s" for m, t in first.items()))
+        lines.append("  " + gui.get_controller().summary())
+
+    if walls:
+        lines.append(f"wall: min {min(walls):.2f}s / avg {sum(walls) / len(walls):.2f}s / max {max(walls):.2f}s")
+    server.stop()
+    _emit(lines, args.out)
+
+
+# ============================================================
+# json: JSON抽出のマイクロベンチ
+# ============================================================
+
+def _legacy_find_last_complete_json(text: str):
+    """比較用: 旧 llm_provider._find_last_complete_json（全ての } から逆走査して json.loads）"""
+    candidates = []
+    i = len(text) - 1
+    while i >= 0:
+        if text[i] == "}":
+            depth = 0
+            for j in range(i, -1, -1):
+                if text[j] == "}":
+                    depth += 1
+                elif text[j] == "{":
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            if isinstance(json.loads(text[j:i + 1]), dict):
+                                candidates.append(text[j:i + 1])
+                        except ValueError:
+                            pass
+                        break
+        i -= 1
+    if not candidates:
+        return None
+    scenes = [c for c in candidates if "scene_id" in json.loads(c)]
+    return max(scenes or candidates, key=len)
+
+
+def _synthetic_response(size: int, rng: random.Random, think_tags: bool = True) -> str:
+    """Qwen風の応答: 括弧を含む長い思考テキスト → 下書きJSON → 最終シーンJSON
+
+    think_tags=False は <think> タグ無しのインライン思考（タグ除去に頼れない場合）。
+    """
+    thought = [
+        "まず構図を考える。{表情} と {ポーズ} のバランスが重要だ。",
+        "前のシーンでは \"嫌\" と言っていたので } ここで心境の変化を入れる。",
+        "候補: {\"speaker\": \"A\"} のような短い吹き出しを3つ。",
+        "Thinking: the bubbles array [ should stay short ] and mood must match.",
+        "sd_prompt には 1girl, blush, {classroom} を入れる。",
+    ]
+    scene = {
+        "scene_id": 7, "title": "放課後の教室", "description": "夕日の差す教室で二人きりになる。",
+        "mood": "緊張", "direction": "ゆっくりと距離を詰める",
+        "bubbles": [{"speaker": "ヒロイン", "type": "speech", "text": f"……{k}回目だよ？"} for k in range(12)],
+        "onomatopoeia": ["ドキドキ", "ぎゅっ"], "sd_prompt": "1girl, classroom, sunset, blush",
+    }
+    final = json.dumps(scene, ensure_ascii=False)
+    draft = json.dumps({"draft": True, "bubbles": scene["bubbles"][:3]}, ensure_ascii=False)
+    parts, length = (["<think>"] if think_tags else []), 0
+    while length < size:
+        line = rng.choice(thought)
+        parts.append(line)
+        length += len(line)
+        if rng.random() < 0.02:
+            parts.append(draft)
+            length += len(draft)
+    parts.append(("</think>\n" if think_tags else "") + "以下が最終出力です。\n```json\n" + final + "\n```")
+    return "\n".join(parts)
+
+
+def cmd_json(args):
+    rng = random.Random(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    lines = [f"=== json bench: 思考テキスト長 {sizes} × {args.repeat}回 ==="]
+    for size, think_tags in [(s, t) for s in sizes for t in (True, False)]:
+        text = _synthetic_response(size, rng, think_tags)
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            c = extract_json(text)
+        new_ms = (time.perf_counter() - t0) / args.repeat * 1000
+        ok = c is not None and c.value.get("scene_id") == 7
+        legacy = "skip"
+        if size <= args.legacy_max:
+            t0 = time.perf_counter()
+            old = _legacy_find_last_complete_json(text)
+            old_ms = (time.perf_counter() - t0) * 1000
+            same = old is not None and json.loads(old) == c.value
+            legacy = f"{old_ms:9.1f}ms ({old_ms / max(new_ms, 1e-6):.0f}倍, 一致={same})"
+        kind = "<think>" if think_tags else "inline "
+        lines.append(f"{len(text):>9}文字 {kind}: extract_json {new_ms:8.2f}ms (scene_id検出={ok}) | 旧実装 {legacy}")
+
+    # 最悪ケース: 深い入れ子が最後に構文エラーで失敗する（'[1,[1,…}'）・json.loads の再帰上限を超える入れ子
+    lines.append("--- 失敗する入れ子（線形時間・ValueError になることの確認） ---")
+    for size in sizes:
+        for name, text in (("失敗する入れ子", "[1," * (size // 3) + "}"),
+                           ("深すぎる入れ子", "[" * (size // 2) + "1" + "]" * (size // 2))):
+            t0 = time.perf_counter()
+            try:
+                loads_tolerant(text)
+                outcome = "値"
+            except ValueError:
+                outcome = "ValueError"
+            ms = (time.perf_counter() - t0) * 1000
+            lines.append(f"{len(text):>9}文字 {name}: {ms:8.2f}ms ({ms * 1000 / len(text):.2f}µs/文字) → {outcome}")
+    _emit(lines, args.out)
+
+
+# ============================================================
+# outline: アウトラインのチャンクプロンプト（確定済みシーンの文脈）
+# ============================================================
+
+_SYN_LOCATIONS = ["教室", "保健室", "屋上", "体育倉庫", "自室のベッド", "浴室", "廊下の突き当たり", "更衣室"]
+_SYN_EMOTIONS = ["緊張", "戸惑い", "羞恥", "期待", "抵抗", "受容", "快楽", "陶酔", "放心", "余韻"]
+
+
+def _synthetic_outline(n: int, rng: random.Random) -> tuple:
+    """合成アウトライン（全シーン）と幕構成 [(名前, 開始, 終了)] を返す"""
+    act1 = max(1, round(n * 0.1))
+    act4 = max(1, round(n * 0.1))
+    act2 = max(1, round((n - act1 - act4) * 0.3))
+    act3 = n - act1 - act2 - act4
+    acts = [
+        ("第1幕・導入", 0, act1),
+        ("第2幕・前戯", act1, act1 + act2),
+        ("第3幕・本番", act1 + act2, act1 + act2 + act3),
+        ("第4幕・余韻", act1 + act2 + act3, n),
+    ]
+    outline, loc = [], rng.choice(_SYN_LOCATIONS)
+    for i in range(n):
+        if rng.random() < 0.2:
+            loc = rng.choice(_SYN_LOCATIONS)
+        intensity = 1 if i < act1 else 3 if i < act1 + act2 else rng.choice([4, 4, 5]) if i < n - act4 else 3
+        kws = rng.sample(POSITION_KEYWORDS, 2)
+        emo = rng.sample(_SYN_EMOTIONS, 2)
+        outline.append({
+            "scene_id": i + 1,
+            "title": f"{kws[0]}と{emo[1]}{i + 1}",
+            "location": loc,
+            "situation": f"{loc}で{kws[0]}から{kws[1]}へ。{emo[0]}が{emo[1]}に変わっていく様子を描く（シーン{i + 1}）",
+            "emotional_arc": {"start": emo[0], "end": emo[1]},
+            "intensity": intensity,
+        })
+    return outline, acts
+
+
+def _legacy_outline_context(previous_scenes: list) -> str:
+    """比較用: 旧 _generate_outline_chunk の確定済みシーン要約（直近20件 + 古い10件のtitle + 完了済みアクション30件）"""
+    if not previous_scenes:
+        return ""
+    prev_lines = []
+    n_prev = len(previous_scenes)
+    _action_set = set()
+    for s in previous_scenes:
+        if s.get("situation", "")[:40]:
+            _action_set.add(s.get("situation", "")[:40])
+        if s.get("title", ""):
+            _action_set.add(s.get("title", ""))
+    _used_positions = {kw for s in previous_scenes[-10:] for kw in POSITION_KEYWORDS if kw in s.get("situation", "")}
+    _completed_actions = ""
+    if _action_set:
+        _completed_actions = (
+            "\n## ⚠️ 完了済みアクション（以下は既に描写済み。絶対に繰り返すな）\n"
+            + "\n".join(f"❌ {a}" for a in sorted(_action_set)[:30])
+            + "\n**上記と同一・類似のsituationやtitleは使用禁止。必ず新しい展開を書け。**\n"
+        )
+    if _used_positions:
+        _completed_actions += (
+            f"\n## ⚠️ 直近チャンクで使用済みの体位/行為（繰り返し厳禁）\n"
+            f"🔁 {', '.join(sorted(_used_positions))}\n"
+            f"**上記の体位/行為は直近で使用済み。必ず異なる体位/行為で新しい展開にすること。**\n"
+        )
+    if n_prev > 20:
+        prev_lines.append(f"（シーン1〜{n_prev - 20}: {n_prev - 20}シーン確定済み、省略）")
+        for s in previous_scenes[max(0, n_prev - 30):n_prev - 20]:
+            prev_lines.append(f"[{s.get('scene_id', '?')}] {s.get('title', '')[:15]} (i={s.get('intensity', 3)})")
+    for s in previous_scenes[max(0, n_prev - 20):]:
+        ea = s.get("emotional_arc", {})
+        emo = f'{ea.get("start", "")}→{ea.get("end", "")}' if isinstance(ea, dict) else ""
+        prev_lines.append(
+            f"[{s.get('scene_id', '?')}] {s.get('title', '')[:20]} (i={s.get('intensity', 3)}, "
+            f"{s.get('location', '')[:15]}) {s.get('situation', '')[:60]} ({emo})"
+        )
+    return f"""## 確定済みシーン（これに続けて書くこと。重複禁止）
+{chr(10).join(prev_lines)}
+{_completed_actions}"""
+
+
+def cmd_outline(args):
+    server = MockLLMServer(args.fixtures, config=config_from_args(args)).start()
+    os.environ["ANTHROPIC_BASE_URL"] = server.anthropic_base_url
+    gui = _import_gui()
+    gui.RESPONSE_CACHE_ENABLED = False
+    client = gui.anthropic.Anthropic(api_key="mock-key")
+    cost_tracker = gui.CostTracker()
+    rng = random.Random(args.seed)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    chunk_size = 10
+
+    def _prompt(prev_summary, offset, n, acts):
+        act_info = "\n".join(f"- {name}: {end - start}シーン" for name, start, end in acts)
+        return gui._outline_chunk_prompt(
+            min(chunk_size, n - offset), offset, n, "bench", "導入→前戯→本番→余韻", ["羞恥", "快楽"],
+            "- 要素", args.synopsis, ["ヒロイン", "男"], act_info, prev_summary,
+        )
+
+    def _latency(system, prompt) -> float:
+        t0 = time.perf_counter()
+        gui._call_api(client, gui.MODELS["haiku"], system, prompt, cost_tracker, 256, routing_hint="cloud")
+        return time.perf_counter() - t0
+
+    lines = [
+        f"=== outline bench: {sizes}シーン, チャンク{chunk_size}シーン ===",
+        f"latency={args.latency}+{args.jitter}s prefill_rate={args.prefill_rate or '∞'} "
+        f"token_rate={args.token_rate or '∞'}（入力トークンは estimate_tokens の概算）",
+    ]
+    for n in sizes:
+        outline, acts = _synthetic_outline(n, rng)
+        digest = OutlineDigest(acts=acts)
+        rows = []
+        for offset in range(0, n, chunk_size):
+            old_system, old_prompt = _prompt(_legacy_outline_context(outline[:offset]), offset, n, acts)
+            new_system, new_prompt = _prompt(digest.render(), offset, n, acts)
+            old_tok = estimate_tokens(old_system) + estimate_tokens(old_prompt)
+            new_tok = estimate_tokens(new_system) + estimate_tokens(new_prompt)
+            covered = len({s["scene_id"] for s in outline[:offset] if f"[{s['scene_id']}]" in old_prompt})
+            rows.append((offset, old_tok, new_tok, covered))
+            digest.extend(outline[offset:offset + chunk_size])
+        lines.append(f"--- {n}シーン ({len(rows)}チャンク) ---")
+        step = max(1, len(rows) // args.rows)
+        for offset, old_tok, new_tok, covered in rows[::step] + ([rows[-1]] if (len(rows) - 1) % step else []):
+            lines.append(
+                f"  シーン{offset + 1:>4}〜: 入力 旧{old_tok:>6} / 新{new_tok:>6}トークン "
+                f"(旧実装が行として渡す確定済みシーン {covered}/{offset}, 新実装は幕要約で全{offset})"
+            )
+        total_old = sum(r[1] for r in rows)
+        total_new = sum(r[2] for r in rows)
+        lines.append(f"  合計入力: 旧{total_old} / 新{total_new}トークン ({total_new / max(total_old, 1):.2f}倍)")
+        if args.latency or args.prefill_rate or args.token_rate:
+            last = outline[:rows[-1][0]]
+            last_digest = OutlineDigest.from_scenes(last, acts)
+            old_ms = _latency(*_prompt(_legacy_outline_context(last), rows[-1][0], n, acts)) * 1000
+            new_ms = _latency(*_prompt(last_digest.render(), rows[-1][0], n, acts)) * 1000
+            lines.append(f"  最終チャンクの遅延: 旧{old_ms:.0f}ms / 新{new_ms:.0f}ms")
+    server.stop()
+    _emit(lines, args.out)
+
+
+# ============================================================
+# wire: シーン応答の短縮形式（scene_wire）の出力トークン・遅延
+# ============================================================
+
+_SYN_BUBBLES = {
+    "speech": ["え…ここで…？", "だめ、見ないで…", "もう…ずるい…", "待って、まだ…"],
+    "moan": ["んっ…♡", "あっ、あぁっ…♡", "ひぁっ…！", "んぅ…っ♡"],
+    "thought": ["熱い…", "やばい…", "とけちゃう…", "ゾクって…"],
+}
+
+
+def _synthetic_scenes(n: int, rng: random.Random) -> list:
+    """録画が無いとき用の合成シーン（generate_scene_draft の出力と同じ形・おおよその分量）"""
+    outline, _acts = _synthetic_outline(n, rng)
+    scenes = []
+    for o in outline:
+        heroine = "ヒロイン"
+        types = ["speech", "moan"] if o["intensity"] >= 3 else ["speech"]
+        bubbles = [{"speaker": heroine, "type": t, "text": rng.choice(_SYN_BUBBLES[t])} for t in types]
+        if rng.random() < 0.3:
+            bubbles.append({"speaker": "男性", "type": "speech", "text": "逃がさねぇぞ"})
+        scenes.append({
+            "scene_id": o["scene_id"],
+            "title": o["title"],
+            "description": (o["situation"] + "。") * 2,
+            "location_detail": f"{o['location']}の奥、夕方の光が斜めに差し込む",
+            "mood": f"{o['emotional_arc']['start']}が少しずつ熱に変わっていく張り詰めた空気",
+            "character_feelings": {heroine: f"{o['emotional_arc']['start']}から{o['emotional_arc']['end']}へ"},
+            "bubbles": bubbles,
+            "onomatopoeia": rng.sample(["ドキドキ", "ビクッ", "ズンッ", "グチュ", "ゾクッ"], 2),
+            "direction": "腰を引き寄せられ、視線が逸らせなくなる",
+            "story_flow": "次のシーンでさらに距離が縮まる",
+            "sd_prompt": "1girl, solo, blush, heavy_breathing, looking_at_viewer, classroom, sunset, "
+                         "from_above, sweat, open_mouth, school_uniform, skirt, indoors",
+        })
+    return scenes
+
+
+def _recorded_scenes(gui, fixtures_dir) -> list:
+    """録画フィクスチャからシーン生成の応答（従来形式・wire形式とも）を取り出す"""
+    scenes = []
+    for fx in load_fixtures(fixtures_dir):
+        try:
+            obj = gui.parse_json_response(fx["response"])
+        except Exception:
+            continue
+        obj = gui.scene_wire.expand_scene(obj)
+        if isinstance(obj, dict) and "bubbles" in obj and "description" in obj:
+            scenes.append(obj)
+    return scenes
+
+
+def cmd_wire(args):
+    server = MockLLMServer(None, config=config_from_args(args)).start()
+    os.environ["ANTHROPIC_BASE_URL"] = server.anthropic_base_url
+    gui = _import_gui()
+    gui.RESPONSE_CACHE_ENABLED = False
+    client = gui.anthropic.Anthropic(api_key="mock-key")
+    cost_tracker = gui.CostTracker()
+
+    scenes = _recorded_scenes(gui, args.fixtures) if args.fixtures else []
+    source = f"録画 {args.fixtures}"
+    if not scenes:
+        scenes = _synthetic_scenes(args.scenes, random.Random(args.seed))
+        source = "合成シーン（録画なし）"
+
+    # 同じシーンを3通りの形で返すフィクスチャを作り、_call_api → _finish_scene_draft まで通して計測する
+    variants = {
+        "従来(インデント)": lambda sc: json.dumps(sc, ensure_ascii=False, indent=2),
+        "従来(1行)": lambda sc: json.dumps(sc, ensure_ascii=False),
+        "wire": lambda sc: json.dumps(compact_scene(sc), ensure_ascii=False),
+    }
+    system = "wire bench"
+    fixtures = []
+    for name, dump in variants.items():
+        for idx, sc in enumerate(scenes):
+            text = dump(sc)
+            user = f"{name} {idx}"
+            fixtures.append({
+                "key": fixture_key(system, user), "system_hash": system_hash(system), "response": text,
+                "usage": {"input_tokens": 0, "output_tokens": estimate_tokens(text)},
+            })
+    server.store = FixtureStore(fixtures)
+
+    lines = [
+        f"=== wire bench: {len(scenes)}シーン（{source}） ===",
+        f"latency={args.latency}+{args.jitter}s token_rate={args.token_rate or '∞'}"
+        f"（出力トークンは estimate_tokens の概算）",
+    ]
+    baseline = None
+    for name, dump in variants.items():
+        tokens, elapsed, matched = 0, 0.0, 0
+        for idx, sc in enumerate(scenes):
+            tokens += estimate_tokens(dump(sc))
+            t0 = time.perf_counter()
+            response = gui._call_api(client, gui.MODELS["sonnet"], system, f"{name} {idx}", cost_tracker, 3000,
+                                     routing_hint="cloud")
+            draft = gui._finish_scene_draft(response)
+            elapsed += time.perf_counter() - t0
+            matched += draft == gui._finish_scene_draft(json.dumps(sc, ensure_ascii=False))
+        baseline = baseline or (tokens, elapsed)
+        lines.append(
+            f"  {name:<10} 出力 {tokens:>7}トークン（1シーン平均 {tokens / len(scenes):.0f}, "
+            f"{tokens / baseline[0]:.2f}倍） / 遅延 平均{elapsed / len(scenes) * 1000:.0f}ms "
+            f"（{elapsed / max(baseline[1], 1e-9):.2f}倍） / 展開後の一致 {matched}/{len(scenes)}"
+        )
+    server.stop()
+    _emit(lines, args.out)
+
+
+def _synthetic_polish(scene: dict, rng: random.Random) -> list:
+    """清書で典型的な編集（セリフ1-2個の言い換え・description の加筆・心情1人分）"""
+    ops = []
+    for i, b in enumerate(scene.get("bubbles", [])[:2]):
+        if i == 0 or rng.random() < 0.5:
+            ops.append({"op": "bubble", "index": i, "text": b["text"].rstrip("♡") + "…もう、止まんない…♡"})
+    ops.append({"op": "set", "field": "description",
+                "value": scene["description"] + "頬は紅潮し、視線は相手から離れない。"})
+    for name in list(scene.get("character_feelings", {}))[:1]:
+        ops.append({"op": "feeling", "name": name, "value": "恥ずかしさよりも、離れたくない気持ちが勝っている"})
+    return ops
+
+
+def cmd_patch(args):
+    server = MockLLMServer(None, config=config_from_args(args)).start()
+    os.environ["ANTHROPIC_BASE_URL"] = server.anthropic_base_url
+    gui = _import_gui()
+    gui.RESPONSE_CACHE_ENABLED = False
+    client = gui.anthropic.Anthropic(api_key="mock-key")
+    cost_tracker = gui.CostTracker()
+
+    scenes = _recorded_scenes(gui, args.fixtures) if args.fixtures else []
+    source = f"録画 {args.fixtures}"
+    if not scenes:
+        scenes = _synthetic_scenes(args.scenes, random.Random(args.seed))
+        source = "合成シーン（録画なし）"
+    rng = random.Random(args.seed)
+    edits = [_synthetic_polish(sc, rng) for sc in scenes]
+    polished = [apply_patch(sc, ops)[0] for sc, ops in zip(scenes, edits)]
+
+    # 同じ清書結果を「シーン全体の出し直し」と「編集操作」の2通りで返し、_apply_scene_patch まで通す
+    variants = {
+        "全体出し直し": lambda i: json.dumps(polished[i], ensure_ascii=False),
+        "編集操作": lambda i: json.dumps(edits[i], ensure_ascii=False),
+    }
+    system = "patch bench"
+    fixtures = []
+    for name, dump in variants.items():
+        for idx in range(len(scenes)):
+            text = dump(idx)
+            fixtures.append({
+                "key": fixture_key(system, f"{name} {idx}"), "system_hash": system_hash(system), "response": text,
+                "usage": {"input_tokens": 0, "output_tokens": estimate_tokens(text)},
+            })
+    server.store = FixtureStore(fixtures)
+
+    lines = [
+        f"=== patch bench: {len(scenes)}シーン（{source}） ===",
+        f"latency={args.latency}+{args.jitter}s token_rate={args.token_rate or '∞'}"
+        f"（出力トークンは estimate_tokens の概算、料金は Opus の出力単価）",
+    ]
+    out_price = gui.COSTS.get(gui.MODELS["opus"], {"output": 25.00})["output"]
+    baseline = None
+    for name, dump in variants.items():
+        tokens, elapsed, matched = 0, 0.0, 0
+        for idx, sc in enumerate(scenes):
+            tokens += estimate_tokens(dump(idx))
+            t0 = time.perf_counter()
+            response = gui._call_api(client, gui.MODELS["opus"], system, f"{name} {idx}", cost_tracker, 3000,
+                                     routing_hint="cloud")
+            result = gui._apply_scene_patch(sc, response, "bench")
+            elapsed += time.perf_counter() - t0
+            matched += result == polished[idx]
+        baseline = baseline or (tokens, elapsed)
+        lines.append(
+            f"  {name:<8} 出力 {tokens:>7}トークン（1シーン平均 {tokens / len(scenes):.0f}, "
+            f"{tokens / baseline[0]:.2f}倍, 出力料金 ${tokens / 1_000_000 * out_price:.4f}） / "
+            f"遅延 平均{elapsed / len(scenes) * 1000:.0f}ms（{elapsed / max(baseline[1], 1e-9):.2f}倍） / "
+            f"清書結果の一致 {matched}/{len(scenes)}"
+        )
+    server.stop()
+    _emit(lines, args.out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM呼び出し周りのベンチマーク")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def _pipeline_args(p):
+        p.add_argument("--concept", default=DEFAULT_CONCEPT)
+        p.add_argument("--characters", default="")
+        p.add_argument("--scenes", type=int, default=15)
+        p.add_argument("--theme", default="")
+        p.add_argument("--serial", action="store_true", help="品質優先モード（直列生成）")
+        p.add_argument("--out", default=None, help="結果の追記先ファイル")
+
+    p_rec = sub.add_parser("record", help="実APIで生成してトラフィックを録画（課金あり）")
+    p_rec.add_argument("--fixtures", required=True, help="録画先ディレクトリ")
+    p_rec.add_argument("--api-key", default="")
+    p_rec.add_argument("--local-url", default="", help="ローカルLLMも使う場合のURL")
+    _pipeline_args(p_rec)
+    p_rec.set_defaults(func=cmd_record)
+
+    p_pipe = sub.add_parser("pipeline", help="擬似サーバーで generate_pipeline を計測")
+    add_simulation_args(p_pipe)
+    _pipeline_args(p_pipe)
+    p_pipe.add_argument("--runs", type=int, default=1)
+    p_pipe.add_argument("--local", action="store_true", help="ローカルLLMも擬似サーバーで有効化")
+    p_pipe.add_argument("--cache", action="store_true", help="レスポンスキャッシュを有効化（既定は無効）")
+    p_pipe.add_argument("--no-cache", action="store_true", help="レスポンスキャッシュを無効化（既定。--cache より優先）")
+    p_pipe.add_argument("--no-prewarm", action="store_true", help="プロンプトキャッシュの予熱を無効化")
+    p_pipe.add_argument("--no-scene-batch", action="store_true", help="低intensityシーンのバッチ生成を無効化")
+    p_pipe.add_argument("--cancel-after", type=float, default=0.0,
+                        help="開始からN秒後に停止し、generate_pipeline が戻るまでの時間を計測")
+    p_pipe.add_argument("--verbose", "-v", action="store_true")
+    p_pipe.set_defaults(func=cmd_pipeline)
+
+    p_json = sub.add_parser("json", help="JSON抽出（json_extract）のマイクロベンチ")
+    p_json.add_argument("--sizes", default="10000,100000,1000000", help="思考テキストの文字数（カンマ区切り）")
+    p_json.add_argument("--repeat", type=int, default=5)
+    p_json.add_argument("--legacy-max", type=int, default=200000, help="旧実装を計測する最大サイズ")
+    p_json.add_argument("--seed", type=int, default=0)
+    p_json.add_argument("--out", default=None, help="結果の追記先ファイル")
+    p_json.set_defaults(func=cmd_json)
+
+    p_outline = sub.add_parser("outline", help="アウトラインのチャンクプロンプトの入力トークン・遅延（旧実装との比較）")
+    add_simulation_args(p_outline)
+    p_outline.add_argument("--sizes", default="50,100,300", help="シーン数（カンマ区切り）")
+    p_outline.add_argument("--rows", type=int, default=6, help="シーン数ごとに表示するチャンクの行数")
+    p_outline.add_argument("--synopsis", default=DEFAULT_CONCEPT, help="プロンプトに入れるあらすじ")
+    p_outline.add_argument("--out", default=None, help="結果の追記先ファイル")
+    p_outline.set_defaults(func=cmd_outline)
+
+    p_wire = sub.add_parser("wire", help="シーン応答の wire 形式の出力トークン・遅延（従来形式との比較）")
+    add_simulation_args(p_wire)
+    p_wire.add_argument("--scenes", type=int, default=10, help="録画が無いときの合成シーン数")
+    p_wire.add_argument("--out", default=None, help="結果の追記先ファイル")
+    p_wire.set_defaults(func=cmd_wire)
+
+    p_patch = sub.add_parser("patch", help="清書・修正の編集操作の出力トークン・遅延（シーン全体の出し直しとの比較）")
+    add_simulation_args(p_patch)
+    p_patch.add_argument("--scenes", type=int, default=10, help="録画が無いときの合成シーン数")
+    p_patch.add_argument("--out", default=None, help="結果の追記先ファイル")
+    p_patch.set_defaults(func=cmd_patch)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -38,14 +38,19 @@ sys.modules["darkdetect"] = _dd
 
 import json
 import csv
+import copy
 import time
 import random
 import threading
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+from collections import deque
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass, field
 from typing import Optional, Callable
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import tkinter as tk
 import customtkinter as ctk
@@ -86,9 +91,35 @@ from char_builder import (
     SHYNESS_OPTIONS, build_custom_character_data
 )
 from schema_validator import (
-    validate_context, validate_outline, validate_scene, validate_results
+    validate_context, validate_outline, validate_scene, validate_results,
+    CONTEXT_JSON_SCHEMA, OUTLINE_JSON_SCHEMA, SCENE_JSON_SCHEMA, SCENES_JSON_SCHEMA,
 )
 from concept_presets import CONCEPT_PRESETS
+from llm_engine import get_engine
+from llm_concurrency import (
+    get_controller, REASON_RATE_LIMIT as AIMD_REASON_RATE_LIMIT,
+    REASON_OVERLOADED as AIMD_REASON_OVERLOADED,
+)
+from llm_rate_limit import get_rate_limiter, estimate_tokens
+import llm_batch
+from llm_cache import get_response_cache, make_key as make_cache_key, UsageRecorder
+from llm_recorder import get_recorder
+from llm_retry import (
+    RetryPolicy, get_default_retry_policy, classify_error,
+    CALL_RETRY_BUDGETS, SCENE_RETRY_BUDGETS, SCENE_RETRY_BASE_DELAYS, RETRY_RUN_DEADLINE,
+    ERR_RATE_LIMIT, ERR_OVERLOADED, ERR_TIMEOUT, ERR_FATAL, ERR_REFUSAL, ERR_JSON,
+)
+from llm_stream import StreamMonitor, StreamAborted, KIND_REFUSAL
+from json_extract import extract_json, loads_tolerant
+from llm_continuation import get_continuation_policy, stitch, CONTINUATION_MAX_ROUNDS
+import llm_cancel
+from outline_stream import OutlineStream
+from outline_digest import OutlineDigest
+from prompt_prewarm import PromptCacheWarmer
+import scene_wire
+from scene_wire import SCENE_WIRE_JSON_SCHEMA
+import scene_patch
+from llm_cancel import CancelToken
 
 # === Font Awesome 6 アイコンフォント ===
 FONTS_DIR = Path(__file__).parent / "fonts"
@@ -226,13 +257,19 @@ class MaterialColors:
 
 
 # === 設定 ===
-MAX_RETRIES = 3
-MAX_RETRIES_OVERLOADED = 6  # 529 Overloaded専用（長時間待機）
-RETRY_DELAY = 2
-RETRY_DELAY_OVERLOADED = 15  # 529 Overloaded初回待機秒数
-CONCURRENT_BATCH_SIZE = 2       # Wave内同時生成数（v8.7: 5→2 ストーリー一貫性向上）
+# リトライの回数・待ち時間は llm_retry（CALL_RETRY_BUDGETS / SCENE_RETRY_BUDGETS）で管理
+MODEL_FALLBACK_DELAY = 5.0  # 過負荷で別モデルに切り替えた直後の待機秒数
+CONCURRENT_MAX_BATCH_SIZE = 4   # AIMDで拡大する場合の同時生成シーン数上限（ストーリー一貫性のため抑える）
 CONCURRENT_MIN_SCENES = 13      # 並列化の最小シーン数
-CONCURRENT_WAVE_COOLDOWN = 2.0  # Wave間クールダウン(秒)
+ROLLING_WINDOW_K = None         # ローリング生成の依存距離k（シーンiはi-k完了後に開始）。None=AIMD上限に追従
+OUTLINE_STREAMING_ENABLED = True  # 並列生成時、アウトラインのチャンク完了ごとにシーン生成を開始
+PROMPT_PREWARM_ENABLED = True   # Phase 2/3 の間にシーン生成の system プロンプトをキャッシュに書き込んでおく
+SCENE_WIRE_FORMAT_ENABLED = True  # シーン生成の応答を短縮キーの wire 形式で受け取る（scene_wire で従来形式に展開）
+SCENE_BATCH_ENABLED = True      # ローリング並列生成で、連続する低intensityシーンを generate_scene_batch でまとめて生成
+SCENE_BATCH_MAX_INTENSITY = 3   # まとめて生成するシーンの intensity 上限（Haiku 担当のシーン）
+SCENE_BATCH_MAX_SCENES = 4      # 1バッチのシーン数上限
+SCENE_BATCH_TOKEN_BUDGET = 2800 # 1バッチの推定出力トークン上限（シーン数はこの予算で決める）
+SCENE_BATCH_EST_TOKENS = 650    # 1シーンの出力トークンの初期推定（バッチの実績で更新）
 
 # プロバイダー設定
 PROVIDER_CLAUDE = "claude"
@@ -251,6 +288,11 @@ SOURCES_DIR = OUTPUT_DIR / "sources"
 CHARACTERS_DIR = OUTPUT_DIR / "characters"
 CHAR_SKILLS_DIR = SKILLS_DIR / "characters"
 PROFILES_DIR = OUTPUT_DIR / "profiles"
+CACHE_DIR = OUTPUT_DIR / "cache"
+RESPONSE_CACHE_ENABLED = False  # 圧縮・あらすじ・アウトラインの応答をディスクキャッシュ（同一入力の再実行を無料化。
+                                # 有効にすると同じコンセプトの再実行で同じあらすじ・アウトラインが返るため既定は無効）
+                                # GUIの「応答キャッシュ」チェック（generate_pipeline(response_cache=True)）で実行ごとに有効化できる
+STREAMING_ENABLED = True  # シーン生成をストリーミング受信し、JSON破綻・拒否応答を検出した時点で中断
 
 # プリセットキャラクター
 PRESETS_DIR = Path(__file__).parent / "presets"
@@ -8900,6 +8942,40 @@ def _select_serihu_skill(theme: str = "", char_profiles: list = None) -> dict:
 
 
 # === データクラス ===
+def _token_cost_usd(model: str, input_tokens: int, output_tokens: int,
+                    cache_creation_tokens: int = 0, cache_read_tokens: int = 0) -> float:
+    """1回分のトークン数から通常料金(USD)を計算（cache_creation=x1.25, cache_read=x0.1）"""
+    if "opus" in model:
+        cost = COSTS.get(MODELS["opus"], {"input": 5.00, "output": 25.00})
+    elif "sonnet" in model:
+        cost = COSTS.get(MODELS["sonnet"], {"input": 3.00, "output": 15.00})
+    elif model == MODELS.get("haiku_fast"):
+        cost = COSTS.get(MODELS["haiku_fast"], {"input": 0.25, "output": 1.25})
+    else:
+        cost = COSTS.get(MODELS["haiku"], {"input": 1.00, "output": 5.00})
+    return (
+        (input_tokens / 1_000_000) * cost["input"] +
+        (output_tokens / 1_000_000) * cost["output"] +
+        (cache_creation_tokens / 1_000_000) * cost["input"] * 1.25 +
+        (cache_read_tokens / 1_000_000) * cost["input"] * 0.10
+    )
+
+
+# API呼び出しをどのフェーズの分として集計するか（CostTracker.add が参照）。
+# パイプラインのスレッドで set_cost_phase() し、エンジンのループ上のタスクへは
+# 投入時のコンテキストごと引き継がれる（ループ上で別フェーズを始めるタスクは自分で設定する）
+_cost_phase: contextvars.ContextVar = contextvars.ContextVar("cost_phase", default="")
+
+
+def set_cost_phase(name: str):
+    """以降のAPI呼び出しを name のフェーズとして集計する（現在のスレッド/タスクのみ）"""
+    _cost_phase.set(name)
+
+
+COST_PHASE_SCENES = "Phase 4 シーン生成"
+COST_PHASE_PREWARM = "キャッシュ予熱"
+
+
 @dataclass
 class CostTracker:
     haiku_input: int = 0
@@ -8925,6 +9001,25 @@ class CostTracker:
     local_llm_calls: int = 0
     local_llm_input: int = 0
     local_llm_output: int = 0
+    # Message Batches API（通常料金の50%）
+    batch_calls: int = 0
+    batch_savings_usd: float = 0.0
+    # レスポンスキャッシュ（API呼出なし・課金なし）
+    response_cache_hits: int = 0
+    response_cache_saved_usd: float = 0.0
+    # ヘッジ（ローカル遅延時のクラウド並行送信）
+    hedge_fired: int = 0
+    hedge_cloud_wins: int = 0
+    hedge_local_wins: int = 0
+    hedge_extra_cost_usd: float = 0.0       # ヘッジが無ければ発生しなかったクラウド料金
+    hedge_cancelled_est_usd: float = 0.0    # キャンセルしたクラウド呼出の入力料金（推定）
+    hedge_elapsed_sec: float = 0.0          # ヘッジ発火した呼び出しの所要時間合計
+    # 続き生成（max_tokens 打ち切りの救済）
+    continuation_responses: int = 0
+    continuation_rounds: int = 0
+    continuation_completed: int = 0
+    # フェーズ別のプロンプトキャッシュ利用: phase → [呼出数, 非キャッシュ入力, cache_creation, cache_read]
+    phase_usage: dict = field(default_factory=dict)
     _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
 
     def add(self, model: str, input_tokens: int, output_tokens: int,
@@ -8939,6 +9034,18 @@ class CostTracker:
             self.api_calls += 1
             self.cache_creation += cache_creation_tokens
             self.cache_read += cache_read_tokens
+            rec = self.phase_usage.setdefault(_cost_phase.get() or "その他", [0, 0, 0, 0])
+            rec[0] += 1
+            rec[1] += input_tokens
+            rec[2] += cache_creation_tokens
+            rec[3] += cache_read_tokens
+            if batch:
+                # トークンは通常通り集計し、割引分を別途差し引く
+                self.batch_calls += 1
+                self.batch_savings_usd += _token_cost_usd(
+                    model, input_tokens, output_tokens,
+                    cache_creation_tokens, cache_read_tokens,
+                ) * (1.0 - llm_batch.BATCH_PRICE_FACTOR)
             if "opus" in model:
                 self.opus_input += input_tokens
                 self.opus_output += output_tokens
@@ -8960,6 +9067,58 @@ class CostTracker:
                 self.haiku_cache_creation += cache_creation_tokens
                 self.haiku_cache_read += cache_read_tokens
 
+    def add_cache_hit(self, usage_records: list):
+        """レスポンスキャッシュのヒットを記録（トークン・コストには計上しない）
+        usage_records: キャッシュ作成時の [model, in, out, cache_creation, cache_read] のリスト"""
+        with self._lock:
+            self.response_cache_hits += 1
+            for rec in usage_records:
+                model, in_tok, out_tok, cc_tok, cr_tok = rec
+                if model != "local-llm":
+                    self.response_cache_saved_usd += _token_cost_usd(model, in_tok, out_tok, cc_tok, cr_tok)
+
+    def add_hedge(self, winner: str, cloud_usage: list, elapsed: float,
+                  model: str = "", cancelled_input_tokens: int = 0):
+        """ヘッジ発火した呼び出しの結果を記録
+        winner: "local" | "cloud" | "none"
+        cloud_usage: クラウド側で実際に発生した [model, in, out, cache_creation, cache_read]（add()で計上済み）
+        cancelled_input_tokens: 途中キャンセルしたクラウド呼出の推定入力トークン（請求されうる分）"""
+        with self._lock:
+            self.hedge_fired += 1
+            self.hedge_elapsed_sec += elapsed
+            if winner == "cloud":
+                self.hedge_cloud_wins += 1
+            elif winner == "local":
+                self.hedge_local_wins += 1
+            for rec in cloud_usage:
+                self.hedge_extra_cost_usd += _token_cost_usd(*rec)
+            if cancelled_input_tokens:
+                est = _token_cost_usd(model, cancelled_input_tokens, 0)
+                self.hedge_cancelled_est_usd += est
+                self.hedge_extra_cost_usd += est
+
+    def add_continuation(self, rounds: int, completed: bool):
+        """打ち切られた応答1件の続き生成結果を記録（トークンは各呼び出しの add() で計上済み）"""
+        with self._lock:
+            self.continuation_responses += 1
+            self.continuation_rounds += rounds
+            if completed:
+                self.continuation_completed += 1
+
+    def cache_report(self) -> list:
+        """フェーズ別のプロンプトキャッシュ読取率（入力トークン全体に占める cache_read の割合）"""
+        with self._lock:
+            usage = {k: list(v) for k, v in self.phase_usage.items()}
+        lines = []
+        for phase, (calls, in_tok, cc_tok, cr_tok) in usage.items():
+            total = in_tok + cc_tok + cr_tok
+            ratio = cr_tok / total if total else 0.0
+            lines.append(
+                f"{phase}: キャッシュ読取率 {ratio:.0%}（read {cr_tok:,} / create {cc_tok:,} / "
+                f"非キャッシュ {in_tok:,}トークン, {calls}回）"
+            )
+        return lines
+
     def total_cost_usd(self) -> float:
         """キャッシュ料金を正確に反映したコスト計算。
         Anthropic API: cache_read=入力単価x0.1, cache_creation=入力単価x1.25"""
@@ -8989,7 +9148,7 @@ class CostTracker:
             (self.opus_cache_creation / 1_000_000) * o_cost["input"] * 1.25 +
             (self.opus_cache_read / 1_000_000) * o_cost["input"] * 0.10
         )
-        return claude_cost
+        return claude_cost - self.batch_savings_usd + self.hedge_cancelled_est_usd
 
     def _cache_savings_usd(self) -> float:
         """キャッシュによる節約額（キャッシュなしの場合との差分）"""
@@ -9020,6 +9179,21 @@ class CostTracker:
             savings = self._cache_savings_usd()
             if savings > 0.001:
                 lines.append(f"Cache節約: -${savings:.4f}")
+        if self.batch_calls:
+            lines.append(f"Batch割引: -${self.batch_savings_usd:.4f}（{self.batch_calls}件）")
+        if self.response_cache_hits:
+            lines.append(f"応答キャッシュ: {self.response_cache_hits}件ヒット（-${self.response_cache_saved_usd:.4f}）")
+        if self.hedge_fired:
+            lines.append(
+                f"ヘッジ: {self.hedge_fired}回（クラウド勝ち{self.hedge_cloud_wins} / ローカル勝ち{self.hedge_local_wins}）"
+                f" 追加コスト+${self.hedge_extra_cost_usd:.4f}"
+                f" 平均所要{self.hedge_elapsed_sec / self.hedge_fired:.1f}秒"
+            )
+        if self.continuation_responses:
+            lines.append(
+                f"続き生成: {self.continuation_responses}件（{self.continuation_rounds}回呼出, "
+                f"完結{self.continuation_completed}件）"
+            )
         lines.append(f"API呼出: {self.api_calls}回")
         lines.append(f"推定コスト: ${self.total_cost_usd():.4f}")
         return "\n".join(lines)
@@ -9070,9 +9244,9 @@ def estimate_cost(num_scenes: int, use_sonnet_polish: bool = True) -> dict:
     sonnet_cache_read_cost = (cached_system_tokens / 1_000_000) * s_cost["input"] * 0.10 * max(0, sonnet_scenes - 1)
     sonnet_input = sonnet_scenes * avg_user_tokens
     sonnet_output = sonnet_scenes * 700
-    # Opus清書: 各シーンJSON往復（入力~2000tok, 出力~1500tok）
-    opus_input = opus_scenes * 2000
-    opus_output = opus_scenes * 1500
+    # Opus清書: 下書きJSONを送り、編集操作のみ受け取る（入力~2500tok, 出力~300tok）
+    opus_input = opus_scenes * 2500
+    opus_output = opus_scenes * 300
     estimated_usd = (
         (haiku_input / 1_000_000) * h_cost["input"] +
         (haiku_output / 1_000_000) * h_cost["output"] +
@@ -9435,18 +9609,119 @@ def log_message(message: str):
 
 
 # === API呼び出し ===
-def call_claude(
+async def _astream_claude(aclient, model: str, system_param, user: str, max_tokens: int,
+                          monitor: StreamMonitor, cost_tracker: CostTracker):
+    """messages.stream() で受信しながら monitor で検証する。(response, headers) を返す
+
+    StreamAborted / 停止要求 / キャンセルで途中終了した場合はストリームを閉じ、
+    それまでの入力トークンと推定出力トークンを記録してから送出する。
+    """
+    monitor.begin()
+    async with aclient.messages.stream(
+        model=model,
+        max_tokens=max_tokens,
+        system=system_param,
+        messages=[{"role": "user", "content": user}],
+        timeout=120.0
+    ) as stream:
+        headers = stream.response.headers
+        try:
+            async for text in stream.text_stream:
+                monitor.feed(text)
+        except BaseException:
+            monitor.end()
+            try:
+                usage = stream.current_message_snapshot.usage
+                cost_tracker.add(model, usage.input_tokens, monitor.output_tokens,
+                                 getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+                                 getattr(usage, 'cache_read_input_tokens', 0) or 0)
+            except Exception:
+                pass  # message_start 受信前に中断
+            get_rate_limiter().update_from_headers(model, headers)
+            raise
+        response = await stream.get_final_message()
+    monitor.end(response.usage.output_tokens, response.stop_reason)
+    return response, headers
+
+
+async def _acontinue_claude(aclient, model: str, system_param, user: str, text: str, max_tokens: int,
+                            cost_tracker: CostTracker, callback: Optional[Callable] = None) -> str:
+    """max_tokens で打ち切られた応答を、途中までの出力を assistant prefill にして続きから生成・連結する
+
+    シーン全体の再生成より安い（入力はキャッシュ可能な system + user + 途中出力、出力は残り分のみ）。
+    続き生成自体が失敗した場合は途中までの出力を返す（json_extract が打ち切りを補完する）。
+    """
+    policy = get_continuation_policy()
+    _limiter = get_rate_limiter()
+    _aimd = get_controller()
+    rounds, finished = 0, False
+    for rounds in range(1, CONTINUATION_MAX_ROUNDS + 1):
+        budget = policy.budget(model, max_tokens, rounds)
+        prefix = text.rstrip()  # assistant prefill は末尾の空白不可
+        log_message(f"出力上限で打ち切り → 続き生成 {rounds}/{CONTINUATION_MAX_ROUNDS} "
+                    f"(max_tokens={budget}, 途中出力{len(prefix)}文字)")
+        if callback:
+            callback(f"出力上限で途切れたため続きを生成中... ({rounds}/{CONTINUATION_MAX_ROUNDS})")
+        try:
+            await _limiter.acquire(
+                model, estimate_tokens(system_param) + estimate_tokens(user) + estimate_tokens(prefix),
+                budget, callback
+            )
+            async with _aimd.slot(model):
+                _t0 = time.monotonic()
+                raw = await aclient.messages.with_raw_response.create(
+                    model=model,
+                    max_tokens=budget,
+                    system=system_param,
+                    messages=[
+                        {"role": "user", "content": user},
+                        {"role": "assistant", "content": prefix},
+                    ],
+                    timeout=120.0
+                )
+            _aimd.record_success(model, time.monotonic() - _t0)
+            _limiter.update_from_headers(model, raw.headers)
+            response = await raw.parse()
+        except anthropic.APIError as e:
+            log_message(f"続き生成失敗: {e} → 途中までの出力を使用")
+            break
+        usage = response.usage
+        cost_tracker.add(model, usage.input_tokens, usage.output_tokens,
+                         getattr(usage, 'cache_creation_input_tokens', 0) or 0,
+                         getattr(usage, 'cache_read_input_tokens', 0) or 0)
+        text = stitch(prefix, response.content[0].text if response.content else "")
+        finished = response.stop_reason != "max_tokens"
+        policy.observe(model, usage.output_tokens, finished)
+        if finished:
+            break
+    _report = getattr(cost_tracker, "add_continuation", None)
+    if _report is not None:
+        _report(rounds, finished)
+    log_message(f"続き生成{'完了' if finished else '未完（打ち切り補完に委ねる）'}: {rounds}回, 計{len(text)}文字")
+    return text
+
+
+async def acall_claude(
     client: anthropic.Anthropic,
     model: str,
     system,
     user: str,
     cost_tracker: CostTracker,
     max_tokens: int = 4096,
-    callback: Optional[Callable] = None
+    callback: Optional[Callable] = None,
+    monitor: Optional[StreamMonitor] = None
 ) -> str:
-    total_max_retries = MAX_RETRIES_OVERLOADED  # 529対応で最大試行回数を拡大
-    overloaded_count = 0  # 529エラー連続カウント
-    for attempt in range(total_max_retries):
+    """Claude API呼び出し（非同期版）。AsyncLLMEngine のループ上で await する
+
+    monitor を渡すとストリーミングで受信し、応答の破綻を検出した時点で
+    StreamAborted を送出する（このレイヤーでは再試行しない）。
+    """
+    aclient = get_engine().async_anthropic(client)
+    policy = _current_retry_policy()
+    retry = policy.begin(CALL_RETRY_BUDGETS)
+    attempt = 0
+    while True:
+        attempt += 1
         try:
             if model == MODELS.get("haiku_fast"):
                 model_name = "Haiku(fast)"
@@ -9454,7 +9729,7 @@ def call_claude(
                 model_name = "Haiku(4.5)"
             else:
                 model_name = "Sonnet"
-            log_message(f"API呼び出し開始: {model_name} (試行 {attempt + 1}/{total_max_retries})")
+            log_message(f"API呼び出し開始: {model_name} (試行 {attempt})")
 
             if callback:
                 callback(f"API呼び出し中 ({model_name})...")
@@ -9465,14 +9740,34 @@ def call_claude(
             else:
                 system_param = system
 
-            response = client.messages.create(
-                model=model,
-                max_tokens=max_tokens,
-                system=system_param,
-                messages=[{"role": "user", "content": user}],
-                timeout=120.0  # 2分タイムアウト
+            # レート制限ヘッダーに基づく送信前ペーシング（プロセス共有）
+            _limiter = get_rate_limiter()
+            await _limiter.acquire(
+                model, estimate_tokens(system_param) + estimate_tokens(user), max_tokens, callback
             )
 
+            # AIMD: モデル別の同時実行枠を確保してから送信
+            _aimd = get_controller()
+            async with _aimd.slot(model):
+                _t0 = time.monotonic()
+                if monitor is not None:
+                    response, _headers = await _astream_claude(
+                        aclient, model, system_param, user, max_tokens, monitor, cost_tracker
+                    )
+                else:
+                    raw = await aclient.messages.with_raw_response.create(
+                        model=model,
+                        max_tokens=max_tokens,
+                        system=system_param,
+                        messages=[{"role": "user", "content": user}],
+                        timeout=120.0  # 2分タイムアウト
+                    )
+                    _headers = raw.headers
+            _aimd.record_success(model, time.monotonic() - _t0)
+            _limiter.update_from_headers(model, _headers)
+            if monitor is None:
+                response = await raw.parse()
+
             usage = response.usage
             cache_creation = getattr(usage, 'cache_creation_input_tokens', 0) or 0
             cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
@@ -9484,69 +9779,105 @@ def call_claude(
                 log_message(f"{model_name}: {usage.input_tokens} in, {usage.output_tokens} out (cache: +{cache_creation} create, {cache_read} read)")
             else:
                 log_message(f"{model_name}: {usage.input_tokens} in, {usage.output_tokens} out")
+            if monitor is not None:
+                log_message(f"{model_name} ストリーム: {monitor.describe()}")
+                if response.stop_reason == "refusal":
+                    raise StreamAborted(KIND_REFUSAL, "stop_reason=refusal", monitor.text)
+
+            text = response.content[0].text
+            if response.stop_reason == "max_tokens":
+                text = await _acontinue_claude(
+                    aclient, model, system_param, user, text, max_tokens, cost_tracker, callback
+                )
+            return text
 
-            return response.content[0].text
+        except StreamAborted as e:
+            # 応答内容の問題なので同一リクエストの再送はせず、シーン単位のリトライ判定に任せる
+            log_message(f"{model_name}: {e} ({monitor.describe() if monitor else ''})")
+            raise
 
-        except anthropic.RateLimitError as e:
-            wait_time = RETRY_DELAY * (2 ** (attempt + 1))
-            log_message(f"Rate limit: {e} (待機{wait_time}秒)")
-            if callback:
-                callback(f"レート制限、{wait_time}秒待機...")
-            time.sleep(wait_time)
-
-        except anthropic.APIStatusError as e:
-            if e.status_code == 401:
-                raise ValueError("APIキーが無効です")
-            if e.status_code == 529:
-                # 529 Overloaded: 段階的対処
-                overloaded_count += 1
-                # 3回失敗後: 別モデルにフォールバック（Haiku→Sonnet）
-                if overloaded_count == 3 and "haiku" in model and model != MODELS.get("haiku_fast"):
-                    fallback_model = MODELS["sonnet"]
-                    log_message(f"529 Overloaded 3回連続: Sonnetにフォールバック")
-                    if callback:
-                        callback(f"Haiku過負荷、Sonnetで代替生成中...")
-                    model = fallback_model  # 以降の試行はSonnetを使用
-                    time.sleep(5)
-                    continue
-                wait_time = RETRY_DELAY_OVERLOADED * min(overloaded_count, 4)  # 15→30→45→60秒
-                log_message(f"529 Overloaded ({overloaded_count}回目): {wait_time}秒待機後に再試行")
-                if callback:
-                    callback(f"サーバー過負荷、{wait_time}秒待機中... ({overloaded_count}/{MAX_RETRIES_OVERLOADED})")
-                time.sleep(wait_time)
-                if overloaded_count >= MAX_RETRIES_OVERLOADED:
-                    raise RuntimeError(f"サーバー過負荷が継続（{MAX_RETRIES_OVERLOADED}回試行）。時間をおいて再実行してください。")
-                continue
-            log_message(f"API error {e.status_code}: {e}")
-            if attempt < total_max_retries - 1:
-                if callback:
-                    callback(f"APIエラー、再試行中...")
-                time.sleep(RETRY_DELAY)
-            else:
+        except InterruptedError:
+            raise
+
+        except Exception as e:
+            kind = classify_error(e)
+            if kind == ERR_FATAL:
+                raise ValueError("APIキーが無効です") from e
+            _limiter = get_rate_limiter()
+            _limiter.update_from_headers(model, getattr(getattr(e, "response", None), "headers", None))
+            hint = None
+            fallback = False
+            if kind == ERR_RATE_LIMIT:
+                get_controller().record_overload(model, AIMD_REASON_RATE_LIMIT)
+                # retry-after / reset ヘッダーがあればそれを待ち時間の下限にする
+                hint = _limiter.retry_after(model) or None
+            elif kind == ERR_OVERLOADED:
+                get_controller().record_overload(model, AIMD_REASON_OVERLOADED)
+                # 3回目の過負荷: 別モデルにフォールバック（Haiku→Sonnet）
+                fallback = (retry.count(ERR_OVERLOADED) == 2 and "haiku" in model
+                            and model != MODELS.get("haiku_fast"))
+
+            delay = retry.next_delay(kind, hint)
+            if delay is None:
+                log_message(f"{model_name} {kind}: {e} → リトライ断念（試行{attempt}回）")
+                if kind == ERR_OVERLOADED:
+                    raise RuntimeError(f"サーバー過負荷が継続（{attempt}回試行）。時間をおいて再実行してください。") from e
+                if kind == ERR_TIMEOUT:
+                    raise RuntimeError(f"APIタイムアウト（{attempt}回試行）") from e
                 raise
 
-        except anthropic.APITimeoutError as e:
-            log_message(f"API timeout: {e}")
-            if callback:
-                callback(f"タイムアウト、再試行中...")
-            if attempt < total_max_retries - 1:
-                time.sleep(RETRY_DELAY * 2)
+            if fallback:
+                model = MODELS["sonnet"]  # 以降の試行はSonnetを使用
+                delay = min(delay, MODEL_FALLBACK_DELAY)
+                log_message(f"529 Overloaded 3回連続: Sonnetにフォールバック")
+                if callback:
+                    callback(f"Haiku過負荷、Sonnetで代替生成中...")
+            elif kind == ERR_RATE_LIMIT:
+                log_message(f"Rate limit: {e} (待機{delay}秒)")
+                if callback:
+                    callback(f"レート制限、{delay}秒待機...")
+            elif kind == ERR_OVERLOADED:
+                _n, _budget = retry.count(ERR_OVERLOADED), CALL_RETRY_BUDGETS[ERR_OVERLOADED]
+                log_message(f"529 Overloaded ({_n}回目): {delay}秒待機後に再試行")
+                if callback:
+                    callback(f"サーバー過負荷、{delay}秒待機中... ({_n}/{_budget})")
+            elif kind == ERR_TIMEOUT:
+                log_message(f"API timeout: {e} (待機{delay}秒)")
+                if callback:
+                    callback(f"タイムアウト、再試行中...")
             else:
-                raise RuntimeError(f"APIタイムアウト（{total_max_retries}回試行）")
+                log_message(f"API error: {e} (待機{delay}秒)")
+                if callback:
+                    callback(f"APIエラー、再試行中... ({str(e)[:30]})")
+            await policy.sleep(delay)
 
-        except Exception as e:
-            log_message(f"Error: {e}")
-            if callback:
-                callback(f"エラー: {str(e)[:30]}...")
-            if attempt < total_max_retries - 1:
-                time.sleep(RETRY_DELAY)
-            else:
-                raise
 
-    raise RuntimeError("最大リトライ回数を超えました")
+def call_claude(
+    client: anthropic.Anthropic,
+    model: str,
+    system,
+    user: str,
+    cost_tracker: CostTracker,
+    max_tokens: int = 4096,
+    callback: Optional[Callable] = None,
+    monitor: Optional[StreamMonitor] = None
+) -> str:
+    """acall_claude() の同期ラッパー（エンジンのループで実行して結果を待つ）"""
+    return get_engine().run(
+        acall_claude(client, model, system, user, cost_tracker, max_tokens, callback, monitor),
+        cancel=llm_cancel.current_token(),
+    )
 
 
 _hybrid_router = None  # HybridRouter instance (set by generate_pipeline)
+_retry_policy = None   # RetryPolicy instance (set by generate_pipeline)
+_prompt_warmer = None  # PromptCacheWarmer instance (set by generate_pipeline)
+_response_cache_enabled = None  # 実行中パイプラインの応答キャッシュ設定（None なら RESPONSE_CACHE_ENABLED）
+
+
+def _current_retry_policy() -> RetryPolicy:
+    """実行中パイプラインのリトライ方針（パイプライン外ではプロセス共有の既定方針）"""
+    return _retry_policy or get_default_retry_policy()
 
 def _call_api(
     client,
@@ -9557,96 +9888,113 @@ def _call_api(
     max_tokens: int = 4096,
     callback: Optional[Callable] = None,
     routing_hint: str = "auto",
+    cache: bool = False,
+    cache_validate: Optional[Callable[[str], bool]] = None,
+    monitor: Optional[StreamMonitor] = None,
+    json_schema: Optional[dict] = None,
 ) -> str:
     """API呼び出し（ハイブリッドルーター経由）
     routing_hint: "local_ok" | "cloud" | "auto"
+    cache: True ならレスポンスキャッシュを使用（再実行で同一入力になる呼び出し向け）
+    cache_validate: 応答をキャッシュしてよいか判定する関数（パース不能な応答の再利用防止）
+    monitor: StreamMonitor を渡すとストリーミング受信（破綻検出で StreamAborted）
+    json_schema: ローカルLLM経路で出力を制約するJSON Schema（schema_validator.*_JSON_SCHEMA）
     """
-    global _hybrid_router
-    if _hybrid_router is not None:
-        return _hybrid_router.call(
-            model, system, user, cost_tracker, max_tokens, callback, routing_hint
+    return get_engine().run(
+        _acall_api(client, model, system, user, cost_tracker, max_tokens, callback, routing_hint,
+                   cache=cache, cache_validate=cache_validate, monitor=monitor, json_schema=json_schema),
+        cancel=llm_cancel.current_token(),
+    )
+
+
+async def _acall_api(
+    client,
+    model: str,
+    system,
+    user: str,
+    cost_tracker: CostTracker,
+    max_tokens: int = 4096,
+    callback: Optional[Callable] = None,
+    routing_hint: str = "auto",
+    cache: bool = False,
+    cache_validate: Optional[Callable[[str], bool]] = None,
+    monitor: Optional[StreamMonitor] = None,
+    json_schema: Optional[dict] = None,
+) -> str:
+    """_call_api() の非同期版（ハイブリッドルーター経由）"""
+    router = _hybrid_router
+    cache_enabled = RESPONSE_CACHE_ENABLED if _response_cache_enabled is None else _response_cache_enabled
+    if cache and cache_enabled:
+        # 経路（ローカル/クラウド）で応答が変わるためキーに含める
+        route = f"{routing_hint}:{'hybrid' if router is not None else 'cloud'}"
+        # temperature: クラウドは指定なし（APIの既定値）、ハイブリッドはローカルLLMの送信値
+        temperature = None
+        if router is not None:
+            from llm_provider import LOCAL_LLM_TEMPERATURE
+            temperature = LOCAL_LLM_TEMPERATURE
+        key = make_cache_key(model, system, user, max_tokens, temperature, route)
+
+        async def _fetch(recorder):
+            return await _acall_api(client, model, system, user, recorder, max_tokens, callback, routing_hint,
+                                    monitor=monitor, json_schema=json_schema)
+
+        response, entry = await get_response_cache(CACHE_DIR).get_or_fetch(
+            key, _fetch, cost_tracker, model=model, validate=cache_validate,
+        )
+        if entry is not None:
+            cost_tracker.add_cache_hit(entry.get("usage", []))
+            log_message(f"レスポンスキャッシュ{'共有' if entry.get('coalesced') else 'ヒット'}: {model} ({key[:12]})")
+            if callback:
+                callback("キャッシュ済みの応答を使用")
+        return response
+
+    # 録画モード（LLM_RECORD_DIR）: 応答とusageをフィクスチャとして保存
+    recorder = get_recorder()
+    tracker = UsageRecorder(cost_tracker) if recorder is not None else cost_tracker
+    _t0 = time.monotonic()
+    if router is not None:
+        response = await router.acall(
+            model, system, user, tracker, max_tokens, callback, routing_hint, monitor=monitor,
+            json_schema=json_schema,
         )
-    return call_claude(client, model, system, user, cost_tracker, max_tokens, callback)
+    else:
+        response = await acall_claude(client, model, system, user, tracker, max_tokens, callback, monitor)
+    if recorder is not None:
+        recorder.record(model, system, user, max_tokens, routing_hint,
+                        response, tracker.records, time.monotonic() - _t0)
+    return response
+
+
+def _is_parseable_json(text: str) -> bool:
+    """レスポンスキャッシュ用: JSONとして解釈できる応答か（打ち切り補完が必要なものは除外）"""
+    candidate = extract_json(text)
+    return candidate is not None and candidate.complete
 
 
 def parse_json_response(text: str):
-    """Parse JSON from API response, handling markdown code blocks and prefixed text."""
-    original_text = text
+    """Parse JSON from API response, handling markdown code blocks and prefixed text.
+
+    抽出は json_extract（1パス走査・scene_id を持つ候補を優先・末尾カンマ/打ち切りを修復）に任せる。
+    """
     log_message(f"Raw API response: {text[:1000]}")
-    
-    try:
-        # マークダウンコードブロック除去
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            parts = text.split("```")
-            if len(parts) >= 2:
-                text = parts[1]
-        
-        text = text.strip()
-        
-        # JSONの前にある前置きテキストを除去
-        # 「{」または「[」で始まる部分を探す
-        if text and not text.startswith("{") and not text.startswith("["):
-            # 最初の { または [ を探す
-            brace_idx = text.find("{")
-            bracket_idx = text.find("[")
-            
-            if brace_idx == -1 and bracket_idx == -1:
-                log_message(f"No JSON found in response: {text[:300]}")
-                raise ValueError(f"No JSON in response: {original_text[:150]}")
-            
-            # より早く出現する方を使用
-            if brace_idx == -1:
-                start_idx = bracket_idx
-            elif bracket_idx == -1:
-                start_idx = brace_idx
-            else:
-                start_idx = min(brace_idx, bracket_idx)
-            
-            log_message(f"Stripping prefix text before JSON (index {start_idx})")
-            text = text[start_idx:]
-        
-        # 末尾の余分なテキストも除去（JSONの閉じ括弧以降）
-        if text.startswith("{"):
-            # 対応する } を探す
-            depth = 0
-            end_idx = 0
-            for i, c in enumerate(text):
-                if c == "{":
-                    depth += 1
-                elif c == "}":
-                    depth -= 1
-                    if depth == 0:
-                        end_idx = i + 1
-                        break
-            if end_idx > 0:
-                text = text[:end_idx]
-        elif text.startswith("["):
-            # 対応する ] を探す
-            depth = 0
-            end_idx = 0
-            for i, c in enumerate(text):
-                if c == "[":
-                    depth += 1
-                elif c == "]":
-                    depth -= 1
-                    if depth == 0:
-                        end_idx = i + 1
-                        break
-            if end_idx > 0:
-                text = text[:end_idx]
-        
-        text = text.strip()
-        if not text:
-            log_message(f"Empty response after parsing. Original: {original_text[:500]}")
-            raise ValueError(f"Empty response: {original_text[:200]}")
-        
-        return json.loads(text)
-    except json.JSONDecodeError as e:
-        log_message(f"JSON parse error: {e}")
-        log_message(f"Parsed text: {text[:500]}")
-        raise ValueError(f"Invalid JSON: {str(e)[:50]}. Text: {text[:100]}...") from e
+    if not text or not text.strip():
+        log_message(f"Empty response after parsing. Original: {(text or '')[:500]}")
+        raise ValueError(f"Empty response: {(text or '')[:200]}")
+
+    candidate = extract_json(text)
+    if candidate is None:
+        # "No JSON in response" / "Invalid JSON" を含むメッセージで送出（リトライ判定用）
+        try:
+            return loads_tolerant(text)
+        except ValueError as e:
+            log_message(f"JSON parse error: {e}")
+            raise
+
+    if candidate.repairs:
+        log_message(f"JSON修復: {', '.join(candidate.repairs)} ({len(candidate.text)}文字)")
+    elif candidate.start > 0:
+        log_message(f"Stripping prefix text before JSON (index {candidate.start})")
+    return candidate.value
 
 
 # === Skill 1: Prompt Compactor ===
@@ -9691,6 +10039,8 @@ def compact_context(
         skill if skill else "You compress prompts to save tokens. Output only JSON.",
         prompt, cost_tracker, 1024, callback,
         routing_hint="local_ok",
+        cache=True, cache_validate=_is_parseable_json,
+        json_schema=CONTEXT_JSON_SCHEMA,
     )
     return parse_json_response(response)
 
@@ -9832,6 +10182,7 @@ def generate_synopsis(
             f"FANZA同人CG集の脚本家です。ユーザーのコンセプトに基づき、エロ同人作品の完全なストーリーあらすじを作成します。成人向けコンテンツを忠実に生成します。",
             prompt, cost_tracker, 2048, callback,
             routing_hint="local_ok",
+            cache=True,
         )
 
         synopsis = response.strip()
@@ -9860,104 +10211,46 @@ def generate_scene_batch(
     theme: str = "",
     char_profiles: list = None,
     callback: Optional[Callable] = None,
-    story_so_far: str = ""
+    story_so_far: str = "",
+    male_description: str = "",
+    faceless_male: bool = True,
+    outline_roadmap: str = "",
+    _return_prompt_only: bool = False,
 ) -> list:
-    """複数のLow-Intensityシーンをまとめて1回のAPI呼び出しで生成（API節約）"""
-    skill = load_skill("low_cost_pipeline")
-    danbooru_nsfw = load_skill("danbooru_nsfw_tags")
-    scene_composer = load_skill("nsfw_scene_composer")
-    _serihu_info = _select_serihu_skill(theme, char_profiles)
-    serihu_skill_name = _serihu_info["primary"]
-    serihu_skill = load_skill(serihu_skill_name)
-    _serihu_secondary = load_skill(_serihu_info["secondary"]) if _serihu_info.get("secondary") else ""
-    _serihu_ratio = _serihu_info.get("ratio", 1.0)
-    _serihu_personality = _serihu_info.get("personality", "")
-    bubble_writer_skill = load_skill("cg_bubble_writer")
-    visual_skill = load_skill("cg_visual_variety")
+    """複数のLow-Intensityシーンをまとめて1回のAPI呼び出しで生成（API節約）
 
+    _return_prompt_only=True の場合は API を呼ばずにリクエスト内容（model/system/user/max_tokens/
+    json_schema）の dict を返す（agenerate_scene_batch 用）。
+    """
     theme_guide = THEME_GUIDES.get(theme, THEME_GUIDES.get("vanilla", {}))
-    theme_name = theme_guide.get("name", "指定なし")
-    dialogue_tone = theme_guide.get("dialogue_tone", "自然で楽しい雰囲気")
-    use_heart = theme_guide.get("use_heart", True)
     theme_sd_tags = theme_guide.get("sd_tags", "")
     theme_sd_expressions = theme_guide.get("sd_expressions", "")
-    key_emotions = theme_guide.get("key_emotions", [])
 
     tag_db = _load_tag_db()
     loc_tags_db = tag_db.get("locations", {})
     time_tags_db = tag_db.get("time_of_day", {})
 
-    # キャラガイド（低intensity用＝簡潔版）
-    char_guide = ""
+    # キャラガイド（低intensity用＝intensity 3 相当）
+    char_guide = _scene_char_guide(char_profiles, 3)
     char_danbooru_tags = []
     char_names = []
+    for cp in char_profiles or []:
+        char_names.append(cp.get("character_name", ""))
+        char_danbooru_tags.extend(cp.get("danbooru_tags", []))
 
-    if char_profiles:
-        for cp in char_profiles:
-            name = cp.get("character_name", "")
-            char_names.append(name)
-            speech = cp.get("speech_pattern", {})
-            avoid = cp.get("avoid_patterns", [])
-            physical = cp.get("physical_description", {})
-            tags = cp.get("danbooru_tags", [])
-            char_danbooru_tags.extend(tags)
-
-            emotional = cp.get("emotional_speech", {})
-            char_guide += f"""
-【{name}】口調ガイド
-・一人称: {speech.get('first_person', '私')} / 語尾: {', '.join(speech.get('sentence_endings', ['〜よ', '〜ね']))}
-・間投詞: {', '.join(speech.get('fillers', ['あっ', 'んっ']))}
-・照れた時: {emotional.get('when_embarrassed', '言葉に詰まる')}
-・甘える時: {emotional.get('when_flirty', '甘い声で')}
-・外見: 髪={physical.get('hair', '')}, 目={physical.get('eyes', '')}
-・NG: {', '.join(avoid) if avoid else 'なし'}
-"""
-
-    heart_instruction = "♡は甘いシーンで自然に使用OK。" if use_heart else f"テーマ「{theme_name}」のspeechでは♡控えめ。ただしmoan（喘ぎ）では♡を積極的に使え（不本意な快楽表現として有効）。"
-
-    # 共通システムプロンプト（CG集フォーマット対応）
-    common_system = f"""{jailbreak}
-
-{skill if skill else "FANZA同人CG集の脚本を生成します。"}
-
-{danbooru_nsfw if danbooru_nsfw else ""}
-
-{scene_composer if scene_composer else ""}
-
-{bubble_writer_skill if bubble_writer_skill else ""}
-
-{char_guide if char_guide else "（キャラ設定なし）"}
+    # Prompt Caching: generate_scene_draft と共通のプレフィックス → バッチ共通部分
+    system_with_cache = _compile_scene_system(
+        _scene_system_prefix(jailbreak, theme, char_profiles, male_description, faceless_male),
+        f"""{char_guide if char_guide else "（キャラ設定なし）"}
 
 ## CG集フォーマット補足
 CG画像1枚 + 吹き出し1-3個（ヒロイン1-2+男0-1） + SE 0-4個。画像がメイン。
 moan=喘ぎ声のみ(説明文禁止) / speech=感情的反応のみ / story_flow=各シーン固有(コピペ禁止)
 
-{f'''
-## ⚠️ セリフ品質ガイド（厳守・最優先）
-
-bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】に厳密に従え。
-「タスク手順」「不自然診断」「改訂版セリフ」等のセクションは無視せよ。
-
-★ 喘ぎ声は必ず下記辞書の【段階1〜4】から選べ。自分で喘ぎを創作するな。
-★ intensityに対応する段階を使え（intensity 1-2=段階1、intensity 3=段階2、intensity 4=段階3、intensity 5=段階4）
-★ 前シーンで使った喘ぎと同じものは絶対禁止。毎シーン辞書の別パターンを選べ。
-
-{serihu_skill}
-''' if serihu_skill else ''}{f'''
-
-### サブスタイル（混合比率{int((1-_serihu_ratio)*100)}%で以下のスタイルも取り入れること）:
-{_serihu_secondary}
-''' if _serihu_secondary and _serihu_ratio < 1.0 else ''}{f'''
-★ キャラ性格タイプ「{_serihu_personality}」を意識したセリフ。ギャップ感を出すこと。
-''' if _serihu_personality else ''}
-
-{f'''
-## CG集ビジュアル構成ガイド
-
-{visual_skill}
-''' if visual_skill else ''}
+設定: {json.dumps(context, ensure_ascii=False)}
 
-全キャラ成人(18+)。JSON配列形式のみ出力。"""
+JSON配列形式のみ出力。""",
+    )
 
     # ストーリー連続性セクション
     story_context_section = ""
@@ -9969,6 +10262,18 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
 
 {story_so_far}
 
+---
+"""
+
+    # ロードマップセクション（generate_scene_draft と同じ形式。★ はバッチ内の全シーン）
+    roadmap_section = ""
+    if outline_roadmap:
+        batch_ids = "・".join(str(s.get("scene_id", "?")) for s in scenes)
+        roadmap_section = f"""## ストーリーロードマップ（全体構成）
+{outline_roadmap}
+
+★ 現在生成: シーン{batch_ids}（{len(scenes)}シーン一括）
+各シーンの前後関係を意識し、ストーリーを確実に進めること。
 ---
 """
 
@@ -10033,10 +10338,10 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
 
     # バッチプロンプト構築
     prompt_parts = []
+    if roadmap_section:
+        prompt_parts.append(roadmap_section)
     if story_context_section:
         prompt_parts.append(story_context_section)
-    prompt_parts.append(f"設定: {json.dumps(context, ensure_ascii=False)}\n")
-    prompt_parts.append(f"テーマ「{theme_name}」のトーン: {dialogue_tone}\n{heart_instruction}\n")
     if batch_setting_hint:
         prompt_parts.append(batch_setting_hint)
 
@@ -10093,25 +10398,55 @@ JSON配列のみ出力。""")
 
     prompt = "\n".join(prompt_parts)
 
-    system_with_cache = [
-        {"type": "text", "text": common_system, "cache_control": {"type": "ephemeral"}},
-    ]
-
     if callback:
         scene_ids = [s.get("scene_id") for s in scenes]
         callback(f"バッチ生成中: シーン {scene_ids} (Haiku, {len(scenes)}シーン一括)...")
 
+    if _return_prompt_only:
+        return {
+            "model": MODELS["haiku"],
+            "system": system_with_cache,
+            "user": prompt,
+            "max_tokens": 2500 * len(scenes),
+            "json_schema": SCENES_JSON_SCHEMA,
+        }
+
     response = _call_api(
         client, MODELS["haiku"],
         system_with_cache,
-        prompt, cost_tracker, 2500 * len(scenes), callback
+        prompt, cost_tracker, 2500 * len(scenes), callback,
+        json_schema=SCENES_JSON_SCHEMA,
     )
+    result_list = _finish_scene_batch(response, scenes)
+
+    for i, result in enumerate(result_list):
+        if result is None:
+            missing_scene = scenes[i]
+            result_list[i] = {
+                "scene_id": missing_scene.get("scene_id", i + 1),
+                "title": "生成不足",
+                "mood": "一般",
+                "bubbles": [],
+                "onomatopoeia": [],
+                "direction": "バッチ生成で不足",
+                "sd_prompt": ""
+            }
+    return result_list
+
 
+def _finish_scene_batch(response: str, scenes: list) -> list:
+    """バッチ応答をパースし、scenes と同じ順・同じ長さのリストにする（返ってこなかったシーンは None）
+
+    scene_id が要求したものと一致すればその位置に、一致しない（連番で振り直された等）ものは
+    空いている位置に先頭から順に割り当てる。
+    """
     # JSON配列をパース
     result_list = parse_json_response(response)
 
     if isinstance(result_list, dict):
         result_list = [result_list]
+    if not isinstance(result_list, list):
+        result_list = []
 
     # スキーマバリデーション（parse直後・各シーン）
     for _bi, _br in enumerate(result_list):
@@ -10126,19 +10461,54 @@ JSON配列のみ出力。""")
         if isinstance(result, dict) and result.get("sd_prompt"):
             result["sd_prompt"] = deduplicate_sd_tags(result["sd_prompt"])
 
-    while len(result_list) < len(scenes):
-        missing_scene = scenes[len(result_list)]
-        result_list.append({
-            "scene_id": missing_scene.get("scene_id", len(result_list) + 1),
-            "title": "生成不足",
-            "mood": "一般",
-            "bubbles": [],
-            "onomatopoeia": [],
-            "direction": "バッチ生成で不足",
-            "sd_prompt": ""
-        })
+    ids = [s.get("scene_id") for s in scenes]
+    matched = [None] * len(scenes)
+    unmatched = []
+    for result in result_list:
+        if not isinstance(result, dict):
+            continue
+        sid = result.get("scene_id")
+        if sid in ids and matched[ids.index(sid)] is None:
+            matched[ids.index(sid)] = result
+        else:
+            unmatched.append(result)
+    for pos in range(len(scenes)):
+        if matched[pos] is None and unmatched:
+            matched[pos] = unmatched.pop(0)
+            if ids[pos] is not None:
+                matched[pos]["scene_id"] = ids[pos]
+    return matched
 
-    return result_list[:len(scenes)]
+
+async def agenerate_scene_batch(
+    client: anthropic.Anthropic,
+    context: dict,
+    scenes: list,
+    jailbreak: str,
+    cost_tracker: CostTracker,
+    theme: str = "",
+    char_profiles: list = None,
+    callback: Optional[Callable] = None,
+    story_so_far: str = "",
+    male_description: str = "",
+    faceless_male: bool = True,
+    outline_roadmap: str = "",
+) -> list:
+    """generate_scene_batch() の非同期版（返らなかったシーンは None のまま返す）"""
+    req = await asyncio.to_thread(
+        generate_scene_batch,
+        client, context, scenes, jailbreak, cost_tracker,
+        theme=theme, char_profiles=char_profiles, callback=callback,
+        story_so_far=story_so_far, male_description=male_description,
+        faceless_male=faceless_male, outline_roadmap=outline_roadmap, _return_prompt_only=True,
+    )
+    response = await _acall_api(
+        client, req["model"],
+        req["system"],
+        req["user"], cost_tracker, req["max_tokens"], callback,
+        json_schema=req["json_schema"],
+    )
+    return _finish_scene_batch(response, scenes)
 
 
 def _generate_outline_chunk(
@@ -10157,107 +10527,82 @@ def _generate_outline_chunk(
     cost_tracker: CostTracker,
     callback: Optional[Callable] = None,
     extra_instructions: str = "",
+    digest: Optional[OutlineDigest] = None,
 ) -> list:
-    """アウトラインを10シーンずつチャンク生成（常にフル12フィールド形式）"""
-
-    # 前チャンクの要約を構築（スライディングウィンドウ: 直近20件+古い分は1行要約）
-    prev_summary = ""
-    # v8.2根本修正: 完了済みアクション一覧を構築（重複防止の要）
-    _completed_actions = ""
-    if previous_scenes:
-        prev_lines = []
-        n_prev = len(previous_scenes)
-
-        # 完了済みアクション・行為の一覧（全シーンから抽出）
-        _action_set = set()
-        for s in previous_scenes:
-            sit = s.get("situation", "")[:40]
-            if sit:
-                _action_set.add(sit)
-            ttl = s.get("title", "")
-            if ttl:
-                _action_set.add(ttl)
-        # v8.5: 体位/行為キーワード抽出（直近チャンクからの繰り返し防止）
-        _POSITION_KEYWORDS = [
-            "騎乗位", "正常位", "バック", "立ちバック", "対面座位", "駅弁",
-            "四つん這い", "寝バック", "側位", "松葉崩し", "背面座位",
-            "膝立ち", "立位", "仰向け", "うつ伏せ", "跨が",
-            "フェラ", "パイズリ", "手コキ", "クンニ", "69", "素股",
-            "挿入", "中出し", "顔射", "口内射精", "二穴",
-        ]
-        _used_positions = set()
-        for s in previous_scenes[-10:]:  # 直近10シーンから抽出
-            sit = s.get("situation", "")
-            for kw in _POSITION_KEYWORDS:
-                if kw in sit:
-                    _used_positions.add(kw)
-        _position_warning = ""
-        if _used_positions:
-            _pos_list = sorted(_used_positions)
-            _position_warning = (
-                f"\n## ⚠️ 直近チャンクで使用済みの体位/行為（繰り返し厳禁）\n"
-                f"🔁 {', '.join(_pos_list)}\n"
-                f"**上記の体位/行為は直近で使用済み。必ず異なる体位/行為で新しい展開にすること。**\n"
-            )
+    """アウトラインを10シーンずつチャンク生成（常にフル12フィールド形式）
 
-        if _action_set:
-            _action_list = sorted(_action_set)[:30]  # 最大30件（トークン制限）
-            _completed_actions = (
-                "\n## ⚠️ 完了済みアクション（以下は既に描写済み。絶対に繰り返すな）\n"
-                + "\n".join(f"❌ {a}" for a in _action_list)
-                + "\n**上記と同一・類似のsituationやtitleは使用禁止。必ず新しい展開を書け。**\n"
-            )
-        # _action_setが空でも体位警告は有効
-        _completed_actions += _position_warning
-
-        # 古いシーン（20件より前）: 1行要約でトークン節約
-        if n_prev > 20:
-            prev_lines.append(f"（シーン1〜{n_prev - 20}: {n_prev - 20}シーン確定済み、省略）")
-            # 最後の5シーンの要約だけ残す（古い分の雰囲気を伝える）
-            old_start = max(0, n_prev - 30)
-            old_end = n_prev - 20
-            for s in previous_scenes[old_start:old_end]:
-                sid = s.get("scene_id", "?")
-                title = s.get("title", "")[:15]
-                intensity = s.get("intensity", 3)
-                prev_lines.append(f"[{sid}] {title} (i={intensity})")
-
-        # 直近20件: フル要約
-        recent_start = max(0, n_prev - 20)
-        for s in previous_scenes[recent_start:]:
-            sid = s.get("scene_id", "?")
-            title = s.get("title", "")[:20]
-            intensity = s.get("intensity", 3)
-            situation = s.get("situation", "")[:60]
-            loc = s.get("location", "")[:15]
-            ea = s.get("emotional_arc", {})
-            emo = f'{ea.get("start", "")}→{ea.get("end", "")}' if isinstance(ea, dict) else ""
-            prev_lines.append(f"[{sid}] {title} (i={intensity}, {loc}) {situation} ({emo})")
-        prev_summary = f"""## 確定済みシーン（これに続けて書くこと。重複禁止）
-{chr(10).join(prev_lines)}
-{_completed_actions}"""
+    digest: 確定済みシーンのダイジェスト（generate_outline がチャンクごとに更新して渡す）。
+    省略時は previous_scenes から作る
+    """
 
+    # 確定済みシーンの文脈（幕ごとの要約 + 直近シーン + 使用済みパターン。スクリプト長に依らずほぼ一定）
+    if digest is None:
+        digest = OutlineDigest.from_scenes(previous_scenes)
+    system, chunk_prompt = _outline_chunk_prompt(
+        chunk_size, chunk_offset, total_scenes, theme_name, story_arc, key_emotions,
+        elements_str, synopsis, char_names, act_info, digest.render(), extra_instructions,
+    )
     start_id = chunk_offset + 1
     end_id = chunk_offset + chunk_size
 
-    output_format = (
-        "## 出力形式（JSON配列）\n"
-        f"シーン{start_id}〜{end_id}の{chunk_size}シーンをJSON配列で出力：\n"
-        "{\n"
-        f'    "scene_id": {start_id}〜{end_id}の番号,\n'
-        '    "title": "シーンタイトル",\n'
-        '    "goal": "このシーンの目的",\n'
-        '    "location": "場所",\n'
-        '    "time": "時間帯",\n'
-        '    "situation": "このシーンで何が起きるか（具体的な状況）",\n'
-        '    "story_flow": "前シーンからの繋がりと次シーンへの橋渡し",\n'
-        '    "emotional_arc": {"start": "シーン冒頭の感情", "end": "シーン終わりの感情"},\n'
-        '    "beats": ["展開ビート1", "展開ビート2", "展開ビート3"],\n'
-        '    "intensity": 1から5の数値,\n'
-        '    "erotic_level": "none/light/medium/heavy/climax",\n'
-        '    "viewer_hook": "視聴者を引き付けるポイント"\n'
-        "}\n\n"
-        f"⚠️ 必ず{chunk_size}シーン（ID {start_id}〜{end_id}）全て出力すること。"
+    if callback:
+        callback(f"[INFO]アウトラインチャンク生成: シーン{start_id}〜{end_id}")
+
+    response = _call_api(
+        client, MODELS["haiku"], system,
+        chunk_prompt, cost_tracker, min(8192, chunk_size * 400), callback,
+        routing_hint="cloud",
+        cache=True, cache_validate=_is_parseable_json,
+        json_schema=OUTLINE_JSON_SCHEMA,
+    )
+
+    chunk = parse_json_response(response)
+    if not isinstance(chunk, list):
+        chunk = [chunk] if isinstance(chunk, dict) else []
+
+    # scene_idを正しいオフセットに修正
+    for i, scene in enumerate(chunk):
+        scene["scene_id"] = chunk_offset + i + 1
+
+    return chunk
+
+
+def _outline_chunk_prompt(
+    chunk_size: int,
+    chunk_offset: int,
+    total_scenes: int,
+    theme_name: str,
+    story_arc: str,
+    key_emotions: list,
+    elements_str: str,
+    synopsis: str,
+    char_names: list,
+    act_info: str,
+    prev_summary: str,
+    extra_instructions: str = "",
+) -> tuple:
+    """アウトラインチャンクの (systemプロンプト, userプロンプト) を構築"""
+    start_id = chunk_offset + 1
+    end_id = chunk_offset + chunk_size
+
+    output_format = (
+        "## 出力形式（JSON配列）\n"
+        f"シーン{start_id}〜{end_id}の{chunk_size}シーンをJSON配列で出力：\n"
+        "{\n"
+        f'    "scene_id": {start_id}〜{end_id}の番号,\n'
+        '    "title": "シーンタイトル",\n'
+        '    "goal": "このシーンの目的",\n'
+        '    "location": "場所",\n'
+        '    "time": "時間帯",\n'
+        '    "situation": "このシーンで何が起きるか（具体的な状況）",\n'
+        '    "story_flow": "前シーンからの繋がりと次シーンへの橋渡し",\n'
+        '    "emotional_arc": {"start": "シーン冒頭の感情", "end": "シーン終わりの感情"},\n'
+        '    "beats": ["展開ビート1", "展開ビート2", "展開ビート3"],\n'
+        '    "intensity": 1から5の数値,\n'
+        '    "erotic_level": "none/light/medium/heavy/climax",\n'
+        '    "viewer_hook": "視聴者を引き付けるポイント"\n'
+        "}\n\n"
+        f"⚠️ 必ず{chunk_size}シーン（ID {start_id}〜{end_id}）全て出力すること。"
     )
 
     chunk_prompt = f"""{prev_summary}以下のストーリーあらすじに基づき、シーン{start_id}〜{end_id}（{chunk_size}シーン分）を生成してください。
@@ -10313,26 +10658,8 @@ def _generate_outline_chunk(
 - 「呼び出し」「始まり」「出会い」等の導入表現は使わないこと
 ''' if end_id >= total_scenes else ''}
 JSON配列のみ出力。\"\"\""""
-
-    if callback:
-        callback(f"[INFO]アウトラインチャンク生成: シーン{start_id}〜{end_id}")
-
-    response = _call_api(
-        client, MODELS["haiku"],
-        f"FANZA同人CG集の脚本プランナーです。全{total_scenes}シーンのうちシーン{start_id}〜{end_id}の詳細設計をJSON配列で出力します。",
-        chunk_prompt, cost_tracker, min(8192, chunk_size * 400), callback,
-        routing_hint="cloud",
-    )
-
-    chunk = parse_json_response(response)
-    if not isinstance(chunk, list):
-        chunk = [chunk] if isinstance(chunk, dict) else []
-
-    # scene_idを正しいオフセットに修正
-    for i, scene in enumerate(chunk):
-        scene["scene_id"] = chunk_offset + i + 1
-
-    return chunk
+    system = f"FANZA同人CG集の脚本プランナーです。全{total_scenes}シーンのうちシーン{start_id}〜{end_id}の詳細設計をJSON配列で出力します。"
+    return system, chunk_prompt
 
 
 def _get_intensity_curve_instruction(theme_guide: dict) -> str:
@@ -10385,6 +10712,410 @@ def _get_intensity_curve_instruction(theme_guide: dict) -> str:
     )
 
 
+EROTIC_LEVEL_BY_INTENSITY = {1: "none", 2: "light", 3: "medium", 4: "heavy", 5: "climax"}
+
+
+def _normalize_outline(
+    outline: list,
+    num_scenes: int,
+    act1: int,
+    act2: int,
+    act3: int,
+    act4: int,
+    log: Callable[[str], None] = log_message,
+):
+    """アウトラインの必須フィールド補完とintensity分布の自動修正（outlineを直接更新）
+
+    チャンク生成の途中経過（暫定アウトライン）にも使うため、シーン数の不足補完は行わない。
+    log: 修正内容の出力先（暫定正規化では抑制する）
+    """
+    # スキーマバリデーション（setdefault補完前に実行して欠落を検出）
+    _outline_val = validate_outline(outline, num_scenes)
+    if not _outline_val["valid"]:
+        for _oe in _outline_val["errors"]:
+            log(f"  [SCHEMA] outline(parse直後): {_oe}")
+
+    # 必須フィールドの補完
+    for i, scene in enumerate(outline):
+        scene.setdefault("scene_id", i + 1)
+        scene.setdefault("title", f"シーン{i+1}")
+        scene.setdefault("goal", "")
+        scene.setdefault("location", "室内")
+        scene.setdefault("time", "")
+        scene.setdefault("situation", "")
+        scene.setdefault("story_flow", "")
+        scene.setdefault("emotional_arc", {"start": "", "end": ""})
+        scene.setdefault("beats", [])
+        scene.setdefault("intensity", 3)
+        scene.setdefault("erotic_level", "medium")
+        scene.setdefault("viewer_hook", "")
+
+    # intensity分布の自動修正
+    _n_scenes = len(outline)
+    _max_i5 = max(2, _n_scenes // 15)  # 15シーンにつき1回のi=5ピーク
+
+    # 1. intensity 5の上限制御（mini-arc分散）
+    intensity_5_count = sum(1 for s in outline if s.get("intensity", 3) == 5)
+    if intensity_5_count > _max_i5:
+        five_indices = [i for i, s in enumerate(outline) if s.get("intensity", 3) == 5]
+        # 均等分散: mini-arcごとに1つのi=5を残す
+        _spacing = max(1, len(five_indices) // _max_i5)
+        keep_five = set(five_indices[i] for i in range(0, len(five_indices), _spacing))
+        # 最後のi=5は必ず残す
+        keep_five.add(five_indices[-1])
+        if len(five_indices) >= 2:
+            keep_five.add(five_indices[-2])
+        # _max_i5個に制限
+        keep_five = sorted(keep_five)[-_max_i5:]
+        for i in five_indices:
+            if i not in keep_five:
+                outline[i]["intensity"] = 4
+        log(f"intensity 5を{intensity_5_count}→{len(keep_five)}シーンに自動修正（{_max_i5}上限）")
+
+    # 2. intensity 5が不足時の自動挿入（50シーン以上で不足なら追加）
+    # v8.9: nearbyチェック改善（近接i=5がある場合は±5-8シーンずらして挿入）
+    if _n_scenes >= 50:
+        _current_i5 = sum(1 for s in outline if s.get("intensity", 3) == 5)
+        if _current_i5 < _max_i5:
+            _act3_start = act1 + act2
+            _act3_end = _act3_start + act3
+            _need_i5 = _max_i5 - _current_i5
+            _arc_size = act3 // _max_i5 if _max_i5 > 0 else act3
+            _existing_5_positions = {i for i, s in enumerate(outline) if s.get("intensity", 3) == 5}
+            for arc_idx in range(_max_i5):
+                if _need_i5 <= 0:
+                    break
+                peak_pos = _act3_start + (arc_idx + 1) * _arc_size - 1
+                peak_pos = min(peak_pos, _act3_end - 1)
+                if peak_pos >= len(outline) or outline[peak_pos].get("intensity", 3) == 5:
+                    continue
+                # 近接チェック: ±5シーン以内にi=5があれば位置をずらす
+                _nearby_5 = any(abs(peak_pos - p) <= 5 for p in _existing_5_positions)
+                if _nearby_5:
+                    # ±6-10シーンの範囲で空きスロットを探す
+                    _found_alt = False
+                    for _offset in [6, -6, 7, -7, 8, -8, 9, -9, 10, -10]:
+                        alt_pos = peak_pos + _offset
+                        if (_act3_start <= alt_pos < _act3_end and
+                            alt_pos < len(outline) and
+                            outline[alt_pos].get("intensity", 3) != 5 and
+                            not any(abs(alt_pos - p) <= 5 for p in _existing_5_positions)):
+                            peak_pos = alt_pos
+                            _found_alt = True
+                            break
+                    if not _found_alt:
+                        continue  # どうしても挿入できない場合はスキップ
+                # ピーク前のシーンをi=4にランプアップ（3→5飛躍防止）
+                if peak_pos > 0 and outline[peak_pos - 1].get("intensity", 3) < 4:
+                    outline[peak_pos - 1]["intensity"] = 4
+                outline[peak_pos]["intensity"] = 5
+                _existing_5_positions.add(peak_pos)
+                _need_i5 -= 1
+                log(f"シーン{peak_pos+1}: mini-arcクライマックスとしてi=5挿入")
+
+    # 3. intensity 1→3以上の飛躍を修正
+    for i in range(1, len(outline)):
+        prev_intensity = outline[i-1].get("intensity", 3)
+        curr_intensity = outline[i].get("intensity", 3)
+        if prev_intensity == 1 and curr_intensity >= 3:
+            outline[i]["intensity"] = 2
+            log(f"シーン{i+1}: intensity {curr_intensity}→2に修正（1→3以上の飛躍防止）")
+
+    # 4. intensity 2段階以上の上昇飛躍を修正（2→4, 2→5, 3→5 等）
+    # v8.2根本修正: i=5ピークを保護（3→5の場合は前のシーンを4にランプアップ）
+    for i in range(1, len(outline)):
+        prev_intensity = outline[i-1].get("intensity", 3)
+        curr_intensity = outline[i].get("intensity", 3)
+        if curr_intensity - prev_intensity >= 2:
+            if curr_intensity == 5 and prev_intensity >= 3:
+                # i=5ピーク保護: ピークを維持し、前のシーンをランプアップ
+                outline[i-1]["intensity"] = 4
+                log(f"シーン{i}: intensity {prev_intensity}→4にランプアップ（i=5ピーク保護）")
+            else:
+                fixed = prev_intensity + 1
+                outline[i]["intensity"] = fixed
+                log(f"シーン{i+1}: intensity {curr_intensity}→{fixed}に修正（{prev_intensity}→{curr_intensity}の上昇飛躍防止）")
+
+    # 5. intensity 3段階以上の下降ジャンプを修正（5→2, 5→1, 4→1 等）
+    for i in range(1, len(outline)):
+        prev_intensity = outline[i-1].get("intensity", 3)
+        curr_intensity = outline[i].get("intensity", 3)
+        if prev_intensity - curr_intensity >= 3:
+            fixed = prev_intensity - 2
+            outline[i]["intensity"] = fixed
+            log(f"シーン{i+1}: intensity {curr_intensity}→{fixed}に修正（{prev_intensity}→{curr_intensity}の急降下防止）")
+
+    # 6. consecutive i=4上限: 4-6シーン連続でi=3ブレイクを強制挿入
+    # v8.9: 固定5→ランダム4-6に変更（機械的6シーンパターン防止）
+    import random as _rng
+    _consecutive_4 = 0
+    _break_count = 0
+    _i4_break_limit = _rng.randint(4, 6)  # 初回のブレイク閾値
+    for i, s in enumerate(outline):
+        if s.get("intensity", 3) == 4:
+            _consecutive_4 += 1
+            if _consecutive_4 > _i4_break_limit:
+                # i=5ピーク直前にブレイクを入れると、Step8aでピークが潰されるため回避
+                _next_is_peak = (i + 1 < len(outline) and outline[i + 1].get("intensity", 3) == 5)
+                if _next_is_peak:
+                    if i > 0 and outline[i - 1].get("intensity", 3) == 4:
+                        outline[i - 1]["intensity"] = 3
+                        _consecutive_4 = 1
+                        _break_count += 1
+                else:
+                    s["intensity"] = 3
+                    _consecutive_4 = 0
+                    _break_count += 1
+                _i4_break_limit = _rng.randint(4, 6)  # 次のブレイク閾値をランダム再設定
+        else:
+            _consecutive_4 = 0
+    if _break_count > 0:
+        log(f"i=4連続上限(4-6ランダム): {_break_count}箇所にi=3ブレイク挿入")
+
+    # 6b. consecutive i≤2上限: act1+1を超えたら強制i=3化（導入肥大化防止）
+    # v8.9: 上限をact1+1に動的設定（100シーンact1=5→上限6、20シーンact1=2→上限3）
+    _max_consecutive_low = min(act1 + 1, 6)  # 最大でも6シーン連続まで
+    _consecutive_low = 0
+    _low_break_count = 0
+    for i, s in enumerate(outline):
+        if s.get("intensity", 3) <= 2:
+            _consecutive_low += 1
+            if _consecutive_low > _max_consecutive_low:
+                s["intensity"] = 3
+                _consecutive_low = 0
+                _low_break_count += 1
+        else:
+            _consecutive_low = 0
+    if _low_break_count > 0:
+        log(f"i≤2連続上限{_max_consecutive_low}: {_low_break_count}箇所にi=3挿入（導入肥大化防止）")
+
+    # 6b2. i≤2の総数上限: act1+2を超えたらact1近辺のi≤2を順次i=3に昇格
+    _total_low = sum(1 for s in outline if s.get("intensity", 3) <= 2)
+    _max_total_low = act1 + 2  # act1=5なら最大7シーンまで
+    if _total_low > _max_total_low:
+        _low_indices = [i for i, s in enumerate(outline) if s.get("intensity", 3) <= 2]
+        _excess = _total_low - _max_total_low
+        # 後方（act1境界付近）のi≤2から昇格
+        for idx in reversed(_low_indices):
+            if _excess <= 0:
+                break
+            outline[idx]["intensity"] = 3
+            _excess -= 1
+        log(f"i≤2総数上限{_max_total_low}: {_total_low}→{_max_total_low}に削減")
+
+    # 6c. i=4の総数上限制御（40%超の場合、超過分をact境界に基づいて再割当）
+    # v8.9: act境界ベースに改善（位置ratioの穴を解消）
+    _i4_count = sum(1 for s in outline if s.get("intensity", 3) == 4)
+    _i4_ratio = _i4_count / max(_n_scenes, 1)
+    if _i4_ratio > 0.40:
+        _i4_target = int(_n_scenes * 0.40)
+        _i4_excess = _i4_count - _i4_target
+        _i4_indices = [i for i, s in enumerate(outline) if s.get("intensity", 3) == 4]
+        _current_i5_6c = sum(1 for s in outline if s.get("intensity", 3) == 5)
+        _act3_start_6c = act1 + act2
+        _act3_end_6c = _act3_start_6c + act3
+        _rebalance_count = 0
+        for idx_6c in _i4_indices:
+            if _rebalance_count >= _i4_excess:
+                break
+            if idx_6c < act1:
+                # Act1（導入） → i=2に降格
+                outline[idx_6c]["intensity"] = 2
+                _rebalance_count += 1
+            elif idx_6c < _act3_start_6c:
+                # Act2（前戯） → i=3に降格
+                outline[idx_6c]["intensity"] = 3
+                _rebalance_count += 1
+            elif idx_6c >= _act3_end_6c:
+                # Act4（エピローグ） → i=3に降格
+                outline[idx_6c]["intensity"] = 3
+                _rebalance_count += 1
+            elif _current_i5_6c < _max_i5:
+                # Act3内でi=5が不足なら昇格を試行
+                _near_5_6c = any(
+                    outline[j].get("intensity", 3) == 5
+                    for j in range(max(0, idx_6c - 5), min(len(outline), idx_6c + 6))
+                )
+                if not _near_5_6c:
+                    outline[idx_6c]["intensity"] = 5
+                    _current_i5_6c += 1
+                    _rebalance_count += 1
+                    if idx_6c > 0 and outline[idx_6c - 1].get("intensity", 3) < 4:
+                        outline[idx_6c - 1]["intensity"] = 4
+                else:
+                    # i=5近接でも、Act3前半なら i=3に降格（ブレイク追加）
+                    _act3_progress = (idx_6c - _act3_start_6c) / max(act3, 1)
+                    if _act3_progress < 0.3:
+                        outline[idx_6c]["intensity"] = 3
+                        _rebalance_count += 1
+        if _rebalance_count > 0:
+            log(f"i=4上限40%制御: {_i4_count}→{_i4_count - _rebalance_count}シーンに再割当（{_rebalance_count}件変更）")
+
+    # 7. エピローグのストーリーリセット防止: 最終act4がi=2以下にならないよう制限
+    if _n_scenes >= 20:
+        _epilogue_start = act1 + act2 + act3
+        for i in range(_epilogue_start, len(outline)):
+            curr_i = outline[i].get("intensity", 3)
+            if curr_i <= 2:
+                outline[i]["intensity"] = 3
+                log(f"シーン{i+1}: エピローグi={curr_i}→3に修正（余韻リセット防止）")
+
+    # 8. 最終スムージング: step6/7が生成した飛躍を修正し、制約を再適用
+    _epilogue_start_8 = (act1 + act2 + act3) if _n_scenes >= 20 else len(outline)
+    for _pass in range(3):  # 最大3パスで収束
+        _smooth_count = 0
+        # 8a. 飛躍修正（前方パス）- i=5ピークは保護
+        for i in range(1, len(outline)):
+            prev_i = outline[i-1].get("intensity", 3)
+            curr_i = outline[i].get("intensity", 3)
+            if curr_i - prev_i >= 2:
+                if curr_i == 5 and prev_i >= 3:
+                    # i=5ピーク保護: ピークを下げるのではなく前のシーンをランプアップ
+                    outline[i-1]["intensity"] = 4
+                    _smooth_count += 1
+                else:
+                    outline[i]["intensity"] = prev_i + 1
+                    _smooth_count += 1
+            elif prev_i - curr_i >= 3:
+                outline[i]["intensity"] = prev_i - 2
+                _smooth_count += 1
+        # 8b. consecutive i=4上限の再適用（i=5ピーク直前保護付き）
+        _consecutive_4_8 = 0
+        for i, s in enumerate(outline):
+            if s.get("intensity", 3) == 4:
+                _consecutive_4_8 += 1
+                if _consecutive_4_8 > _i4_break_limit:  # v8.9: Step 6bと同じランダム閾値
+                    _next_is_peak = (i + 1 < len(outline) and outline[i + 1].get("intensity", 3) == 5)
+                    if _next_is_peak:
+                        if i > 0 and outline[i - 1].get("intensity", 3) == 4:
+                            outline[i - 1]["intensity"] = 3
+                            _consecutive_4_8 = 1
+                            _smooth_count += 1
+                    else:
+                        s["intensity"] = 3
+                        _consecutive_4_8 = 0
+                        _smooth_count += 1
+            else:
+                _consecutive_4_8 = 0
+        # 8b2. consecutive i≤2上限の再適用（v8.9: 動的上限）
+        _consecutive_low_8 = 0
+        for i, s in enumerate(outline):
+            if s.get("intensity", 3) <= 2:
+                _consecutive_low_8 += 1
+                if _consecutive_low_8 > _max_consecutive_low:
+                    s["intensity"] = 3
+                    _consecutive_low_8 = 0
+                    _smooth_count += 1
+            else:
+                _consecutive_low_8 = 0
+        # 8c. エピローグi<=2防止の再適用（境界の飛躍も修正）
+        for i in range(_epilogue_start_8, len(outline)):
+            if outline[i].get("intensity", 3) <= 2:
+                outline[i]["intensity"] = 3
+                _smooth_count += 1
+        # エピローグ境界: 直前シーンがi<=1だとi=3へ+2飛躍になるので直前をi=2に引き上げ
+        if _epilogue_start_8 > 0 and _epilogue_start_8 < len(outline):
+            _pre_epi = outline[_epilogue_start_8 - 1].get("intensity", 3)
+            if _pre_epi < 2:
+                outline[_epilogue_start_8 - 1]["intensity"] = 2
+                _smooth_count += 1
+        if _smooth_count == 0:
+            break
+    if _pass > 0:
+        if _smooth_count == 0:
+            log(f"最終スムージング: {_pass + 1}パスで収束")
+        else:
+            log(f"最終スムージング: 3パスで未収束（残り{_smooth_count}箇所）")
+
+    # 9. v8.9: Act間エスカレーション検証（Act3がAct2以下ならブースト）
+    if _n_scenes >= 30:
+        _act_ranges = [
+            (0, act1),
+            (act1, act1 + act2),
+            (act1 + act2, act1 + act2 + act3),
+            (act1 + act2 + act3, len(outline)),
+        ]
+        _act_avgs = []
+        for _start, _end in _act_ranges:
+            _end = min(_end, len(outline))
+            _count = _end - _start
+            if _count > 0:
+                _avg = sum(outline[i].get("intensity", 3) for i in range(_start, _end)) / _count
+            else:
+                _avg = 3.0
+            _act_avgs.append(_avg)
+
+        # Act3 avg がAct2 avg以下ならAct3をブースト
+        if len(_act_avgs) >= 3 and _act_avgs[2] <= _act_avgs[1] + 0.2:
+            _boost_count = 0
+            _act3_s = act1 + act2
+            _act3_e = min(act1 + act2 + act3, len(outline))
+            for i in range(_act3_s, _act3_e):
+                if outline[i].get("intensity", 3) == 3:
+                    outline[i]["intensity"] = 4
+                    _boost_count += 1
+                    if _boost_count >= max(2, act3 // 10):
+                        break
+            if _boost_count > 0:
+                log(f"Act間エスカレーション: Act3 avg {_act_avgs[2]:.2f}≤Act2 avg {_act_avgs[1]:.2f} → {_boost_count}シーンをi=3→4にブースト")
+
+        # Act4 avg がAct3 avg以上ならAct4を抑制
+        if len(_act_avgs) >= 4 and _act_avgs[3] >= _act_avgs[2]:
+            _act4_s = act1 + act2 + act3
+            _depress_count = 0
+            for i in range(_act4_s, len(outline)):
+                if outline[i].get("intensity", 3) == 4:
+                    outline[i]["intensity"] = 3
+                    _depress_count += 1
+                    if _depress_count >= max(1, act4 // 3):
+                        break
+            if _depress_count > 0:
+                log(f"Act間エスカレーション: Act4 avg {_act_avgs[3]:.2f}≥Act3 → {_depress_count}シーンをi=4→3に抑制")
+
+    # erotic_levelとintensityの整合性を修正
+    for scene in outline:
+        scene["erotic_level"] = EROTIC_LEVEL_BY_INTENSITY.get(scene.get("intensity", 3), "medium")
+
+    # タイトル重複修正（アウトライン段階で検出・修正）
+    _seen_titles_ol = set()
+    _title_fix_ol = 0
+    for s in outline:
+        t = s.get("title", "")
+        if t in _seen_titles_ol:
+            sid = s.get("scene_id", "?")
+            sit = s.get("situation", "")[:20]
+            loc = s.get("location", "")
+            new_title = f"{loc}での{sit}" if loc and sit else f"シーン{sid}"
+            if new_title in _seen_titles_ol:
+                new_title = f"{new_title}({sid})"
+            s["title"] = new_title
+            _title_fix_ol += 1
+            log(f"アウトラインtitle重複修正: S{sid}「{t}」→「{new_title}」")
+        _seen_titles_ol.add(s.get("title", ""))
+    if _title_fix_ol > 0:
+        log(f"アウトラインtitle重複修正: {_title_fix_ol}件")
+
+    # situation連続類似検出・警告（3連続で同一キーワードパターン）
+    _SITUATION_KW_OL = ["膣奥", "突かれ", "責められ", "腰を振", "ピストン",
+                        "挿入", "犯され", "抱かれ", "押し倒", "襲われ",
+                        "口内", "フェラ", "パイズリ", "騎乗", "バック",
+                        "正常位", "四つん這い", "膝立ち", "指で"]
+    _sit_kw_list = []
+    for s in outline:
+        sit = s.get("situation", "")
+        kws = frozenset(kw for kw in _SITUATION_KW_OL if kw in sit)
+        _sit_kw_list.append(kws)
+    _consec_same_ol = 0
+    for idx in range(2, len(outline)):
+        if (_sit_kw_list[idx] and
+            _sit_kw_list[idx] == _sit_kw_list[idx - 1] == _sit_kw_list[idx - 2]):
+            _consec_same_ol += 1
+            sid = outline[idx].get("scene_id", idx + 1)
+            log(f"⚠️ アウトライン: S{sid-2}〜S{sid} situationキーワード同一（{_sit_kw_list[idx]}）")
+    if _consec_same_ol > 0:
+        log(f"⚠️ アウトライン: {_consec_same_ol}箇所でsituation連続類似検出")
+
+
 def generate_outline(
     client: anthropic.Anthropic,
     context: dict,
@@ -10396,8 +11127,13 @@ def generate_outline(
     story_structure: dict = None,
     male_description: str = "",
     faceless_male: bool = True,
+    on_chunk: Optional[Callable[[list], None]] = None,
 ) -> list:
-    """あらすじをシーン分割してアウトライン生成（Haiku API 1回）"""
+    """あらすじをシーン分割してアウトライン生成（Haiku API 1回）
+
+    on_chunk: 13シーン以上のチャンク生成時、最後以外のチャンクが完了するたびに
+    それまでのシーンを暫定正規化したコピーで呼ぶ（シーン生成をアウトライン完成前に始めるため）
+    """
     theme_guide = THEME_GUIDES.get(theme, THEME_GUIDES.get("vanilla", {}))
     theme_name = theme_guide.get("name", "指定なし")
     story_arc = theme_guide.get("story_arc", "導入→展開→本番→余韻")
@@ -10625,6 +11361,8 @@ JSON配列のみ出力。"""
                 f"FANZA同人CG集の脚本プランナーです。ストーリーあらすじを忠実に{num_scenes}シーンに分割し、各シーンの詳細設計をJSON配列で出力します。",
                 prompt, cost_tracker, outline_max_tokens, callback,
                 routing_hint="cloud",
+                cache=True, cache_validate=_is_parseable_json,
+                json_schema=OUTLINE_JSON_SCHEMA,
             )
             outline = parse_json_response(response)
             if not isinstance(outline, list) or len(outline) == 0:
@@ -10656,6 +11394,13 @@ JSON配列のみ出力。"""
 - 第2ラウンドは第1ラウンドと異なるアプローチにせよ（例: 第1が受動的→第2は能動的/堕ち、第1が恐怖→第2は快楽依存）
 - 確定済みシーンのsituation/title一覧を確認し、同じ表現・キーワードの3回以上使用を避けよ
 """
+            # 確定済みシーンはダイジェストで渡す（チャンクのプロンプトがシーン数に比例して伸びないように）
+            _digest = OutlineDigest(acts=[
+                ("第1幕・導入", 0, act1),
+                ("第2幕・前戯", act1, act1 + act2),
+                ("第3幕・本番", act1 + act2, act1 + act2 + act3),
+                ("第4幕・余韻", act1 + act2 + act3, num_scenes),
+            ])
             for offset in range(0, num_scenes, chunk_size):
                 this_chunk = min(chunk_size, num_scenes - offset)
                 log_message(f"チャンクアウトライン: シーン{offset+1}〜{offset+this_chunk} ({this_chunk}シーン)")
@@ -10666,399 +11411,20 @@ JSON配列のみ出力。"""
                     outline,  # 確定済みシーンを渡す
                     cost_tracker, callback,
                     extra_instructions=_chunk_extra_instructions,
+                    digest=_digest,
                 )
                 outline.extend(chunk)
+                _digest.extend(chunk)
                 log_message(f"チャンク完了: {len(chunk)}シーン取得、合計{len(outline)}シーン")
+                if on_chunk is not None and offset + this_chunk < num_scenes:
+                    _provisional = copy.deepcopy(outline)
+                    _normalize_outline(_provisional, num_scenes, act1, act2, act3, act4, log=lambda _msg: None)
+                    on_chunk(_provisional)
 
             if len(outline) == 0:
                 raise ValueError("Chunk outline generation failed")
 
-        # スキーマバリデーション（setdefault補完前に実行して欠落を検出）
-        _outline_val = validate_outline(outline, num_scenes)
-        if not _outline_val["valid"]:
-            for _oe in _outline_val["errors"]:
-                log_message(f"  [SCHEMA] outline(parse直後): {_oe}")
-
-        # 必須フィールドの補完
-        for i, scene in enumerate(outline):
-            scene.setdefault("scene_id", i + 1)
-            scene.setdefault("title", f"シーン{i+1}")
-            scene.setdefault("goal", "")
-            scene.setdefault("location", "室内")
-            scene.setdefault("time", "")
-            scene.setdefault("situation", "")
-            scene.setdefault("story_flow", "")
-            scene.setdefault("emotional_arc", {"start": "", "end": ""})
-            scene.setdefault("beats", [])
-            scene.setdefault("intensity", 3)
-            scene.setdefault("erotic_level", "medium")
-            scene.setdefault("viewer_hook", "")
-
-        # intensity分布の自動修正
-        _n_scenes = len(outline)
-        _max_i5 = max(2, _n_scenes // 15)  # 15シーンにつき1回のi=5ピーク
-
-        # 1. intensity 5の上限制御（mini-arc分散）
-        intensity_5_count = sum(1 for s in outline if s.get("intensity", 3) == 5)
-        if intensity_5_count > _max_i5:
-            five_indices = [i for i, s in enumerate(outline) if s.get("intensity", 3) == 5]
-            # 均等分散: mini-arcごとに1つのi=5を残す
-            _spacing = max(1, len(five_indices) // _max_i5)
-            keep_five = set(five_indices[i] for i in range(0, len(five_indices), _spacing))
-            # 最後のi=5は必ず残す
-            keep_five.add(five_indices[-1])
-            if len(five_indices) >= 2:
-                keep_five.add(five_indices[-2])
-            # _max_i5個に制限
-            keep_five = sorted(keep_five)[-_max_i5:]
-            for i in five_indices:
-                if i not in keep_five:
-                    outline[i]["intensity"] = 4
-            log_message(f"intensity 5を{intensity_5_count}→{len(keep_five)}シーンに自動修正（{_max_i5}上限）")
-
-        # 2. intensity 5が不足時の自動挿入（50シーン以上で不足なら追加）
-        # v8.9: nearbyチェック改善（近接i=5がある場合は±5-8シーンずらして挿入）
-        if _n_scenes >= 50:
-            _current_i5 = sum(1 for s in outline if s.get("intensity", 3) == 5)
-            if _current_i5 < _max_i5:
-                _act3_start = act1 + act2
-                _act3_end = _act3_start + act3
-                _need_i5 = _max_i5 - _current_i5
-                _arc_size = act3 // _max_i5 if _max_i5 > 0 else act3
-                _existing_5_positions = {i for i, s in enumerate(outline) if s.get("intensity", 3) == 5}
-                for arc_idx in range(_max_i5):
-                    if _need_i5 <= 0:
-                        break
-                    peak_pos = _act3_start + (arc_idx + 1) * _arc_size - 1
-                    peak_pos = min(peak_pos, _act3_end - 1)
-                    if peak_pos >= len(outline) or outline[peak_pos].get("intensity", 3) == 5:
-                        continue
-                    # 近接チェック: ±5シーン以内にi=5があれば位置をずらす
-                    _nearby_5 = any(abs(peak_pos - p) <= 5 for p in _existing_5_positions)
-                    if _nearby_5:
-                        # ±6-10シーンの範囲で空きスロットを探す
-                        _found_alt = False
-                        for _offset in [6, -6, 7, -7, 8, -8, 9, -9, 10, -10]:
-                            alt_pos = peak_pos + _offset
-                            if (_act3_start <= alt_pos < _act3_end and
-                                alt_pos < len(outline) and
-                                outline[alt_pos].get("intensity", 3) != 5 and
-                                not any(abs(alt_pos - p) <= 5 for p in _existing_5_positions)):
-                                peak_pos = alt_pos
-                                _found_alt = True
-                                break
-                        if not _found_alt:
-                            continue  # どうしても挿入できない場合はスキップ
-                    # ピーク前のシーンをi=4にランプアップ（3→5飛躍防止）
-                    if peak_pos > 0 and outline[peak_pos - 1].get("intensity", 3) < 4:
-                        outline[peak_pos - 1]["intensity"] = 4
-                    outline[peak_pos]["intensity"] = 5
-                    _existing_5_positions.add(peak_pos)
-                    _need_i5 -= 1
-                    log_message(f"シーン{peak_pos+1}: mini-arcクライマックスとしてi=5挿入")
-
-        # 3. intensity 1→3以上の飛躍を修正
-        for i in range(1, len(outline)):
-            prev_intensity = outline[i-1].get("intensity", 3)
-            curr_intensity = outline[i].get("intensity", 3)
-            if prev_intensity == 1 and curr_intensity >= 3:
-                outline[i]["intensity"] = 2
-                log_message(f"シーン{i+1}: intensity {curr_intensity}→2に修正（1→3以上の飛躍防止）")
-
-        # 4. intensity 2段階以上の上昇飛躍を修正（2→4, 2→5, 3→5 等）
-        # v8.2根本修正: i=5ピークを保護（3→5の場合は前のシーンを4にランプアップ）
-        for i in range(1, len(outline)):
-            prev_intensity = outline[i-1].get("intensity", 3)
-            curr_intensity = outline[i].get("intensity", 3)
-            if curr_intensity - prev_intensity >= 2:
-                if curr_intensity == 5 and prev_intensity >= 3:
-                    # i=5ピーク保護: ピークを維持し、前のシーンをランプアップ
-                    outline[i-1]["intensity"] = 4
-                    log_message(f"シーン{i}: intensity {prev_intensity}→4にランプアップ（i=5ピーク保護）")
-                else:
-                    fixed = prev_intensity + 1
-                    outline[i]["intensity"] = fixed
-                    log_message(f"シーン{i+1}: intensity {curr_intensity}→{fixed}に修正（{prev_intensity}→{curr_intensity}の上昇飛躍防止）")
-
-        # 5. intensity 3段階以上の下降ジャンプを修正（5→2, 5→1, 4→1 等）
-        for i in range(1, len(outline)):
-            prev_intensity = outline[i-1].get("intensity", 3)
-            curr_intensity = outline[i].get("intensity", 3)
-            if prev_intensity - curr_intensity >= 3:
-                fixed = prev_intensity - 2
-                outline[i]["intensity"] = fixed
-                log_message(f"シーン{i+1}: intensity {curr_intensity}→{fixed}に修正（{prev_intensity}→{curr_intensity}の急降下防止）")
-
-        # 6. consecutive i=4上限: 4-6シーン連続でi=3ブレイクを強制挿入
-        # v8.9: 固定5→ランダム4-6に変更（機械的6シーンパターン防止）
-        import random as _rng
-        _consecutive_4 = 0
-        _break_count = 0
-        _i4_break_limit = _rng.randint(4, 6)  # 初回のブレイク閾値
-        for i, s in enumerate(outline):
-            if s.get("intensity", 3) == 4:
-                _consecutive_4 += 1
-                if _consecutive_4 > _i4_break_limit:
-                    # i=5ピーク直前にブレイクを入れると、Step8aでピークが潰されるため回避
-                    _next_is_peak = (i + 1 < len(outline) and outline[i + 1].get("intensity", 3) == 5)
-                    if _next_is_peak:
-                        if i > 0 and outline[i - 1].get("intensity", 3) == 4:
-                            outline[i - 1]["intensity"] = 3
-                            _consecutive_4 = 1
-                            _break_count += 1
-                    else:
-                        s["intensity"] = 3
-                        _consecutive_4 = 0
-                        _break_count += 1
-                    _i4_break_limit = _rng.randint(4, 6)  # 次のブレイク閾値をランダム再設定
-            else:
-                _consecutive_4 = 0
-        if _break_count > 0:
-            log_message(f"i=4連続上限(4-6ランダム): {_break_count}箇所にi=3ブレイク挿入")
-
-        # 6b. consecutive i≤2上限: act1+1を超えたら強制i=3化（導入肥大化防止）
-        # v8.9: 上限をact1+1に動的設定（100シーンact1=5→上限6、20シーンact1=2→上限3）
-        _max_consecutive_low = min(act1 + 1, 6)  # 最大でも6シーン連続まで
-        _consecutive_low = 0
-        _low_break_count = 0
-        for i, s in enumerate(outline):
-            if s.get("intensity", 3) <= 2:
-                _consecutive_low += 1
-                if _consecutive_low > _max_consecutive_low:
-                    s["intensity"] = 3
-                    _consecutive_low = 0
-                    _low_break_count += 1
-            else:
-                _consecutive_low = 0
-        if _low_break_count > 0:
-            log_message(f"i≤2連続上限{_max_consecutive_low}: {_low_break_count}箇所にi=3挿入（導入肥大化防止）")
-
-        # 6b2. i≤2の総数上限: act1+2を超えたらact1近辺のi≤2を順次i=3に昇格
-        _total_low = sum(1 for s in outline if s.get("intensity", 3) <= 2)
-        _max_total_low = act1 + 2  # act1=5なら最大7シーンまで
-        if _total_low > _max_total_low:
-            _low_indices = [i for i, s in enumerate(outline) if s.get("intensity", 3) <= 2]
-            _excess = _total_low - _max_total_low
-            # 後方（act1境界付近）のi≤2から昇格
-            for idx in reversed(_low_indices):
-                if _excess <= 0:
-                    break
-                outline[idx]["intensity"] = 3
-                _excess -= 1
-            log_message(f"i≤2総数上限{_max_total_low}: {_total_low}→{_max_total_low}に削減")
-
-        # 6c. i=4の総数上限制御（40%超の場合、超過分をact境界に基づいて再割当）
-        # v8.9: act境界ベースに改善（位置ratioの穴を解消）
-        _i4_count = sum(1 for s in outline if s.get("intensity", 3) == 4)
-        _i4_ratio = _i4_count / max(_n_scenes, 1)
-        if _i4_ratio > 0.40:
-            _i4_target = int(_n_scenes * 0.40)
-            _i4_excess = _i4_count - _i4_target
-            _i4_indices = [i for i, s in enumerate(outline) if s.get("intensity", 3) == 4]
-            _current_i5_6c = sum(1 for s in outline if s.get("intensity", 3) == 5)
-            _act3_start_6c = act1 + act2
-            _act3_end_6c = _act3_start_6c + act3
-            _rebalance_count = 0
-            for idx_6c in _i4_indices:
-                if _rebalance_count >= _i4_excess:
-                    break
-                if idx_6c < act1:
-                    # Act1（導入） → i=2に降格
-                    outline[idx_6c]["intensity"] = 2
-                    _rebalance_count += 1
-                elif idx_6c < _act3_start_6c:
-                    # Act2（前戯） → i=3に降格
-                    outline[idx_6c]["intensity"] = 3
-                    _rebalance_count += 1
-                elif idx_6c >= _act3_end_6c:
-                    # Act4（エピローグ） → i=3に降格
-                    outline[idx_6c]["intensity"] = 3
-                    _rebalance_count += 1
-                elif _current_i5_6c < _max_i5:
-                    # Act3内でi=5が不足なら昇格を試行
-                    _near_5_6c = any(
-                        outline[j].get("intensity", 3) == 5
-                        for j in range(max(0, idx_6c - 5), min(len(outline), idx_6c + 6))
-                    )
-                    if not _near_5_6c:
-                        outline[idx_6c]["intensity"] = 5
-                        _current_i5_6c += 1
-                        _rebalance_count += 1
-                        if idx_6c > 0 and outline[idx_6c - 1].get("intensity", 3) < 4:
-                            outline[idx_6c - 1]["intensity"] = 4
-                    else:
-                        # i=5近接でも、Act3前半なら i=3に降格（ブレイク追加）
-                        _act3_progress = (idx_6c - _act3_start_6c) / max(act3, 1)
-                        if _act3_progress < 0.3:
-                            outline[idx_6c]["intensity"] = 3
-                            _rebalance_count += 1
-            if _rebalance_count > 0:
-                log_message(f"i=4上限40%制御: {_i4_count}→{_i4_count - _rebalance_count}シーンに再割当（{_rebalance_count}件変更）")
-
-        # 7. エピローグのストーリーリセット防止: 最終act4がi=2以下にならないよう制限
-        if _n_scenes >= 20:
-            _epilogue_start = act1 + act2 + act3
-            for i in range(_epilogue_start, len(outline)):
-                curr_i = outline[i].get("intensity", 3)
-                if curr_i <= 2:
-                    outline[i]["intensity"] = 3
-                    log_message(f"シーン{i+1}: エピローグi={curr_i}→3に修正（余韻リセット防止）")
-
-        # 8. 最終スムージング: step6/7が生成した飛躍を修正し、制約を再適用
-        _epilogue_start_8 = (act1 + act2 + act3) if _n_scenes >= 20 else len(outline)
-        for _pass in range(3):  # 最大3パスで収束
-            _smooth_count = 0
-            # 8a. 飛躍修正（前方パス）- i=5ピークは保護
-            for i in range(1, len(outline)):
-                prev_i = outline[i-1].get("intensity", 3)
-                curr_i = outline[i].get("intensity", 3)
-                if curr_i - prev_i >= 2:
-                    if curr_i == 5 and prev_i >= 3:
-                        # i=5ピーク保護: ピークを下げるのではなく前のシーンをランプアップ
-                        outline[i-1]["intensity"] = 4
-                        _smooth_count += 1
-                    else:
-                        outline[i]["intensity"] = prev_i + 1
-                        _smooth_count += 1
-                elif prev_i - curr_i >= 3:
-                    outline[i]["intensity"] = prev_i - 2
-                    _smooth_count += 1
-            # 8b. consecutive i=4上限の再適用（i=5ピーク直前保護付き）
-            _consecutive_4_8 = 0
-            for i, s in enumerate(outline):
-                if s.get("intensity", 3) == 4:
-                    _consecutive_4_8 += 1
-                    if _consecutive_4_8 > _i4_break_limit:  # v8.9: Step 6bと同じランダム閾値
-                        _next_is_peak = (i + 1 < len(outline) and outline[i + 1].get("intensity", 3) == 5)
-                        if _next_is_peak:
-                            if i > 0 and outline[i - 1].get("intensity", 3) == 4:
-                                outline[i - 1]["intensity"] = 3
-                                _consecutive_4_8 = 1
-                                _smooth_count += 1
-                        else:
-                            s["intensity"] = 3
-                            _consecutive_4_8 = 0
-                            _smooth_count += 1
-                else:
-                    _consecutive_4_8 = 0
-            # 8b2. consecutive i≤2上限の再適用（v8.9: 動的上限）
-            _consecutive_low_8 = 0
-            for i, s in enumerate(outline):
-                if s.get("intensity", 3) <= 2:
-                    _consecutive_low_8 += 1
-                    if _consecutive_low_8 > _max_consecutive_low:
-                        s["intensity"] = 3
-                        _consecutive_low_8 = 0
-                        _smooth_count += 1
-                else:
-                    _consecutive_low_8 = 0
-            # 8c. エピローグi<=2防止の再適用（境界の飛躍も修正）
-            for i in range(_epilogue_start_8, len(outline)):
-                if outline[i].get("intensity", 3) <= 2:
-                    outline[i]["intensity"] = 3
-                    _smooth_count += 1
-            # エピローグ境界: 直前シーンがi<=1だとi=3へ+2飛躍になるので直前をi=2に引き上げ
-            if _epilogue_start_8 > 0 and _epilogue_start_8 < len(outline):
-                _pre_epi = outline[_epilogue_start_8 - 1].get("intensity", 3)
-                if _pre_epi < 2:
-                    outline[_epilogue_start_8 - 1]["intensity"] = 2
-                    _smooth_count += 1
-            if _smooth_count == 0:
-                break
-        if _pass > 0:
-            if _smooth_count == 0:
-                log_message(f"最終スムージング: {_pass + 1}パスで収束")
-            else:
-                log_message(f"最終スムージング: 3パスで未収束（残り{_smooth_count}箇所）")
-
-        # 9. v8.9: Act間エスカレーション検証（Act3がAct2以下ならブースト）
-        if _n_scenes >= 30:
-            _act_ranges = [
-                (0, act1),
-                (act1, act1 + act2),
-                (act1 + act2, act1 + act2 + act3),
-                (act1 + act2 + act3, len(outline)),
-            ]
-            _act_avgs = []
-            for _start, _end in _act_ranges:
-                _end = min(_end, len(outline))
-                _count = _end - _start
-                if _count > 0:
-                    _avg = sum(outline[i].get("intensity", 3) for i in range(_start, _end)) / _count
-                else:
-                    _avg = 3.0
-                _act_avgs.append(_avg)
-
-            # Act3 avg がAct2 avg以下ならAct3をブースト
-            if len(_act_avgs) >= 3 and _act_avgs[2] <= _act_avgs[1] + 0.2:
-                _boost_count = 0
-                _act3_s = act1 + act2
-                _act3_e = min(act1 + act2 + act3, len(outline))
-                for i in range(_act3_s, _act3_e):
-                    if outline[i].get("intensity", 3) == 3:
-                        outline[i]["intensity"] = 4
-                        _boost_count += 1
-                        if _boost_count >= max(2, act3 // 10):
-                            break
-                if _boost_count > 0:
-                    log_message(f"Act間エスカレーション: Act3 avg {_act_avgs[2]:.2f}≤Act2 avg {_act_avgs[1]:.2f} → {_boost_count}シーンをi=3→4にブースト")
-
-            # Act4 avg がAct3 avg以上ならAct4を抑制
-            if len(_act_avgs) >= 4 and _act_avgs[3] >= _act_avgs[2]:
-                _act4_s = act1 + act2 + act3
-                _depress_count = 0
-                for i in range(_act4_s, len(outline)):
-                    if outline[i].get("intensity", 3) == 4:
-                        outline[i]["intensity"] = 3
-                        _depress_count += 1
-                        if _depress_count >= max(1, act4 // 3):
-                            break
-                if _depress_count > 0:
-                    log_message(f"Act間エスカレーション: Act4 avg {_act_avgs[3]:.2f}≥Act3 → {_depress_count}シーンをi=4→3に抑制")
-
-        # erotic_levelとintensityの整合性を修正
-        erotic_map = {1: "none", 2: "light", 3: "medium", 4: "heavy", 5: "climax"}
-        for scene in outline:
-            scene["erotic_level"] = erotic_map.get(scene.get("intensity", 3), "medium")
-
-        # タイトル重複修正（アウトライン段階で検出・修正）
-        _seen_titles_ol = set()
-        _title_fix_ol = 0
-        for s in outline:
-            t = s.get("title", "")
-            if t in _seen_titles_ol:
-                sid = s.get("scene_id", "?")
-                sit = s.get("situation", "")[:20]
-                loc = s.get("location", "")
-                new_title = f"{loc}での{sit}" if loc and sit else f"シーン{sid}"
-                if new_title in _seen_titles_ol:
-                    new_title = f"{new_title}({sid})"
-                s["title"] = new_title
-                _title_fix_ol += 1
-                log_message(f"アウトラインtitle重複修正: S{sid}「{t}」→「{new_title}」")
-            _seen_titles_ol.add(s.get("title", ""))
-        if _title_fix_ol > 0:
-            log_message(f"アウトラインtitle重複修正: {_title_fix_ol}件")
-
-        # situation連続類似検出・警告（3連続で同一キーワードパターン）
-        _SITUATION_KW_OL = ["膣奥", "突かれ", "責められ", "腰を振", "ピストン",
-                            "挿入", "犯され", "抱かれ", "押し倒", "襲われ",
-                            "口内", "フェラ", "パイズリ", "騎乗", "バック",
-                            "正常位", "四つん這い", "膝立ち", "指で"]
-        _sit_kw_list = []
-        for s in outline:
-            sit = s.get("situation", "")
-            kws = frozenset(kw for kw in _SITUATION_KW_OL if kw in sit)
-            _sit_kw_list.append(kws)
-        _consec_same_ol = 0
-        for idx in range(2, len(outline)):
-            if (_sit_kw_list[idx] and
-                _sit_kw_list[idx] == _sit_kw_list[idx - 1] == _sit_kw_list[idx - 2]):
-                _consec_same_ol += 1
-                sid = outline[idx].get("scene_id", idx + 1)
-                log_message(f"⚠️ アウトライン: S{sid-2}〜S{sid} situationキーワード同一（{_sit_kw_list[idx]}）")
-        if _consec_same_ol > 0:
-            log_message(f"⚠️ アウトライン: {_consec_same_ol}箇所でsituation連続類似検出")
+        _normalize_outline(outline, num_scenes, act1, act2, act3, act4)
 
         # アウトライン数がnum_scenesに不足する場合、自動補完
         if len(outline) < num_scenes:
@@ -11096,13 +11462,13 @@ JSON配列のみ出力。"""
                     "emotional_arc": {"start": "", "end": ""},
                     "beats": [],
                     "intensity": min(pad_intensity, 5),
-                    "erotic_level": erotic_map.get(min(pad_intensity, 5), "medium"),
+                    "erotic_level": EROTIC_LEVEL_BY_INTENSITY.get(min(pad_intensity, 5), "medium"),
                     "viewer_hook": ""
                 })
 
             # 補完後のerotic_level再整合
             for scene in outline:
-                scene["erotic_level"] = erotic_map.get(scene.get("intensity", 3), "medium")
+                scene["erotic_level"] = EROTIC_LEVEL_BY_INTENSITY.get(scene.get("intensity", 3), "medium")
             log_message(f"アウトライン補完完了: {len(outline)}シーン")
 
         log_message(f"アウトライン生成完了（API）: {len(outline)}シーン, テーマ: {theme_name}")
@@ -11258,26 +11624,20 @@ def _oneliner_scene_summary(scene: dict) -> str:
 def _build_narrative_arc_summary(scene_results: list) -> str:
     """v8.7: ナラティブアーク要約（~100tok）。序盤・転換点・intensity推移を永続化。
     100シーン超でも中盤の流れが消失しない。"""
-    if not scene_results:
-        return ""
-    first = scene_results[0]
-    intensities = [s.get("intensity", 3) for s in scene_results]
-    turning = []
-    for i in range(1, len(intensities)):
-        if abs(intensities[i] - intensities[i - 1]) >= 2:
-            s = scene_results[i]
-            turning.append(f"S{s.get('scene_id', i + 1)}:{s.get('title', '')[:15]}")
-    tp = "/".join(turning[-3:]) or "なし"
-    return (
-        f"【全体の流れ】{first.get('location_detail', '')} "
-        f"{first.get('description', '')[:60]}...から開始 / "
-        f"intensity: {intensities[0]}→{intensities[-1]}(peak={max(intensities)}) / "
-        f"転換点: {tp}"
-    )
+    return StoryContext([], scene_results).arc_summary()
 
 
 def _build_story_so_far(story_summaries: list, scene_results: list) -> str:
-    """story_so_farを構築（3層スライディングウィンドウ）。
+    """story_so_farを構築（3層スライディングウィンドウ、1回限り）。
+
+    層の構成は StoryContext を参照。シーン生成ループでは StoryContext を使い回すこと
+    （毎シーン全履歴を走査し直さない）。
+    """
+    return StoryContext(story_summaries, scene_results).snapshot()
+
+
+class StoryContext:
+    """story_so_far の増分ビルダー（3層スライディングウィンドウ）。
 
     - v8.7: ナラティブアーク要約（先頭に挿入、~100tok追加）
     - 直近3シーン: フルテキスト（extract_scene_summary）
@@ -11286,173 +11646,203 @@ def _build_story_so_far(story_summaries: list, scene_results: list) -> str:
 
     セリフ重複防止のブラックリストは別途used_blacklistで処理されるため、
     古いシーンの詳細をstory_so_farに保持する必要は薄い。
+
+    story_summaries / scene_results は呼び出し側が追記していくリストをそのまま参照し、
+    snapshot() のたびに新しく追記されたシーンだけを1回ずつ取り込む（各層の行・アーク要約の
+    集計はシーン完了時に1回だけ計算）。snapshot() の組み立てはスクリプト長に依らず一定量で、
+    同じ確定済みシーンからは常にバイト単位で同一の文字列を返す（プロンプトキャッシュ用）。
+    返す文字列は不変なので、並列に開始するシーンへそのまま渡してよい。
+    追記済みのシーン（dict）は以後変更しないこと。
     """
-    n = len(story_summaries)
-    if n == 0:
-        return ""
 
-    parts = []
+    ONELINE_MAX = 20      # 1行概要を載せる最大件数（それより古い分は件数のみ）
+    COMPACT_WINDOW = 8    # 圧縮要約以上の詳しさで載せる直近シーン数
+    RECENT_WINDOW = 3     # フルテキストで載せる直近シーン数
+    ARC_MIN_SCENES = 9    # ナラティブアーク要約を挿入するシーン数
+    ARC_TURNING_POINTS = 3
+
+    def __init__(self, story_summaries: list, scene_results: list):
+        self._summaries = story_summaries
+        self._results = scene_results
+        self._oneliners: list = []     # j → "[S{sid}] title: desc"
+        self._compacts: list = []      # j → _compact_scene_summary
+        self._arc_head = ""
+        self._first_intensity = 3
+        self._last_intensity = 3
+        self._peak_intensity = 0
+        self._turning: deque = deque(maxlen=self.ARC_TURNING_POINTS)
+        self._key = None
+        self._text = ""
+
+    def _ingest(self):
+        """scene_results に追記されたシーンを取り込む"""
+        for j in range(len(self._oneliners), len(self._results)):
+            sc = self._results[j]
+            sid = sc.get("scene_id", j + 1)
+            self._oneliners.append(f"[S{sid}] {sc.get('title', '')[:15]}: {sc.get('description', '')[:40]}")
+            self._compacts.append(_compact_scene_summary(sc))
+            intensity = sc.get("intensity", 3)
+            if j == 0:
+                self._arc_head = (
+                    f"【全体の流れ】{sc.get('location_detail', '')} "
+                    f"{sc.get('description', '')[:60]}...から開始 / "
+                )
+                self._first_intensity = self._peak_intensity = intensity
+            else:
+                if abs(intensity - self._last_intensity) >= 2:
+                    self._turning.append(f"S{sid}:{sc.get('title', '')[:15]}")
+                self._peak_intensity = max(self._peak_intensity, intensity)
+            self._last_intensity = intensity
+
+    def arc_summary(self) -> str:
+        """ナラティブアーク要約（_build_narrative_arc_summary と同じ内容）"""
+        self._ingest()
+        if not self._oneliners:
+            return ""
+        tp = "/".join(self._turning) or "なし"
+        return (
+            f"{self._arc_head}"
+            f"intensity: {self._first_intensity}→{self._last_intensity}(peak={self._peak_intensity}) / "
+            f"転換点: {tp}"
+        )
+
+    def snapshot(self) -> str:
+        """現時点の story_so_far（確定済みシーンが増えていなければ前回と同じ文字列）"""
+        self._ingest()
+        key = (len(self._summaries), len(self._results))
+        if key != self._key:
+            self._key = key
+            self._text = self._render()
+        return self._text
+
+    def _render(self) -> str:
+        n = len(self._summaries)
+        if n == 0:
+            return ""
+        n_results = len(self._results)
+        parts = []
 
-    # v8.7: ナラティブアーク要約（9シーン以上で挿入）
-    if n >= 9 and scene_results:
-        arc = _build_narrative_arc_summary(scene_results)
-        if arc:
-            parts.append(arc)
+        # v8.7: ナラティブアーク要約（9シーン以上で挿入）
+        if n >= self.ARC_MIN_SCENES and n_results:
+            parts.append(self.arc_summary())
             parts.append("")
 
-    # 9シーン以上前: 1行概要（スライディングウィンドウ: 直近20件のみ、それ以前は省略）
-    oneline_end = max(0, n - 8)
-    if oneline_end > 0:
-        parts.append("--- 序盤の展開 ---")
-        # 20件を超える古いシーンは件数表示のみ（トークン爆発防止）
-        _ONELINE_MAX = 20
-        if oneline_end > _ONELINE_MAX:
-            _skipped = oneline_end - _ONELINE_MAX
-            parts.append(f"（シーン1〜{_skipped}: {_skipped}シーン確定済み、省略）")
-            oneline_start = oneline_end - _ONELINE_MAX
-        else:
-            oneline_start = 0
-        for j in range(oneline_start, oneline_end):
-            if j < len(scene_results):
-                sc = scene_results[j]
-                sid = sc.get("scene_id", j + 1)
-                title = sc.get("title", "")[:15]
-                desc = sc.get("description", "")[:40]
-                parts.append(f"[S{sid}] {title}: {desc}")
-        parts.append("")
-
-    # 4-8シーン前: 圧縮要約（セリフ/SE情報保持でブラックリスト補助）
-    compact_start = max(0, n - 8)
-    compact_end = max(0, n - 3)
-    if compact_start < compact_end:
-        parts.append("--- これまでの展開 ---")
-        for j in range(compact_start, compact_end):
-            if j < len(scene_results):
-                parts.append(_compact_scene_summary(scene_results[j]))
-        parts.append("")
-
-    # 直近3シーン: フルテキスト
-    recent_start = max(0, n - 3)
-    if recent_start < n:
+        # 9シーン以上前: 1行概要（スライディングウィンドウ: 直近20件のみ、それ以前は省略）
+        oneline_end = max(0, n - self.COMPACT_WINDOW)
+        if oneline_end > 0:
+            parts.append("--- 序盤の展開 ---")
+            # 20件を超える古いシーンは件数表示のみ（トークン爆発防止）
+            if oneline_end > self.ONELINE_MAX:
+                _skipped = oneline_end - self.ONELINE_MAX
+                parts.append(f"（シーン1〜{_skipped}: {_skipped}シーン確定済み、省略）")
+                oneline_start = oneline_end - self.ONELINE_MAX
+            else:
+                oneline_start = 0
+            parts.extend(self._oneliners[oneline_start:min(oneline_end, n_results)])
+            parts.append("")
+
+        # 4-8シーン前: 圧縮要約（セリフ/SE情報保持でブラックリスト補助）
+        compact_start = max(0, n - self.COMPACT_WINDOW)
+        compact_end = max(0, n - self.RECENT_WINDOW)
+        if compact_start < compact_end:
+            parts.append("--- これまでの展開 ---")
+            parts.extend(self._compacts[compact_start:min(compact_end, n_results)])
+            parts.append("")
+
+        # 直近3シーン: フルテキスト
+        recent_start = max(0, n - self.RECENT_WINDOW)
         parts.append("--- 直近の展開（詳細） ---")
-        for j in range(recent_start, n):
-            parts.append(story_summaries[j])
-
-    # v9.0: 直前シーンの物理状態を明示抽出（generate_scene_draftのプロンプト注入用）
-    if scene_results:
-        last = scene_results[-1]
-        sd_prompt = last.get("sd_prompt", "")
-        sd_tags_lower = {t.strip().lower().replace(" ", "_") for t in sd_prompt.split(",") if t.strip()}
-        _cl = sorted(_CLOTHING_STATE_TAGS & sd_tags_lower)
-        _fl = sorted(_FLUID_STATE_TAGS & sd_tags_lower)
-        _ex = sorted(_EXPRESSION_STATE_TAGS & sd_tags_lower)
-        last_intensity = last.get("intensity", 3)
-        parts.append("")
-        parts.append("--- 前シーン最終物理状態（次シーンで引き継ぐこと） ---")
-        parts.append(f"服装: {', '.join(_cl) if _cl else '着衣'}")
-        parts.append(f"体液: {', '.join(_fl) if _fl else 'なし'}")
-        if _ex:
-            parts.append(f"表情: {', '.join(_ex)}")
-        parts.append(f"興奮レベル: intensity={last_intensity}")
-
-    return "\n".join(parts)
+        parts.extend(self._summaries[recent_start:n])
+
+        # v9.0: 直前シーンの物理状態を明示抽出（generate_scene_draftのプロンプト注入用）
+        if n_results:
+            last = self._results[-1]
+            sd_prompt = last.get("sd_prompt", "")
+            sd_tags_lower = {t.strip().lower().replace(" ", "_") for t in sd_prompt.split(",") if t.strip()}
+            _cl = sorted(_CLOTHING_STATE_TAGS & sd_tags_lower)
+            _fl = sorted(_FLUID_STATE_TAGS & sd_tags_lower)
+            _ex = sorted(_EXPRESSION_STATE_TAGS & sd_tags_lower)
+            last_intensity = last.get("intensity", 3)
+            parts.append("")
+            parts.append("--- 前シーン最終物理状態（次シーンで引き継ぐこと） ---")
+            parts.append(f"服装: {', '.join(_cl) if _cl else '着衣'}")
+            parts.append(f"体液: {', '.join(_fl) if _fl else 'なし'}")
+            if _ex:
+                parts.append(f"表情: {', '.join(_ex)}")
+            parts.append(f"興奮レベル: intensity={last_intensity}")
 
+        return "\n".join(parts)
 
-def generate_scene_draft(
-    client: anthropic.Anthropic,
-    context: dict,
-    scene: dict,
-    jailbreak: str,
-    cost_tracker: CostTracker,
-    theme: str = "",
-    char_profiles: list = None,
-    callback: Optional[Callable] = None,
-    story_so_far: str = "",
-    synopsis: str = "",
-    outline_roadmap: str = "",
-    male_description: str = "",
-    scene_index: int = -1,
-    total_scenes: int = 0,
-    _return_prompt_only: bool = False,
-    faceless_male: bool = True,
-) -> dict:
-    skill = load_skill("low_cost_pipeline")
 
-    # Danbooruタグ強化スキルを読み込み
-    danbooru_nsfw = load_skill("danbooru_nsfw_tags")
+# ============================================================
+# シーン生成の system プロンプト（Prompt Caching）
+# ============================================================
+# system は次のブロックに分け、それぞれに cache_control を付ける（先頭から順に変わりにくい）:
+#   1. 共通プレフィックス（jailbreak・スキル・キャラ固有セリフ例・男性設定・テーマ）
+#      … 実行中の全シーンでバイト単位で同一。generate_scene_draft と generate_scene_batch で共有
+#   2. 呼び出し側の共通部分（出力フォーマット規則・あらすじ・設定）… 実行中は同一
+#   3. intensity 別（キャラ口調ガイドの段階・エロ指示）… 同じ intensity のシーンで同一
+# シーン固有の情報（ロードマップ・story_so_far・シーン指示）は user に置く。
+# 同じモデルのシーン呼び出しは少なくともブロック1まで、同じ intensity ならブロック3まで読み取りになる。
 
-    # NSFWシーン構成スキル
-    scene_composer = load_skill("nsfw_scene_composer")
+SCENE_PREFIX_CACHE_MAX = 16   # 共通プレフィックスのメモ化件数（generate_pipeline の開始時にクリア）
 
-    # エロ漫画セリフスキルを性格・テーマ別に選択
-    _serihu_info = _select_serihu_skill(theme, char_profiles)
-    serihu_skill_name = _serihu_info["primary"]
-    serihu_skill = load_skill(serihu_skill_name)
-    _serihu_secondary = load_skill(_serihu_info["secondary"]) if _serihu_info.get("secondary") else ""
-    _serihu_ratio = _serihu_info.get("ratio", 1.0)
-    _serihu_personality = _serihu_info.get("personality", "")
+_scene_prefix_cache: dict = {}
+_scene_prefix_lock = threading.Lock()
 
-    # CG集吹き出し専門スキル（自然な日本語セリフガイド）
-    bubble_writer_skill = load_skill("cg_bubble_writer")
+SCENE_DRAFT_FORMAT_RULES = """## FANZA同人CG集フォーマット
+「セリフ付きCG集」＝1枚絵に吹き出し+オノマトペ。**画像がメイン、テキストはサブ**。
+各ページ: CG画像1枚 + 吹き出し1-3個（ヒロイン1-2+男0-1） + SE 0-4個
 
-    # CG集ビジュアル多様性スキル
-    visual_skill = load_skill("cg_visual_variety")
+## ⚠️ 追加厳守ルール（上記吹き出しスキルに加えて）
 
-    # テーマ別ガイドを取得
-    theme_guide = THEME_GUIDES.get(theme, THEME_GUIDES.get("vanilla", {}))
-    theme_name = theme_guide.get("name", "指定なし")
-    dialogue_tone = theme_guide.get("dialogue_tone", "自然で楽しい雰囲気")
-    use_heart = theme_guide.get("use_heart", True)
-    theme_sd_tags = theme_guide.get("sd_tags", "")
-    theme_sd_expressions = theme_guide.get("sd_expressions", "")
-    key_emotions = theme_guide.get("key_emotions", [])
-    story_elements = theme_guide.get("story_elements", [])
-    
-    # シーンの重要度
-    intensity = scene.get("intensity", 3)
-    location = scene.get("location", "室内")
-    time_of_day = scene.get("time", "")
-    
-    # タグDB読み込み（外部JSON対応）
-    tag_db = _load_tag_db()
-    
-    # 背景タグテンプレート
-    loc_tags_db = tag_db.get("locations", {})
-    time_tags_db = tag_db.get("time_of_day", {})
-    
-    # 場所と時間帯のタグを取得
-    location_tags = ""
-    for key, tags in loc_tags_db.items():
-        if key in location:
-            location_tags = tags
-            break
-    if not location_tags:
-        location_tags = "indoor, room"
-    
-    time_tags = ""
-    for key, tags in time_tags_db.items():
-        if key in time_of_day:
-            time_tags = tags
-            break
-    
-    # キャラプロファイルをintensity別に圧縮（API節約）
-    char_guide = ""
-    char_danbooru_tags = []
-    char_names = []
+### セリフ・SE重複禁止
+story_so_farのセリフ・SEと同一・類似は絶対禁止。毎シーン辞書の別パターンを選べ。
+
+### 場所名の一貫性
+同じ場所は**全シーンで同一の表記**。表記ブレ禁止。
 
+### セリフ内容整合性
+- moan=喘ぎ声のみ。説明文禁止（❌「そうなんだ」「汗すごい」）
+- speech=感情的反応のみ。身体報告禁止（❌「震えてる」「目が回る」）
+- thought=感覚・感情の断片のみ。ナレーション・文語表現禁止。❌部位/器官を主語にする描写型（「胸が…」「体が…」「脳が…」「心が…」「思考が…」）❌文語的表現（「胸がときめく」「心が満たされ」「魂が震え」）→✅感覚主体の断片（「熱い…」「ゾクって…」「とけちゃう…」「やばい…」）
+- 男性speech=命令/挑発/独白のみ。観察実況禁止（❌「いい声だな」「敏感だな」「ここも感じるんだな」→✅「もっと鳴け」「欲しいんだろ」「逃がさねぇ」）
+- descriptionと吹き出しの内容が**論理的に一致**すること
+
+### story_flowの書き方
+各シーン固有の展開。前シーンのコピペ禁止。状況が必ず進展すること。
+
+### 語尾パターン多様性
+同じ語尾パターン（～し…、～る♡、～の…、～て…、～だし等）を3シーン連続で使うな。
+speech/thoughtの語尾は毎シーン構造を変えろ（体言止め/疑問/感嘆/中断/独白）。
+
+### thought先頭パターン反復禁止
+同じ書き出し（先頭2文字）を3シーン以内で再使用するな。バリエーションが生命線。
+同一構文（X…Yが…Z…）の3連続も禁止。構文パターンを変えろ（疑問/自嘲/矛盾/驚き/諦め/感覚）。
+感情は恐怖/羞恥/快感否定の3種だけでなく、怒り/諦め/自嘲/混乱/背徳感も使え。
+❌禁止: thoughtで部位名・器官名を主語にする説明型（「胸…」「体が…」「脳が…」「心が…」「思考が…」）。文語的表現（「胸がときめく」「心が満たされ」）も禁止。感覚・感情を主語にしろ（「熱い…」「ゾクって…」「やばい…」「とけちゃう…」）。
+同じキーワード（「だめ」「声」等）は全シーン中4回まで。
+
+## オノマトペ辞書（同じ組み合わせの連続禁止）
+・挿入: ズブッ, ヌプッ, ズリュッ, ヌルッ, ズンッ ・抽送: パンパン, グチュグチュ, ヌチュヌチュ
+・愛撫: サワッ, ペロッ, チュッ, レロレロ ・吸引: チュパッ, ジュルッ, ゴクッ
+・射精: ドクドク, ドビュッ, ビュルル ・反応: ビクッ, ビクビク, ガクガク, ゾクッ
+・心音: ドキドキ, バクバク ・衝撃: ドンッ, ギシギシ ・濡れ: トロッ, グショッ, ヌルヌル
+・剥ぎ: ビリッ, スルッ"""
+
+
+def _scene_char_guide(char_profiles: list, intensity: int) -> str:
+    """キャラ口調ガイド（intensity 1-2 / 3 / 4-5 の3段階で詳しさを変える）"""
+    char_guide = ""
     if char_profiles:
         for cp in char_profiles:
             name = cp.get("character_name", "")
-            char_names.append(name)
             speech = cp.get("speech_pattern", {})
             emotional = cp.get("emotional_speech", {})
             examples = cp.get("dialogue_examples", {})
             relationship = cp.get("relationship_speech", {})
             avoid = cp.get("avoid_patterns", [])
             physical = cp.get("physical_description", {})
-            tags = cp.get("danbooru_tags", [])
-
-            char_danbooru_tags.extend(tags)
 
             if intensity <= 2:
                 char_guide += f"""
@@ -11499,6 +11889,299 @@ NG: {', '.join(avoid[:3]) if avoid else 'なし'}
 ■ NG表現: {', '.join(avoid) if avoid else 'なし'}
 ■ 外見: 髪={physical.get('hair', '')}, 目={physical.get('eyes', '')}, 体型={physical.get('body', '')}
 """
+    return char_guide
+
+
+def _compile_scene_system(*blocks: str) -> list:
+    """system ブロックのリストを作る（空ブロックは除き、各ブロックの末尾をキャッシュのブレークポイントにする）"""
+    return [{"type": "text", "text": b, "cache_control": {"type": "ephemeral"}} for b in blocks if b]
+
+
+def _scene_run_block(context: dict, synopsis: str = "") -> str:
+    """generate_scene_draft の2番目のブロック（フォーマット規則・あらすじ・設定。実行中は全シーンで同一）"""
+    synopsis_section = ""
+    if synopsis:
+        synopsis_section = f"""## 参考: 作品全体のあらすじ
+{synopsis}
+---
+"""
+    return (f"{SCENE_DRAFT_FORMAT_RULES}\n\n{synopsis_section}設定: {json.dumps(context, ensure_ascii=False)}\n\n"
+            "JSON形式のみ出力。")
+
+
+async def _aprewarm_prompt_cache(client, cost_tracker: CostTracker, model: str, system):
+    """system をキャッシュに書き込むだけの最小リクエスト（PromptCacheWarmer の send）"""
+    set_cost_phase(COST_PHASE_PREWARM)
+    aclient = get_engine().async_anthropic(client)
+    _limiter = get_rate_limiter()
+    await _limiter.acquire(model, estimate_tokens(system) + 1, 1)
+    async with get_controller().slot(model):
+        raw = await aclient.messages.with_raw_response.create(
+            model=model,
+            max_tokens=1,
+            system=system,
+            messages=[{"role": "user", "content": "OK"}],
+            timeout=60.0,
+        )
+    _limiter.update_from_headers(model, raw.headers)
+    usage = (await raw.parse()).usage
+    cache_creation = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    cost_tracker.add(model, usage.input_tokens, usage.output_tokens, cache_creation, cache_read)
+    log_message(f"キャッシュ予熱 {model}: +{cache_creation} create, {cache_read} read")
+
+
+def _prewarm_scene_system(*blocks: str):
+    """シーン生成に使うモデルごとに、system の先頭ブロックを予熱する（予熱無効なら何もしない）"""
+    if _prompt_warmer is None:
+        return
+    system = _compile_scene_system(*blocks)
+    models = [MODELS["haiku"], MODELS["sonnet"]]
+    if _hybrid_router is not None and _hybrid_router.local_enabled:
+        models.remove(MODELS["haiku"])   # intensity 1-3 はローカルLLM用の system
+    for model in models:
+        _prompt_warmer.warm(model, system)
+
+
+def _scene_system_prefix(
+    jailbreak: str,
+    theme: str = "",
+    char_profiles: list = None,
+    male_description: str = "",
+    faceless_male: bool = True,
+) -> str:
+    """シーン生成 system の共通プレフィックス（同じ入力なら常に同一の文字列、メモ化）"""
+    key = (
+        jailbreak, theme, json.dumps(char_profiles or [], ensure_ascii=False, sort_keys=True),
+        male_description, faceless_male,
+    )
+    with _scene_prefix_lock:
+        cached = _scene_prefix_cache.get(key)
+    if cached is not None:
+        return cached
+    text = _build_scene_system_prefix(jailbreak, theme, char_profiles, male_description, faceless_male)
+    with _scene_prefix_lock:
+        if len(_scene_prefix_cache) >= SCENE_PREFIX_CACHE_MAX:
+            _scene_prefix_cache.clear()
+        _scene_prefix_cache[key] = text
+    return text
+
+
+def _build_scene_system_prefix(
+    jailbreak: str,
+    theme: str,
+    char_profiles: list,
+    male_description: str,
+    faceless_male: bool,
+) -> str:
+    skill = load_skill("low_cost_pipeline")
+    # Danbooruタグ強化スキル / NSFWシーン構成スキル / CG集吹き出し専門スキル / ビジュアル多様性スキル
+    danbooru_nsfw = load_skill("danbooru_nsfw_tags")
+    scene_composer = load_skill("nsfw_scene_composer")
+    bubble_writer_skill = load_skill("cg_bubble_writer")
+    visual_skill = load_skill("cg_visual_variety")
+
+    # エロ漫画セリフスキルを性格・テーマ別に選択
+    _serihu_info = _select_serihu_skill(theme, char_profiles)
+    serihu_skill = load_skill(_serihu_info["primary"])
+    _serihu_secondary = load_skill(_serihu_info["secondary"]) if _serihu_info.get("secondary") else ""
+    _serihu_ratio = _serihu_info.get("ratio", 1.0)
+    _serihu_personality = _serihu_info.get("personality", "")
+
+    theme_guide = THEME_GUIDES.get(theme, THEME_GUIDES.get("vanilla", {}))
+    theme_name = theme_guide.get("name", "指定なし")
+    dialogue_tone = theme_guide.get("dialogue_tone", "自然で楽しい雰囲気")
+    use_heart = theme_guide.get("use_heart", True)
+    key_emotions = theme_guide.get("key_emotions", [])
+    story_elements = theme_guide.get("story_elements", [])
+
+    # キャラ固有セリフプールからfew-shot例を注入
+    char_pool_section = ""
+    if char_profiles:
+        _cp0 = char_profiles[0]
+        _cp_id = generate_char_id(_cp0.get("work_title", ""), _cp0.get("character_name", ""))
+        _scene_char_pool = load_character_pool(_cp_id)
+        if _scene_char_pool:
+            sample_lines = []
+            thought_lines = []
+            for _ph in ["foreplay", "penetration", "climax"]:
+                phase_speech = _scene_char_pool.get("speech", {}).get(_ph, [])[:2]
+                sample_lines.extend(phase_speech)
+                phase_thought = _scene_char_pool.get("thought", {}).get(_ph, [])[:1]
+                thought_lines.extend(phase_thought)
+            if sample_lines or thought_lines:
+                char_pool_section = "\n## キャラ固有セリフ例（このトーンで書け）\n"
+                if sample_lines:
+                    char_pool_section += "### 会話(speech)例:\n" + "\n".join(f"・{l}" for l in sample_lines) + "\n"
+                if thought_lines:
+                    char_pool_section += "### 心の声(thought)例:\n" + "\n".join(f"・({l})" for l in thought_lines) + "\n"
+                char_pool_section += "※thoughtは感覚・感情主体で書け。「指が…」「胸が…」等の身体部位実況は禁止。\n"
+
+    # v8.8: テーマ世界ルール（セリフ制約等）
+    world_rules = theme_guide.get("world_rules", [])
+    world_rules_instruction = ""
+    if world_rules:
+        world_rules_instruction = "\n## ⚠️ テーマ世界設定ルール（厳守）\n"
+        for wr in world_rules:
+            world_rules_instruction += f"- {wr}\n"
+
+    # ♡使用のルール（テーマ別）
+    heart_instruction = ""
+    if use_heart:
+        heart_instruction = "♡は甘いシーンで自然に使用OK。"
+    else:
+        heart_instruction = f"""
+テーマ「{theme_name}」のspeech（会話）では♡は控えめに。
+ただし**moan（喘ぎ）では♡を積極的に使え**（不本意な快楽の表現として効果的）。
+セリフ品質ガイドの喘ぎ辞書にある♡はそのまま使用すること。
+"""
+
+    # テーマ別セリフトーン指示
+    theme_dialogue_instruction = f"""
+## テーマ「{theme_name}」のセリフトーン
+
+{dialogue_tone}
+
+【このテーマで重要な感情】
+{', '.join(key_emotions) if key_emotions else '自然な感情表現'}
+
+【ストーリー要素として入れるべきもの】
+{chr(10).join(f'・{e}' for e in story_elements[:3]) if story_elements else '・特になし'}
+
+{heart_instruction}
+"""
+
+    # v9.0: faceless_male 対応の男性描写セクション構築
+    if male_description and faceless_male:
+        _male_section = f"""
+## 男性キャラクター外見設定
+**外見: {male_description}**
+- descriptionに男性が登場する場合、必ずこの外見設定を反映した描写にすること
+- 男性はfaceless male（顔なし）として扱う。男性の顔の特徴（目・鼻・口・表情）は一切描写しない
+- 描写例: 「{male_description}の男に押し倒され…」「背後から{male_description}に覆いかぶさられ…」
+"""
+    elif male_description and not faceless_male:
+        _male_section = f"""
+## 男性キャラクター外見設定
+**外見: {male_description}**
+- descriptionに男性が登場する場合、必ずこの外見設定を反映した描写にすること
+- 男性の外見（体型・髪型・服装・表情）を一貫して描写すること
+- 描写例: 「{male_description}の男に押し倒され…」「背後から{male_description}に覆いかぶさられ…」
+"""
+    elif faceless_male:
+        _male_section = """
+## 男性キャラクター
+- 男性はfaceless male（顔なし）として扱う。男性の顔の特徴（目・鼻・口・表情）は一切描写しない
+"""
+    else:
+        _male_section = """
+## 男性キャラクター
+- 男性の外見（体型・髪型・服装・表情）を一貫して描写すること
+"""
+
+    return f"""{jailbreak}
+
+{skill if skill else "FANZA同人CG集の脚本を生成します。"}
+
+{danbooru_nsfw if danbooru_nsfw else ""}
+
+{scene_composer if scene_composer else ""}
+
+{bubble_writer_skill if bubble_writer_skill else ""}
+
+{char_pool_section}
+{_male_section}
+{f'''
+## ⚠️ セリフ品質ガイド（厳守・最優先）
+
+bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】に厳密に従え。
+「タスク手順」「不自然診断」「改訂版セリフ」等のセクションは無視せよ。
+
+★ 喘ぎ声は必ず下記辞書の【段階1〜4】から選べ。自分で喘ぎを創作するな。
+★ intensityに対応する段階を使え（intensity 1-2=段階1、intensity 3=段階2、intensity 4=段階3、intensity 5=段階4）
+★ 前シーンで使った喘ぎと同じものは絶対禁止。毎シーン辞書の別パターンを選べ。
+
+{serihu_skill}
+''' if serihu_skill else ''}{f'''
+
+### サブスタイル（混合比率{int((1-_serihu_ratio)*100)}%で以下のスタイルも取り入れること）:
+{_serihu_secondary}
+''' if _serihu_secondary and _serihu_ratio < 1.0 else ''}{f'''
+★ キャラ性格タイプ「{_serihu_personality}」を意識したセリフ。ギャップ感を出すこと。
+''' if _serihu_personality else ''}
+
+{f'''
+## CG集ビジュアル構成ガイド
+
+{visual_skill}
+''' if visual_skill else ''}
+{theme_dialogue_instruction}
+{world_rules_instruction}
+全キャラ成人(18+)。"""
+
+
+def generate_scene_draft(
+    client: anthropic.Anthropic,
+    context: dict,
+    scene: dict,
+    jailbreak: str,
+    cost_tracker: CostTracker,
+    theme: str = "",
+    char_profiles: list = None,
+    callback: Optional[Callable] = None,
+    story_so_far: str = "",
+    synopsis: str = "",
+    outline_roadmap: str = "",
+    male_description: str = "",
+    scene_index: int = -1,
+    total_scenes: int = 0,
+    _return_prompt_only: bool = False,
+    faceless_male: bool = True,
+) -> dict:
+    # スキル・テーマ・キャラの共通部分は _scene_system_prefix（全シーンで同一、Prompt Caching対象）
+    serihu_skill_name = _select_serihu_skill(theme, char_profiles)["primary"]
+
+    # テーマ別ガイドを取得
+    theme_guide = THEME_GUIDES.get(theme, THEME_GUIDES.get("vanilla", {}))
+    theme_name = theme_guide.get("name", "指定なし")
+    theme_sd_tags = theme_guide.get("sd_tags", "")
+    theme_sd_expressions = theme_guide.get("sd_expressions", "")
+    key_emotions = theme_guide.get("key_emotions", [])
+    
+    # シーンの重要度
+    intensity = scene.get("intensity", 3)
+    location = scene.get("location", "室内")
+    time_of_day = scene.get("time", "")
+    
+    # タグDB読み込み（外部JSON対応）
+    tag_db = _load_tag_db()
+    
+    # 背景タグテンプレート
+    loc_tags_db = tag_db.get("locations", {})
+    time_tags_db = tag_db.get("time_of_day", {})
+    
+    # 場所と時間帯のタグを取得
+    location_tags = ""
+    for key, tags in loc_tags_db.items():
+        if key in location:
+            location_tags = tags
+            break
+    if not location_tags:
+        location_tags = "indoor, room"
+    
+    time_tags = ""
+    for key, tags in time_tags_db.items():
+        if key in time_of_day:
+            time_tags = tags
+            break
+    
+    # キャラプロファイルをintensity別に圧縮（API節約）
+    char_guide = _scene_char_guide(char_profiles, intensity)
+    char_danbooru_tags = []
+    char_names = []
+    for cp in char_profiles or []:
+        char_names.append(cp.get("character_name", ""))
+        char_danbooru_tags.extend(cp.get("danbooru_tags", []))
 
     # フルネーム→短縮名マップ構築（キャラ名途切れ対策用）
     char_short_names = []
@@ -11511,61 +12194,8 @@ NG: {', '.join(avoid[:3]) if avoid else 'なし'}
                 break
         char_short_names.append(short)
 
-    # キャラ固有セリフプールからfew-shot例を注入
-    char_pool_section = ""
-    if char_profiles:
-        _cp0 = char_profiles[0]
-        _cp_id = generate_char_id(_cp0.get("work_title", ""), _cp0.get("character_name", ""))
-        _scene_char_pool = load_character_pool(_cp_id)
-        if _scene_char_pool:
-            sample_lines = []
-            thought_lines = []
-            for _ph in ["foreplay", "penetration", "climax"]:
-                phase_speech = _scene_char_pool.get("speech", {}).get(_ph, [])[:2]
-                sample_lines.extend(phase_speech)
-                phase_thought = _scene_char_pool.get("thought", {}).get(_ph, [])[:1]
-                thought_lines.extend(phase_thought)
-            if sample_lines or thought_lines:
-                char_pool_section = "\n## キャラ固有セリフ例（このトーンで書け）\n"
-                if sample_lines:
-                    char_pool_section += "### 会話(speech)例:\n" + "\n".join(f"・{l}" for l in sample_lines) + "\n"
-                if thought_lines:
-                    char_pool_section += "### 心の声(thought)例:\n" + "\n".join(f"・({l})" for l in thought_lines) + "\n"
-                char_pool_section += "※thoughtは感覚・感情主体で書け。「指が…」「胸が…」等の身体部位実況は禁止。\n"
-
-    # v8.8: テーマ世界ルール（セリフ制約等）
+    # v8.8: テーマ世界ルール（ローカル用圧縮プロンプトで使用。クラウド用は共通プレフィックスに含む）
     world_rules = theme_guide.get("world_rules", [])
-    world_rules_instruction = ""
-    if world_rules:
-        world_rules_instruction = "\n## ⚠️ テーマ世界設定ルール（厳守）\n"
-        for wr in world_rules:
-            world_rules_instruction += f"- {wr}\n"
-
-    # ♡使用のルール（テーマ別）
-    heart_instruction = ""
-    if use_heart:
-        heart_instruction = "♡は甘いシーンで自然に使用OK。"
-    else:
-        heart_instruction = f"""
-テーマ「{theme_name}」のspeech（会話）では♡は控えめに。
-ただし**moan（喘ぎ）では♡を積極的に使え**（不本意な快楽の表現として効果的）。
-セリフ品質ガイドの喘ぎ辞書にある♡はそのまま使用すること。
-"""
-
-    # テーマ別セリフトーン指示
-    theme_dialogue_instruction = f"""
-## テーマ「{theme_name}」のセリフトーン
-
-{dialogue_tone}
-
-【このテーマで重要な感情】
-{', '.join(key_emotions) if key_emotions else '自然な感情表現'}
-
-【ストーリー要素として入れるべきもの】
-{chr(10).join(f'・{e}' for e in story_elements[:3]) if story_elements else '・特になし'}
-
-{heart_instruction}
-"""
 
     # シーン重要度別のエロ指示（5段階）- CG集フォーマット対応
     if intensity >= 5:
@@ -11721,124 +12351,6 @@ NG: {', '.join(avoid[:3]) if avoid else 'なし'}
     # テーマ別SDタグを追加
     theme_tags_combined = f"{theme_sd_tags}, {theme_sd_expressions}".strip(", ")
     
-    # === Prompt Caching: 共通部分（全シーンで同一）とシーン固有部分を分離 ===
-
-    # v9.0: faceless_male 対応の男性描写セクション構築
-    if male_description and faceless_male:
-        _male_section = f"""
-## 男性キャラクター外見設定
-**外見: {male_description}**
-- descriptionに男性が登場する場合、必ずこの外見設定を反映した描写にすること
-- 男性はfaceless male（顔なし）として扱う。男性の顔の特徴（目・鼻・口・表情）は一切描写しない
-- 描写例: 「{male_description}の男に押し倒され…」「背後から{male_description}に覆いかぶさられ…」
-"""
-    elif male_description and not faceless_male:
-        _male_section = f"""
-## 男性キャラクター外見設定
-**外見: {male_description}**
-- descriptionに男性が登場する場合、必ずこの外見設定を反映した描写にすること
-- 男性の外見（体型・髪型・服装・表情）を一貫して描写すること
-- 描写例: 「{male_description}の男に押し倒され…」「背後から{male_description}に覆いかぶさられ…」
-"""
-    elif faceless_male:
-        _male_section = """
-## 男性キャラクター
-- 男性はfaceless male（顔なし）として扱う。男性の顔の特徴（目・鼻・口・表情）は一切描写しない
-"""
-    else:
-        _male_section = """
-## 男性キャラクター
-- 男性の外見（体型・髪型・服装・表情）を一貫して描写すること
-"""
-
-    # 共通部分（キャッシュ対象）- CG集フォーマット完全対応
-    common_system = f"""{jailbreak}
-
-{skill if skill else "FANZA同人CG集の脚本を生成します。"}
-
-{danbooru_nsfw if danbooru_nsfw else ""}
-
-{scene_composer if scene_composer else ""}
-
-{bubble_writer_skill if bubble_writer_skill else ""}
-
-{char_guide if char_guide else "（キャラ設定なし）"}
-
-{char_pool_section}
-{_male_section}
-## FANZA同人CG集フォーマット
-「セリフ付きCG集」＝1枚絵に吹き出し+オノマトペ。**画像がメイン、テキストはサブ**。
-各ページ: CG画像1枚 + 吹き出し1-3個（ヒロイン1-2+男0-1） + SE 0-4個
-
-## ⚠️ 追加厳守ルール（上記吹き出しスキルに加えて）
-
-### セリフ・SE重複禁止
-story_so_farのセリフ・SEと同一・類似は絶対禁止。毎シーン辞書の別パターンを選べ。
-
-### 場所名の一貫性
-同じ場所は**全シーンで同一の表記**。表記ブレ禁止。
-
-### セリフ内容整合性
-- moan=喘ぎ声のみ。説明文禁止（❌「そうなんだ」「汗すごい」）
-- speech=感情的反応のみ。身体報告禁止（❌「震えてる」「目が回る」）
-- thought=感覚・感情の断片のみ。ナレーション・文語表現禁止。❌部位/器官を主語にする描写型（「胸が…」「体が…」「脳が…」「心が…」「思考が…」）❌文語的表現（「胸がときめく」「心が満たされ」「魂が震え」）→✅感覚主体の断片（「熱い…」「ゾクって…」「とけちゃう…」「やばい…」）
-- 男性speech=命令/挑発/独白のみ。観察実況禁止（❌「いい声だな」「敏感だな」「ここも感じるんだな」→✅「もっと鳴け」「欲しいんだろ」「逃がさねぇ」）
-- descriptionと吹き出しの内容が**論理的に一致**すること
-
-### story_flowの書き方
-各シーン固有の展開。前シーンのコピペ禁止。状況が必ず進展すること。
-
-### 語尾パターン多様性
-同じ語尾パターン（～し…、～る♡、～の…、～て…、～だし等）を3シーン連続で使うな。
-speech/thoughtの語尾は毎シーン構造を変えろ（体言止め/疑問/感嘆/中断/独白）。
-
-### thought先頭パターン反復禁止
-同じ書き出し（先頭2文字）を3シーン以内で再使用するな。バリエーションが生命線。
-同一構文（X…Yが…Z…）の3連続も禁止。構文パターンを変えろ（疑問/自嘲/矛盾/驚き/諦め/感覚）。
-感情は恐怖/羞恥/快感否定の3種だけでなく、怒り/諦め/自嘲/混乱/背徳感も使え。
-❌禁止: thoughtで部位名・器官名を主語にする説明型（「胸…」「体が…」「脳が…」「心が…」「思考が…」）。文語的表現（「胸がときめく」「心が満たされ」）も禁止。感覚・感情を主語にしろ（「熱い…」「ゾクって…」「やばい…」「とけちゃう…」）。
-同じキーワード（「だめ」「声」等）は全シーン中4回まで。
-
-## オノマトペ辞書（同じ組み合わせの連続禁止）
-・挿入: ズブッ, ヌプッ, ズリュッ, ヌルッ, ズンッ ・抽送: パンパン, グチュグチュ, ヌチュヌチュ
-・愛撫: サワッ, ペロッ, チュッ, レロレロ ・吸引: チュパッ, ジュルッ, ゴクッ
-・射精: ドクドク, ドビュッ, ビュルル ・反応: ビクッ, ビクビク, ガクガク, ゾクッ
-・心音: ドキドキ, バクバク ・衝撃: ドンッ, ギシギシ ・濡れ: トロッ, グショッ, ヌルヌル
-・剥ぎ: ビリッ, スルッ
-
-{f'''
-## ⚠️ セリフ品質ガイド（厳守・最優先）
-
-bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】に厳密に従え。
-「タスク手順」「不自然診断」「改訂版セリフ」等のセクションは無視せよ。
-
-★ 喘ぎ声は必ず下記辞書の【段階1〜4】から選べ。自分で喘ぎを創作するな。
-★ intensityに対応する段階を使え（intensity 1-2=段階1、intensity 3=段階2、intensity 4=段階3、intensity 5=段階4）
-★ 前シーンで使った喘ぎと同じものは絶対禁止。毎シーン辞書の別パターンを選べ。
-
-{serihu_skill}
-''' if serihu_skill else ''}{f'''
-
-### サブスタイル（混合比率{int((1-_serihu_ratio)*100)}%で以下のスタイルも取り入れること）:
-{_serihu_secondary}
-''' if _serihu_secondary and _serihu_ratio < 1.0 else ''}{f'''
-★ キャラ性格タイプ「{_serihu_personality}」を意識したセリフ。ギャップ感を出すこと。
-''' if _serihu_personality else ''}
-
-{f'''
-## CG集ビジュアル構成ガイド
-
-{visual_skill}
-''' if visual_skill else ''}
-
-全キャラ成人(18+)。JSON形式のみ出力。"""
-
-    # シーン固有部分（毎回変わる）
-    scene_system = f"""{erotic_instruction}
-
-{theme_dialogue_instruction}
-{world_rules_instruction}"""
-
     # ハイブリッドモード: ローカルLLM用に圧縮プロンプトを構築（Context 8192対応）
     # bubbles/sd_promptはauto_fix+enhance_sd_promptsで上書きするため指示を大幅削減
     _use_local_prompt = (
@@ -11881,14 +12393,7 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
 {_local_char_compact}
 {_local_male}
 {_local_world}""".strip()
-        # _local_prompt は synopsis_section 等の定義後に構築（後述）
-        pass
-    else:
-        # Prompt Caching: systemをリスト形式でcache_control付与
-        system_with_cache = [
-            {"type": "text", "text": common_system, "cache_control": {"type": "ephemeral"}},
-            {"type": "text", "text": scene_system}
-        ]
+        # _local_prompt は story_context_section 等の定義後に構築（後述）
 
     # シーン別SD推奨タグ（ポーズ・表情）+ テーマ別タグ - 大幅拡張
     intensity_sd_tags = {
@@ -11923,14 +12428,6 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
     composition_db = tag_db.get("compositions", {})
     composition_tags = composition_db.get(str(intensity), {}).get("tags", "")
 
-    # あらすじセクション（全シーン共通の物語の骨格）
-    synopsis_section = ""
-    if synopsis:
-        synopsis_section = f"""## 参考: 作品全体のあらすじ
-{synopsis}
----
-"""
-
     # ストーリー連続性セクション（使用済みセリフ・SE・story_flowを明示抽出）
     story_context_section = ""
     if story_so_far:
@@ -12120,10 +12617,20 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
         prompt = _local_prompt
 
     if not _use_local_prompt:
-        prompt = f"""{synopsis_section}{roadmap_section}{story_context_section}設定: {json.dumps(context, ensure_ascii=False)}
-{scene_instruction}
+        # Prompt Caching: 共通プレフィックス → フォーマット規則・あらすじ・設定 → intensity別（各末尾がブレークポイント）
+        system_with_cache = _compile_scene_system(
+            _scene_system_prefix(jailbreak, theme, char_profiles, male_description, faceless_male),
+            _scene_run_block(context, synopsis),
+            f"{char_guide if char_guide else '（キャラ設定なし）'}\n{erotic_instruction}",
+        )
 
-## 出力形式（この形式で出力してください）
+        # 出力形式: 短縮キーの wire 形式（出力トークン削減、_finish_scene_draft で展開）または従来形式
+        _heroine = char_names[0] if char_names else 'ヒロイン'
+        _sd_example = f"{QUALITY_POSITIVE_TAGS}, キャラ外見タグ, ポーズ・行為タグ, 表情タグ, 場所・背景タグ, 照明タグ, テーマタグ"
+        if SCENE_WIRE_FORMAT_ENABLED:
+            output_format_section = scene_wire.output_format(scene['scene_id'], _heroine, _sd_example)
+        else:
+            output_format_section = f"""## 出力形式（この形式で出力してください）
 
 {{
     "scene_id": {scene['scene_id']},
@@ -12132,18 +12639,23 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
     "location_detail": "場所の具体的な描写",
     "mood": "シーンの空気感・雰囲気（15-30字の情景描写。1-2語のラベル禁止）",
     "character_feelings": {{
-        "{char_names[0] if char_names else 'ヒロイン'}": "このシーンでの心情"
+        "{_heroine}": "このシーンでの心情"
     }},
     "bubbles": [
-        {{"speaker": "{char_names[0] if char_names else 'ヒロイン'}", "type": "speech", "text": "短い一言"}},
-        {{"speaker": "{char_names[0] if char_names else 'ヒロイン'}", "type": "moan", "text": "あっ♡"}},
+        {{"speaker": "{_heroine}", "type": "speech", "text": "短い一言"}},
+        {{"speaker": "{_heroine}", "type": "moan", "text": "あっ♡"}},
         {{"speaker": "男性", "type": "speech", "text": "男のセリフ"}}
     ],
     "onomatopoeia": ["効果音1", "効果音2"],
     "direction": "演出・ト書き",
     "story_flow": "次のシーンへの繋がり",
-    "sd_prompt": "{QUALITY_POSITIVE_TAGS}, キャラ外見タグ, ポーズ・行為タグ, 表情タグ, 場所・背景タグ, 照明タグ, テーマタグ"
-}}
+    "sd_prompt": "{_sd_example}"
+}}"""
+
+        # シーン固有部分（毎回変わる）
+        prompt = f"""{roadmap_section}{story_context_section}{scene_instruction}
+
+{output_format_section}
 
 ## タグ参考（sd_promptに統合して使用）
 
@@ -12220,19 +12732,49 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
     if callback:
         callback(f"シーン {scene['scene_id']} 生成中 ({model_name}, 重要度{intensity}, {theme_name}, セリフ:{serihu_skill_name})...")
 
+    _json_schema = SCENE_WIRE_JSON_SCHEMA if SCENE_WIRE_FORMAT_ENABLED and not _use_local_prompt else SCENE_JSON_SCHEMA
+
     # Batch APIモード: プロンプトのみ返す（API呼出なし）
     if _return_prompt_only:
-        return {"system": system_with_cache, "user": prompt, "model": model}
+        return {
+            "system": system_with_cache, "user": prompt, "model": model,
+            "max_tokens": 3000, "routing_hint": routing_hint,
+            "use_local_prompt": _use_local_prompt, "json_schema": _json_schema,
+        }
 
     response = _call_api(
         client, model,
         system_with_cache,
         prompt, cost_tracker, 3000, callback,
         routing_hint=routing_hint,
+        monitor=_scene_stream_monitor(scene_index, total_scenes, callback),
+        json_schema=_json_schema,
     )
-    
+
+    return _finish_scene_draft(response, _use_local_prompt)
+
+
+def _scene_stream_monitor(scene_index: int, total_scenes: int,
+                          callback: Optional[Callable]) -> Optional[StreamMonitor]:
+    """シーン生成用の StreamMonitor（STREAMING_ENABLED=False なら None）
+
+    受信中は "[STREAM]" 付きの進捗を callback に流す（GUIはステータス表示のみ更新）。
+    """
+    if not STREAMING_ENABLED:
+        return None
+    label = f"シーン {scene_index + 1}/{total_scenes}" if scene_index >= 0 and total_scenes else "シーン"
+
+    def _progress(monitor):
+        if callback:
+            callback(f"[STREAM]{label} 生成中… {monitor.chars}文字 ({monitor.tokens_per_sec:.0f} tok/s)")
+
+    return StreamMonitor(label, on_progress=_progress)
+
+
+def _finish_scene_draft(response: str, use_local_prompt: bool = False) -> dict:
+    """シーン生成レスポンスの後処理（parse → wire形式の展開 → スキーマ検証 → SDタグ重複排除）"""
     # 重複排除の後処理
-    result = parse_json_response(response)
+    result = scene_wire.expand_scene(parse_json_response(response))
 
     # スキーマバリデーション（parse直後）
     if isinstance(result, dict):
@@ -12246,12 +12788,79 @@ bubblesのtextは以下の【喘ぎ声バリエーション集】と【鉄則】
         result["sd_prompt"] = deduplicate_sd_tags(result["sd_prompt"])
 
     # ローカルLLM生成フラグ（auto_fixでbubbles再構築に使用）
-    if isinstance(result, dict) and _use_local_prompt:
+    if isinstance(result, dict) and use_local_prompt:
         result["_generated_by"] = "local"
 
     return result
 
 
+async def agenerate_scene_draft(
+    client: anthropic.Anthropic,
+    context: dict,
+    scene: dict,
+    jailbreak: str,
+    cost_tracker: CostTracker,
+    theme: str = "",
+    char_profiles: list = None,
+    callback: Optional[Callable] = None,
+    story_so_far: str = "",
+    synopsis: str = "",
+    outline_roadmap: str = "",
+    male_description: str = "",
+    scene_index: int = -1,
+    total_scenes: int = 0,
+    faceless_male: bool = True,
+) -> dict:
+    """generate_scene_draft() の非同期版
+
+    プロンプト構築（スキル読込・文字列処理）はスレッドで行い、API呼び出しのみループ上で await する。
+    """
+    req = await asyncio.to_thread(
+        generate_scene_draft,
+        client, context, scene, jailbreak, cost_tracker,
+        theme=theme, char_profiles=char_profiles, callback=callback,
+        story_so_far=story_so_far, synopsis=synopsis,
+        outline_roadmap=outline_roadmap, male_description=male_description,
+        scene_index=scene_index, total_scenes=total_scenes,
+        _return_prompt_only=True, faceless_male=faceless_male,
+    )
+    if _prompt_warmer is not None and not req["use_local_prompt"]:
+        # 予熱中ならキャッシュ作成の完了を待ってから送る（同時に送ると両方が作成課金になる）
+        await _prompt_warmer.ready(req["model"], req["system"])
+    response = await _acall_api(
+        client, req["model"],
+        req["system"],
+        req["user"], cost_tracker, req["max_tokens"], callback,
+        routing_hint=req["routing_hint"],
+        monitor=_scene_stream_monitor(scene_index, total_scenes, callback),
+        json_schema=req["json_schema"],
+    )
+    return _finish_scene_draft(response, req["use_local_prompt"])
+
+
+def _apply_scene_patch(scene: dict, response: str, label: str) -> dict:
+    """清書・修正の応答（編集操作の配列）を scene に適用した新しいシーンを返す
+
+    max_tokens は編集操作の分しか取らないため、シーン全体で返って打ち切られた応答は採用せず scene を返す。
+    """
+    candidate = extract_json(response) if response else None
+    parsed = candidate.value if candidate is not None else parse_json_response(response)
+    sid = scene.get("scene_id", "?")
+    try:
+        patched, applied, rejected = scene_patch.patch_from_response(
+            scene, parsed, truncated=candidate is not None and candidate.truncated,
+        )
+    except scene_patch.TruncatedSceneResponse:
+        log_message(f"{label}: シーン{sid} はシーン全体で返り途中で打ち切られたため下書きを維持")
+        return scene
+    if applied is None:
+        log_message(f"{label}: シーン{sid} はシーン全体で返ったためそのまま採用")
+    else:
+        log_message(f"{label}: シーン{sid} に編集 {applied}件を適用"
+                    + (f"（不正な操作 {len(rejected)}件を無視: {str(rejected)[:200]}）" if rejected else ""))
+    return patched
+
+
 def polish_scene(
     client: anthropic.Anthropic,
     context: dict,
@@ -12330,22 +12939,14 @@ Output JSON only."""
 4. character_feelingsをより感情的に
 5. onomatopoeiaが場面に合っているか確認
 
-## 保持すべきフィールド
-- scene_id, title, description, location_detail
-- mood, character_feelings
-- bubbles (speaker, type, text)
-- onomatopoeia
-- direction, story_flow
-- sd_prompt
-
-同じJSON形式で出力。JSONのみ。"""
+{scene_patch.patch_format()}"""
 
     response = _call_api(
         client, model or MODELS["sonnet"],
         system_prompt,
-        prompt, cost_tracker, 2500, callback
+        prompt, cost_tracker, 1200, callback
     )
-    return parse_json_response(response)
+    return _apply_scene_patch(draft, response, "清書")
 
 
 # === Skill 3: Script Quality Supervisor ===
@@ -12406,36 +13007,44 @@ def apply_fix(
 指示に従い、該当箇所のみ修正してください。
 全体の再生成は禁止。最小限の変更のみ。
 
-同じJSON形式で出力。JSONのみ。"""
+{scene_patch.patch_format()}"""
 
     response = _call_api(
         client, MODELS["haiku"],
         "You apply minimal fixes to scripts. Never regenerate entirely.",
-        prompt, cost_tracker, 2048, callback
+        prompt, cost_tracker, 800, callback
     )
-    return parse_json_response(response)
+    return _apply_scene_patch(scene, response, "修正")
 
 
-# === Wave並列生成ヘルパー ===
-def _generate_single_scene_for_wave(
+# === 並列シーン生成ヘルパー ===
+async def _agenerate_single_scene_for_wave(
     client, context, scene, jailbreak, cost_tracker, theme, char_profiles,
     callback, story_so_far, synopsis, current_roadmap, male_description,
-    scene_index, total_scenes, timestamp, faceless_male=True,
+    scene_index, total_scenes, timestamp, faceless_male=True, hold=None,
 ):
-    """Wave並列生成用: 1シーン分の生成+エラーハンドリング。
+    """1シーン分の生成+エラーハンドリング（AsyncLLMEngine のループ上で実行）。
+
+    ローリング並列・直列・Batch失敗時の再生成で共通。失敗時は RetryPolicy の
+    シーン単位の予算（過負荷・コンテンツ拒否・JSONパースエラー）に従って再投入する。
+    hold はワーカースロット（ローカルLLMのセマフォ等）を返す関数。生成中だけ確保し、
+    バックオフ待ちの間は解放して他のシーンに譲る（待ち終わったら列の最後尾から再取得）。
 
     戻り値: (scene_index, result_dict_or_None, summary_string_or_None, error_msg_or_None)
-    InterruptedError は再送出してWave全体を停止させる。
+    InterruptedError は再送出してスケジューラー全体を停止させる。
     """
     intensity = scene.get("intensity", 3)
     model_type = "Sonnet" if intensity >= 4 else "Haiku(4.5)"
+    policy = _current_retry_policy()
+    retry = policy.begin(SCENE_RETRY_BUDGETS, SCENE_RETRY_BASE_DELAYS)
+    retry_reasons = {ERR_OVERLOADED: "サーバー過負荷", ERR_REFUSAL: "コンテンツ拒否", ERR_JSON: "JSONパースエラー"}
 
-    def _try_generate(**extra_kwargs):
-        draft = generate_scene_draft(
+    async def _try_generate(synopsis_for_try):
+        draft = await agenerate_scene_draft(
             client, context, scene, jailbreak,
             cost_tracker, theme, char_profiles, callback,
             story_so_far=story_so_far,
-            synopsis=extra_kwargs.get("synopsis_override", synopsis),
+            synopsis=synopsis_for_try,
             outline_roadmap=current_roadmap,
             male_description=male_description,
             scene_index=scene_index,
@@ -12447,112 +13056,133 @@ def _generate_single_scene_for_wave(
         if not scene_val["valid"]:
             for err in scene_val["errors"]:
                 log_message(f"  [SCHEMA] シーン{scene_index+1}: {err}")
+            if callback:
+                callback(f"[WARN]シーン{scene_index+1}検証: {len(scene_val['errors'])}件の問題")
         return draft
 
-    try:
-        log_message(f"シーン {scene_index+1}/{total_scenes} 生成開始 (intensity={intensity}, {model_type})")
-        if callback:
-            callback(f"[SCENE]シーン {scene_index+1}/{total_scenes} [{model_type}] 重要度{intensity}")
+    log_message(f"シーン {scene_index+1}/{total_scenes} 生成開始 (intensity={intensity}, {model_type})")
+    if callback:
+        callback(f"[SCENE]シーン {scene_index+1}/{total_scenes} [{model_type}] 重要度{intensity}")
+
+    synopsis_for_try = synopsis
+    while True:
+        try:
+            if hold is not None:
+                async with hold():
+                    draft = await _try_generate(synopsis_for_try)
+            else:
+                draft = await _try_generate(synopsis_for_try)
+            break
+
+        except InterruptedError:
+            # ユーザー停止要求 → 再送出してスケジューラー全体を停止させる
+            raise
+
+        except Exception as e:
+            err_msg = str(e)
+            log_message(f"シーン {scene_index+1} 生成エラー: {err_msg}")
+            kind = classify_error(e)
+            delay = retry.next_delay(kind) if kind in retry_reasons else None
+            if delay is None:
+                # リトライ対象外 or 予算切れ → エラー結果を返す
+                import traceback
+                log_message(traceback.format_exc())
+                if callback:
+                    callback(f"[ERROR]シーン {scene_index+1} エラー: {err_msg[:50]}")
+                error_result = {
+                    "scene_id": scene.get("scene_id", scene_index + 1),
+                    "title": f"シーン{scene_index+1}",
+                    "mood": "エラー",
+                    "bubbles": [],
+                    "onomatopoeia": [],
+                    "direction": f"生成エラー: {err_msg[:100]}",
+                    "sd_prompt": ""
+                }
+                return (scene_index, error_result, f"[シーン{scene_index+1}: エラーにより欠落]", None)
+
+            if kind == ERR_REFUSAL:
+                synopsis_for_try = ""  # あらすじが拒否の引き金になりやすいため外して再試行
+            _n, _budget = retry.count(kind), SCENE_RETRY_BUDGETS[kind]
+            _wait = f"{delay}秒後に" if delay else ""
+            log_message(f"シーン {scene_index+1} {retry_reasons[kind]}検出: {_wait}再投入 ({_n}/{_budget})")
+            if callback:
+                callback(f"[WARN]シーン {scene_index+1} {retry_reasons[kind]}、{_wait}リトライ中... ({_n}/{_budget})")
+            await policy.sleep(delay)
+
+    _save_scene_files(timestamp, scene_index, draft)
+    summary = extract_scene_summary(draft)
+    if retry.attempts:
+        log_message(f"シーン {scene_index+1} リトライ{retry.attempts}回目で成功")
+    log_message(f"シーン {scene_index+1}/{total_scenes} 完了")
+    if callback:
+        callback(f"[OK]シーン {scene_index+1}/{total_scenes} {'リトライ成功' if retry.attempts else '完了'}")
+    return (scene_index, draft, summary, None)
+
 
-        draft = _try_generate()
+def _save_scene_files(timestamp, scene_index, draft):
+    """生成したシーンを drafts/ と final/ に保存"""
+    draft_file = DRAFTS_DIR / f"draft_{timestamp}_scene{scene_index+1}.json"
+    with open(draft_file, "w", encoding="utf-8") as f:
+        json.dump(draft, f, ensure_ascii=False, indent=2)
+    final_file = FINAL_DIR / f"final_{timestamp}_scene{scene_index+1}.json"
+    with open(final_file, "w", encoding="utf-8") as f:
+        json.dump(draft, f, ensure_ascii=False, indent=2)
 
-        # ファイル保存
-        draft_file = DRAFTS_DIR / f"draft_{timestamp}_scene{scene_index+1}.json"
-        with open(draft_file, "w", encoding="utf-8") as f:
-            json.dump(draft, f, ensure_ascii=False, indent=2)
-        final_file = FINAL_DIR / f"final_{timestamp}_scene{scene_index+1}.json"
-        with open(final_file, "w", encoding="utf-8") as f:
-            json.dump(draft, f, ensure_ascii=False, indent=2)
 
-        summary = extract_scene_summary(draft)
-        log_message(f"シーン {scene_index+1}/{total_scenes} 完了")
+async def _agenerate_scene_batch_for_wave(
+    client, context, scenes, jailbreak, cost_tracker, theme, char_profiles,
+    callback, story_so_far, male_description, indices, total_scenes, timestamp, faceless_male=True,
+    outline_roadmap="",
+):
+    """連続する低intensityシーンをまとめて1回で生成する（AsyncLLMEngine のループ上で実行）。
+
+    戻り値: indices と同じ順の [(scene_index, draft, summary) or None, ...]。
+    応答に含まれなかったシーン・API エラー時は None（呼び出し元が分割して再生成する）。
+    InterruptedError は再送出する。
+    """
+    for si, scene in zip(indices, scenes):
+        log_message(f"シーン {si+1}/{total_scenes} 生成開始 (intensity={scene.get('intensity', 3)}, "
+                    f"Haiku(4.5) バッチ{len(scenes)}シーン)")
         if callback:
-            callback(f"[OK]シーン {scene_index+1}/{total_scenes} 完了")
-        return (scene_index, draft, summary, None)
-
+            callback(f"[SCENE]シーン {si+1}/{total_scenes} [Haiku(4.5) バッチ] 重要度{scene.get('intensity', 3)}")
+    try:
+        drafts = await agenerate_scene_batch(
+            client, context, scenes, jailbreak, cost_tracker, theme, char_profiles, callback,
+            story_so_far=story_so_far, male_description=male_description, faceless_male=faceless_male,
+            outline_roadmap=outline_roadmap,
+        )
     except InterruptedError:
-        # ユーザー停止要求 → 再送出してWave全体を停止させる
         raise
-
     except Exception as e:
-        err_msg = str(e)
-        log_message(f"シーン {scene_index+1} 生成エラー: {err_msg}")
-
-        # 529 Overloaded: クールダウン後にリトライ
-        is_overloaded = "サーバー過負荷" in err_msg or "529" in err_msg or "Overloaded" in err_msg
-        if is_overloaded:
-            cooldown = 60
-            log_message(f"サーバー過負荷検出: {cooldown}秒待機後にシーン{scene_index+1}をリトライ")
-            if callback:
-                callback(f"[WARN]サーバー過負荷、{cooldown}秒待機後にシーン{scene_index+1}をリトライ...")
-            time.sleep(cooldown)
-            try:
-                draft = _try_generate()
-                draft_file = DRAFTS_DIR / f"draft_{timestamp}_scene{scene_index+1}.json"
-                with open(draft_file, "w", encoding="utf-8") as f:
-                    json.dump(draft, f, ensure_ascii=False, indent=2)
-                final_file = FINAL_DIR / f"final_{timestamp}_scene{scene_index+1}.json"
-                with open(final_file, "w", encoding="utf-8") as f:
-                    json.dump(draft, f, ensure_ascii=False, indent=2)
-                summary = extract_scene_summary(draft)
-                log_message(f"シーン {scene_index+1} 過負荷リトライ成功")
-                if callback:
-                    callback(f"[OK]シーン {scene_index+1}/{total_scenes} 過負荷リトライ成功")
-                return (scene_index, draft, summary, None)
-            except InterruptedError:
-                raise
-            except Exception as e2:
-                err_msg = str(e2)
-                log_message(f"シーン {scene_index+1} 過負荷リトライも失敗: {err_msg}")
-
-        # コンテンツ拒否 or JSONパースエラー → 最大2回リトライ
-        is_refusal = any(kw in err_msg for kw in ["倫理", "対応することはできません", "cannot", "inappropriate"])
-        is_json_error = any(kw in err_msg for kw in ["Invalid JSON", "No JSON", "Empty response", "JSONDecodeError"])
+        log_message(f"バッチ生成エラー (シーン{[si + 1 for si in indices]}): {e}")
+        return [None] * len(scenes)
 
-        if is_refusal or is_json_error:
-            retry_reason = "コンテンツ拒否" if is_refusal else "JSONパースエラー"
-            log_message(f"シーン {scene_index+1} {retry_reason}検出、リトライ")
+    out = []
+    for si, scene, draft in zip(indices, scenes, drafts):
+        if draft is None:
+            out.append(None)
+            continue
+        draft["intensity"] = scene.get("intensity", 3)
+        scene_val = validate_scene(draft, si)
+        if not scene_val["valid"]:
+            for err in scene_val["errors"]:
+                log_message(f"  [SCHEMA] シーン{si+1}: {err}")
             if callback:
-                callback(f"[WARN]シーン {scene_index+1} {retry_reason}、リトライ中...")
-            for retry_n in range(2):
-                try:
-                    draft = _try_generate(synopsis_override="" if is_refusal else synopsis)
-                    draft_file = DRAFTS_DIR / f"draft_{timestamp}_scene{scene_index+1}.json"
-                    with open(draft_file, "w", encoding="utf-8") as f:
-                        json.dump(draft, f, ensure_ascii=False, indent=2)
-                    final_file = FINAL_DIR / f"final_{timestamp}_scene{scene_index+1}.json"
-                    with open(final_file, "w", encoding="utf-8") as f:
-                        json.dump(draft, f, ensure_ascii=False, indent=2)
-                    summary = extract_scene_summary(draft)
-                    log_message(f"シーン {scene_index+1} リトライ{retry_n+1}回目成功")
-                    if callback:
-                        callback(f"[OK]シーン {scene_index+1}/{total_scenes} リトライ成功")
-                    return (scene_index, draft, summary, None)
-                except InterruptedError:
-                    raise
-                except Exception as e2:
-                    log_message(f"シーン {scene_index+1} リトライ{retry_n+1}回目失敗: {e2}")
-
-        # 全リトライ失敗 → エラー結果を返す
-        import traceback
-        log_message(traceback.format_exc())
+                callback(f"[WARN]シーン{si+1}検証: {len(scene_val['errors'])}件の問題")
+        _save_scene_files(timestamp, si, draft)
+        log_message(f"シーン {si+1}/{total_scenes} 完了（バッチ）")
         if callback:
-            callback(f"[ERROR]シーン {scene_index+1} エラー: {err_msg[:50]}")
-
-        error_result = {
-            "scene_id": scene.get("scene_id", scene_index + 1),
-            "title": f"シーン{scene_index+1}",
-            "mood": "エラー",
-            "bubbles": [],
-            "onomatopoeia": [],
-            "direction": f"生成エラー: {err_msg[:100]}",
-            "sd_prompt": ""
-        }
-        return (scene_index, error_result, f"[シーン{scene_index+1}: エラーにより欠落]", None)
+            callback(f"[OK]シーン {si+1}/{total_scenes} 完了")
+        out.append((si, draft, extract_scene_summary(draft)))
+    return out
 
 
-def _prepare_wave_scene_args(scene_index, scene, roadmap_lines, story_so_far, outline):
-    """Wave内の1シーン用の共通引数（ロードマップ・前シーン情報）を準備する"""
+def _prepare_wave_scene_args(scene_index, scene, roadmap_lines, story_so_far, outline, marked=None):
+    """並列生成する1シーン用の共通引数（ロードマップ・前シーン情報）を準備する
+
+    marked: ロードマップで ★ を付ける行の index（省略時は scene_index のみ。バッチ生成ではバッチ内の全シーン）
+    """
+    marked = {scene_index} if marked is None else set(marked)
     # 各シーンのロードマップ（近傍±5行）
     marked_lines = []
     window_start = max(0, scene_index - 5)
@@ -12561,7 +13191,7 @@ def _prepare_wave_scene_args(scene_index, scene, roadmap_lines, story_so_far, ou
         marked_lines.append(f"  ... (シーン1〜{window_start}省略)")
     for j in range(window_start, window_end):
         line = roadmap_lines[j]
-        if j == scene_index:
+        if j in marked:
             marked_lines.append(f"★ {line}")
         else:
             marked_lines.append(f"  {line}")
@@ -12583,121 +13213,406 @@ def _prepare_wave_scene_args(scene_index, scene, roadmap_lines, story_so_far, ou
     return current_roadmap, story_so_far_augmented
 
 
-def _generate_scenes_wave(
-    wave_scenes, client, context, jailbreak, cost_tracker, theme, char_profiles,
-    callback, story_so_far, synopsis, roadmap_lines, male_description,
-    total_scenes, timestamp, max_workers=CONCURRENT_BATCH_SIZE,
-    outline=None, faceless_male=True,
-):
-    """Wave内の全シーンを生成し、scene_index順にソートして返す。
+def _adaptive_window_size() -> int:
+    """AIMDコントローラーの現在の同時実行上限からローリングウィンドウ幅を決める
+
+    シーンはintensityでSonnet/Haikuに振り分けられるため、大きい方の上限を採用する。
+    ハイブリッドモードではローカルLLMの並列スロットが全て埋まる幅も確保する。
+    実際のAPI同時実行数はモデル別のスロットで制限される。
+    """
+    _aimd = get_controller()
+    limit = max(_aimd.limit(MODELS["sonnet"]), _aimd.limit(MODELS["haiku"]))
+    window = max(1, min(limit, CONCURRENT_MAX_BATCH_SIZE))
+    if _hybrid_router is not None and _hybrid_router.local is not None:
+        window = max(window, _hybrid_router.local.parallelism)
+    return window
+
+
+def _rolling_window_k() -> int:
+    """ローリングスケジューラーの依存距離k（シーンiはシーンi-kの完了後に開始）"""
+    if ROLLING_WINDOW_K:
+        return max(1, int(ROLLING_WINDOW_K))
+    return _adaptive_window_size()
+
+
+def _build_roadmap_lines(outline: list) -> list:
+    """ストーリーロードマップ（1シーン1行の概要）を構築"""
+    roadmap_lines = []
+    for s in outline:
+        sid = s.get("scene_id", "?")
+        title = s.get("title", "")[:20]
+        _rm_intensity = s.get("intensity", 3)
+        situation = s.get("situation", "")[:60]
+        location = s.get("location", "")[:15]
+        goal = s.get("goal", "")[:30]
+        goal_part = f" 目的:{goal}" if goal else ""
+        roadmap_lines.append(f"[{sid}] {title} (i={_rm_intensity}, {location}) {situation}{goal_part}")
+    return roadmap_lines
+
 
-    ハイブリッドモード時:
-    - cloud (i>=4): ThreadPoolExecutor並列
-    - local (i<=3): 直列（GPU占有のため並列不可）
-    - cloudの実行中にlocalを直列処理（インターリーブ）
+def _close_outline_stream(stream: OutlineStream, outline: list) -> list:
+    """最終アウトラインで OutlineStream を閉じ、生成開始済みシーンを含む最終アウトラインを返す
 
-    戻り値: [(scene_index, result_dict, summary_string, error), ...]
-    InterruptedError発生時はexecutorをシャットダウンして再送出。
-    v8.7: outline引数追加でWave内前シーンアウトライン情報を注入。
+    確定済み（生成開始済み）のシーンは最終正規化の結果に関わらずそのまま使う。
+    その直後のシーンが2段階以上上がる場合は1段階に抑える。
+    """
+    released = stream.scenes
+    n = len(released)
+    if 0 < n < len(outline):
+        prev_i = released[-1].get("intensity", 3)
+        curr_i = outline[n].get("intensity", 3)
+        if curr_i - prev_i >= 2:
+            outline[n]["intensity"] = prev_i + 1
+            outline[n]["erotic_level"] = EROTIC_LEVEL_BY_INTENSITY.get(prev_i + 1, "medium")
+            log_message(f"シーン{n+1}: intensity {curr_i}→{prev_i + 1}に修正（先行生成シーンとの境界）")
+    final = stream.close(outline)
+    if n:
+        log_message(f"アウトライン確定: 先行生成{n}シーン + 残り{len(final) - n}シーン")
+    return final
+
+
+def _generate_scenes_rolling(
+    outline, client, context, jailbreak, cost_tracker, theme, char_profiles,
+    callback, synopsis, roadmap_lines, male_description, timestamp,
+    results, story_summaries, faceless_male=True,
+):
+    """ローリング依存ウィンドウで全シーンを生成する（Wave方式の置き換え）。
+
+    - シーンiはシーンi-kの完了を待って開始（kは ROLLING_WINDOW_K / AIMD上限）
+    - story_so_far は開始時点で「先頭から連続して完了したシーン」から構築
+    - 直前シーンが未完了でも _prepare_wave_scene_args のアウトラインアンカーで接続
+    - 遅いSonnetシーンがあっても、後続シーンはウィンドウ内で先に進める
+    - ハイブリッドモード時、ローカルシーン（intensity<=3）はローカルLLMの並列スロット合計まで同時実行
+      （llama-server の /props で検出、1スロットなら直列）
+    - 非ハイブリッド時、開始できるシーンに続く到着済みの低intensityシーン（SCENE_BATCH_MAX_INTENSITY 以下）を
+      推定出力トークンの予算内で generate_scene_batch にまとめる。返らなかったシーンだけ分割して再生成
+
+    完了したシーンは連続プレフィックスが伸びた時点で results / story_summaries に
+    scene_index順で追記される（呼び出し元のリストを直接更新）。
+    InterruptedError等の例外発生時は残りのタスクをキャンセルして再送出。
+    停止トークンがキャンセルされた場合は実行中のHTTPリクエストごと全タスクを打ち切る。
     """
-    wave_results = []
+    get_engine().run(_arun_scenes_rolling(
+        OutlineStream.from_outline(outline), client, context, jailbreak, cost_tracker, theme,
+        char_profiles, callback, synopsis, male_description, timestamp,
+        results, story_summaries, faceless_male, roadmap_lines=roadmap_lines,
+    ), cancel=llm_cancel.current_token())
+
+
+def _start_scenes_rolling(
+    stream, client, context, jailbreak, cost_tracker, theme, char_profiles,
+    callback, synopsis, male_description, timestamp,
+    results, story_summaries, faceless_male=True,
+) -> concurrent.futures.Future:
+    """アウトライン生成（Phase 3）と並行してローリング生成を開始し、完了を表す Future を返す
+
+    stream（OutlineStream）でチャンクが確定するたびに該当シーンの生成を始める。
+    後続シーンのロードマップは既知のシーンの範囲で埋め、チャンク到着に応じて伸ばす。
+    """
+    token = llm_cancel.current_token()
+    coro = _arun_scenes_rolling(
+        stream, client, context, jailbreak, cost_tracker, theme, char_profiles,
+        callback, synopsis, male_description, timestamp,
+        results, story_summaries, faceless_male,
+    )
+    return get_engine().submit(token.run(coro) if token is not None else coro)
 
-    # ハイブリッドモード: local/cloud分割
+
+async def _arun_scenes_rolling(
+    stream, client, context, jailbreak, cost_tracker, theme, char_profiles,
+    callback, synopsis, male_description, timestamp,
+    results, story_summaries, faceless_male, roadmap_lines=None,
+):
+    # Phase 3 の途中から投入された場合もシーン生成の分として集計
+    set_cost_phase(COST_PHASE_SCENES)
     is_hybrid = _hybrid_router is not None and _hybrid_router.local_enabled
-    if is_hybrid:
-        local_scenes = []
-        cloud_scenes = []
-        for scene_index, scene in wave_scenes:
-            intensity = scene.get("intensity", 3)
-            if intensity >= 4:
-                cloud_scenes.append((scene_index, scene))
-            else:
-                local_scenes.append((scene_index, scene))
-
-        if local_scenes or cloud_scenes:
-            log_message(f"  ハイブリッドWave: ローカル{len(local_scenes)}シーン + クラウド{len(cloud_scenes)}シーン")
-
-        # Phase 1: クラウドシーンを非同期で開始
-        cloud_futures = {}
-        executor = None
-        if cloud_scenes:
-            executor = ThreadPoolExecutor(max_workers=max_workers)
-            for scene_index, scene in cloud_scenes:
-                roadmap, ssa = _prepare_wave_scene_args(
-                    scene_index, scene, roadmap_lines, story_so_far, outline
-                )
-                future = executor.submit(
-                    _generate_single_scene_for_wave,
-                    client, context, scene, jailbreak, cost_tracker, theme, char_profiles,
-                    callback, ssa, synopsis, roadmap, male_description,
-                    scene_index, total_scenes, timestamp, faceless_male,
-                )
-                cloud_futures[future] = scene_index
+    k_initial = _rolling_window_k()
+    log_message(f"ローリング生成: {stream.total}シーン, 依存距離k={k_initial}"
+                f"{'（AIMD自動調整）' if not ROLLING_WINDOW_K else ''}"
+                f"{', ハイブリッド' if is_hybrid else ''}"
+                f"{'' if stream.closed else ', アウトライン到着順に開始'}")
+    if callback:
+        callback(f"[INFO]ローリング並列モード: シーンiはシーンi-{k_initial}完了後に開始")
+
+    base = len(results)                    # Phase 4開始前に確定済みのシーン数
+    done = []                              # scene_index → (draft, summary)（開始済みのシーン分）
+    prefix = 0                             # 先頭から連続して完了したシーン数
+    progress = asyncio.Condition()
+    # ローカルLLMはサーバーの並列スロット数まで（スロット1のサーバーはGPU占有のため直列）
+    local_sem = asyncio.Semaphore(max(1, _hybrid_router.local.parallelism) if is_hybrid else 1)
+    # ロードマップは既知シーンが増えたときだけ作り直す
+    roadmap = {"version": None, "lines": roadmap_lines}
+    # story_so_far は完了プレフィックスの伸びに合わせて増分更新
+    story = StoryContext(story_summaries, results)
+
+    def _roadmap_lines():
+        if roadmap_lines is not None:
+            return roadmap_lines
+        if roadmap["version"] != stream.version:
+            roadmap["version"] = stream.version
+            roadmap["lines"] = _build_roadmap_lines(stream.known())
+        return roadmap["lines"]
+
+    def _ready(i):
+        k = _rolling_window_k()
+        return i - k < 0 or done[i - k] is not None
+
+    async def _complete(si, draft, summary):
+        nonlocal prefix
+        async with progress:
+            done[si] = (draft, summary)
+            # 連続プレフィックスを伸ばして results / story_summaries に順序通り追記
+            while prefix < len(done) and done[prefix] is not None:
+                _draft, _summary = done[prefix]
+                results.append(_draft)
+                story_summaries.append(_summary)
+                log_message(f"シーン {prefix+1} 要約蓄積: {_summary[:80]}...")
+                prefix += 1
+            progress.notify_all()
+
+    async def _run_single(i, scene):
+        # 開始時点の連続プレフィックスのstory_so_far
+        story_so_far = story.snapshot()
+        scene_roadmap, ssa = _prepare_wave_scene_args(
+            i, scene, _roadmap_lines(), story_so_far, stream.scenes
+        )
+        if prefix < i:
+            log_message(f"  シーン{i+1}開始: 完了済みプレフィックス={prefix}シーン（未完了の直前シーンはアンカーで接続）")
+
+        # ローカルシーンはスロットを生成中だけ確保（リトライ待ちの間は解放して後続に譲る）
+        hold = (lambda: local_sem) if is_hybrid and scene.get("intensity", 3) < 4 else None
+        si, draft, summary, _err = await _agenerate_single_scene_for_wave(
+            client, context, scene, jailbreak, cost_tracker, theme, char_profiles,
+            callback, ssa, synopsis, scene_roadmap, male_description,
+            i, stream.total, timestamp, faceless_male, hold=hold,
+        )
+        await _complete(si, draft, summary)
 
-        # Phase 2: クラウドの待ち時間中にローカルシーンを直列処理
-        try:
-            for scene_index, scene in local_scenes:
-                roadmap, ssa = _prepare_wave_scene_args(
-                    scene_index, scene, roadmap_lines, story_so_far, outline
-                )
-                result = _generate_single_scene_for_wave(
-                    client, context, scene, jailbreak, cost_tracker, theme, char_profiles,
-                    callback, ssa, synopsis, roadmap, male_description,
-                    scene_index, total_scenes, timestamp, faceless_male,
-                )
-                wave_results.append(result)
+    # 低intensityシーンのバッチ（ハイブリッド時は低intensityシーンがローカルLLMに行くため使わない）
+    batching = SCENE_BATCH_ENABLED and not is_hybrid
+    arrived = []                           # stream から受け取ったシーン（scene_index順）
+    started, claimed = set(), set()        # 生成を始めたシーン / 前のシーンのバッチにまとめられたシーン
+    batch_stats = {"batches": 0, "scenes": 0, "retried": 0, "est": float(SCENE_BATCH_EST_TOKENS)}
 
-            # Phase 3: クラウド結果を収集
-            interrupted = False
-            for future in as_completed(cloud_futures):
-                try:
-                    result = future.result()
-                    wave_results.append(result)
-                except InterruptedError:
-                    interrupted = True
-                    for f in cloud_futures:
-                        f.cancel()
-                    break
+    def _batchable(scene):
+        return scene.get("intensity", 3) <= SCENE_BATCH_MAX_INTENSITY
+
+    def _claim_batch(i):
+        """シーンiから続く到着済み・未開始の低intensityシーンを、推定出力トークンの予算内でまとめる"""
+        group = [i]
+        if not batching or not _batchable(arrived[i]):
+            return group
+        est = batch_stats["est"]
+        for j in range(i + 1, len(arrived)):
+            if (len(group) >= SCENE_BATCH_MAX_SCENES or est * (len(group) + 1) > SCENE_BATCH_TOKEN_BUDGET
+                    or j in started or j in claimed or not _batchable(arrived[j])):
+                break
+            group.append(j)
+        if len(group) > 1:
+            claimed.update(group[1:])
+        return group
+
+    async def _run_batch(group):
+        story_so_far = story.snapshot()
+        batch_roadmap, ssa = _prepare_wave_scene_args(
+            group[0], arrived[group[0]], _roadmap_lines(), story_so_far, stream.scenes, marked=group
+        )
+        out = await _agenerate_scene_batch_for_wave(
+            client, context, [arrived[j] for j in group], jailbreak, cost_tracker, theme, char_profiles,
+            callback, ssa, male_description, group, stream.total, timestamp, faceless_male,
+            outline_roadmap=batch_roadmap,
+        )
+        got = [r for r in out if r is not None]
+        batch_stats["batches"] += 1
+        batch_stats["scenes"] += len(got)
+        if got:
+            # 1シーンあたりの出力トークンの実績で次のバッチの大きさを調整
+            observed = sum(estimate_tokens(json.dumps(d, ensure_ascii=False)) for _si, d, _s in got) / len(got)
+            batch_stats["est"] = (batch_stats["est"] + observed) / 2
+        for si, draft, summary in got:
+            await _complete(si, draft, summary)
+
+        missing = [j for j, r in zip(group, out) if r is None]
+        if not missing:
+            return
+        # 不足分だけ半分ずつに分けて再生成（1シーンになったら通常の1シーン生成）
+        batch_stats["retried"] += len(missing)
+        log_message(f"バッチ不足: シーン{[j + 1 for j in missing]} を分割して再生成")
+        half = (len(missing) + 1) // 2
+        parts = [p for p in (missing[:half], missing[half:]) if p]
+        await asyncio.gather(*(
+            _run_batch(part) if len(part) > 1 else _run_single(part[0], arrived[part[0]]) for part in parts
+        ))
+
+    async def _run_scene(i, scene):
+        async with progress:
+            await progress.wait_for(lambda: _ready(i))
+            if i in claimed:
+                return   # 前のシーンのバッチで生成する
+            started.add(i)
+            group = _claim_batch(i)
+        if len(group) > 1:
+            await _run_batch(group)
+        else:
+            await _run_single(i, scene)
 
-            if interrupted:
-                raise InterruptedError("ユーザーによる停止")
-        finally:
-            if executor:
-                executor.shutdown(wait=False)
+    tasks = []
+    try:
+        async for i, scene in stream:
+            if not stream.closed:
+                log_message(f"  シーン{i+1}: アウトライン確定 → 生成キューへ（アウトライン生成中）")
+            done.append(None)
+            arrived.append(scene)
+            tasks.append(asyncio.ensure_future(_run_scene(i, scene)))
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    if batch_stats["batches"]:
+        log_message(f"低intensityバッチ: {batch_stats['batches']}回で{batch_stats['scenes']}シーン生成"
+                    f"（不足の再生成 {batch_stats['retried']}シーン, 推定 {batch_stats['est']:.0f}トークン/シーン）")
+    # 全タスク終了後に未完了シーンが残るのはスケジューラの不整合。欠けたまま後段へ渡さない
+    missing = [i + 1 for i, d in enumerate(done) if d is None]
+    if missing or len(results) != base + len(done):
+        msg = (f"ローリング生成の不整合: 未完了シーン{missing}"
+               f"（確定 {len(results) - base}/{len(done)}シーン）")
+        log_message(f"[ERROR]{msg}")
+        if callback:
+            callback(f"[ERROR]{msg}")
+        raise RuntimeError(msg)
+
+
+def _generate_scenes_batch_api(
+    outline, client, context, jailbreak, cost_tracker, theme, char_profiles,
+    callback, synopsis, roadmap_lines, male_description, timestamp,
+    results, story_summaries, faceless_male=True, job_key="", resume_state=None,
+):
+    """Message Batches API で全シーンのドラフトを生成する（非対話・夜間向け）。
+
+    1. 全シーンのプロンプトを構築して1つのバッチとして投入
+    2. 状態（batch_id・アウトライン等）を CONTEXT_DIR に保存し、完了までポーリング
+    3. 結果をパース・検証して results / story_summaries に scene_index 順で追記
+
+    バッチ内のシーンは同時に生成されるため story_so_far は使えない。
+    代わりにロードマップと前シーンのアウトラインアンカーで接続する。
+    失敗・期限切れのシーンのみ通常APIで個別に再生成する。
+    resume_state を渡すと投入を省略し、保存済みのジョブのポーリングから再開する。
+    """
+    total_scenes = len(outline)
+    state_file = llm_batch.state_path(CONTEXT_DIR, timestamp)
+
+    if resume_state is None:
+        requests = []
+        scenes_meta = {}
+        for i, scene in enumerate(outline):
+            roadmap, ssa = _prepare_wave_scene_args(i, scene, roadmap_lines, "", outline)
+            req = generate_scene_draft(
+                client, context, scene, jailbreak,
+                cost_tracker, theme, char_profiles, None,
+                story_so_far=ssa,
+                synopsis=synopsis,
+                outline_roadmap=roadmap,
+                male_description=male_description,
+                scene_index=i,
+                total_scenes=total_scenes,
+                _return_prompt_only=True,
+                faceless_male=faceless_male,
+            )
+            custom_id = llm_batch.scene_custom_id(i)
+            requests.append(llm_batch.build_request(
+                custom_id, req["model"], req["system"], req["user"], req["max_tokens"]
+            ))
+            scenes_meta[custom_id] = {
+                "model": req["model"],
+                "use_local_prompt": req["use_local_prompt"],
+            }
 
+        batch_id = llm_batch.submit(client, requests)
+        state = {
+            "job_key": job_key,
+            "timestamp": timestamp,
+            "batch_id": batch_id,
+            "status": llm_batch.STATUS_SUBMITTED,
+            "processing_status": "in_progress",
+            "scenes": scenes_meta,
+            "context": context,
+            "synopsis": synopsis,
+            "outline": outline,
+        }
+        llm_batch.save_state(state_file, state)
+        log_message(f"Batch投入: {batch_id} ({total_scenes}シーン) → {state_file.name}")
+        if callback:
+            callback(f"[WAVE]Batch投入完了: {total_scenes}シーン（結果待ち、停止しても再実行で再開可能）")
     else:
-        # 従来モード: 全シーンをThreadPoolExecutor並列
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = {}
-            for scene_index, scene in wave_scenes:
-                roadmap, ssa = _prepare_wave_scene_args(
-                    scene_index, scene, roadmap_lines, story_so_far, outline
-                )
-                future = executor.submit(
-                    _generate_single_scene_for_wave,
-                    client, context, scene, jailbreak, cost_tracker, theme, char_profiles,
-                    callback, ssa, synopsis, roadmap, male_description,
-                    scene_index, total_scenes, timestamp, faceless_male,
-                )
-                futures[future] = scene_index
+        state = resume_state
+        batch_id = state["batch_id"]
 
-            interrupted = False
-            for future in as_completed(futures):
-                try:
-                    result = future.result()
-                    wave_results.append(result)
-                except InterruptedError:
-                    interrupted = True
-                    for f in futures:
-                        f.cancel()
-                    break
+    def _on_poll(batch):
+        if state.get("processing_status") != batch.processing_status:
+            state["processing_status"] = batch.processing_status
+            llm_batch.save_state(state_file, state)
+
+    llm_batch.wait_until_ended(client, batch_id, callback, on_poll=_on_poll)
+
+    # 結果回収
+    drafts = [None] * total_scenes
+    for custom_id, result_type, message, err in llm_batch.iter_results(client, batch_id):
+        i = llm_batch.scene_index_from_custom_id(custom_id)
+        if not 0 <= i < total_scenes:
+            continue
+        if message is None:
+            log_message(f"シーン {i+1} Batch失敗 ({result_type}): {err[:200]}")
+            continue
+        meta = state["scenes"].get(custom_id, {})
+        usage = message.usage
+        cost_tracker.add(
+            message.model, usage.input_tokens, usage.output_tokens,
+            getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            getattr(usage, "cache_read_input_tokens", 0) or 0,
+            batch=True,
+        )
+        try:
+            draft = _finish_scene_draft(message.content[0].text, meta.get("use_local_prompt", False))
+        except Exception as e:
+            log_message(f"シーン {i+1} Batch結果パース失敗: {e}")
+            continue
+        draft["intensity"] = outline[i].get("intensity", 3)
+        scene_val = validate_scene(draft, i)
+        if not scene_val["valid"]:
+            for err_msg in scene_val["errors"]:
+                log_message(f"  [SCHEMA] シーン{i+1}: {err_msg}")
+        drafts[i] = draft
 
-            if interrupted:
-                raise InterruptedError("ユーザーによる停止")
+    failed = [i for i, d in enumerate(drafts) if d is None]
+    log_message(f"Batch結果回収: 成功{total_scenes - len(failed)}/{total_scenes}")
+    if callback:
+        callback(f"[OK]Batch完了: 成功{total_scenes - len(failed)}/{total_scenes}シーン")
+
+    story = StoryContext(story_summaries, results)
+    for i, draft in enumerate(drafts):
+        if draft is None:
+            # 失敗シーンのみ通常APIで再生成（前シーンまでの結果をstory_so_farとして使える）
+            if callback:
+                callback(f"[WARN]シーン {i+1} Batch失敗 → 通常APIで再生成")
+            roadmap, ssa = _prepare_wave_scene_args(
+                i, outline[i], roadmap_lines, story.snapshot(), outline
+            )
+            _si, draft, summary, _err = get_engine().run(_agenerate_single_scene_for_wave(
+                client, context, outline[i], jailbreak, cost_tracker, theme, char_profiles,
+                callback, ssa, synopsis, roadmap, male_description,
+                i, total_scenes, timestamp, faceless_male,
+            ), cancel=llm_cancel.current_token())
+        else:
+            _save_scene_files(timestamp, i, draft)
+            summary = extract_scene_summary(draft)
+        results.append(draft)
+        story_summaries.append(summary)
+        log_message(f"シーン {i+1} 要約蓄積: {summary[:80]}...")
 
-    # scene_index順にソート
-    wave_results.sort(key=lambda x: x[0])
-    return wave_results
+    state["status"] = llm_batch.STATUS_COLLECTED
+    llm_batch.save_state(state_file, state)
 
 
 # === メインパイプライン ===
@@ -12723,25 +13638,59 @@ def generate_pipeline(
     local_llm_enabled: bool = False,
     local_llm_url: str = "",
     local_llm_api_key: str = "",
+    local_llm_hedge: bool = False,
+    local_llm_slots: str = "",
+    local_llm_json_schema: bool = True,
+    batch_mode: bool = False,
+    response_cache: Optional[bool] = None,
+    retry_deadline: float = RETRY_RUN_DEADLINE,
+    cancel_token: Optional[CancelToken] = None,
 ) -> tuple[list, CostTracker]:
-    global _hybrid_router
+    global _hybrid_router, _retry_policy, _prompt_warmer, _response_cache_enabled
     client = anthropic.Anthropic(api_key=api_key)
     cost_tracker = CostTracker()
+    # 停止トークン（cancel() で実行中のAPI呼び出し・HTTPストリームごと打ち切る）
+    cancel_token = cancel_token or CancelToken()
+    llm_cancel.bind(cancel_token)
+    set_cost_phase("")
+    # 応答キャッシュ（None なら RESPONSE_CACHE_ENABLED に従う）
+    _response_cache_enabled = response_cache
+    if response_cache:
+        log_message(f"応答キャッシュ有効: {CACHE_DIR}")
+    # キャラのセリフプール等の編集を反映するため、実行ごとにシーンの共通プレフィックスを作り直す
+    with _scene_prefix_lock:
+        _scene_prefix_cache.clear()
+    # リトライ方針（この実行の期限 retry_deadline 秒を過ぎたら再試行せず失敗扱い）
+    _retry_policy = RetryPolicy(deadline=retry_deadline, should_stop=lambda: cancel_token.cancelled)
+    # プロンプトキャッシュの予熱（Batch APIモードはリクエストをまとめて投入するので不要）
+    if _prompt_warmer is not None:
+        _prompt_warmer.close()
+    _prompt_warmer = None
+    if PROMPT_PREWARM_ENABLED and not batch_mode:
+        _prompt_warmer = PromptCacheWarmer(
+            functools.partial(_aprewarm_prompt_cache, client, cost_tracker), get_engine().loop,
+        )
+        cancel_token.add_callback(_prompt_warmer.close)
 
     # ハイブリッドルーター初期化
     if local_llm_enabled:
         try:
             from llm_provider import create_hybrid_router, LOCAL_LLM_BASE_URL
+            # カンマ/改行区切りで複数URLを指定するとエンドポイントプールで負荷分散
             _base_url = local_llm_url.strip() if local_llm_url.strip() else LOCAL_LLM_BASE_URL
             _api_key = local_llm_api_key.strip() if local_llm_api_key.strip() else None
             _hybrid_router = create_hybrid_router(
                 client, call_claude, local_enabled=True,
                 local_base_url=_base_url, local_api_key=_api_key,
+                acall_claude_func=acall_claude,
+                hedge=local_llm_hedge,
+                local_slots=local_llm_slots.strip() or None,
+                local_json_schema=local_llm_json_schema,
             )
-            _is_runpod = "runpod.ai" in _base_url
             if _hybrid_router.local_enabled:
-                _label = "RunPod" if _is_runpod else "ローカルLLM"
-                log_message(f"ハイブリッドモード: {_label} + Claude API")
+                log_message(f"ハイブリッドモード: {_hybrid_router.local.label}"
+                            f"（並列{_hybrid_router.local.parallelism}スロット） + Claude API"
+                            f"{'（ヘッジ有効）' if _hybrid_router.hedge else ''}")
             else:
                 log_message("ローカルLLM/RunPod未検出 → Claude APIのみモード")
                 _hybrid_router = None
@@ -12825,118 +13774,181 @@ def generate_pipeline(
         if callback:
             callback(f"[CHAR]テーマ: {theme_name}")
 
-    # Phase 1: コンテキスト圧縮
-    log_message("Phase 1 開始: コンテキスト圧縮")
-    if callback:
-        callback("🔧 Phase 1: コンテキスト圧縮")
+    # Batch APIモード: 同じ条件で結果未回収のジョブがあれば Phase 1-3 を省略して再開
+    _batch_job_key = ""
+    _batch_resume = None
+    if batch_mode:
+        _batch_job_key = llm_batch.make_job_key(
+            concept, characters, num_scenes, theme, story_structure,
+            male_description, faceless_male,
+        )
+        _pending_path = llm_batch.find_pending_state(CONTEXT_DIR, _batch_job_key)
+        if _pending_path is not None:
+            _batch_resume = llm_batch.load_state(_pending_path)
+            timestamp = _batch_resume["timestamp"]
+            log_message(f"Batchジョブ再開: {_batch_resume['batch_id']} ({_pending_path.name})")
+            if callback:
+                callback(f"[INFO]未回収のBatchジョブを再開: {_batch_resume['batch_id'][:16]}…")
+        if _hybrid_router is not None:
+            # Batch APIはクラウドのみ（ローカルLLMは使わない）
+            log_message("Batch APIモード: ハイブリッドルーターを無効化")
+            _hybrid_router = None
 
-    try:
-        if char_profiles:
-            context = compact_context_local(concept, characters, theme, char_profiles, callback)
-            log_message("コンテキスト圧縮完了（ローカル）")
-        else:
-            context = compact_context(client, concept, characters, theme, cost_tracker, callback)
-            log_message("コンテキスト圧縮完了（API）")
-    except Exception as e:
-        log_message(f"コンテキスト圧縮エラー: {e}")
-        raise
+    results = []
+    story_summaries = []
+    _outline_stream = None   # アウトラインのチャンクをシーン生成に流す OutlineStream
+    _scene_future = None     # Phase 3 と並行して開始したローリング生成
+
+    if _batch_resume is not None:
+        context = _batch_resume["context"]
+        synopsis = _batch_resume["synopsis"]
+        outline = _batch_resume["outline"]
+        log_message(f"Phase 1-3 省略（Batch再開）: {len(outline)}シーン")
+        if callback:
+            callback(f"[OK]Batch再開: アウトライン{len(outline)}シーンを復元")
+    else:
+        # Phase 1: コンテキスト圧縮
+        log_message("Phase 1 開始: コンテキスト圧縮")
+        set_cost_phase("Phase 1 コンテキスト圧縮")
+        if callback:
+            callback("🔧 Phase 1: コンテキスト圧縮")
 
-    context_file = CONTEXT_DIR / f"context_{timestamp}.json"
-    with open(context_file, "w", encoding="utf-8") as f:
-        json.dump(context, f, ensure_ascii=False, indent=2)
+        try:
+            if char_profiles:
+                context = compact_context_local(concept, characters, theme, char_profiles, callback)
+                log_message("コンテキスト圧縮完了（ローカル）")
+            else:
+                context = compact_context(client, concept, characters, theme, cost_tracker, callback)
+                log_message("コンテキスト圧縮完了（API）")
+        except Exception as e:
+            log_message(f"コンテキスト圧縮エラー: {e}")
+            raise
+
+        context_file = CONTEXT_DIR / f"context_{timestamp}.json"
+        with open(context_file, "w", encoding="utf-8") as f:
+            json.dump(context, f, ensure_ascii=False, indent=2)
+
+        # スキーマバリデーション: コンテキスト
+        ctx_validation = validate_context(context)
+        if not ctx_validation["valid"]:
+            for err in ctx_validation["errors"]:
+                log_message(f"  [SCHEMA] context: {err}")
+            if callback:
+                callback(f"[WARN]コンテキスト検証: {len(ctx_validation['errors'])}件の問題")
 
-    # スキーマバリデーション: コンテキスト
-    ctx_validation = validate_context(context)
-    if not ctx_validation["valid"]:
-        for err in ctx_validation["errors"]:
-            log_message(f"  [SCHEMA] context: {err}")
         if callback:
-            callback(f"[WARN]コンテキスト検証: {len(ctx_validation['errors'])}件の問題")
-
-    if callback:
-        callback("[OK]コンテキスト圧縮完了")
+            callback("[OK]コンテキスト圧縮完了")
+
+        # Phase 2: ストーリーあらすじ生成（Haiku 1回）
+        log_message("Phase 2 開始: ストーリーあらすじ生成")
+        set_cost_phase("Phase 2 あらすじ")
+        # あらすじ・アウトラインの生成中にシーン生成の共通プレフィックスを予熱
+        _scene_prefix = _scene_system_prefix(jailbreak, theme, char_profiles, male_description, faceless_male)
+        _prewarm_scene_system(_scene_prefix)
+        if callback:
+            callback("🔧 Phase 2: ストーリー原案作成")
 
-    # Phase 2: ストーリーあらすじ生成（Haiku 1回）
-    log_message("Phase 2 開始: ストーリーあらすじ生成")
-    if callback:
-        callback("🔧 Phase 2: ストーリー原案作成")
+        try:
+            synopsis = generate_synopsis(client, concept, context, num_scenes, theme, cost_tracker, callback, male_description=male_description, faceless_male=faceless_male)
+            log_message(f"あらすじ生成完了: {len(synopsis)}文字")
 
-    try:
-        synopsis = generate_synopsis(client, concept, context, num_scenes, theme, cost_tracker, callback, male_description=male_description, faceless_male=faceless_male)
-        log_message(f"あらすじ生成完了: {len(synopsis)}文字")
+            # あらすじをファイルに保存
+            synopsis_file = CONTEXT_DIR / f"synopsis_{timestamp}.txt"
+            with open(synopsis_file, "w", encoding="utf-8") as f:
+                f.write(synopsis)
+        except Exception as e:
+            log_message(f"あらすじ生成エラー: {e}")
+            import traceback
+            log_message(traceback.format_exc())
+            # フォールバック: コンセプトをあらすじとして使用
+            synopsis = concept
+            if callback:
+                callback(f"[WARN]あらすじ生成失敗、コンセプトで代替")
 
-        # あらすじをファイルに保存
-        synopsis_file = CONTEXT_DIR / f"synopsis_{timestamp}.txt"
-        with open(synopsis_file, "w", encoding="utf-8") as f:
-            f.write(synopsis)
-    except Exception as e:
-        log_message(f"あらすじ生成エラー: {e}")
-        import traceback
-        log_message(traceback.format_exc())
-        # フォールバック: コンセプトをあらすじとして使用
-        synopsis = concept
         if callback:
-            callback(f"[WARN]あらすじ生成失敗、コンセプトで代替")
-
-    if callback:
-        callback("[OK]ストーリー原案完成")
+            callback("[OK]ストーリー原案完成")
 
-    # Phase 3: アウトライン生成（あらすじをシーン分割）
-    log_message("Phase 3 開始: アウトライン生成（シーン分割）")
-    if callback:
-        callback("🔧 Phase 3: シーン分割")
+        # Phase 3: アウトライン生成（あらすじをシーン分割）
+        log_message("Phase 3 開始: アウトライン生成（シーン分割）")
+        set_cost_phase("Phase 3 アウトライン")
+        # あらすじ確定後はフォーマット規則・あらすじ・設定のブロックまで予熱
+        _prewarm_scene_system(_scene_prefix, _scene_run_block(context, synopsis))
+        if callback:
+            callback("🔧 Phase 3: シーン分割")
+
+        # 13シーン以上の並列生成: チャンクが確定した順にシーン生成を始める（Phase 3/4 の重ね合わせ）
+        if (OUTLINE_STREAMING_ENABLED and not batch_mode and not quality_priority
+                and num_scenes >= CONCURRENT_MIN_SCENES):
+            _outline_stream = OutlineStream(num_scenes)
+            _scene_future = _start_scenes_rolling(
+                _outline_stream, client, context, jailbreak, cost_tracker, theme,
+                char_profiles, callback, synopsis, male_description, timestamp,
+                results, story_summaries, faceless_male=faceless_male,
+            )
 
-    try:
-        outline = generate_outline(client, context, num_scenes, theme, cost_tracker, callback, synopsis=synopsis, story_structure=story_structure, male_description=male_description, faceless_male=faceless_male)
-        log_message(f"アウトライン生成完了: {len(outline)}シーン")
+        try:
+            try:
+                outline = generate_outline(client, context, num_scenes, theme, cost_tracker, callback, synopsis=synopsis, story_structure=story_structure, male_description=male_description, faceless_male=faceless_male,
+                                           on_chunk=_outline_stream.publish if _outline_stream is not None else None)
+                log_message(f"アウトライン生成完了: {len(outline)}シーン")
         
-        intensity_counts = {}
-        for scene in outline:
-            i = scene.get("intensity", 3)
-            intensity_counts[i] = intensity_counts.get(i, 0) + 1
-        log_message(f"intensity分布: {intensity_counts}")
-    except Exception as e:
-        log_message(f"アウトライン生成エラー: {e}、フォールバック（均等分割）を使用")
-        if callback:
-            callback(f"[WARN]シーン分割エラー、均等分割で代替中...")
-        # フォールバック: ストーリー構成に基づく均等分割
-        fb_ss = story_structure or {"prologue": 10, "main": 80, "epilogue": 10}
-        fb_pro = fb_ss.get("prologue", 10) / 100
-        fb_epi = fb_ss.get("epilogue", 10) / 100
-        fb_main_start = fb_pro
-        fb_main_end = 1.0 - fb_epi
-        outline = []
-        for idx in range(1, num_scenes + 1):
-            ratio = idx / num_scenes
-            if ratio <= fb_pro:
-                intensity = 1  # プロローグ
-            elif ratio <= fb_main_start + (fb_main_end - fb_main_start) * 0.25:
-                intensity = 3  # 前戯
-            elif ratio <= fb_main_end:
-                intensity = 4 + (1 if ratio > fb_main_start + (fb_main_end - fb_main_start) * 0.7 else 0)
-            else:
-                intensity = 3  # エピローグ
-            outline.append({
-                "scene_id": idx,
-                "summary": f"シーン{idx}",
-                "intensity": min(intensity, 5),
-                "location": "室内",
-                "time": ""
-            })
-        log_message(f"フォールバックアウトライン生成: {num_scenes}シーン")
+                intensity_counts = {}
+                for scene in outline:
+                    i = scene.get("intensity", 3)
+                    intensity_counts[i] = intensity_counts.get(i, 0) + 1
+                log_message(f"intensity分布: {intensity_counts}")
+            except Exception as e:
+                log_message(f"アウトライン生成エラー: {e}、フォールバック（均等分割）を使用")
+                if callback:
+                    callback(f"[WARN]シーン分割エラー、均等分割で代替中...")
+                # フォールバック: ストーリー構成に基づく均等分割
+                fb_ss = story_structure or {"prologue": 10, "main": 80, "epilogue": 10}
+                fb_pro = fb_ss.get("prologue", 10) / 100
+                fb_epi = fb_ss.get("epilogue", 10) / 100
+                fb_main_start = fb_pro
+                fb_main_end = 1.0 - fb_epi
+                outline = []
+                for idx in range(1, num_scenes + 1):
+                    ratio = idx / num_scenes
+                    if ratio <= fb_pro:
+                        intensity = 1  # プロローグ
+                    elif ratio <= fb_main_start + (fb_main_end - fb_main_start) * 0.25:
+                        intensity = 3  # 前戯
+                    elif ratio <= fb_main_end:
+                        intensity = 4 + (1 if ratio > fb_main_start + (fb_main_end - fb_main_start) * 0.7 else 0)
+                    else:
+                        intensity = 3  # エピローグ
+                    outline.append({
+                        "scene_id": idx,
+                        "summary": f"シーン{idx}",
+                        "intensity": min(intensity, 5),
+                        "location": "室内",
+                        "time": ""
+                    })
+                log_message(f"フォールバックアウトライン生成: {num_scenes}シーン")
+
+            if _outline_stream is not None:
+                outline = _close_outline_stream(_outline_stream, outline)
+        except BaseException as e:
+            # シーン生成側（_scene_future）がアウトラインの続きを待ち続けないように中断を伝える
+            # （KeyboardInterrupt 等はエンジンのループごと止めないよう InterruptedError に置き換える）
+            if _outline_stream is not None:
+                _outline_stream.fail(e if isinstance(e, Exception)
+                                     else InterruptedError(f"アウトライン生成が中断されました: {e!r}"))
+            raise
+
+        # スキーマバリデーション: アウトライン
+        outline_validation = validate_outline(outline, num_scenes)
+        if not outline_validation["valid"]:
+            for err in outline_validation["errors"]:
+                log_message(f"  [SCHEMA] outline: {err}")
+            if callback:
+                callback(f"[WARN]アウトライン検証: {len(outline_validation['errors'])}件の問題")
 
-    # スキーマバリデーション: アウトライン
-    outline_validation = validate_outline(outline, num_scenes)
-    if not outline_validation["valid"]:
-        for err in outline_validation["errors"]:
-            log_message(f"  [SCHEMA] outline: {err}")
         if callback:
-            callback(f"[WARN]アウトライン検証: {len(outline_validation['errors'])}件の問題")
-
-    if callback:
-        _haiku_n = sum(1 for s in outline if s.get("intensity", 3) <= 4)
-        _high_n = sum(1 for s in outline if s.get("intensity", 3) >= 5)
-        callback(f"[OK]シーン分割完成: {len(outline)}シーン（Haiku4.5×{_haiku_n} + Sonnet×{_high_n}）")
+            _haiku_n = sum(1 for s in outline if s.get("intensity", 3) <= 4)
+            _high_n = sum(1 for s in outline if s.get("intensity", 3) >= 5)
+            callback(f"[OK]シーン分割完成: {len(outline)}シーン（Haiku4.5×{_haiku_n} + Sonnet×{_high_n}）")
 
     # コスト見積もり（Prompt Caching反映版）
     haiku_count = sum(1 for s in outline if s.get("intensity", 3) <= 3)
@@ -12967,20 +13979,10 @@ def generate_pipeline(
         callback(f"[COST]推定コスト: ${est_cost:.4f}（API {len(outline)+2}回: Haiku4.5×{haiku_count} + Sonnet×{high_count}）")
 
     # Phase 4: シーン生成
-    results = []
-    story_summaries = []
+    set_cost_phase(COST_PHASE_SCENES)
 
     # ストーリーロードマップ構築（全シーンの概要を各シーン生成に渡す）
-    roadmap_lines = []
-    for s in outline:
-        sid = s.get("scene_id", "?")
-        title = s.get("title", "")[:20]
-        _rm_intensity = s.get("intensity", 3)
-        situation = s.get("situation", "")[:60]
-        location = s.get("location", "")[:15]
-        goal = s.get("goal", "")[:30]
-        goal_part = f" 目的:{goal}" if goal else ""
-        roadmap_lines.append(f"[{sid}] {title} (i={_rm_intensity}, {location}) {situation}{goal_part}")
+    roadmap_lines = _build_roadmap_lines(outline)
     outline_roadmap = "\n".join(roadmap_lines)
 
     # v8.7: 品質優先モードではWave並列を無効化（全シーン直列生成）
@@ -12990,64 +13992,53 @@ def generate_pipeline(
         if callback:
             callback("[INFO]品質優先モード: 直列生成（ストーリー一貫性最大化）")
 
-    if use_wave_parallel:
-        # === Wave並列モード: 5シーン同時生成 ===
-        num_waves = (len(outline) + CONCURRENT_BATCH_SIZE - 1) // CONCURRENT_BATCH_SIZE
-        log_message(f"Wave並列モード: {CONCURRENT_BATCH_SIZE}シーン同時生成×{num_waves}wave")
-        if callback:
-            callback(f"[INFO]Wave並列モード: {CONCURRENT_BATCH_SIZE}シーン同時生成×{num_waves}wave")
-
-        wave_idx = 0
-        scene_cursor = 0
-        while scene_cursor < len(outline):
-            wave_end = min(scene_cursor + CONCURRENT_BATCH_SIZE, len(outline))
-            wave_scenes = [(i, outline[i]) for i in range(scene_cursor, wave_end)]
-            wave_idx += 1
-
-            log_message(f"Wave {wave_idx}: シーン {scene_cursor+1}-{wave_end}/{len(outline)} 並列生成中...")
-            if callback:
-                callback(f"[WAVE]Wave {wave_idx}: シーン {scene_cursor+1}-{wave_end}/{len(outline)} 並列生成中...")
-
-            # Wave開始前にstory_so_farスナップショットを取得（Wave内全シーンで共有）
-            story_so_far = _build_story_so_far(story_summaries, results)
+    if batch_mode:
+        # === Batch APIモード: 全シーンを1ジョブで投入 → ポーリング → 後処理 ===
+        _generate_scenes_batch_api(
+            outline, client, context, jailbreak, cost_tracker, theme,
+            char_profiles, callback, synopsis, roadmap_lines,
+            male_description, timestamp, results, story_summaries,
+            faceless_male=faceless_male,
+            job_key=_batch_job_key, resume_state=_batch_resume,
+        )
 
-            wave_results = _generate_scenes_wave(
-                wave_scenes, client, context, jailbreak, cost_tracker, theme,
-                char_profiles, callback, story_so_far, synopsis, roadmap_lines,
-                male_description, len(outline), timestamp,
-                outline=outline, faceless_male=faceless_male,
+    elif use_wave_parallel or _scene_future is not None:
+        # === ローリング並列モード: シーンiはシーンi-k完了後に開始（バリア無し） ===
+        _aimd = get_controller()
+        if _scene_future is not None:
+            # Phase 3 の途中から生成中（確定済みチャンクのシーンは開始済み）
+            _scene_future.result()
+            log_message(f"アウトライン並行生成: 完成前に{_outline_stream.released_before_close}シーンを開始"
+                        f"（最初のシーン投入まで{_outline_stream.first_release or 0:.1f}秒）")
+        else:
+            _generate_scenes_rolling(
+                outline, client, context, jailbreak, cost_tracker, theme,
+                char_profiles, callback, synopsis, roadmap_lines,
+                male_description, timestamp, results, story_summaries,
+                faceless_male=faceless_male,
             )
-
-            # 結果をscene_index順に蓄積
-            for si, draft, summary, _err in wave_results:
-                results.append(draft)
-                story_summaries.append(summary)
-                log_message(f"シーン {si+1} 要約蓄積: {summary[:80]}...")
-
-            log_message(f"Wave {wave_idx} 完了: シーン {scene_cursor+1}-{wave_end}/{len(outline)}")
-            if callback:
-                callback(f"[OK]Wave {wave_idx} 完了: シーン {scene_cursor+1}-{wave_end}/{len(outline)}")
-
-            scene_cursor = wave_end
-
-            # Wave間クールダウン（最終Wave以外）
-            if scene_cursor < len(outline):
-                # ユーザー停止チェック
-                if callback:
-                    try:
-                        callback(f"[INFO]Wave間クールダウン {CONCURRENT_WAVE_COOLDOWN}秒...")
-                    except InterruptedError:
-                        raise
-                time.sleep(CONCURRENT_WAVE_COOLDOWN)
+        log_message(f"ローリング生成完了: {len(outline)}シーン")
+        if callback:
+            callback(f"[OK]ローリング生成完了: {len(outline)}シーン")
+
+        log_message(_aimd.summary())
+        for _ch in _aimd.history():
+            log_message(f"  AIMD {_ch['model']}: {_ch['old']} → {_ch['new']} ({_ch['reason']})")
+        for _m, _rl in get_rate_limiter().snapshot().items():
+            if _rl["paced"]:
+                log_message(f"  RateLimit {_m}: 送信前ペーシング {_rl['paced']}回 / 計{_rl['paced_seconds']}秒")
+        if _hybrid_router is not None:
+            log_message(_hybrid_router.local.summary())
+            log_message(_hybrid_router.breaker.summary())
+            for _tr in _hybrid_router.breaker.history():
+                log_message(f"  Breaker: {_tr['old']} → {_tr['new']} ({_tr['reason']})")
 
     else:
         # === 直列モード: 12シーン以下（従来通り） ===
+        story = StoryContext(story_summaries, results)
         for i, scene in enumerate(outline):
-            intensity = scene.get("intensity", 3)
-            model_type = "Sonnet" if intensity >= 4 else "Haiku(4.5)"
-
-            # story_so_far を構築（スライディングウィンドウ方式）
-            story_so_far = _build_story_so_far(story_summaries, results)
+            # story_so_far（スライディングウィンドウ方式、完了シーンを増分で取り込む）
+            story_so_far = story.snapshot()
 
             # 現在シーン近傍±5のロードマップ
             marked_lines = []
@@ -13065,142 +14056,20 @@ def generate_pipeline(
                 marked_lines.append(f"  ... (シーン{window_end+1}〜{len(roadmap_lines)}省略)")
             current_roadmap = "\n".join(marked_lines)
 
-            try:
-                log_message(f"シーン {i+1}/{len(outline)} 生成開始 (intensity={intensity}, {model_type})")
-                if callback:
-                    callback(f"[SCENE]シーン {i+1}/{len(outline)} [{model_type}] 重要度{intensity}")
-
-                draft = generate_scene_draft(
-                    client, context, scene, jailbreak,
-                    cost_tracker, theme, char_profiles, callback,
-                    story_so_far=story_so_far,
-                    synopsis=synopsis,
-                    outline_roadmap=current_roadmap,
-                    male_description=male_description,
-                    scene_index=i,
-                    total_scenes=len(outline),
-                    faceless_male=faceless_male,
-                )
-
-                draft["intensity"] = intensity
-
-                # スキーマバリデーション: 個別シーン
-                scene_val = validate_scene(draft, i)
-                if not scene_val["valid"]:
-                    for err in scene_val["errors"]:
-                        log_message(f"  [SCHEMA] シーン{i+1}: {err}")
-                    if callback:
-                        callback(f"[WARN]シーン{i+1}検証: {len(scene_val['errors'])}件の問題")
-
-                results.append(draft)
-
-                # 要約を蓄積して次シーンに渡す
-                summary = extract_scene_summary(draft)
-                story_summaries.append(summary)
-                log_message(f"シーン {i+1} 要約蓄積: {summary[:80]}...")
-
-                draft_file = DRAFTS_DIR / f"draft_{timestamp}_scene{i+1}.json"
-                with open(draft_file, "w", encoding="utf-8") as f:
-                    json.dump(draft, f, ensure_ascii=False, indent=2)
-                final_file = FINAL_DIR / f"final_{timestamp}_scene{i+1}.json"
-                with open(final_file, "w", encoding="utf-8") as f:
-                    json.dump(draft, f, ensure_ascii=False, indent=2)
-
-                log_message(f"シーン {i+1}/{len(outline)} 完了")
-                if callback:
-                    callback(f"[OK]シーン {i+1}/{len(outline)} 完了")
-
-            except Exception as e:
-                err_msg = str(e)
-                log_message(f"シーン {i+1} 生成エラー: {err_msg}")
-
-                # 529 Overloaded: グローバルクールダウン後にリトライ
-                is_overloaded = "サーバー過負荷" in err_msg or "529" in err_msg or "Overloaded" in err_msg
-                if is_overloaded:
-                    cooldown = 60
-                    log_message(f"サーバー過負荷検出: {cooldown}秒のグローバルクールダウン後にシーン{i+1}をリトライ")
-                    if callback:
-                        callback(f"[WARN]サーバー過負荷、{cooldown}秒待機後にシーン{i+1}をリトライ...")
-                    time.sleep(cooldown)
-                    try:
-                        draft = generate_scene_draft(
-                            client, context, scene, jailbreak,
-                            cost_tracker, theme, char_profiles, callback,
-                            story_so_far=story_so_far, synopsis=synopsis,
-                            outline_roadmap=current_roadmap,
-                            male_description=male_description,
-                            scene_index=i,
-                            total_scenes=len(outline),
-                            faceless_male=faceless_male,
-                        )
-                        draft["intensity"] = intensity
-                        results.append(draft)
-                        summary = extract_scene_summary(draft)
-                        story_summaries.append(summary)
-                        log_message(f"シーン {i+1} 過負荷リトライ成功")
-                        if callback:
-                            callback(f"[OK]シーン {i+1}/{len(outline)} 過負荷リトライ成功")
-                        continue
-                    except Exception as e2:
-                        err_msg = str(e2)
-                        log_message(f"シーン {i+1} 過負荷リトライも失敗: {err_msg}")
-
-                # リトライ判定（コンテンツ拒否 or JSONパースエラー）
-                is_refusal = any(kw in err_msg for kw in ["倫理", "対応することはできません", "cannot", "inappropriate"])
-                is_json_error = any(kw in err_msg for kw in ["Invalid JSON", "No JSON", "Empty response", "JSONDecodeError"])
-
-                if is_refusal or is_json_error:
-                    retry_reason = "コンテンツ拒否" if is_refusal else "JSONパースエラー"
-                    log_message(f"シーン {i+1} {retry_reason}検出、リトライ")
-                    if callback:
-                        callback(f"[WARN]シーン {i+1} {retry_reason}、リトライ中...")
-
-                    # 最大2回リトライ
-                    retry_success = False
-                    for retry_n in range(2):
-                        try:
-                            draft = generate_scene_draft(
-                                client, context, scene, jailbreak,
-                                cost_tracker, theme, char_profiles, callback,
-                                story_so_far=story_so_far,
-                                synopsis="" if is_refusal else synopsis,
-                                outline_roadmap=current_roadmap,
-                                male_description=male_description,
-                                scene_index=i,
-                                total_scenes=len(outline),
-                                faceless_male=faceless_male,
-                            )
-                            draft["intensity"] = intensity
-                            results.append(draft)
-                            summary = extract_scene_summary(draft)
-                            story_summaries.append(summary)
-                            log_message(f"シーン {i+1} リトライ{retry_n+1}回目成功")
-                            if callback:
-                                callback(f"[OK]シーン {i+1}/{len(outline)} リトライ成功")
-                            retry_success = True
-                            break
-                        except Exception as e2:
-                            log_message(f"シーン {i+1} リトライ{retry_n+1}回目失敗: {e2}")
-
-                    if retry_success:
-                        continue
-
-                import traceback
-                log_message(traceback.format_exc())
-                if callback:
-                    callback(f"[ERROR]シーン {i+1} エラー: {err_msg[:50]}")
-
-                error_result = {
-                    "scene_id": scene.get("scene_id", i + 1),
-                    "title": f"シーン{i+1}",
-                    "mood": "エラー",
-                    "bubbles": [],
-                    "onomatopoeia": [],
-                    "direction": f"生成エラー: {err_msg[:100]}",
-                    "sd_prompt": ""
-                }
-                results.append(error_result)
-                story_summaries.append(f"[シーン{i+1}: エラーにより欠落]")
+            _si, draft, summary, _err = get_engine().run(_agenerate_single_scene_for_wave(
+                client, context, scene, jailbreak, cost_tracker, theme, char_profiles,
+                callback, story_so_far, synopsis, current_roadmap, male_description,
+                i, len(outline), timestamp, faceless_male,
+            ), cancel=llm_cancel.current_token())
+            results.append(draft)
+            # 要約を蓄積して次シーンに渡す
+            story_summaries.append(summary)
+            log_message(f"シーン {i+1} 要約蓄積: {summary[:80]}...")
+
+    log_message(_retry_policy.summary())
+    if _prompt_warmer is not None:
+        _prompt_warmer.close()
+        log_message(_prompt_warmer.summary())
 
     # スキーマバリデーション: 結果配列全体
     results_validation = validate_results(results)
@@ -13217,6 +14086,7 @@ def generate_pipeline(
 
     # Phase 5: 品質検証 + SDプロンプト最適化（APIコスト不要）
     log_message("Phase 5 開始: 品質検証 + SDプロンプト最適化")
+    set_cost_phase("Phase 5 品質検証")
     if callback:
         callback("[CHECK]Phase 5: 品質検証 + SDプロンプト最適化")
 
@@ -13326,6 +14196,8 @@ def generate_pipeline(
     # 完了サマリー
     success_count = sum(1 for r in results if r.get("mood") != "エラー")
     log_message(f"パイプライン完了: {success_count}/{len(results)}シーン成功")
+    for _line in cost_tracker.cache_report():
+        log_message(f"  PromptCache {_line}")
 
     if callback:
         _final_score = post_validation.get("score", validation.get("score", 0))
@@ -15137,6 +16009,7 @@ class App(ctk.CTk):
         self.config_data = load_config()
         self.is_generating = False
         self.stop_requested = False
+        self.cancel_token = None  # 実行中パイプラインの停止トークン（CancelToken）
         self.last_results = None  # 最新の生成結果を保持（再エクスポート用）
         self.last_metadata = None  # パイプラインメタデータ（再エクスポート用）
         self.create_widgets()
@@ -15865,6 +16738,36 @@ class App(ctk.CTk):
         )
         self.quality_priority_cb.pack(anchor="w", padx=20, pady=(0, 8))
 
+        # Batch APIモード（非対話・料金50%、結果まで数分〜最大24時間）
+        self.batch_mode_var = ctk.BooleanVar(value=False)
+        self.batch_mode_cb = ctk.CTkCheckBox(
+            settings_card, text="Batch APIモード（夜間向け・料金50%・結果待ちあり）",
+            variable=self.batch_mode_var,
+            font=ctk.CTkFont(family=FONT_JP, size=13),
+            text_color=MaterialColors.ON_SURFACE_VARIANT,
+            fg_color=MaterialColors.PRIMARY,
+            hover_color=MaterialColors.PRIMARY_CONTAINER,
+            border_color=MaterialColors.OUTLINE,
+            checkmark_color=MaterialColors.ON_PRIMARY,
+            corner_radius=4
+        )
+        self.batch_mode_cb.pack(anchor="w", padx=20, pady=(0, 8))
+
+        # 応答キャッシュ（同じ入力の再実行で圧縮・あらすじ・アウトラインを再利用。同じ結果が返る）
+        self.response_cache_var = ctk.BooleanVar(value=RESPONSE_CACHE_ENABLED)
+        self.response_cache_cb = ctk.CTkCheckBox(
+            settings_card, text="応答キャッシュ（再実行時にあらすじ・アウトラインを再利用・無料）",
+            variable=self.response_cache_var,
+            font=ctk.CTkFont(family=FONT_JP, size=13),
+            text_color=MaterialColors.ON_SURFACE_VARIANT,
+            fg_color=MaterialColors.PRIMARY,
+            hover_color=MaterialColors.PRIMARY_CONTAINER,
+            border_color=MaterialColors.OUTLINE,
+            checkmark_color=MaterialColors.ON_PRIMARY,
+            corner_radius=4
+        )
+        self.response_cache_cb.pack(anchor="w", padx=20, pady=(0, 8))
+
         # ローカルLLM使用チェックボックス（ハイブリッド生成）
         self.local_llm_var = ctk.BooleanVar(value=False)
         self.local_llm_cb = ctk.CTkCheckBox(
@@ -15890,7 +16793,7 @@ class App(ctk.CTk):
         ctk.CTkLabel(url_row, text="URL:", font=ctk.CTkFont(family=FONT_JP, size=11),
                      width=60, anchor="e").pack(side="left")
         self.local_llm_url_entry = ctk.CTkEntry(
-            url_row, placeholder_text="空欄=localhost:1234 / RunPod: https://api.runpod.ai/v2/{ID}/openai/v1",
+            url_row, placeholder_text="空欄=localhost:1234 / RunPod: https://api.runpod.ai/v2/{ID}/openai/v1（カンマ区切りで複数可）",
             font=ctk.CTkFont(size=11), height=28,
         )
         self.local_llm_url_entry.pack(side="left", fill="x", expand=True, padx=(4, 0))
@@ -15901,11 +16804,52 @@ class App(ctk.CTk):
         ctk.CTkLabel(key_row, text="API Key:", font=ctk.CTkFont(family=FONT_JP, size=11),
                      width=60, anchor="e").pack(side="left")
         self.local_llm_key_entry = ctk.CTkEntry(
-            key_row, placeholder_text="RunPod API Key（ローカルの場合は空欄）",
+            key_row, placeholder_text="RunPod API Key（ローカルの場合は空欄、複数URL時はカンマ区切りで対応付け）",
             font=ctk.CTkFont(size=11), height=28, show="*",
         )
         self.local_llm_key_entry.pack(side="left", fill="x", expand=True, padx=(4, 0))
 
+        # 並列スロット数（llama-server -np / vLLM の同時処理数）
+        slots_row = ctk.CTkFrame(self.local_llm_settings_frame, fg_color="transparent")
+        slots_row.pack(fill="x", pady=(0, 4))
+        ctk.CTkLabel(slots_row, text="スロット:", font=ctk.CTkFont(family=FONT_JP, size=11),
+                     width=60, anchor="e").pack(side="left")
+        self.local_llm_slots_entry = ctk.CTkEntry(
+            slots_row, placeholder_text="空欄=自動検出（llama-server /props）、複数URL時はカンマ区切り",
+            font=ctk.CTkFont(size=11), height=28,
+        )
+        self.local_llm_slots_entry.pack(side="left", fill="x", expand=True, padx=(4, 0))
+
+        # ヘッジ（ローカルが遅い時にクラウドへ並行送信し、早い方を採用）
+        self.local_llm_hedge_var = ctk.BooleanVar(value=False)
+        self.local_llm_hedge_cb = ctk.CTkCheckBox(
+            self.local_llm_settings_frame, text="遅延時にクラウドへ並行送信（ヘッジ・追加コストあり）",
+            variable=self.local_llm_hedge_var,
+            font=ctk.CTkFont(family=FONT_JP, size=11),
+            text_color=MaterialColors.ON_SURFACE_VARIANT,
+            fg_color=MaterialColors.PRIMARY,
+            hover_color=MaterialColors.PRIMARY_CONTAINER,
+            border_color=MaterialColors.OUTLINE,
+            checkmark_color=MaterialColors.ON_PRIMARY,
+            corner_radius=4
+        )
+        self.local_llm_hedge_cb.pack(anchor="w", padx=(64, 0), pady=(0, 4))
+
+        # 制約付きデコード（JSON Schemaを response_format で送り、出力をスキーマに固定）
+        self.local_llm_json_schema_var = ctk.BooleanVar(value=True)
+        self.local_llm_json_schema_cb = ctk.CTkCheckBox(
+            self.local_llm_settings_frame, text="JSONスキーマで出力を制約（パース失敗を防止）",
+            variable=self.local_llm_json_schema_var,
+            font=ctk.CTkFont(family=FONT_JP, size=11),
+            text_color=MaterialColors.ON_SURFACE_VARIANT,
+            fg_color=MaterialColors.PRIMARY,
+            hover_color=MaterialColors.PRIMARY_CONTAINER,
+            border_color=MaterialColors.OUTLINE,
+            checkmark_color=MaterialColors.ON_PRIMARY,
+            corner_radius=4
+        )
+        self.local_llm_json_schema_cb.pack(anchor="w", padx=(64, 0), pady=(0, 4))
+
         # ══════════════════════════════════════════════════════════════
         # 6. 生成セクション
         # ══════════════════════════════════════════════════════════════
@@ -16279,6 +17223,15 @@ class App(ctk.CTk):
             if _key:
                 self.local_llm_key_entry.delete(0, "end")
                 self.local_llm_key_entry.insert(0, _key)
+        if "local_llm_slots" in self.config_data and hasattr(self, 'local_llm_slots_entry'):
+            _slots = self.config_data["local_llm_slots"]
+            if _slots:
+                self.local_llm_slots_entry.delete(0, "end")
+                self.local_llm_slots_entry.insert(0, _slots)
+        if "local_llm_hedge" in self.config_data and hasattr(self, 'local_llm_hedge_var'):
+            self.local_llm_hedge_var.set(self.config_data["local_llm_hedge"])
+        if "local_llm_json_schema" in self.config_data and hasattr(self, 'local_llm_json_schema_var'):
+            self.local_llm_json_schema_var.set(self.config_data["local_llm_json_schema"])
         if "male_hair_style" in self.config_data and hasattr(self, 'male_hair_style_combo'):
             self.male_hair_style_combo.set(self.config_data["male_hair_style"])
         if "male_hair_color" in self.config_data and hasattr(self, 'male_hair_color_combo'):
@@ -16311,6 +17264,10 @@ class App(ctk.CTk):
         # v8.7: 品質優先モードの復元
         if self.config_data.get("quality_priority") and hasattr(self, 'quality_priority_var'):
             self.quality_priority_var.set(True)
+        if self.config_data.get("batch_mode") and hasattr(self, 'batch_mode_var'):
+            self.batch_mode_var.set(True)
+        if "response_cache" in self.config_data and hasattr(self, 'response_cache_var'):
+            self.response_cache_var.set(self.config_data["response_cache"])
 
         # 初期コスト予測を表示
         self.after(100, self.update_cost_preview)
@@ -16720,9 +17677,14 @@ class App(ctk.CTk):
             "sd_prefix_tags": self.sd_prefix_text.get("1.0", "end-1c").strip() if hasattr(self, 'sd_prefix_text') else "",
             "sd_suffix_tags": self.sd_suffix_text.get("1.0", "end-1c").strip() if hasattr(self, 'sd_suffix_text') else "",
             "quality_priority": self.quality_priority_var.get() if hasattr(self, 'quality_priority_var') else False,
+            "batch_mode": self.batch_mode_var.get() if hasattr(self, 'batch_mode_var') else False,
+            "response_cache": self.response_cache_var.get() if hasattr(self, 'response_cache_var') else RESPONSE_CACHE_ENABLED,
             "local_llm_enabled": self.local_llm_var.get() if hasattr(self, 'local_llm_var') else False,
             "local_llm_url": self.local_llm_url_entry.get() if hasattr(self, 'local_llm_url_entry') else "",
             "local_llm_api_key": self.local_llm_key_entry.get() if hasattr(self, 'local_llm_key_entry') else "",
+            "local_llm_hedge": self.local_llm_hedge_var.get() if hasattr(self, 'local_llm_hedge_var') else False,
+            "local_llm_slots": self.local_llm_slots_entry.get() if hasattr(self, 'local_llm_slots_entry') else "",
+            "local_llm_json_schema": self.local_llm_json_schema_var.get() if hasattr(self, 'local_llm_json_schema_var') else True,
         }
         save_config(self.config_data)
         self.snackbar.show("設定を保存しました", type="success")
@@ -16758,6 +17720,9 @@ class App(ctk.CTk):
             "local_llm_enabled": self.local_llm_var.get() if hasattr(self, 'local_llm_var') else False,
             "local_llm_url": self.local_llm_url_entry.get() if hasattr(self, 'local_llm_url_entry') else "",
             "local_llm_api_key": self.local_llm_key_entry.get() if hasattr(self, 'local_llm_key_entry') else "",
+            "local_llm_hedge": self.local_llm_hedge_var.get() if hasattr(self, 'local_llm_hedge_var') else False,
+            "local_llm_slots": self.local_llm_slots_entry.get() if hasattr(self, 'local_llm_slots_entry') else "",
+            "local_llm_json_schema": self.local_llm_json_schema_var.get() if hasattr(self, 'local_llm_json_schema_var') else True,
         }
 
     def apply_config(self, config: dict):
@@ -16941,6 +17906,10 @@ class App(ctk.CTk):
         log_message(message)
 
     def update_status(self, message: str):
+        # ストリーミング進捗は高頻度なのでステータス表示のみ更新（ログ・フェーズは触らない）
+        if message.startswith("[STREAM]"):
+            self.status_label.configure(text=message[len("[STREAM]"):])
+            return
         # ステータスアイコン自動切替
         if "[ERROR]" in message or "エラー" in message:
             self.status_icon_label.configure(text=Icons.XMARK)
@@ -17130,6 +18099,7 @@ class App(ctk.CTk):
 
         self.is_generating = True
         self.stop_requested = False
+        self.cancel_token = CancelToken()
         self.generate_btn.configure(state="disabled", text="生成中...")
         self.stop_btn.configure(
             state="normal",
@@ -17148,6 +18118,9 @@ class App(ctk.CTk):
     def stop_generation(self):
         if self.is_generating:
             self.stop_requested = True
+            if self.cancel_token is not None:
+                # 実行中のAPI呼び出し（HTTPストリーム）もその場で打ち切る
+                self.cancel_token.cancel()
             self.update_status("[STOP]停止リクエスト送信...")
             self.stop_btn.configure(state="disabled", text="停止中...")
 
@@ -17226,6 +18199,12 @@ class App(ctk.CTk):
                 local_llm_enabled=self.local_llm_var.get() if hasattr(self, 'local_llm_var') else False,
                 local_llm_url=self.local_llm_url_entry.get() if hasattr(self, 'local_llm_url_entry') else "",
                 local_llm_api_key=self.local_llm_key_entry.get() if hasattr(self, 'local_llm_key_entry') else "",
+                local_llm_hedge=self.local_llm_hedge_var.get() if hasattr(self, 'local_llm_hedge_var') else False,
+                local_llm_slots=self.local_llm_slots_entry.get() if hasattr(self, 'local_llm_slots_entry') else "",
+                local_llm_json_schema=self.local_llm_json_schema_var.get() if hasattr(self, 'local_llm_json_schema_var') else True,
+                batch_mode=self.batch_mode_var.get() if hasattr(self, 'batch_mode_var') else False,
+                response_cache=self.response_cache_var.get() if hasattr(self, 'response_cache_var') else None,
+                cancel_token=self.cancel_token,
             )
 
             if self.stop_requested:
@@ -17387,6 +18366,8 @@ class App(ctk.CTk):
             import tkinter.messagebox as mb
             if mb.askokcancel("確認", "生成中です。停止して終了しますか？"):
                 self.stop_requested = True
+                if self.cancel_token is not None:
+                    self.cancel_token.cancel()
                 self.after(500, self.destroy)
         else:
             self.destroy()
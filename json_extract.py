@@ -0,0 +1,284 @@
+"""
+Tolerant JSON Extractor
+
+LLM応答テキスト（前置き・```json フェンス・<think>ブロック・後置きを含む）から
+JSONの値を取り出す共通実装。gui.parse_json_response / llm_provider._strip_thinking /
+main.query_claude はすべてこれを使う。
+
+- 文字列リテラルを理解するトークナイザで先頭から走査する。候補ごとに json.loads を
+  総当たりしないため、思考テキストに括弧が大量に含まれていても通常は線形時間。
+  構文エラーで失敗した候補の中で開いたままだった括弧は、そこから走査し直しても同じトークンで
+  失敗するので再走査しない（'[1,[1,[1,…}' のような深い入れ子の失敗も1回の走査で済む）
+- ルート直下の候補（オブジェクト/配列）から
+  prefer_keys（既定 scene_id）を持つもの → 完全なもの → 修復不要なもの → 長いもの の順に選ぶ
+- よくある破損を修復する:
+  末尾カンマ（{"a": 1,}）・要素間のカンマ欠落・max_tokens による打ち切り
+  （開いた文字列と括弧を閉じる。キーだけで値の無い末尾は切り落とす）
+"""
+
+import re
+import json
+from typing import Optional
+
+# ============================================================
+# Constants
+# ============================================================
+
+DEFAULT_PREFER_KEYS = ("scene_id",)
+
+REPAIR_TRAILING_COMMA = "末尾カンマ除去"
+REPAIR_MISSING_COMMA = "カンマ補完"
+REPAIR_TRUNCATED = "打ち切り補完"
+
+# <think>…</think>（閉じていない場合は末尾まで）
+_THINK_RE = re.compile(r"<think>.*?(?:</think>|\Z)", re.DOTALL)
+_START_RE = re.compile(r"[{\[]")
+_WS_RE = re.compile(r"[ \t\r\n]*")
+_TOKEN_RE = re.compile(
+    r"[ \t\r\n]*(?:([{}\[\],:\"])|(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null))"
+)
+# 末尾で途切れたリテラル（"tru", "-1.", "nul" など）
+_PARTIAL_LITERAL_RE = re.compile(r"[0-9.eE+\-a-z]{1,32}")
+# 開き '"' の直後から閉じ '"' まで（エスケープ考慮、unrolled loop）
+_STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+# 期待するトークン
+_EXPECT_VALUE = 0
+_EXPECT_KEY = 1
+_EXPECT_COLON = 2
+_EXPECT_COMMA_OR_CLOSE = 3
+_EXPECT_KEY_OR_CLOSE = 4      # '{' の直後
+_EXPECT_VALUE_OR_CLOSE = 5    # '[' の直後
+
+
+class JSONCandidate:
+    """テキスト中のルート値1つ（修復済みテキストと、その位置・状態）"""
+
+    def __init__(self, start: int, end: int, text: str, complete: bool, repairs: list):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.complete = complete      # 閉じ括弧まで揃っている（打ち切りでない）
+        self.repairs = repairs        # 適用した修復の種類
+        self.value = None
+
+    @property
+    def truncated(self) -> bool:
+        return not self.complete
+
+    def __repr__(self):
+        return (f"JSONCandidate({self.start}:{self.end}, {len(self.text)}文字, "
+                f"complete={self.complete}, repairs={self.repairs})")
+
+
+def strip_thinking(text: str) -> str:
+    """<think>…</think> ブロックを除去"""
+    if "<think>" not in text:
+        return text
+    return _THINK_RE.sub("", text)
+
+
+# ============================================================
+# 走査
+# ============================================================
+
+def _closers(stack: list, depth: int) -> str:
+    return "".join("}" if c == "{" else "]" for c in reversed(stack[:depth]))
+
+
+def _build(text: str, start: int, end: int, edits: list, suffix: str = "") -> str:
+    """text[start:end] に edits（位置順の (pos, 削除長, 挿入文字列)）を適用"""
+    if not edits and not suffix:
+        return text[start:end]
+    parts, cur = [], start
+    for pos, delete, insert in edits:
+        if pos >= end:
+            break
+        parts.append(text[cur:pos])
+        parts.append(insert)
+        cur = pos + delete
+    parts.append(text[cur:end])
+    parts.append(suffix)
+    return "".join(parts)
+
+
+def _scan_value(text: str, start: int):
+    """text[start]（'{' か '['）から始まるルート値を1つ走査する
+
+    戻り値: (JSONCandidate または None, 次に走査を再開する位置, 再走査不要な開始位置)
+    構文エラーなら (None, start + 1, エラー時点で開いていた入れ子の括弧の位置)。
+    """
+    n = len(text)
+    stack: list = []
+    opens: list = []         # stack と対応する開き括弧の位置
+    expect = _EXPECT_VALUE
+    edits: list = []
+    repairs: list = []
+    pos = start
+    prev_comma = -1          # 直前のトークンが ',' ならその位置
+    safe_pos, safe_depth = start, 0   # 打ち切り時に切り詰めてよい位置とその時点の深さ
+
+    while True:
+        m = _TOKEN_RE.match(text, pos)
+        if m is None:
+            rest = _WS_RE.match(text, pos).end()
+            if rest < n and (n - rest > 64 or not _PARTIAL_LITERAL_RE.fullmatch(text[rest:].rstrip())):
+                return None, start + 1, opens[1:]
+            # 末尾まで到達 = 打ち切り → 最後の安全な位置で切って括弧を閉じる
+            if safe_depth == 0:
+                return None, n, ()
+            repairs.append(REPAIR_TRUNCATED)
+            body = _build(text, start, safe_pos, edits, _closers(stack, safe_depth))
+            return JSONCandidate(start, n, body, False, repairs), n, ()
+
+        punct, literal = m.group(1), m.group(2)
+        tpos = m.end() - len(punct or literal)
+        pos = m.end()
+        comma_before, prev_comma = prev_comma, -1
+
+        # カンマ欠落の補完: 値・キーが来るべきでない位置に値・キーが来た
+        if expect == _EXPECT_COMMA_OR_CLOSE and (literal or punct in '"{['):
+            edits.append((tpos, 0, ","))
+            if REPAIR_MISSING_COMMA not in repairs:
+                repairs.append(REPAIR_MISSING_COMMA)
+            expect = _EXPECT_KEY if stack[-1] == "{" else _EXPECT_VALUE
+
+        if punct == '"':
+            sm = _STRING_BODY_RE.match(text, pos)
+            if sm is None:
+                # 閉じていない文字列 = 打ち切り
+                if expect in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+                    tail = text[pos:]
+                    stripped = tail.rstrip("\\")
+                    if (len(tail) - len(stripped)) % 2:
+                        tail = tail[:-1]   # 途中で切れたエスケープ
+                    repairs.append(REPAIR_TRUNCATED)
+                    body = _build(text, start, pos, edits) + tail + '"' + _closers(stack, len(stack))
+                    return JSONCandidate(start, n, body, False, repairs), n, ()
+                if safe_depth == 0:
+                    return None, n, ()
+                repairs.append(REPAIR_TRUNCATED)
+                body = _build(text, start, safe_pos, edits, _closers(stack, safe_depth))
+                return JSONCandidate(start, n, body, False, repairs), n, ()
+            pos = sm.end()
+            if expect in (_EXPECT_KEY, _EXPECT_KEY_OR_CLOSE):
+                expect = _EXPECT_COLON
+                continue
+            if expect not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+                return None, start + 1, opens[1:]
+        elif literal:
+            if expect not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+                return None, start + 1, opens[1:]
+        elif punct in "{[":
+            if expect not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+                return None, start + 1, opens[1:]
+            stack.append(punct)
+            opens.append(tpos)
+            expect = _EXPECT_KEY_OR_CLOSE if punct == "{" else _EXPECT_VALUE_OR_CLOSE
+            safe_pos, safe_depth = pos, len(stack)
+            continue
+        elif punct in "}]":
+            if not stack or stack[-1] != ("{" if punct == "}" else "["):
+                return None, start + 1, opens[1:]
+            if expect in (_EXPECT_KEY, _EXPECT_VALUE) and comma_before >= 0:
+                # 末尾カンマ: {"a": 1,} / [1, 2,]
+                edits.append((comma_before, 1, ""))
+                if REPAIR_TRAILING_COMMA not in repairs:
+                    repairs.append(REPAIR_TRAILING_COMMA)
+            elif expect not in (_EXPECT_COMMA_OR_CLOSE, _EXPECT_KEY_OR_CLOSE, _EXPECT_VALUE_OR_CLOSE):
+                return None, start + 1, opens[1:]
+            stack.pop()
+            opens.pop()
+            if not stack:
+                body = _build(text, start, pos, edits)
+                return JSONCandidate(start, pos, body, True, repairs), pos, ()
+        elif punct == ":":
+            if expect != _EXPECT_COLON:
+                return None, start + 1, opens[1:]
+            expect = _EXPECT_VALUE
+            continue
+        else:  # ","
+            if expect != _EXPECT_COMMA_OR_CLOSE:
+                return None, start + 1, opens[1:]
+            expect = _EXPECT_KEY if stack[-1] == "{" else _EXPECT_VALUE
+            prev_comma = tpos
+            continue
+
+        # 値が1つ確定した
+        expect = _EXPECT_COMMA_OR_CLOSE
+        safe_pos, safe_depth = pos, len(stack)
+
+
+def find_json_candidates(text: str) -> list:
+    """テキスト中のルート値（オブジェクト/配列）候補を出現順に列挙する"""
+    text = strip_thinking(text)
+    candidates = []
+    skip: set = set()        # 失敗した候補の中で開いたままだった括弧（同じ位置で失敗するので走査しない）
+    pos = 0
+    while True:
+        m = _START_RE.search(text, pos)
+        if m is None:
+            break
+        if m.start() in skip:
+            pos = m.start() + 1
+            continue
+        candidate, pos, failed_opens = _scan_value(text, m.start())
+        if candidate is not None:
+            candidates.append(candidate)
+        skip.update(failed_opens)
+    return candidates
+
+
+# ============================================================
+# 選択
+# ============================================================
+
+def _has_keys(value, keys) -> bool:
+    if not keys:
+        return False
+    if isinstance(value, list):
+        value = next((v for v in value if isinstance(v, dict)), None)
+    return isinstance(value, dict) and any(k in value for k in keys)
+
+
+def extract_json(text: str, prefer_keys=DEFAULT_PREFER_KEYS, repair: bool = True) -> Optional[JSONCandidate]:
+    """最も妥当なルート値を返す（.value にパース済みの値）。見つからなければ None
+
+    repair=False なら修復が必要な候補を除外する。
+    """
+    if not text:
+        return None
+    best, best_score = None, None
+    for c in find_json_candidates(text):
+        if c.repairs and not repair:
+            continue
+        try:
+            c.value = json.loads(c.text, strict=False)   # 文字列内の生改行は許容
+        except (ValueError, RecursionError):
+            continue   # 深すぎる入れ子も解釈できない候補として扱う
+        score = (_has_keys(c.value, prefer_keys), c.complete, not c.repairs, len(c.text), c.start)
+        if best_score is None or score > best_score:
+            best, best_score = c, score
+    return best
+
+
+def extract_json_text(text: str, prefer_keys=DEFAULT_PREFER_KEYS) -> Optional[str]:
+    """extract_json() のテキスト版（修復済みのJSON文字列）"""
+    c = extract_json(text, prefer_keys)
+    return c.text if c is not None else None
+
+
+def loads_tolerant(text: str, prefer_keys=DEFAULT_PREFER_KEYS):
+    """応答テキストからJSON値を取り出してパースする
+
+    失敗時は ValueError。メッセージはシーン単位のリトライ判定に合わせて
+    "Empty response" / "No JSON in response" / "Invalid JSON" で始める。
+    """
+    if not text or not text.strip():
+        raise ValueError(f"Empty response: {(text or '')[:200]}")
+    c = extract_json(text, prefer_keys)
+    if c is not None:
+        return c.value
+    if _START_RE.search(strip_thinking(text)) is None:
+        raise ValueError(f"No JSON in response: {text[:150]}")
+    raise ValueError(f"Invalid JSON: 解釈可能な候補なし. Text: {text[:100]}...")
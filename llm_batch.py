@@ -0,0 +1,145 @@
+"""
+Message Batches API Helper
+
+全シーンのドラフト生成を1つのバッチジョブとして投入し、完了までポーリングする。
+ポーリング状態は JSON で永続化し、プロセス再起動後も同じジョブを再開できる。
+
+- 料金は通常APIの50%（CostTracker.add(..., batch=True) で反映）
+- リクエスト単位の同時実行・レート制限の対象外（夜間の数百シーン生成向け）
+- 結果は custom_id ("scene-0001" 形式) で元のシーンに対応付ける
+"""
+
+import json
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import llm_cancel
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+BATCH_POLL_INTERVAL = 30          # ポーリング間隔(秒)
+BATCH_STATE_PREFIX = "batch_state_"
+BATCH_PRICE_FACTOR = 0.5          # Batch APIは通常料金の50%
+
+# state["status"]
+STATUS_SUBMITTED = "submitted"    # 投入済み・結果未取得
+STATUS_COLLECTED = "collected"    # 結果取得・後処理完了
+
+
+def scene_custom_id(scene_index: int) -> str:
+    return f"scene-{scene_index + 1:04d}"
+
+
+def scene_index_from_custom_id(custom_id: str) -> int:
+    return int(custom_id.rsplit("-", 1)[1]) - 1
+
+
+def make_job_key(*parts) -> str:
+    """生成条件（コンセプト・キャラ・シーン数等）からジョブ識別キーを作る"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+# ============================================================
+# State persistence
+# ============================================================
+
+def state_path(state_dir: Path, timestamp: str) -> Path:
+    return Path(state_dir) / f"{BATCH_STATE_PREFIX}{timestamp}.json"
+
+
+def save_state(path: Path, state: dict) -> None:
+    """状態を書き出す（途中で落ちても壊れないよう一時ファイル経由で置換）"""
+    path = Path(path)
+    state["updated_at"] = datetime.now().isoformat(timespec="seconds")
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    tmp.replace(path)
+
+
+def load_state(path: Path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def find_pending_state(state_dir: Path, job_key: str) -> Optional[Path]:
+    """同じジョブキーで結果未取得の状態ファイルを探す（新しい順）"""
+    for path in sorted(Path(state_dir).glob(f"{BATCH_STATE_PREFIX}*.json"), reverse=True):
+        try:
+            state = load_state(path)
+        except (OSError, json.JSONDecodeError):
+            continue
+        if state.get("job_key") == job_key and state.get("status") == STATUS_SUBMITTED:
+            return path
+    return None
+
+
+# ============================================================
+# Batch API
+# ============================================================
+
+def build_request(custom_id: str, model: str, system, user: str, max_tokens: int) -> dict:
+    return {
+        "custom_id": custom_id,
+        "params": {
+            "model": model,
+            "max_tokens": max_tokens,
+            "system": system,
+            "messages": [{"role": "user", "content": user}],
+        },
+    }
+
+
+def submit(client, requests: list) -> str:
+    """バッチを投入して batch_id を返す"""
+    batch = client.messages.batches.create(requests=requests)
+    logger.info(f"Batch投入: {batch.id} ({len(requests)}件)")
+    return batch.id
+
+
+def wait_until_ended(
+    client,
+    batch_id: str,
+    callback: Optional[Callable] = None,
+    poll_interval: float = BATCH_POLL_INTERVAL,
+    on_poll: Optional[Callable] = None,
+):
+    """processing_status が ended になるまでポーリングして batch を返す
+
+    callback は進捗表示に使う（GUIの停止要求で InterruptedError を送出しうる。
+    ポーリング間隔の待機も現在の CancelToken のキャンセルで即座に InterruptedError になる。
+    いずれの場合もバッチはサーバー側で継続し、状態ファイルから再開できる）。
+    """
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if on_poll:
+            on_poll(batch)
+        if batch.processing_status == "ended":
+            return batch
+        finished = counts.succeeded + counts.errored + counts.canceled + counts.expired
+        msg = (f"Batch {batch_id[:16]}… 処理中: 完了{finished}/{finished + counts.processing}"
+               f" (エラー{counts.errored})")
+        logger.info(msg)
+        if callback:
+            callback(f"[INFO]{msg}")
+        llm_cancel.sleep(poll_interval)
+
+
+def iter_results(client, batch_id: str) -> Iterator[tuple]:
+    """(custom_id, result_type, message_or_None, error_text) を順に返す"""
+    for entry in client.messages.batches.results(batch_id):
+        result = entry.result
+        if result.type == "succeeded":
+            yield entry.custom_id, result.type, result.message, ""
+        else:
+            err = getattr(result, "error", None)
+            yield entry.custom_id, result.type, None, str(err) if err else result.type
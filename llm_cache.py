@@ -0,0 +1,274 @@
+"""
+LLM Response Cache
+
+同一プロンプトの再送を避けるためのコンテンツアドレス型ディスクキャッシュ。
+
+- キー: sha256(model, 正規化したsystemブロック, userプロンプト, max_tokens, temperature, 経路)
+  systemブロックの cache_control（Prompt Caching指定）は応答に影響しないため除外する
+- 値: 生のレスポンステキスト + 実際に発生したusage（ヒット時の節約額計算用）
+- 容量（合計バイト数）と TTL で古いエントリから削除。合計サイズは書き込みのたびに差分で更新し、
+  ディレクトリ全体の走査は容量超過時（上限の CACHE_EVICT_TARGET まで削る）と
+  CACHE_SWEEP_INTERVAL ごとの TTL 掃除のときだけ行う
+- 同一キーの同時リクエストは single-flight で1本にまとめる（後続は先行の結果を待つ）
+
+コンテキスト圧縮・あらすじ・アウトライン等、再実行時に同じ入力になる呼び出しで使う。
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+CACHE_MAX_BYTES = 200 * 1024 * 1024   # 200MB
+CACHE_TTL_SEC = 7 * 24 * 3600         # 7日
+CACHE_FORMAT_VERSION = 1
+CACHE_SWEEP_INTERVAL = 3600           # TTL切れの掃除（全体走査）の最小間隔(秒)
+CACHE_EVICT_TARGET = 0.9              # 容量超過時は上限のこの割合まで削除（超過のたびに走査しないため）
+
+
+def _normalize_system(system) -> list:
+    """systemをテキストブロックのリストに正規化（cache_control等のメタ情報は除外）"""
+    if not system:
+        return []
+    if isinstance(system, str):
+        return [{"type": "text", "text": system}]
+    blocks = []
+    for b in system:
+        if isinstance(b, dict):
+            blocks.append({k: v for k, v in b.items() if k != "cache_control"})
+        else:
+            blocks.append({"type": "text", "text": str(b)})
+    return blocks
+
+
+def make_key(model: str, system, user: str, max_tokens: int,
+             temperature: Optional[float] = None, route: str = "") -> str:
+    payload = {
+        "v": CACHE_FORMAT_VERSION,
+        "model": model,
+        "system": _normalize_system(system),
+        "user": user,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "route": route,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class UsageRecorder:
+    """cost_tracker.add() の呼び出しを記録しつつ本物へ転送するプロキシ
+
+    キャッシュミス時の実呼び出しに渡し、発生したusageをエントリに保存する。
+    """
+
+    def __init__(self, cost_tracker):
+        self._target = cost_tracker
+        self.records: list = []
+
+    def add(self, model, input_tokens, output_tokens,
+            cache_creation_tokens=0, cache_read_tokens=0, batch=False):
+        self.records.append([model, input_tokens, output_tokens,
+                             cache_creation_tokens, cache_read_tokens])
+        if self._target is not None:
+            self._target.add(model, input_tokens, output_tokens,
+                             cache_creation_tokens, cache_read_tokens, batch)
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+def _file_size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return 0
+
+
+class ResponseCache:
+    """ディスク上のレスポンスキャッシュ（スレッドセーフ）+ single-flight"""
+
+    def __init__(self, directory: Path, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl_sec: float = CACHE_TTL_SEC):
+        self._dir = Path(directory)
+        self._max_bytes = max_bytes
+        self._ttl = ttl_sec
+        self._lock = threading.Lock()
+        self._size: Optional[int] = None   # 合計バイト数（最初の走査までは不明）
+        self._swept_at = 0.0               # 最後に全体走査した時刻
+        self._inflight: dict = {}     # key → asyncio.Future
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def _path(self, key: str) -> Path:
+        return self._dir / key[:2] / f"{key}.json"
+
+    # ------------------------------------------------------------
+    # 読み書き
+    # ------------------------------------------------------------
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if time.time() - entry.get("created", 0) > self._ttl:
+            self.discard(key)
+            return None
+        try:
+            os.utime(path)  # LRU用にアクセス時刻を更新
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, response: str, usage: list, model: str = "") -> None:
+        path = self._path(key)
+        entry = {
+            "model": model,
+            "response": response,
+            "usage": usage,
+            "created": time.time(),
+        }
+        with self._lock:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            old_size = _file_size(path)
+            new_size = tmp.stat().st_size
+            tmp.replace(path)
+            if self._size is not None:
+                self._size += new_size - old_size
+            now = time.time()
+            if (self._size is None or self._size > self._max_bytes
+                    or now - self._swept_at > CACHE_SWEEP_INTERVAL):
+                self._evict_locked()
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            path = self._path(key)
+            size = _file_size(path)
+            try:
+                path.unlink()
+            except OSError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def _evict_locked(self):
+        """ディレクトリ全体を走査して TTL切れを削除し、容量超過分を最終アクセスの古い順に削除"""
+        now = time.time()
+        self._swept_at = now
+        if not self._dir.exists():
+            self._size = 0
+            return
+        files = []
+        total = 0
+        for p in self._dir.glob("*/*.json"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if now - st.st_mtime > self._ttl:
+                p.unlink(missing_ok=True)
+                continue
+            files.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total > self._max_bytes:
+            target = self._max_bytes * CACHE_EVICT_TARGET
+            files.sort()
+            for _mtime, size, p in files:
+                if total <= target:
+                    break
+                p.unlink(missing_ok=True)
+                total -= size
+        self._size = total
+
+    def clear(self) -> None:
+        with self._lock:
+            for p in self._dir.glob("*/*.json"):
+                p.unlink(missing_ok=True)
+            self._size = 0
+
+    # ------------------------------------------------------------
+    # single-flight
+    # ------------------------------------------------------------
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[UsageRecorder], Awaitable[str]],
+        cost_tracker,
+        model: str = "",
+        validate: Optional[Callable[[str], bool]] = None,
+    ) -> tuple:
+        """キャッシュから取得、無ければ fetch(recorder) を1本だけ実行して保存
+
+        戻り値: (response_text, entry_or_None)。entry はヒット時のみ（usage記録を含む）。
+        validate が False を返した応答はキャッシュしない（パース不能な応答の再利用防止）。
+        """
+        entry = self.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry["response"], entry
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # 同一リクエストが実行中 → その結果を共有（usageは先行側で計上済み）
+            self.coalesced += 1
+            response = await asyncio.shield(inflight)
+            return response, {"usage": [], "coalesced": True}
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[key] = fut
+        self.misses += 1
+        try:
+            recorder = UsageRecorder(cost_tracker)
+            response = await fetch(recorder)
+            if response and (validate is None or validate(response)):
+                try:
+                    self.put(key, response, recorder.records, model)
+                except OSError as e:
+                    logger.warning(f"レスポンスキャッシュ書き込み失敗: {e}")
+            fut.set_result(response)
+            return response, None
+        except BaseException as e:
+            if not fut.done():
+                fut.set_exception(e if isinstance(e, Exception) else RuntimeError("cancelled"))
+                fut.exception()  # 待機者がいない場合の未取得警告を抑制
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+
+# ============================================================
+# Process-wide cache
+# ============================================================
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(directory: Optional[Path] = None) -> ResponseCache:
+    """プロセス共有のレスポンスキャッシュを返す（初回はdirectory必須）"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if directory is None:
+                raise RuntimeError("ResponseCache が未初期化です（directory を指定してください）")
+            _cache = ResponseCache(directory)
+        return _cache
@@ -0,0 +1,156 @@
+"""
+Cooperative Cancellation Token
+
+停止ボタンで実行中のLLM呼び出しを確実に止めるためのトークン。
+
+- CancelToken.cancel() は任意のスレッド（GUIスレッド）から呼べる
+- CancelToken.run(coro) はエンジンのループ上で coro をタスクとして実行し、キャンセルされたら
+  タスクを cancel() する。httpx / AsyncAnthropic はタスクのキャンセルで接続（ストリーム）を閉じるため、
+  送信中・受信中のリクエストもその場で打ち切られ、以降のトークン課金・ドラフト書き込みは起きない。
+  後始末は CANCEL_GRACE 秒まで待ち、InterruptedError（既存の停止要求と同じ例外）を送出する
+- run() の中では current_token() で同じトークンを参照できる（ContextVar。子タスクや
+  asyncio.to_thread で実行される同期プロバイダーにも引き継がれる）
+
+generate_pipeline が1実行につき1つ作って bind() し、_call_api / シーンスケジューラー /
+RetryPolicy の待機が current_token() で参照する。
+"""
+
+import time
+import asyncio
+import logging
+import threading
+import contextvars
+from typing import Callable, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+CANCEL_GRACE = 1.0               # キャンセル後、実行中タスクの後始末を待つ上限(秒)
+CANCEL_REASON_USER = "ユーザーによる停止"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("llm_cancel_token", default=None)
+
+
+class CancelToken:
+    """スレッドセーフな1回限りのキャンセルフラグ + 通知"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: list = []
+        self.reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = CANCEL_REASON_USER):
+        """キャンセルを要求（2回目以降は無視）。登録済みのコールバックを呼ぶ"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        logger.info(f"キャンセル要求: {reason}")
+        for fn in callbacks:
+            try:
+                fn()
+            except Exception as e:
+                logger.warning(f"キャンセル通知に失敗: {e!r}")
+
+    def add_callback(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """キャンセル時に呼ぶ関数を登録し、登録解除用の関数を返す（キャンセル済みなら即座に呼ぶ）"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(fn)
+                return lambda: self._remove_callback(fn)
+        fn()
+        return lambda: None
+
+    def _remove_callback(self, fn):
+        with self._lock:
+            try:
+                self._callbacks.remove(fn)
+            except ValueError:
+                pass
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise InterruptedError(self.reason or CANCEL_REASON_USER)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """同期コード用の割り込み可能な待機（キャンセルされたら True を返して即座に戻る）"""
+        return self._event.wait(timeout)
+
+    async def run(self, coro: Coroutine, grace: float = CANCEL_GRACE):
+        """coro を子タスクとして実行し、キャンセルされたら打ち切って InterruptedError を送出する"""
+        if self._event.is_set():
+            coro.close()
+            self.raise_if_cancelled()
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(self._scoped(coro))
+        fired = loop.create_future()
+
+        def _notify():
+            loop.call_soon_threadsafe(lambda: fired.done() or fired.set_result(None))
+
+        remove = self.add_callback(_notify)
+        try:
+            await asyncio.wait({task, fired}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            # 呼び出し側のタスク自体がキャンセルされた
+            task.cancel()
+            raise
+        finally:
+            remove()
+            fired.cancel()
+
+        if task.done():
+            return task.result()
+        task.cancel()
+        done, _ = await asyncio.wait({task}, timeout=grace)
+        if not done:
+            logger.warning(f"キャンセル後の後始末が{grace}秒以内に終わらないタスクを放棄")
+        else:
+            # 後始末中の例外は停止理由に置き換える（取り出して未処理警告を防ぐ）
+            if not task.cancelled():
+                task.exception()
+        self.raise_if_cancelled()
+
+    async def _scoped(self, coro: Coroutine):
+        _current.set(self)
+        return await coro
+
+
+def bind(token: Optional[CancelToken]):
+    """呼び出し元スレッド（generate_pipeline を実行するワーカースレッド）に token を結び付ける
+
+    ContextVar はスレッドごとに独立しているため、他のスレッドの呼び出しには影響しない。
+    """
+    _current.set(token)
+
+
+def current_token() -> Optional[CancelToken]:
+    """実行中の CancelToken.run() / bind() のトークン（範囲外なら None）"""
+    return _current.get()
+
+
+def check_cancelled():
+    """現在のトークンがキャンセル済みなら InterruptedError を送出"""
+    token = _current.get()
+    if token is not None:
+        token.raise_if_cancelled()
+
+
+def sleep(seconds: float):
+    """同期コード用のリトライ待機（現在のトークンがキャンセルされたら即座に InterruptedError）"""
+    token = _current.get()
+    if token is None:
+        time.sleep(seconds)
+        return
+    if token.wait(seconds):
+        token.raise_if_cancelled()
@@ -0,0 +1,217 @@
+"""
+Circuit Breaker for Local LLM Backend
+
+HybridRouter のローカルLLM経路を守るサーキットブレーカー。
+連続失敗でローカル経路を遮断し、一定時間後にヘルスチェックを経て段階的に復帰させる。
+
+状態遷移:
+  closed    … 通常。連続失敗が閾値に達すると open
+  open      … 全リクエストをクラウドへ。open_timeout 経過後の最初の判定で probe() を実行し、
+               成功なら half_open、失敗なら待ち時間を倍にして open のまま
+  half_open … トラフィックを 25% → 50% → 100% と段階的に戻す（各段で所定回数成功したら次段）。
+               100% 段を通過すると closed。途中で1回でも失敗すれば再び open
+
+ジョブ途中でローカルサーバーが再起動しても、復帰後は自動的にローカルへ戻る。
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+BREAKER_FAILURE_THRESHOLD = 5        # closed → open となる連続失敗数
+BREAKER_OPEN_TIMEOUT = 30.0          # open 状態の初回待ち時間(秒)
+BREAKER_MAX_OPEN_TIMEOUT = 300.0     # 再オープン時に倍々で伸ばす待ち時間の上限(秒)
+BREAKER_RAMP_STEPS = (0.25, 0.5, 1.0)  # half_open で流すトラフィック比率
+BREAKER_RAMP_SUCCESSES = 3           # 各段で次段へ進むのに必要な成功数
+BREAKER_HISTORY_SIZE = 50
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """closed / open / half_open の3状態ブレーカー（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        name: str,
+        probe: Optional[Callable[[], bool]] = None,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        open_timeout: float = BREAKER_OPEN_TIMEOUT,
+        max_open_timeout: float = BREAKER_MAX_OPEN_TIMEOUT,
+        ramp_steps: tuple = BREAKER_RAMP_STEPS,
+        ramp_successes: int = BREAKER_RAMP_SUCCESSES,
+    ):
+        self.name = name
+        self._probe = probe
+        self._failure_threshold = failure_threshold
+        self._base_timeout = open_timeout
+        self._max_timeout = max_open_timeout
+        self._ramp_steps = ramp_steps
+        self._ramp_successes = ramp_successes
+        self._lock = threading.Lock()
+
+        self._state = STATE_CLOSED
+        self._failures = 0              # closed中の連続失敗数
+        self._timeout = open_timeout    # 現在の open 待ち時間
+        self._open_until = 0.0
+        self._probing = False
+        self._ramp_index = 0
+        self._ramp_ok = 0               # 現在の段での成功数
+        self._admit_credit = 0.0        # half_open の比率制御用（決定的に間引く）
+        self.trips = 0
+        self._history: deque = deque(maxlen=BREAKER_HISTORY_SIZE)
+
+    # ------------------------------------------------------------
+    # 状態
+    # ------------------------------------------------------------
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @property
+    def consecutive_failures(self) -> int:
+        return self._failures
+
+    @property
+    def ramp(self) -> float:
+        """現在ローカルに流しているトラフィック比率"""
+        if self._state == STATE_CLOSED:
+            return 1.0
+        if self._state == STATE_OPEN:
+            return 0.0
+        return self._ramp_steps[self._ramp_index]
+
+    def _transition_locked(self, new_state: str, reason: str):
+        old = self._state
+        self._state = new_state
+        self._history.append({
+            "time": time.time(), "old": old, "new": new_state, "reason": reason,
+        })
+        msg = f"CircuitBreaker [{self.name}] {old} → {new_state} ({reason})"
+        if new_state == STATE_OPEN:
+            logger.warning(msg)
+        else:
+            logger.info(msg)
+
+    def _open_locked(self, reason: str):
+        self._open_until = time.monotonic() + self._timeout
+        self._failures = 0
+        self.trips += 1
+        self._transition_locked(STATE_OPEN, f"{reason}, {self._timeout:.0f}秒後に再確認")
+
+    # ------------------------------------------------------------
+    # 判定・記録
+    # ------------------------------------------------------------
+
+    def allow(self) -> bool:
+        """このリクエストをローカルへ送ってよいか
+
+        open の待ち時間が過ぎていれば probe() を1回だけ実行して half_open へ進める。
+        probe() は同期HTTPを伴うため、イベントループ上ではスレッド経由で呼ぶこと。
+        """
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return True
+            if self._state == STATE_HALF_OPEN:
+                return self._admit_locked()
+            if self._probing or time.monotonic() < self._open_until:
+                return False
+            self._probing = True
+
+        ok = True
+        if self._probe is not None:
+            try:
+                ok = bool(self._probe())
+            except Exception as e:
+                logger.warning(f"CircuitBreaker [{self.name}] probe失敗: {e}")
+                ok = False
+
+        with self._lock:
+            self._probing = False
+            if self._state != STATE_OPEN:
+                return self._state == STATE_CLOSED or self._admit_locked()
+            if not ok:
+                self._timeout = min(self._timeout * 2, self._max_timeout)
+                self._open_until = time.monotonic() + self._timeout
+                logger.info(f"CircuitBreaker [{self.name}] probe NG → {self._timeout:.0f}秒後に再確認")
+                return False
+            self._ramp_index = 0
+            self._ramp_ok = 0
+            self._admit_credit = 1.0 - self._ramp_steps[0]   # プローブ直後の1本目は必ず通す
+            self._transition_locked(STATE_HALF_OPEN, f"probe OK, トラフィック{self.ramp:.0%}で再開")
+            return self._admit_locked()
+
+    def _admit_locked(self) -> bool:
+        self._admit_credit += self._ramp_steps[self._ramp_index]
+        if self._admit_credit >= 1.0:
+            self._admit_credit -= 1.0
+            return True
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                self._failures = 0
+                return
+            if self._state != STATE_HALF_OPEN:
+                return
+            self._ramp_ok += 1
+            if self._ramp_ok < self._ramp_successes:
+                return
+            self._ramp_ok = 0
+            if self._ramp_index + 1 < len(self._ramp_steps):
+                self._ramp_index += 1
+                self._history.append({
+                    "time": time.time(), "old": STATE_HALF_OPEN, "new": STATE_HALF_OPEN,
+                    "reason": f"ramp {self.ramp:.0%}",
+                })
+                logger.info(f"CircuitBreaker [{self.name}] トラフィック{self.ramp:.0%}へ拡大")
+                return
+            self._timeout = self._base_timeout
+            self._transition_locked(STATE_CLOSED, "段階的復帰完了")
+
+    def record_failure(self, reason: str = ""):
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                self._failures += 1
+                if self._failures >= self._failure_threshold:
+                    self._open_locked(f"連続失敗{self._failures}回: {reason}"[:200])
+            elif self._state == STATE_HALF_OPEN:
+                self._timeout = min(self._timeout * 2, self._max_timeout)
+                self._open_locked(f"half_open中に失敗: {reason}"[:200])
+
+    # ------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------
+
+    def history(self) -> list:
+        with self._lock:
+            return list(self._history)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self._state,
+                "consecutive_failures": self._failures,
+                "ramp": self.ramp,
+                "open_remaining": round(max(0.0, self._open_until - time.monotonic()), 1)
+                if self._state == STATE_OPEN else 0.0,
+                "trips": self.trips,
+                "transitions": list(self._history)[-10:],
+            }
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        return (f"CircuitBreaker [{self.name}]: {snap['state']}"
+                f" (トラフィック{snap['ramp']:.0%}, 遮断{snap['trips']}回)")
@@ -0,0 +1,278 @@
+"""
+Adaptive Concurrency Controller (AIMD)
+
+モデル（"claude-sonnet-..." / "local-llm" 等）ごとに同時実行数の上限を動的に調整する。
+
+- Additive Increase: 応答レイテンシが健全な間は、上限分の成功ごとに +1
+- Multiplicative Decrease: RateLimitError / 529 Overloaded で上限を ×0.5
+- 削減直後はクールダウン期間を設け、同じ過負荷バーストで何度も削減しない
+- 上限の変更は理由付きで履歴に残し、snapshot() で現在値とともに参照できる
+
+acall_claude() と HybridRouter.acall() が同じコントローラー（get_controller()）を共有する。
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+AIMD_INITIAL_LIMIT = 2          # 初期同時実行数（v8.7: 5→2 ストーリー一貫性向上）
+AIMD_MIN_LIMIT = 1
+AIMD_MAX_LIMIT = 8
+AIMD_DECREASE_FACTOR = 0.5      # 過負荷時の乗算的削減率
+AIMD_LATENCY_TOLERANCE = 2.0    # ベースラインの何倍までを「健全」とみなすか
+AIMD_LATENCY_EWMA_ALPHA = 0.2
+AIMD_COOLDOWN_SEC = 15.0        # 削減後、再削減・増加を止める期間
+AIMD_HISTORY_SIZE = 100
+
+# 過負荷理由
+REASON_RATE_LIMIT = "rate_limit"
+REASON_OVERLOADED = "overloaded_529"
+REASON_LOCAL_ERROR = "local_error"
+REASON_HEALTHY = "healthy"
+
+
+class _ModelState:
+    """1モデル分のAIMD状態"""
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.latency_ewma: Optional[float] = None
+        self.latency_floor: Optional[float] = None   # 観測された最小EWMA（ベースライン）
+        self.cooldown_until = 0.0
+        self.successes = 0
+        self.overloads = 0
+        self.waiters: deque = deque()                 # (loop, future)
+
+    @property
+    def effective_limit(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+
+class AIMDController:
+    """モデル別の適応的同時実行数コントローラー（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        initial_limit: int = AIMD_INITIAL_LIMIT,
+        min_limit: int = AIMD_MIN_LIMIT,
+        max_limit: int = AIMD_MAX_LIMIT,
+        cooldown_sec: float = AIMD_COOLDOWN_SEC,
+    ):
+        self._initial = initial_limit
+        self._min = min_limit
+        self._max = max_limit
+        self._cooldown_sec = cooldown_sec
+        self._states: dict = {}
+        self._lock = threading.Lock()
+        self._history: deque = deque(maxlen=AIMD_HISTORY_SIZE)
+
+    def _state(self, key: str) -> _ModelState:
+        st = self._states.get(key)
+        if st is None:
+            st = _ModelState(self._initial, self._min, self._max)
+            self._states[key] = st
+        return st
+
+    def configure(self, key: str, initial: Optional[int] = None, max_limit: Optional[int] = None):
+        """キー個別に上限を設定（ローカルLLMのスロット数など、容量が既知の場合）"""
+        with self._lock:
+            st = self._state(key)
+            if max_limit is not None:
+                st.max_limit = max(st.min_limit, max_limit)
+            if initial is not None:
+                st.limit = float(max(st.min_limit, min(initial, st.max_limit)))
+            elif st.limit > st.max_limit:
+                st.limit = float(st.max_limit)
+            self._wake_locked(st)
+
+    # ------------------------------------------------------------
+    # スロット管理
+    # ------------------------------------------------------------
+
+    @asynccontextmanager
+    async def slot(self, key: str):
+        """同時実行枠を1つ確保する（上限に達していれば空くまで await）"""
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    async def acquire(self, key: str):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                st = self._state(key)
+                if st.in_flight < st.effective_limit:
+                    st.in_flight += 1
+                    return
+                fut = loop.create_future()
+                st.waiters.append((loop, fut))
+            try:
+                await fut
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        st.waiters.remove((loop, fut))
+                    except ValueError:
+                        # 起床済みだった場合は枠を次の待機者へ譲る
+                        self._wake_locked(st)
+                raise
+
+    def release(self, key: str):
+        with self._lock:
+            st = self._state(key)
+            st.in_flight = max(0, st.in_flight - 1)
+            self._wake_locked(st)
+
+    def _wake_locked(self, st: _ModelState):
+        """空き枠の数だけ待機者を起こす（ロック保持中に呼ぶ）"""
+        free = st.effective_limit - st.in_flight
+        while free > 0 and st.waiters:
+            loop, fut = st.waiters.popleft()
+            loop.call_soon_threadsafe(_set_future_done, fut)
+            free -= 1
+
+    # ------------------------------------------------------------
+    # フィードバック
+    # ------------------------------------------------------------
+
+    def record_success(self, key: str, latency: float):
+        """成功応答を記録。レイテンシが健全なら加算的に上限を増やす"""
+        with self._lock:
+            st = self._state(key)
+            st.successes += 1
+            if st.latency_ewma is None:
+                st.latency_ewma = latency
+            else:
+                st.latency_ewma += AIMD_LATENCY_EWMA_ALPHA * (latency - st.latency_ewma)
+            if st.latency_floor is None or st.latency_ewma < st.latency_floor:
+                st.latency_floor = st.latency_ewma
+
+            if time.monotonic() < st.cooldown_until:
+                return
+            if latency > st.latency_floor * AIMD_LATENCY_TOLERANCE:
+                return
+            if st.limit >= st.max_limit:
+                return
+
+            old = st.effective_limit
+            # 1ウィンドウ（= 現在の上限数の成功）ごとに +1
+            st.limit = min(float(st.max_limit), st.limit + 1.0 / max(st.limit, 1.0))
+            if st.effective_limit != old:
+                self._record_change_locked(
+                    key, old, st.effective_limit,
+                    f"{REASON_HEALTHY} (latency {latency:.1f}s, baseline {st.latency_floor:.1f}s)",
+                )
+                self._wake_locked(st)
+
+    def record_overload(self, key: str, reason: str):
+        """RateLimit / 529 等を記録し、上限を乗算的に削減する"""
+        with self._lock:
+            st = self._state(key)
+            st.overloads += 1
+            now = time.monotonic()
+            if now < st.cooldown_until:
+                # 同じバースト内の連続エラーでは再削減しない
+                return
+            old = st.effective_limit
+            st.limit = max(float(st.min_limit), st.limit * AIMD_DECREASE_FACTOR)
+            st.cooldown_until = now + self._cooldown_sec
+            self._record_change_locked(key, old, st.effective_limit, reason)
+
+    def _record_change_locked(self, key: str, old: int, new: int, reason: str):
+        self._history.append({
+            "time": time.time(),
+            "model": key,
+            "old": old,
+            "new": new,
+            "reason": reason,
+        })
+        logger.info(f"AIMD [{key}] 同時実行上限 {old} → {new} ({reason})")
+
+    # ------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------
+
+    def limit(self, key: str) -> int:
+        """現在の同時実行上限"""
+        with self._lock:
+            return self._state(key).effective_limit
+
+    def cooldown_remaining(self, key: Optional[str] = None) -> float:
+        """削減後クールダウンの残り秒数（key省略時は全モデルの最大値）"""
+        now = time.monotonic()
+        with self._lock:
+            if key is not None:
+                states = [self._state(key)]
+            else:
+                states = list(self._states.values())
+            return max([0.0] + [st.cooldown_until - now for st in states])
+
+    def history(self, key: Optional[str] = None) -> list:
+        """上限変更履歴 [{time, model, old, new, reason}, ...]"""
+        with self._lock:
+            return [h for h in self._history if key is None or h["model"] == key]
+
+    def snapshot(self) -> dict:
+        """モデル別の現在状態"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                key: {
+                    "limit": st.effective_limit,
+                    "in_flight": st.in_flight,
+                    "latency_ewma": round(st.latency_ewma, 2) if st.latency_ewma is not None else None,
+                    "successes": st.successes,
+                    "overloads": st.overloads,
+                    "cooldown_remaining": round(max(0.0, st.cooldown_until - now), 1),
+                }
+                for key, st in self._states.items()
+            }
+
+    def summary(self) -> str:
+        """ログ出力用の1行サマリー"""
+        snap = self.snapshot()
+        if not snap:
+            return "AIMD: (未使用)"
+        parts = [
+            f"{key.split('-20')[0]}={s['limit']}"
+            f" (ok {s['successes']}, 過負荷 {s['overloads']})"
+            for key, s in snap.items()
+        ]
+        return "AIMD同時実行上限: " + ", ".join(parts)
+
+
+def _set_future_done(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(None)
+
+
+# ============================================================
+# Process-wide controller
+# ============================================================
+
+_controller: Optional[AIMDController] = None
+_controller_lock = threading.Lock()
+
+
+def get_controller() -> AIMDController:
+    """プロセス共有のAIMDコントローラーを返す"""
+    global _controller
+    with _controller_lock:
+        if _controller is None:
+            _controller = AIMDController()
+        return _controller
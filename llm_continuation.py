@@ -0,0 +1,98 @@
+"""
+Continuation Salvage for Truncated Responses
+
+max_tokens で打ち切られた応答（Claude: stop_reason == "max_tokens" /
+OpenAI互換: finish_reason == "length"）を、途中までの出力を assistant prefill にした
+続き生成リクエストで完結させる。シーン全体の再生成（入力トークン全額 + 待ち時間）を避けるためのもの。
+
+- ContinuationPolicy: 続き生成1回あたりの max_tokens を決める。
+  ラウンドごとに倍々で増やし、モデル別に直近の必要量を学習して初回から足りる量を割り当てる
+- stitch(): 途中までの出力と続きを連結（続きの先頭で前の末尾を繰り返した場合は重複を除く）
+
+acall_claude()（gui.py）と LocalLLMProvider.call()/acall() が使う。
+"""
+
+import threading
+from typing import Optional
+
+# ============================================================
+# Constants
+# ============================================================
+
+CONTINUATION_MAX_ROUNDS = 2         # 1応答あたりの続き生成の最大回数
+CONTINUATION_MIN_TOKENS = 1024      # 続き生成1回の最小 max_tokens
+CONTINUATION_MAX_TOKENS = 8192      # 続き生成1回の最大 max_tokens
+CONTINUATION_GROWTH = 2.0           # ラウンドごとの max_tokens 倍率
+CONTINUATION_HEADROOM = 1.25        # 学習した必要量に対する余裕
+STITCH_MAX_OVERLAP = 64             # 重複除去で照合する最大文字数
+STITCH_MIN_OVERLAP = 8              # これ未満の一致は偶然とみなして除去しない
+
+
+def stitch(prefix: str, continuation: str) -> str:
+    """途中までの出力と続きを連結する
+
+    続きの先頭が prefix の末尾を繰り返している場合（ローカルLLMで起きやすい）は重複を除く。
+    """
+    if not continuation:
+        return prefix
+    limit = min(STITCH_MAX_OVERLAP, len(prefix), len(continuation))
+    for k in range(limit, STITCH_MIN_OVERLAP - 1, -1):
+        if prefix.endswith(continuation[:k]):
+            return prefix + continuation[k:]
+    return prefix + continuation
+
+
+class ContinuationPolicy:
+    """続き生成の max_tokens をモデル（経路）別に決める（スレッドセーフ）"""
+
+    def __init__(self, min_tokens: int = CONTINUATION_MIN_TOKENS,
+                 max_tokens: int = CONTINUATION_MAX_TOKENS,
+                 growth: float = CONTINUATION_GROWTH):
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.growth = growth
+        self._lock = threading.Lock()
+        self._needed: dict = {}      # key → 直近の続き生成で必要だった出力トークン数
+        self.rounds = 0
+        self.completed = 0
+
+    def budget(self, key: str, max_tokens: int, round_index: int, cap: Optional[int] = None) -> int:
+        """round_index（1始まり）回目の続き生成に割り当てる max_tokens"""
+        with self._lock:
+            needed = int(self._needed.get(key, 0) * CONTINUATION_HEADROOM)
+        base = max(self.min_tokens, max_tokens // 2, needed)
+        limit = min(cap, self.max_tokens) if cap else self.max_tokens
+        return min(limit, int(base * self.growth ** (round_index - 1)))
+
+    def observe(self, key: str, output_tokens: int, finished: bool):
+        """続き生成1回の結果を学習（完結しなければ予算不足として上方修正）"""
+        with self._lock:
+            self.rounds += 1
+            prev = self._needed.get(key, 0)
+            if finished:
+                self.completed += 1
+                # 小さい値にはゆっくり追従（1回の短い続きで予算を絞りすぎない）
+                self._needed[key] = max(output_tokens, int(prev * 0.8))
+            else:
+                self._needed[key] = max(prev, int(output_tokens * self.growth))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"rounds": self.rounds, "completed": self.completed, "needed": dict(self._needed)}
+
+
+# ============================================================
+# Process-wide policy
+# ============================================================
+
+_policy: Optional[ContinuationPolicy] = None
+_policy_lock = threading.Lock()
+
+
+def get_continuation_policy() -> ContinuationPolicy:
+    """プロセス共有の続き生成ポリシーを返す"""
+    global _policy
+    with _policy_lock:
+        if _policy is None:
+            _policy = ContinuationPolicy()
+        return _policy
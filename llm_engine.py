@@ -0,0 +1,166 @@
+"""
+Async LLM Engine
+
+専用スレッド上で1本の asyncio イベントループを回し、Claude API (AsyncAnthropic) と
+ローカルLLM (httpx.AsyncClient) への呼び出しを同一ループ上で多重化する。
+
+- リクエスト待ち・リトライ待機はすべて await で行うため、in-flight 数に比例して
+  OSスレッドが増えない（ThreadPoolExecutor の wave 方式の置き換え）
+- 同期コード（GUIワーカースレッド / generate_pipeline）からは run() / submit() で利用する
+- ループスレッド内から run() を呼ぶとデッドロックするため RuntimeError を送出する
+"""
+
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncLLMEngine:
+    """バックグラウンドスレッドで動くイベントループ + 非同期クライアントのキャッシュ"""
+
+    def __init__(self, name: str = "llm-engine"):
+        self._name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        # (api_key, base_url) → AsyncAnthropic
+        self._anthropic_clients: dict = {}
+
+    # ------------------------------------------------------------
+    # ループ管理
+    # ------------------------------------------------------------
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        """イベントループスレッドを起動（起動済みなら何もしない）"""
+        with self._lock:
+            if self._loop is not None and self._thread is not None and self._thread.is_alive():
+                return self._loop
+            self._ready.clear()
+            self._thread = threading.Thread(target=self._run_loop, name=self._name, daemon=True)
+            self._thread.start()
+        self._ready.wait()
+        return self._loop
+
+    def _run_loop(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            except Exception:
+                pass
+            loop.close()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self.start()
+
+    def in_loop_thread(self) -> bool:
+        """現在のスレッドがエンジンのループスレッドか"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """コルーチンをループに投入し、concurrent.futures.Future を返す（ノンブロッキング）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None, cancel=None) -> Any:
+        """コルーチンをループで実行し、完了までブロックして結果を返す（同期ラッパー用）
+
+        cancel: llm_cancel.CancelToken を渡すと、キャンセル時に実行中のタスク（HTTP接続を含む）を
+        打ち切って InterruptedError を送出する
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("AsyncLLMEngine.run() はループスレッド内から呼べません（awaitを使用）")
+        if cancel is not None:
+            coro = cancel.run(coro)
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # 呼び出し側の中断（タイムアウト/KeyboardInterrupt）時はループ側のタスクも止める
+            if not future.done():
+                future.cancel()
+            raise
+
+    def shutdown(self, timeout: float = 5.0):
+        """ループを停止してスレッドを終了"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        clients = list(self._anthropic_clients.values())
+        self._anthropic_clients.clear()
+
+        async def _close_clients():
+            for c in clients:
+                try:
+                    await c.close()
+                except Exception:
+                    pass
+
+        try:
+            asyncio.run_coroutine_threadsafe(_close_clients(), loop).result(timeout)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout)
+
+    # ------------------------------------------------------------
+    # 非同期クライアント
+    # ------------------------------------------------------------
+
+    def async_anthropic(self, client):
+        """同期 anthropic.Anthropic と同じ認証・接続先の AsyncAnthropic を返す（キャッシュ）
+
+        同期クライアントは既存の関数シグネチャ互換のために受け渡しが続いているので、
+        そこから api_key / base_url を引き継いで非同期クライアントを1つだけ作る。
+        """
+        import anthropic
+
+        if isinstance(client, anthropic.AsyncAnthropic):
+            return client
+        api_key = getattr(client, "api_key", None)
+        base_url = str(getattr(client, "base_url", "") or "")
+        key = (api_key, base_url)
+        aclient = self._anthropic_clients.get(key)
+        if aclient is None:
+            # 再試行は llm_retry.RetryPolicy に一元化する（SDK内蔵のリトライは
+            # AIMDスロットを握ったまま固定バックオフで待つため無効化）
+            kwargs = {"api_key": api_key, "max_retries": 0}
+            if base_url:
+                kwargs["base_url"] = base_url
+            aclient = anthropic.AsyncAnthropic(**kwargs)
+            self._anthropic_clients[key] = aclient
+        return aclient
+
+
+# ============================================================
+# Process-wide engine
+# ============================================================
+
+_engine: Optional[AsyncLLMEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> AsyncLLMEngine:
+    """プロセス共有のエンジンを返す（初回呼び出し時に起動）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AsyncLLMEngine()
+        engine = _engine
+    engine.start()
+    return engine
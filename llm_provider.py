@@ -10,10 +10,30 @@ _call_api() のバックエンドとして動作し、既存パイプライン
 import json
 import re
 import time
+import asyncio
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
+from collections import deque
 from typing import Optional, Callable
 
+# 非同期HTTPクライアント（anthropic SDKの依存として通常は導入済み）
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+from llm_concurrency import get_controller, REASON_LOCAL_ERROR
+from llm_circuit import CircuitBreaker, STATE_OPEN
+from llm_cache import UsageRecorder
+from llm_rate_limit import estimate_tokens
+from llm_stream import StreamAborted
+from json_extract import strip_thinking, extract_json_text
+from llm_continuation import get_continuation_policy, stitch, CONTINUATION_MAX_ROUNDS
+import llm_cancel
+
 logger = logging.getLogger(__name__)
 
 # ============================================================
@@ -24,14 +44,26 @@ LOCAL_LLM_BASE_URL = "http://localhost:1234/v1"
 LOCAL_LLM_MODEL = "qwen3.5-35b-a3b-uncensored-hauhaucs-aggressive"
 LOCAL_LLM_TIMEOUT = 300  # seconds
 LOCAL_LLM_MAX_RETRIES = 2
+LOCAL_LLM_AIMD_KEY = "local-llm"  # AIMDコントローラー上のキー（CostTrackerと同じ名前）
+LOCAL_LLM_TEMPERATURE = 0.9
+
+# 複数エンドポイントのプール
+LOCAL_POOL_HEALTH_INTERVAL = 30     # /models ヘルスチェック間隔(秒)
+LOCAL_POOL_EWMA_ALPHA = 0.3         # レイテンシEWMAの平滑化係数
+LOCAL_POOL_DEFAULT_LATENCY = 20.0   # 未計測エンドポイントの仮レイテンシ(秒)
+LOCAL_LLM_MAX_SLOTS = 16            # /props で検出したスロット数の上限（誤検出時の暴走防止）
+
+# ヘッジ（ローカルが遅い場合にクラウドへ並行送信）
+HEDGE_PERCENTILE = 0.95        # 観測レイテンシのこの分位点を超えたらヘッジ発火
+HEDGE_MIN_SAMPLES = 5          # 分位点を使い始める最小サンプル数
+HEDGE_DEFAULT_DELAY = 120.0    # サンプル不足時の発火待ち時間(秒)
+HEDGE_MIN_DELAY = 5.0
+HEDGE_WINDOW = 50              # 分位点計算に使う直近サンプル数
 
 # RunPod Serverless (cloud-hosted local LLM)
 # URL format: https://api.runpod.ai/v2/{ENDPOINT_ID}/openai/v1
 RUNPOD_TIMEOUT = 600  # RunPodはコールドスタートがあるため長め
 
-# Thinking block regex (Qwen3.5 outputs <think>...</think>)
-_THINK_RE = re.compile(r"<think>[\s\S]*?</think>", re.DOTALL)
-
 # ============================================================
 # Provider ABC
 # ============================================================
@@ -48,10 +80,33 @@ class LLMProvider(ABC):
         cost_tracker,
         max_tokens: int = 4096,
         callback: Optional[Callable] = None,
+        json_schema: Optional[dict] = None,
     ) -> str:
-        """LLMを呼び出してテキスト応答を返す"""
+        """LLMを呼び出してテキスト応答を返す
+
+        json_schema: 出力を制約するJSON Schema（制約付きデコード対応のプロバイダーのみが使う）
+        """
         ...
 
+    async def acall(
+        self,
+        model: str,
+        system,
+        user: str,
+        cost_tracker,
+        max_tokens: int = 4096,
+        callback: Optional[Callable] = None,
+        monitor=None,
+        json_schema: Optional[dict] = None,
+    ) -> str:
+        """非同期版 call()。既定では同期 call() をワーカースレッドで実行する
+
+        monitor (llm_stream.StreamMonitor) はストリーミング対応のプロバイダーのみが使う。
+        """
+        return await asyncio.to_thread(
+            self.call, model, system, user, cost_tracker, max_tokens, callback, json_schema=json_schema
+        )
+
     @abstractmethod
     def is_available(self) -> bool:
         """プロバイダーが利用可能か確認"""
@@ -65,15 +120,29 @@ class LLMProvider(ABC):
 class ClaudeProvider(LLMProvider):
     """既存の call_claude() をラップするプロバイダー"""
 
-    def __init__(self, client, call_claude_func):
+    def __init__(self, client, call_claude_func, acall_claude_func=None):
         self._client = client
         self._call_claude = call_claude_func
+        self._acall_claude = acall_claude_func
 
-    def call(self, model, system, user, cost_tracker, max_tokens=4096, callback=None):
+    def call(self, model, system, user, cost_tracker, max_tokens=4096, callback=None, json_schema=None):
+        # json_schema はローカル専用（Claude はプロンプトの出力例に従う）
         return self._call_claude(
             self._client, model, system, user, cost_tracker, max_tokens, callback
         )
 
+    async def acall(self, model, system, user, cost_tracker, max_tokens=4096, callback=None,
+                    monitor=None, json_schema=None):
+        if self._acall_claude is None:
+            return await super().acall(model, system, user, cost_tracker, max_tokens, callback)
+        if monitor is not None:
+            return await self._acall_claude(
+                self._client, model, system, user, cost_tracker, max_tokens, callback, monitor=monitor
+            )
+        return await self._acall_claude(
+            self._client, model, system, user, cost_tracker, max_tokens, callback
+        )
+
     def is_available(self) -> bool:
         return self._client is not None
 
@@ -86,20 +155,94 @@ class LocalLLMProvider(LLMProvider):
     """ローカルLLM (llama-server / LM Studio / RunPod Serverless) 用プロバイダー"""
 
     def __init__(self, base_url: str = LOCAL_LLM_BASE_URL, model: str = LOCAL_LLM_MODEL,
-                 api_key: Optional[str] = None):
+                 api_key: Optional[str] = None, max_retries: int = LOCAL_LLM_MAX_RETRIES,
+                 slots: Optional[int] = None, json_schema: bool = True):
         self._base_url = base_url.rstrip("/")
         self._model = model
         self._api_key = api_key  # RunPod認証用（ローカルはNone）
+        self._max_retries = max_retries
+        self._slots = slots             # 明示指定された並列スロット数（Noneなら /props で検出）
+        self._slots_discovered = None
         self._available = None  # lazy check
         # RunPodはコールドスタートがあるためタイムアウトを延長
         self._is_runpod = "runpod.ai" in base_url
         self._timeout = RUNPOD_TIMEOUT if self._is_runpod else LOCAL_LLM_TIMEOUT
+        self._aclient = None  # httpx.AsyncClient（acall初回に生成）
+        # 制約付きデコード（response_format: json_schema）。サーバーが400で拒否したら以後は送らない
+        self._json_schema = json_schema
+        self._schema_rejected = False
+
+    @property
+    def label(self) -> str:
+        return "RunPod" if self._is_runpod else "ローカルLLM"
+
+    @property
+    def base_url(self) -> str:
+        return self._base_url
 
-    def call(self, model, system, user, cost_tracker, max_tokens=4096, callback=None):
+    @property
+    def slots(self) -> int:
+        """サーバーが同時に処理できるリクエスト数（明示指定 > /props検出 > 1）"""
+        return self._slots or self._slots_discovered or 1
+
+    @property
+    def _props_url(self) -> str:
+        # llama-server の /props はOpenAI互換パス(/v1)の外にある
+        root = self._base_url[:-3] if self._base_url.endswith("/v1") else self._base_url
+        return f"{root}/props"
+
+    def _needs_slot_discovery(self) -> bool:
+        # RunPodはワーカー単位でスケールするため検出しない（コールドスタートも避ける）
+        return not self._slots and self._slots_discovered is None and not self._is_runpod
+
+    def _apply_props(self, data) -> int:
+        """/props 応答から total_slots を読み取る（llama-server以外は1）"""
+        try:
+            n = int(data.get("total_slots") or 1)
+        except (AttributeError, TypeError, ValueError):
+            n = 1
+        self._slots_discovered = max(1, min(n, LOCAL_LLM_MAX_SLOTS))
+        if self._slots_discovered > 1:
+            logger.info(f"{self.label} {self._base_url}: 並列スロット {self._slots_discovered} を検出")
+        return self._slots_discovered
+
+    def discover_slots(self) -> int:
+        """llama-server の /props から並列スロット数を取得"""
+        if not self._needs_slot_discovery():
+            return self.slots
         import urllib.request
-        import urllib.error
+        try:
+            req = urllib.request.Request(self._props_url, method="GET", headers=self._probe_headers())
+            with urllib.request.urlopen(req, timeout=self._probe_timeout) as resp:
+                return self._apply_props(json.loads(resp.read().decode("utf-8")))
+        except Exception:
+            return self._apply_props({})
+
+    async def adiscover_slots(self) -> int:
+        """discover_slots() の非同期版"""
+        if not self._needs_slot_discovery():
+            return self.slots
+        if not HTTPX_AVAILABLE:
+            return await asyncio.to_thread(self.discover_slots)
+        try:
+            resp = await self._async_client().get(
+                self._props_url, headers=self._probe_headers(), timeout=self._probe_timeout,
+            )
+            resp.raise_for_status()
+            return self._apply_props(resp.json())
+        except Exception:
+            return self._apply_props({})
+
+    def _uses_schema(self, json_schema: Optional[dict]) -> bool:
+        return bool(json_schema) and self._json_schema and not self._schema_rejected
 
-        # Build messages
+    def _build_payload(self, system, user: str, max_tokens: int, json_schema: Optional[dict] = None) -> dict:
+        """OpenAI互換 /chat/completions のリクエストボディを構築
+
+        json_schema を渡すと response_format で出力をスキーマに制約する（文法で先頭から
+        JSONに固定されるため assistant prefill は付けない）。
+        """
+        constrained = self._uses_schema(json_schema)
         messages = []
         if system:
             sys_text = system if isinstance(system, str) else "\n".join(
@@ -107,62 +250,202 @@ class LocalLLMProvider(LLMProvider):
             )
             messages.append({"role": "system", "content": sys_text})
         messages.append({"role": "user", "content": user + " /no_think"})
-        # Assistant prefill: JSONの開始を強制して思考スキップ
-        messages.append({"role": "assistant", "content": "{"})
+        if not constrained:
+            # Assistant prefill: JSONの開始を強制して思考スキップ
+            messages.append({"role": "assistant", "content": "{"})
 
         # max_tokensをローカルLLM向けに制限（context 8192、出力は1024で十分）
         _effective_max_tokens = min(max_tokens, 2048)
 
-        payload = json.dumps({
+        payload = {
             "model": self._model,
             "messages": messages,
-            "temperature": 0.9,
+            "temperature": LOCAL_LLM_TEMPERATURE,
             "max_tokens": _effective_max_tokens,
-        }, ensure_ascii=False).encode("utf-8")
+        }
+        if constrained:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": json_schema.get("title", "response"),
+                    "strict": True,
+                    "schema": json_schema,
+                },
+            }
+        return payload
+
+    @staticmethod
+    def _prefill(payload: dict) -> str:
+        """payload 末尾の assistant prefill（無ければ空文字）"""
+        last = payload["messages"][-1]
+        return last["content"] if last["role"] == "assistant" else ""
+
+    def _schema_fallback(self, status: int, payload: dict, body: str) -> bool:
+        """response_format 付きリクエストが400で拒否されたら以後スキーマを送らない（再送すべきなら True）"""
+        if status != 400 or "response_format" not in payload or self._schema_rejected:
+            return False
+        self._schema_rejected = True
+        logger.warning(f"{self.label} {self._base_url}: json_schema 非対応 → prefill方式に切替 ({body[:100]})")
+        return True
+
+    def _headers(self) -> dict:
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        if self._api_key:
+            headers["Authorization"] = f"Bearer {self._api_key}"
+        return headers
+
+    def _handle_response(self, data: dict, cost_tracker, prefill: str = "{") -> str:
+        """応答JSONから本文を取り出し、prefill復元・thinking除去・トークン計上を行う"""
+        content = data["choices"][0]["message"]["content"]
+        usage = data.get("usage", {})
+
+        # Assistant prefillの "{" を復元
+        if not content.startswith(prefill):
+            content = prefill + content
+
+        # Strip thinking blocks
+        content = _strip_thinking(content)
+
+        # Track cost (local = $0, but track tokens for statistics)
+        if cost_tracker:
+            cost_tracker.add(
+                "local-llm",
+                usage.get("prompt_tokens", 0),
+                usage.get("completion_tokens", 0),
+            )
+
+        finish_reason = data["choices"][0].get("finish_reason", "")
+        if finish_reason == "length":
+            logger.warning("LocalLLM: output truncated (finish_reason=length, 続き生成でも未完)")
+
+        return content
+
+    # ------------------------------------------------------------
+    # 続き生成（finish_reason == "length" の救済）
+    # ------------------------------------------------------------
+
+    def _continuation_payload(self, payload: dict, partial: str, budget: int) -> dict:
+        """prefill を途中までの出力に差し替えたリクエスト
+
+        response_format は外す（文法は出力の先頭から適用されるため、途中からの続きには使えない）。
+        """
+        prefill = self._prefill(payload)
+        messages = list(payload["messages"][:-1] if prefill else payload["messages"])
+        messages.append({"role": "assistant", "content": partial if partial.startswith(prefill) else prefill + partial})
+        body = {k: v for k, v in payload.items() if k != "response_format"}
+        return dict(body, messages=messages, max_tokens=budget)
+
+    def _start_continuation(self, data: dict, payload: dict):
+        """打ち切られていれば続き生成の状態 (content, usage, key) を返す。不要なら None"""
+        choice = data["choices"][0]
+        if choice.get("finish_reason") != "length":
+            return None
+        usage = dict(data.get("usage") or {})
+        return choice["message"]["content"] or "", usage, f"{LOCAL_LLM_AIMD_KEY}:{self.base_url}"
+
+    def _merge_continuation(self, content: str, usage: dict, data: dict) -> tuple:
+        """続き生成の応答を連結し、(content, usage, finished, 出力トークン) を返す"""
+        choice = data["choices"][0]
+        extra = data.get("usage") or {}
+        out_tokens = extra.get("completion_tokens", 0)
+        usage = {
+            "prompt_tokens": usage.get("prompt_tokens", 0) + extra.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0) + out_tokens,
+        }
+        content = stitch(content, choice["message"]["content"] or "")
+        return content, usage, choice.get("finish_reason") != "length", out_tokens
+
+    def _finish_continuation(self, content: str, usage: dict, rounds: int, finished: bool,
+                             cost_tracker) -> dict:
+        logger.info(f"{self.label} 続き生成{'完了' if finished else '未完'}: {rounds}回, 計{len(content)}文字")
+        _report = getattr(cost_tracker, "add_continuation", None)
+        if _report is not None:
+            _report(rounds, finished)
+        return {"choices": [{"message": {"content": content},
+                             "finish_reason": "stop" if finished else "length"}], "usage": usage}
+
+    def _continue_sync(self, url: str, payload: dict, data: dict, max_tokens: int,
+                       cost_tracker, callback) -> dict:
+        """max_tokens で打ち切られた応答を続きから生成して連結（同期版）"""
+        import urllib.request
+        state = self._start_continuation(data, payload)
+        if state is None:
+            return data
+        content, usage, key = state
+        policy = get_continuation_policy()
+        rounds, finished = 0, False
+        for rounds in range(1, CONTINUATION_MAX_ROUNDS + 1):
+            budget = policy.budget(key, max_tokens, rounds, cap=payload["max_tokens"])
+            if callback:
+                callback(f"  [{self.label}] 出力上限で打ち切り → 続き生成 ({rounds}/{CONTINUATION_MAX_ROUNDS})")
+            body = json.dumps(self._continuation_payload(payload, content, budget), ensure_ascii=False)
+            try:
+                req = urllib.request.Request(url, data=body.encode("utf-8"), headers=self._headers(), method="POST")
+                with urllib.request.urlopen(req, timeout=self._timeout) as resp:
+                    extra = json.loads(resp.read().decode("utf-8"))
+                content, usage, finished, out_tokens = self._merge_continuation(content, usage, extra)
+            except Exception as e:
+                logger.warning(f"{self.label} 続き生成失敗: {e} → 途中までの出力を使用")
+                break
+            policy.observe(key, out_tokens, finished)
+            if finished:
+                break
+        return self._finish_continuation(content, usage, rounds, finished, cost_tracker)
+
+    async def _acontinue(self, client, url: str, payload: dict, data: dict, max_tokens: int,
+                         cost_tracker, callback) -> dict:
+        """_continue_sync() の非同期版"""
+        state = self._start_continuation(data, payload)
+        if state is None:
+            return data
+        content, usage, key = state
+        policy = get_continuation_policy()
+        rounds, finished = 0, False
+        for rounds in range(1, CONTINUATION_MAX_ROUNDS + 1):
+            budget = policy.budget(key, max_tokens, rounds, cap=payload["max_tokens"])
+            if callback:
+                callback(f"  [{self.label}] 出力上限で打ち切り → 続き生成 ({rounds}/{CONTINUATION_MAX_ROUNDS})")
+            body = json.dumps(self._continuation_payload(payload, content, budget), ensure_ascii=False)
+            try:
+                resp = await client.post(url, content=body.encode("utf-8"), headers=self._headers())
+                resp.raise_for_status()
+                content, usage, finished, out_tokens = self._merge_continuation(content, usage, resp.json())
+            except (httpx.HTTPError, KeyError, IndexError, ValueError) as e:
+                logger.warning(f"{self.label} 続き生成失敗: {e!r} → 途中までの出力を使用")
+                break
+            policy.observe(key, out_tokens, finished)
+            if finished:
+                break
+        return self._finish_continuation(content, usage, rounds, finished, cost_tracker)
+
+    def call(self, model, system, user, cost_tracker, max_tokens=4096, callback=None, json_schema=None):
+        import urllib.request
+        import urllib.error
+
+        raw_payload = self._build_payload(system, user, max_tokens, json_schema)
+        payload = json.dumps(raw_payload, ensure_ascii=False).encode("utf-8")
 
         url = f"{self._base_url}/chat/completions"
+        _label = self.label
 
-        for attempt in range(LOCAL_LLM_MAX_RETRIES + 1):
+        for attempt in range(self._max_retries + 1):
+            data = None
+            llm_cancel.check_cancelled()
             try:
-                _label = "RunPod" if self._is_runpod else "ローカルLLM"
                 if callback:
                     callback(f"  [{_label}] 生成中... (attempt {attempt + 1})")
 
-                headers = {"Content-Type": "application/json; charset=utf-8"}
-                if self._api_key:
-                    headers["Authorization"] = f"Bearer {self._api_key}"
                 req = urllib.request.Request(
                     url,
                     data=payload,
-                    headers=headers,
+                    headers=self._headers(),
                     method="POST",
                 )
                 with urllib.request.urlopen(req, timeout=self._timeout) as resp:
                     data = json.loads(resp.read().decode("utf-8"))
+                data = self._continue_sync(url, raw_payload, data, max_tokens, cost_tracker, callback)
 
-                content = data["choices"][0]["message"]["content"]
-                usage = data.get("usage", {})
-
-                # Assistant prefillの "{" を復元
-                if not content.startswith("{"):
-                    content = "{" + content
-
-                # Strip thinking blocks
-                content = _strip_thinking(content)
-
-                # Track cost (local = $0, but track tokens for statistics)
-                if cost_tracker:
-                    cost_tracker.add(
-                        "local-llm",
-                        usage.get("prompt_tokens", 0),
-                        usage.get("completion_tokens", 0),
-                    )
-
-                finish_reason = data["choices"][0].get("finish_reason", "")
-                if finish_reason == "length":
-                    logger.warning("LocalLLM: output truncated (finish_reason=length)")
-
-                return content
+                return self._handle_response(data, cost_tracker, self._prefill(raw_payload))
 
             except urllib.error.HTTPError as e:
                 _err_body = ""
@@ -170,64 +453,473 @@ class LocalLLMProvider(LLMProvider):
                     _err_body = e.read().decode("utf-8", errors="replace")[:500]
                 except Exception:
                     pass
+                if self._schema_fallback(e.code, raw_payload, _err_body):
+                    return self.call(model, system, user, cost_tracker, max_tokens, callback)
                 logger.error(f"{_label} HTTP {e.code} (attempt {attempt + 1}): {_err_body}")
                 if callback:
                     callback(f"  [{_label}] HTTP {e.code}: {_err_body[:100]}")
-                if attempt < LOCAL_LLM_MAX_RETRIES:
-                    time.sleep(2 if self._is_runpod else 1)
+                if attempt < self._max_retries:
+                    llm_cancel.sleep(2 if self._is_runpod else 1)
                     continue
                 raise ConnectionError(f"{_label} HTTP {e.code}: {_err_body[:200]}") from e
             except urllib.error.URLError as e:
                 logger.error(f"{_label} connection error (attempt {attempt + 1}): {e}")
                 if callback:
                     callback(f"  [{_label}] 接続エラー: {e}")
-                if attempt < LOCAL_LLM_MAX_RETRIES:
-                    time.sleep(3 if self._is_runpod else 2)
+                if attempt < self._max_retries:
+                    llm_cancel.sleep(3 if self._is_runpod else 2)
                     continue
                 raise ConnectionError(f"{_label}に接続できません: {e}") from e
             except (KeyError, IndexError, json.JSONDecodeError) as e:
-                _raw = ""
-                try:
-                    _raw = str(data)[:300] if 'data' in dir() else "no data"
-                except Exception:
-                    _raw = "could not read data"
+                _raw = str(data)[:300] if data is not None else "no data"
                 logger.error(f"{_label} parse error (attempt {attempt + 1}): {e} | raw: {_raw}")
                 if callback:
                     callback(f"  [{_label}] パースエラー: {e}")
-                if attempt < LOCAL_LLM_MAX_RETRIES:
-                    time.sleep(1)
+                if attempt < self._max_retries:
+                    llm_cancel.sleep(1)
+                    continue
+                raise ValueError(f"{_label}の応答が不正です: {e}") from e
+
+    def _async_client(self):
+        """ループ上で共有する httpx.AsyncClient（接続プールを使い回す）"""
+        if self._aclient is None or self._aclient.is_closed:
+            self._aclient = httpx.AsyncClient(timeout=self._timeout)
+        return self._aclient
+
+    async def _astream_chat(self, client, url: str, payload: dict, monitor) -> dict:
+        """stream=true で受信しながら monitor で検証し、非ストリーム応答と同じ形の dict を返す"""
+        monitor.begin(prefill=self._prefill(payload))
+        body = dict(payload, stream=True, stream_options={"include_usage": True})
+        parts, usage, finish_reason = [], {}, ""
+        async with client.stream(
+            "POST", url,
+            content=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+            headers=self._headers(),
+        ) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+                resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = line[5:].strip()
+                if chunk == "[DONE]":
+                    break
+                event = json.loads(chunk)
+                if event.get("usage"):
+                    usage = event["usage"]
+                for choice in event.get("choices") or []:
+                    delta = (choice.get("delta") or {}).get("content") or ""
+                    if delta:
+                        parts.append(delta)
+                        monitor.feed(delta)
+                    if choice.get("finish_reason"):
+                        finish_reason = choice["finish_reason"]
+        monitor.end(usage.get("completion_tokens"), finish_reason)
+        return {
+            "choices": [{"message": {"content": "".join(parts)}, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    async def acall(self, model, system, user, cost_tracker, max_tokens=4096, callback=None,
+                    monitor=None, json_schema=None):
+        """httpx.AsyncClient による非同期呼び出し（httpx未導入時はスレッド実行にフォールバック）
+
+        monitor を渡すと stream=true で受信し、破綻を検出した時点で接続を閉じて StreamAborted を送出する。
+        """
+        if not HTTPX_AVAILABLE:
+            return await super().acall(model, system, user, cost_tracker, max_tokens, callback,
+                                       json_schema=json_schema)
+
+        payload = self._build_payload(system, user, max_tokens, json_schema)
+        url = f"{self._base_url}/chat/completions"
+        _label = self.label
+        client = self._async_client()
+
+        for attempt in range(self._max_retries + 1):
+            data = None
+            llm_cancel.check_cancelled()
+            try:
+                if callback:
+                    callback(f"  [{_label}] 生成中... (attempt {attempt + 1})")
+
+                if monitor is not None:
+                    data = await self._astream_chat(client, url, payload, monitor)
+                    logger.info(f"{_label} ストリーム: {monitor.describe()}")
+                else:
+                    resp = await client.post(
+                        url,
+                        content=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                        headers=self._headers(),
+                    )
+                    resp.raise_for_status()
+                    data = resp.json()
+                data = await self._acontinue(client, url, payload, data, max_tokens, cost_tracker, callback)
+
+                return self._handle_response(data, cost_tracker, self._prefill(payload))
+
+            except StreamAborted as e:
+                logger.warning(f"{_label} {e}")
+                if cost_tracker:
+                    cost_tracker.add("local-llm", 0, monitor.output_tokens)
+                raise
+
+            except httpx.HTTPStatusError as e:
+                _err_body = e.response.text[:500]
+                _code = e.response.status_code
+                if self._schema_fallback(_code, payload, _err_body):
+                    return await self.acall(model, system, user, cost_tracker, max_tokens, callback,
+                                            monitor=monitor)
+                logger.error(f"{_label} HTTP {_code} (attempt {attempt + 1}): {_err_body}")
+                if callback:
+                    callback(f"  [{_label}] HTTP {_code}: {_err_body[:100]}")
+                if attempt < self._max_retries:
+                    await asyncio.sleep(2 if self._is_runpod else 1)
+                    continue
+                raise ConnectionError(f"{_label} HTTP {_code}: {_err_body[:200]}") from e
+            except httpx.TransportError as e:
+                logger.error(f"{_label} connection error (attempt {attempt + 1}): {e!r}")
+                if callback:
+                    callback(f"  [{_label}] 接続エラー: {e!r}")
+                if attempt < self._max_retries:
+                    await asyncio.sleep(3 if self._is_runpod else 2)
+                    continue
+                raise ConnectionError(f"{_label}に接続できません: {e!r}") from e
+            except (KeyError, IndexError, ValueError) as e:
+                _raw = str(data)[:300] if data is not None else "no data"
+                logger.error(f"{_label} parse error (attempt {attempt + 1}): {e} | raw: {_raw}")
+                if callback:
+                    callback(f"  [{_label}] パースエラー: {e}")
+                if attempt < self._max_retries:
+                    await asyncio.sleep(1)
                     continue
                 raise ValueError(f"{_label}の応答が不正です: {e}") from e
 
     def is_available(self) -> bool:
-        """LLMサーバーが起動しているか確認（ローカル/RunPod共用）"""
+        """LLMサーバーが起動しているか確認（ローカル/RunPod共用、結果はキャッシュ）"""
         if self._available is not None:
             return self._available
+        return self.probe()
+
+    def probe(self) -> bool:
+        """/models に問い合わせて可用性を再確認（キャッシュを更新）"""
         import urllib.request
         import urllib.error
         try:
-            headers = {}
-            if self._api_key:
-                headers["Authorization"] = f"Bearer {self._api_key}"
             req = urllib.request.Request(
                 f"{self._base_url}/models",
                 method="GET",
-                headers=headers,
+                headers=self._probe_headers(),
             )
             # RunPodはコールドスタートがあるので長めのタイムアウト
-            _check_timeout = 30 if self._is_runpod else 5
-            with urllib.request.urlopen(req, timeout=_check_timeout) as resp:
+            with urllib.request.urlopen(req, timeout=self._probe_timeout) as resp:
                 data = json.loads(resp.read().decode("utf-8"))
                 self._available = len(data.get("data", [])) > 0
         except (urllib.error.URLError, Exception):
             self._available = False
+        if self._available:
+            self.discover_slots()
+        return self._available
+
+    async def aprobe(self) -> bool:
+        """probe() の非同期版（httpx未導入時はスレッド実行）"""
+        if not HTTPX_AVAILABLE:
+            return await asyncio.to_thread(self.probe)
+        try:
+            resp = await self._async_client().get(
+                f"{self._base_url}/models",
+                headers=self._probe_headers(),
+                timeout=self._probe_timeout,
+            )
+            resp.raise_for_status()
+            self._available = len(resp.json().get("data", [])) > 0
+        except Exception:
+            self._available = False
+        if self._available:
+            await self.adiscover_slots()
         return self._available
 
+    @property
+    def _probe_timeout(self) -> float:
+        return 30 if self._is_runpod else 5
+
+    def _probe_headers(self) -> dict:
+        headers = {}
+        if self._api_key:
+            headers["Authorization"] = f"Bearer {self._api_key}"
+        return headers
+
     def reset_availability(self):
         """可用性キャッシュをリセット（再チェック用）"""
         self._available = None
 
 
+
+# ============================================================
+# Local LLM Pool (複数エンドポイント)
+# ============================================================
+
+class _PoolEndpoint:
+    """プール内の1エンドポイントの状態"""
+
+    def __init__(self, provider: LocalLLMProvider, aimd_key: str):
+        self.provider = provider
+        self.aimd_key = aimd_key
+        self.healthy = True
+        self.ewma_latency: Optional[float] = None
+        self.inflight = 0          # 待機中 + 実行中のリクエスト数（キュー深さ）
+        self.calls = 0
+        self.errors = 0
+
+    def expected_wait(self, default_latency: float) -> float:
+        """このエンドポイントに投げた場合の完了までの見込み時間（空きスロットがあれば待ち無し）"""
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return latency * (self.inflight // self.provider.slots + 1)
+
+    def record_latency(self, latency: float):
+        if self.ewma_latency is None:
+            self.ewma_latency = latency
+        else:
+            self.ewma_latency += LOCAL_POOL_EWMA_ALPHA * (latency - self.ewma_latency)
+
+
+class LocalLLMPool(LLMProvider):
+    """複数のローカルLLM / RunPodエンドポイントを束ねるプロバイダー
+
+    - 各呼び出しは「EWMAレイテンシ × (キュー深さ÷スロット数+1)」が最小のエンドポイントへ送る
+    - 接続エラーのエンドポイントは不健康として外し、次点のエンドポイントへフェイルオーバー
+    - /models ヘルスチェックを定期的に行い、復帰したエンドポイントを戻す
+    - 同時実行数はエンドポイントごとに AIMDコントローラーで管理（上限 = サーバーの並列スロット数）
+    """
+
+    def __init__(self, providers: list, health_interval: float = LOCAL_POOL_HEALTH_INTERVAL):
+        if not providers:
+            raise ValueError("LocalLLMPool: エンドポイントが空です")
+        single = len(providers) == 1
+        self._endpoints = [
+            _PoolEndpoint(p, LOCAL_LLM_AIMD_KEY if single else f"{LOCAL_LLM_AIMD_KEY}#{i + 1}")
+            for i, p in enumerate(providers)
+        ]
+        self._health_interval = health_interval
+        self._last_probe = 0.0
+        self._probe_task = None
+        self._lock = threading.Lock()
+
+    @property
+    def label(self) -> str:
+        if len(self._endpoints) == 1:
+            return self._endpoints[0].provider.label
+        healthy = sum(1 for ep in self._endpoints if ep.healthy)
+        return f"ローカルLLMプール({healthy}/{len(self._endpoints)})"
+
+    @property
+    def parallelism(self) -> int:
+        """同時に処理できるリクエスト数（健康なエンドポイントのスロット数合計）"""
+        return sum(ep.provider.slots for ep in self._endpoints if ep.healthy)
+
+    def _default_latency(self) -> float:
+        known = sorted(ep.ewma_latency for ep in self._endpoints if ep.ewma_latency is not None)
+        return known[len(known) // 2] if known else LOCAL_POOL_DEFAULT_LATENCY
+
+    def _pick(self, exclude: set) -> Optional[_PoolEndpoint]:
+        """見込み完了時間が最小の健康なエンドポイントを選び、キュー深さを加算"""
+        with self._lock:
+            default = self._default_latency()
+            candidates = [ep for ep in self._endpoints if ep.healthy and id(ep) not in exclude]
+            if not candidates:
+                return None
+            ep = min(candidates, key=lambda e: (e.expected_wait(default), e.inflight))
+            ep.inflight += 1
+            return ep
+
+    def _finish(self, ep: _PoolEndpoint, latency: Optional[float] = None, error=None):
+        with self._lock:
+            ep.inflight -= 1
+            ep.calls += 1
+            if error is not None:
+                ep.errors += 1
+                ep.healthy = False
+                logger.warning(f"{ep.provider.label} {ep.provider.base_url} を一時除外: {error}")
+            elif latency is not None:
+                ep.record_latency(latency)
+
+    def _no_endpoint_error(self, last_error) -> ConnectionError:
+        if last_error is not None:
+            return ConnectionError(f"全エンドポイント失敗: {last_error}")
+        return ConnectionError("利用可能なローカルLLMエンドポイントがありません")
+
+    def call(self, model, system, user, cost_tracker, max_tokens=4096, callback=None, json_schema=None):
+        self._maybe_probe_sync()
+        tried, last_error = set(), None
+        while True:
+            ep = self._pick(tried)
+            if ep is None:
+                raise self._no_endpoint_error(last_error)
+            tried.add(id(ep))
+            t0 = time.monotonic()
+            try:
+                result = ep.provider.call(model, system, user, cost_tracker, max_tokens, callback,
+                                          json_schema=json_schema)
+            except ConnectionError as e:
+                self._finish(ep, error=e)
+                last_error = e
+                continue
+            except BaseException:
+                self._finish(ep)
+                raise
+            self._finish(ep, latency=time.monotonic() - t0)
+            return result
+
+    async def acall(self, model, system, user, cost_tracker, max_tokens=4096, callback=None,
+                    monitor=None, json_schema=None):
+        self._maybe_schedule_probe()
+        aimd = get_controller()
+        tried, last_error = set(), None
+        while True:
+            ep = self._pick(tried)
+            if ep is None:
+                raise self._no_endpoint_error(last_error)
+            tried.add(id(ep))
+            try:
+                async with aimd.slot(ep.aimd_key):
+                    t0 = time.monotonic()
+                    result = await ep.provider.acall(model, system, user, cost_tracker, max_tokens, callback,
+                                                     monitor=monitor, json_schema=json_schema)
+            except ConnectionError as e:
+                aimd.record_overload(ep.aimd_key, REASON_LOCAL_ERROR)
+                self._finish(ep, error=e)
+                last_error = e
+                if callback and len(tried) < len(self._endpoints):
+                    callback(f"  [フェイルオーバー] {ep.provider.base_url} 失敗 → 別エンドポイントで再試行")
+                continue
+            except BaseException:
+                self._finish(ep)
+                raise
+            latency = time.monotonic() - t0
+            aimd.record_success(ep.aimd_key, latency)
+            self._finish(ep, latency=latency)
+            return result
+
+    # ------------------------------------------------------------
+    # ヘルスチェック
+    # ------------------------------------------------------------
+
+    def _apply_probe(self, ep: _PoolEndpoint, ok: bool):
+        with self._lock:
+            if ok and not ep.healthy:
+                logger.info(f"{ep.provider.label} {ep.provider.base_url} 復帰")
+            ep.healthy = ok
+        if ok:
+            # AIMD上限をスロット数に合わせる（スロットを超えて送ってもサーバー側で待つだけ）
+            slots = ep.provider.slots
+            get_controller().configure(ep.aimd_key, initial=slots, max_limit=slots)
+
+    def probe_all(self) -> int:
+        """全エンドポイントを並行して /models で確認し、健康な数を返す"""
+        self._last_probe = time.monotonic()
+        with ThreadPoolExecutor(max_workers=len(self._endpoints)) as ex:
+            results = list(ex.map(lambda ep: ep.provider.probe(), self._endpoints))
+        for ep, ok in zip(self._endpoints, results):
+            self._apply_probe(ep, ok)
+        return self.parallelism
+
+    async def aprobe_all(self) -> int:
+        self._last_probe = time.monotonic()
+        results = await asyncio.gather(*(ep.provider.aprobe() for ep in self._endpoints))
+        for ep, ok in zip(self._endpoints, results):
+            self._apply_probe(ep, ok)
+        return self.parallelism
+
+    def _probe_due(self) -> bool:
+        return time.monotonic() - self._last_probe >= self._health_interval
+
+    def _maybe_probe_sync(self):
+        if self._probe_due():
+            self.probe_all()
+
+    def _maybe_schedule_probe(self):
+        """前回から health_interval 経過していればバックグラウンドでヘルスチェック"""
+        if not self._probe_due() or (self._probe_task is not None and not self._probe_task.done()):
+            return
+        self._last_probe = time.monotonic()
+        self._probe_task = asyncio.get_running_loop().create_task(self.aprobe_all())
+
+    def is_available(self) -> bool:
+        # 全滅中はヘルスチェック間隔ごとに再確認（acallが呼ばれなくても復帰できるように）
+        if self._last_probe == 0.0 or (self.parallelism == 0 and self._probe_due()):
+            self.probe_all()
+        return self.parallelism > 0
+
+    def snapshot(self) -> list:
+        """エンドポイントごとの状態（ログ・統計用）"""
+        with self._lock:
+            return [
+                {
+                    "url": ep.provider.base_url,
+                    "healthy": ep.healthy,
+                    "slots": ep.provider.slots,
+                    "ewma_latency": round(ep.ewma_latency, 2) if ep.ewma_latency is not None else None,
+                    "inflight": ep.inflight,
+                    "calls": ep.calls,
+                    "errors": ep.errors,
+                }
+                for ep in self._endpoints
+            ]
+
+    def summary(self) -> str:
+        parts = []
+        for snap in self.snapshot():
+            lat = f"{snap['ewma_latency']:.1f}s" if snap["ewma_latency"] is not None else "-"
+            state = "OK" if snap["healthy"] else "除外"
+            parts.append(f"{snap['url']} [{state}, {snap['slots']}スロット] {snap['calls']}回"
+                         f" (エラー{snap['errors']}, EWMA {lat})")
+        return "ローカルLLMエンドポイント: " + ", ".join(parts)
+
+# ============================================================
+# Hedge Policy
+# ============================================================
+
+class HedgePolicy:
+    """ローカル呼び出しのヘッジ発火待ち時間を観測レイテンシの分位点から決める
+
+    ローカルが delay() 秒以内に応答しなければ、同じリクエストをクラウドにも送り、
+    先に完了した方を採用する（RunPodのコールドスタート等によるテール遅延対策）。
+    """
+
+    def __init__(self, percentile: float = HEDGE_PERCENTILE, min_samples: int = HEDGE_MIN_SAMPLES,
+                 default_delay: float = HEDGE_DEFAULT_DELAY, min_delay: float = HEDGE_MIN_DELAY,
+                 window: int = HEDGE_WINDOW):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self._samples: deque = deque(maxlen=window)
+
+    def observe(self, latency: float):
+        """ローカルが完了したときのレイテンシを記録"""
+        self._samples.append(latency)
+
+    def delay(self) -> float:
+        if len(self._samples) < self.min_samples:
+            return self.default_delay
+        ordered = sorted(self._samples)
+        idx = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return max(self.min_delay, ordered[idx])
+
+
+class HedgeCloudFailed(Exception):
+    """ヘッジでローカル・クラウドの両方が失敗した（クラウド側の例外を cause に持つ）
+
+    ローカル側の失敗はヘッジ中にブレーカーへ記録済み。HybridRouter.acall() はこれを
+    ローカル失敗として扱わず（ブレーカーに二重計上せず、クラウドへ再送もしない）、
+    cause をそのまま送出して呼び出し側のリトライ分類に任せる。
+    """
+
+    def __init__(self, cause: BaseException):
+        super().__init__(str(cause))
+        self.cause = cause
+
+
 # ============================================================
 # Hybrid Router
 # ============================================================
@@ -238,18 +930,41 @@ ROUTE_CLOUD_REQUIRED = "cloud"     # クラウド必須
 ROUTE_AUTO = "auto"                # intensity等で自動判定
 
 class HybridRouter:
-    """ローカル/クラウドのルーティングを管理するルーター"""
+    """ローカル/クラウドのルーティングを管理するルーター
+
+    ローカル経路はサーキットブレーカーで保護する。連続失敗で遮断（open）し、
+    一定時間後に /models プローブ → 段階的なトラフィック復帰（half_open）→ closed と戻る。
+    hedge を渡すと acall() でローカルが遅い場合にクラウドへ並行送信する。
+    """
 
-    def __init__(self, cloud_provider: ClaudeProvider, local_provider: Optional[LocalLLMProvider] = None):
+    def __init__(self, cloud_provider: ClaudeProvider, local_provider: Optional[LocalLLMPool] = None,
+                 hedge: Optional[HedgePolicy] = None):
         self.cloud = cloud_provider
         self.local = local_provider
-        self._local_enabled = local_provider is not None
-        self._local_failures = 0
-        self._max_local_failures = 10  # 連続失敗でローカル無効化（フォールバック込みで余裕を持たせる）
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(
+            LOCAL_LLM_AIMD_KEY,
+            probe=(lambda: local_provider.probe_all() > 0) if local_provider is not None else None,
+        )
 
     @property
     def local_enabled(self) -> bool:
-        return self._local_enabled and self.local is not None and self.local.is_available()
+        return (
+            self.local is not None
+            and self.breaker.state != STATE_OPEN
+            and self.local.is_available()
+        )
+
+    def _on_local_failure(self, e: Exception, callback: Optional[Callable]):
+        # ストリーム中断（応答内容の破綻）はサーバー障害ではないのでブレーカーには数えない
+        if not isinstance(e, StreamAborted):
+            self.breaker.record_failure(str(e))
+        logger.warning(
+            f"ローカルLLM失敗 (ブレーカー: {self.breaker.state}, 連続{self.breaker.consecutive_failures}回): {e}"
+            f" → クラウドにフォールバック"
+        )
+        if callback:
+            callback(f"  [フォールバック] ローカル失敗 → クラウドで再生成")
 
     def call(
         self,
@@ -260,51 +975,178 @@ class HybridRouter:
         max_tokens: int = 4096,
         callback: Optional[Callable] = None,
         routing_hint: str = ROUTE_AUTO,
+        json_schema: Optional[dict] = None,
     ) -> str:
-        """ルーティングルールに基づいてLLM呼び出しを振り分ける"""
+        """ルーティングルールに基づいてLLM呼び出しを振り分ける
+
+        json_schema はローカル経路でのみ使う（制約付きデコード）。クラウドには渡さない。
+        """
 
         use_local = self._should_use_local(model, routing_hint)
 
         if use_local:
             try:
-                result = self.local.call(model, system, user, cost_tracker, max_tokens, callback)
-                self._local_failures = 0  # reset on success
+                result = self.local.call(model, system, user, cost_tracker, max_tokens, callback,
+                                         json_schema=json_schema)
+                self.breaker.record_success()
                 return result
             except (ConnectionError, ValueError) as e:
-                self._local_failures += 1
-                logger.warning(
-                    f"ローカルLLM失敗 ({self._local_failures}/{self._max_local_failures}): {e}"
-                    f" → クラウドにフォールバック"
-                )
-                if self._local_failures >= self._max_local_failures:
-                    logger.error("ローカルLLM連続失敗上限 → ローカル無効化")
-                    self._local_enabled = False
-                if callback:
-                    callback(f"  [フォールバック] ローカル失敗 → クラウドで再生成")
+                self._on_local_failure(e, callback)
                 # Fall through to cloud
 
         return self.cloud.call(model, system, user, cost_tracker, max_tokens, callback)
 
+    async def acall(
+        self,
+        model: str,
+        system,
+        user: str,
+        cost_tracker,
+        max_tokens: int = 4096,
+        callback: Optional[Callable] = None,
+        routing_hint: str = ROUTE_AUTO,
+        monitor=None,
+        json_schema: Optional[dict] = None,
+    ) -> str:
+        """call() の非同期版（AsyncLLMEngine のループ上で使用）
+
+        monitor はストリーミング検証用。フォールバック時はクラウド呼び出しで再利用する（begin() でリセット）。
+        """
+
+        # 可用性チェック・ブレーカーのプローブは同期HTTPなのでループをブロックしないようスレッドで実行
+        use_local = await asyncio.to_thread(self._should_use_local, model, routing_hint)
+
+        if use_local and self.hedge is not None:
+            try:
+                result, source = await self._acall_hedged(
+                    model, system, user, cost_tracker, max_tokens, callback, monitor, json_schema
+                )
+                if source == "local":
+                    self.breaker.record_success()
+                return result
+            except HedgeCloudFailed as e:
+                # クラウドは送信済みで失敗 → 再送せず、クラウドの例外で呼び出し元のリトライに任せる
+                raise e.cause from None
+            except (ConnectionError, ValueError) as e:
+                self._on_local_failure(e, callback)
+                # Fall through to cloud
+
+        elif use_local:
+            # 同時実行数はプール側でエンドポイントごとにAIMD管理
+            try:
+                result = await self.local.acall(model, system, user, cost_tracker, max_tokens, callback,
+                                                monitor=monitor, json_schema=json_schema)
+                self.breaker.record_success()
+                return result
+            except (ConnectionError, ValueError) as e:
+                self._on_local_failure(e, callback)
+                # Fall through to cloud
+
+        return await self.cloud.acall(model, system, user, cost_tracker, max_tokens, callback,
+                                      monitor=monitor)
+
+    async def _acall_hedged(self, model, system, user, cost_tracker, max_tokens, callback,
+                            monitor=None, json_schema=None) -> tuple:
+        """ローカルを先行させ、分位点ベースの期限を過ぎたらクラウドにも送って早い方を採用
+
+        戻り値: (応答テキスト, "local" | "cloud")。負けた側はキャンセルする。
+        クラウドが先に失敗してもローカルの完了を待つ。両方失敗した場合は HedgeCloudFailed。
+        ヘッジ発火時の結果・追加コストは cost_tracker.add_hedge() に報告する。
+        """
+        t0 = time.monotonic()
+        local_task = asyncio.ensure_future(
+            self.local.acall(model, system, user, cost_tracker, max_tokens, callback, monitor=monitor,
+                             json_schema=json_schema)
+        )
+        delay = self.hedge.delay()
+        try:
+            done, _ = await asyncio.wait({local_task}, timeout=delay)
+        except BaseException:
+            local_task.cancel()
+            raise
+        if done:
+            result = local_task.result()  # 例外は呼び出し元でフォールバック処理
+            self.hedge.observe(time.monotonic() - t0)
+            return result, "local"
+
+        logger.info(f"ヘッジ発火: ローカル応答なし {delay:.1f}秒 → クラウドへ並行送信")
+        if callback:
+            callback(f"  [ヘッジ] ローカル応答なし {delay:.0f}秒 → クラウドへ並行送信")
+        recorder = UsageRecorder(cost_tracker)
+        cloud_task = asyncio.ensure_future(
+            self.cloud.acall(model, system, user, recorder, max_tokens, callback,
+                             monitor=monitor.fork() if monitor is not None else None)
+        )
+        tasks = {local_task: "local", cloud_task: "cloud"}
+        pending = set(tasks)
+        winner = None
+        cloud_error = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    exc = task.exception()
+                    if exc is None:
+                        winner = winner or task
+                    elif tasks[task] == "local" and isinstance(exc, (ConnectionError, ValueError)):
+                        if not isinstance(exc, StreamAborted):
+                            self.breaker.record_failure(str(exc))
+                    elif tasks[task] == "cloud":
+                        # ローカルはまだ成功し得るので待ち続ける
+                        cloud_error = exc
+                        logger.warning(f"ヘッジ: クラウド側が失敗 ({exc!r}) → ローカルの完了を待つ")
+                    else:
+                        raise exc
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        elapsed = time.monotonic() - t0
+        source = tasks[winner] if winner is not None else "none"
+        if source == "local":
+            self.hedge.observe(elapsed)
+        _report = getattr(cost_tracker, "add_hedge", None)
+        if _report is not None:
+            cancelled_tokens = 0
+            if source == "local" and not recorder.records:
+                cancelled_tokens = estimate_tokens(system) + estimate_tokens(user)
+            _report(source, recorder.records, elapsed, model, cancelled_tokens)
+        logger.info(f"ヘッジ結果: {source}が先に完了 ({elapsed:.1f}秒)")
+
+        if winner is None:
+            raise HedgeCloudFailed(cloud_error)
+        return winner.result(), source
+
     def _should_use_local(self, model: str, routing_hint: str) -> bool:
         """ローカルLLMを使うべきか判定"""
-        if not self.local_enabled:
+        if self.local is None:
             return False
         if routing_hint == ROUTE_CLOUD_REQUIRED:
             return False
-        if routing_hint == ROUTE_LOCAL_OK:
-            return True
         # ROUTE_AUTO: model based
         # Sonnet/Opus → cloud, Haiku → local
-        if "sonnet" in model or "opus" in model:
+        if routing_hint != ROUTE_LOCAL_OK and ("sonnet" in model or "opus" in model):
+            return False
+        # ブレーカー判定（open中は遮断、half_open中は段階的に通す）
+        if not self.breaker.allow():
+            return False
+        if not self.local.is_available():
+            self.breaker.record_failure("健康なエンドポイントなし")
             return False
         return True
 
     def get_stats(self) -> dict:
         """ルーティング統計"""
         return {
-            "local_enabled": self._local_enabled,
+            "local_enabled": self.local_enabled,
             "local_available": self.local.is_available() if self.local else False,
-            "local_failures": self._local_failures,
+            "local_failures": self.breaker.consecutive_failures,
+            "breaker": self.breaker.snapshot(),
+            "hedge_delay": round(self.hedge.delay(), 1) if self.hedge else None,
+            "local_endpoints": self.local.snapshot() if self.local else [],
+            "concurrency": get_controller().snapshot(),
         }
 
 
@@ -313,32 +1155,15 @@ class HybridRouter:
 # ============================================================
 
 def _strip_thinking(text: str) -> str:
-    """Qwen3.5の<think>ブロックを除去（インラインthinking含む）"""
-    result = _THINK_RE.sub("", text).strip()
-
-    # <think>タグなしのインラインthinkingを処理
-    # パターン: 最後の有効なJSONブロックを探す（thinkingの後に最終回答JSONが来る）
-    # まず "```json" fenced block を探す
-    fence_matches = list(re.finditer(r"```(?:json)?\s*([\s\S]*?)```", result))
-    if fence_matches:
-        # 最後のfenced blockを使う
-        candidate = fence_matches[-1].group(1).strip()
-        try:
-            json.loads(candidate)
-            return candidate
-        except (json.JSONDecodeError, ValueError):
-            pass
-
-    # Thinking Process: / Thinking: プレフィックスを探す
-    for prefix in ["Thinking Process:", "Thinking:", "**Thinking"]:
-        if prefix in result:
-            # thinkingの後にあるJSON部分を探す
-            pass
-
-    # 最後の完全なJSON objectを探す（thinkingの後に来る最終回答）
-    last_json = _find_last_complete_json(result)
-    if last_json:
-        return last_json
+    """Qwen3.5の<think>ブロックを除去（インラインthinking含む）
+
+    thinking の後に最終回答のJSONが来る前提で、json_extract で最も妥当なJSONを取り出す。
+    JSONが見つからなければ最初の括弧以降（無ければ全体）を返す。
+    """
+    result = strip_thinking(text).strip()
+    candidate = extract_json_text(result)
+    if candidate is not None:
+        return candidate
 
     # フォールバック: 最初のJSON部分
     for marker in ["{", "["]:
@@ -349,113 +1174,77 @@ def _strip_thinking(text: str) -> str:
     return result
 
 
-def _find_last_complete_json(text: str) -> Optional[str]:
-    """テキストから最も大きい完全なJSONオブジェクトを抽出
-    シーンJSONは scene_id/description 等のキーを含む大きなオブジェクト。
-    小さい内部オブジェクト（bubbleなど）を誤って拾わないよう、最大サイズを優先する。
-    """
-    candidates = []
-
-    # 全ての } 位置から逆方向に対応する { を探す
-    i = len(text) - 1
-    while i >= 0:
-        if text[i] == "}":
-            close_pos = i
-            depth = 0
-            for j in range(close_pos, -1, -1):
-                if text[j] == "}":
-                    depth += 1
-                elif text[j] == "{":
-                    depth -= 1
-                    if depth == 0:
-                        candidate = text[j : close_pos + 1]
-                        try:
-                            parsed = json.loads(candidate)
-                            if isinstance(parsed, dict):
-                                candidates.append(candidate)
-                        except (json.JSONDecodeError, ValueError):
-                            pass
-                        break
-        i -= 1
-
-    if not candidates:
-        return None
-
-    # 最大のJSONを優先（シーンJSONは内部のbubbleオブジェクトより大きい）
-    # さらに scene_id キーを持つものを最優先
-    best = None
-    for c in candidates:
-        try:
-            parsed = json.loads(c)
-            if isinstance(parsed, dict) and "scene_id" in parsed:
-                if best is None or len(c) > len(best):
-                    best = c
-        except (json.JSONDecodeError, ValueError):
-            pass
-
-    if best:
-        return best
-
-    # scene_idが無い場合は最大のJSONを返す
-    return max(candidates, key=len)
-
-
 def extract_json_from_response(text: str) -> str:
     """応答テキストからJSON部分を抽出（markdown fenceやthinking除去）"""
-    text = _strip_thinking(text)
+    return _strip_thinking(text)
 
-    # ```json ... ``` ブロック抽出
-    fence_match = re.search(r"```(?:json)?\s*([\s\S]*?)```", text)
-    if fence_match:
-        return fence_match.group(1).strip()
 
-    # { または [ で始まるJSON部分を抽出
-    for marker in ["{", "["]:
-        idx = text.find(marker)
-        if idx >= 0:
-            candidate = text[idx:]
-            # 対応する閉じ括弧まで
-            try:
-                json.loads(candidate)
-                return candidate
-            except json.JSONDecodeError:
-                # 末尾から削っていく
-                for end_marker in ["}", "]"]:
-                    last = candidate.rfind(end_marker)
-                    if last > 0:
-                        try:
-                            json.loads(candidate[: last + 1])
-                            return candidate[: last + 1]
-                        except json.JSONDecodeError:
-                            continue
-
-    return text
+def parse_endpoint_list(text) -> list:
+    """カンマ・空白・改行区切りの文字列（またはlist）をエンドポイントURL等のリストに分解"""
+    if not text:
+        return []
+    if isinstance(text, str):
+        text = re.split(r"[,\s]+", text)
+    return [t.strip() for t in text if t and t.strip()]
 
 
 def create_hybrid_router(
     client,
     call_claude_func,
     local_enabled: bool = False,
-    local_base_url: str = LOCAL_LLM_BASE_URL,
+    local_base_url=LOCAL_LLM_BASE_URL,
     local_api_key: Optional[str] = None,
+    acall_claude_func=None,
+    hedge: bool = False,
+    local_slots=None,
+    local_json_schema: bool = True,
 ) -> HybridRouter:
     """HybridRouterのファクトリ関数
 
     Args:
-        local_base_url: ローカルLLMのURL。RunPodの場合は
+        local_base_url: ローカルLLMのURL。カンマ/改行区切り（またはlist）で複数指定すると
+            LocalLLMPool で負荷分散する。RunPodの場合は
             https://api.runpod.ai/v2/{ENDPOINT_ID}/openai/v1
-        local_api_key: RunPod API Key（ローカルLM Studioの場合はNone）
+        local_api_key: RunPod API Key（ローカルLM Studioの場合はNone）。
+            カンマ区切りで複数指定するとURLと順番に対応させる（1つなら全URL共通）
+        acall_claude_func: call_claude_func の非同期版（HybridRouter.acall 用、省略時はスレッド実行）
+        hedge: True でローカルが遅い場合にクラウドへ並行送信する（HedgePolicy）
+        local_slots: 各エンドポイントの並列スロット数（int / カンマ区切り文字列 / list）。
+            省略したエンドポイントは llama-server の /props から自動検出（検出不可なら1）
+        local_json_schema: True で呼び出し側が渡した JSON Schema を response_format として送り、
+            ローカルLLMの出力を文法で制約する（非対応サーバーでは自動的に prefill 方式へ戻る）
     """
-    cloud = ClaudeProvider(client, call_claude_func)
+    cloud = ClaudeProvider(client, call_claude_func, acall_claude_func)
 
     local = None
     if local_enabled:
-        local = LocalLLMProvider(base_url=local_base_url, api_key=local_api_key)
-        _label = "RunPod" if "runpod.ai" in local_base_url else "ローカルLLM"
-        if local.is_available():
-            logger.info(f"{_label}検出: {local_base_url}")
-        else:
-            logger.warning(f"{_label}が応答しません: {local_base_url} → クラウドのみモード")
+        urls = parse_endpoint_list(local_base_url) or [LOCAL_LLM_BASE_URL]
+        keys = parse_endpoint_list(local_api_key)
+        slots = [int(n) for n in parse_endpoint_list(
+            str(local_slots) if isinstance(local_slots, int) else local_slots
+        ) if n.isdigit() and int(n) > 0]
+        # 複数エンドポイント時は個別リトライせず、即座に別エンドポイントへフェイルオーバー
+        retries = LOCAL_LLM_MAX_RETRIES if len(urls) == 1 else 0
+        providers = [
+            LocalLLMProvider(
+                base_url=url,
+                api_key=(keys[i] if i < len(keys) else keys[0]) if keys else None,
+                max_retries=retries,
+                slots=(slots[i] if i < len(slots) else slots[0]) if slots else None,
+                json_schema=local_json_schema,
+            )
+            for i, url in enumerate(urls)
+        ]
+        local = LocalLLMPool(providers)
+        local.probe_all()
+        for snap in local.snapshot():
+            _label = "RunPod" if "runpod.ai" in snap["url"] else "ローカルLLM"
+            if snap["healthy"]:
+                logger.info(f"{_label}検出: {snap['url']} ({snap['slots']}スロット)")
+            else:
+                logger.warning(f"{_label}が応答しません: {snap['url']}")
+        if not local.is_available():
+            logger.warning("ローカルLLMエンドポイントが全て応答しません → クラウドのみモード")
             local = None
 
-    return HybridRouter(cloud, local)
+    return HybridRouter(cloud, local, HedgePolicy() if hedge and local is not None else None)
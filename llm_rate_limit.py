@@ -0,0 +1,237 @@
+"""
+Header-driven Rate Limiter
+
+Anthropic API のレスポンスヘッダー（anthropic-ratelimit-* / retry-after）から
+モデルごとの残り枠を把握し、送信前にペーシングするプロセス共有のトークンバケット。
+
+- requests / input-tokens / output-tokens の3次元を個別のバケットとして管理
+- ヘッダーの remaining と reset から補充レートを推定し、次の観測まで連続的に補充
+- 送信時に見積もりトークンを予約するため、同時に走る全パイプライン・全ジョブで枠を共有できる
+- 429 の retry-after はモデル単位のブロック期間として扱い、盲目的な指数バックオフを置き換える
+
+ヘッダーを一度も観測していないモデルは制限しない（初回リクエストはそのまま送る）。
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+HEADER_PREFIX = "anthropic-ratelimit-"
+DIMENSIONS = ("requests", "input-tokens", "output-tokens")
+
+RATE_LIMIT_MAX_WAIT = 120.0      # 1回のペーシング待機の上限(秒)
+RATE_LIMIT_SAFETY_MARGIN = 0.05  # 上限の5%は予備として残す
+
+
+def estimate_tokens(text) -> int:
+    """入力トークン数の概算（日本語は1文字≒1トークン、ASCIIは4文字≒1トークン）"""
+    if isinstance(text, list):
+        text = "".join(
+            b.get("text", "") for b in text if isinstance(b, dict)
+        )
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii) // 4 + 1
+
+
+def _parse_reset(value: str, now: float) -> Optional[float]:
+    """reset ヘッダー（RFC 3339）を time.monotonic() 基準の時刻に変換"""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return now + max(0.0, dt.timestamp() - time.time())
+
+
+class _Bucket:
+    """1次元分のトークンバケット（ヘッダー観測値から補充レートを推定）"""
+
+    def __init__(self):
+        self.limit: Optional[float] = None
+        self.level = 0.0
+        self.rate = 0.0          # 補充レート（単位/秒）
+        self.updated = 0.0
+
+    def observe(self, limit: float, remaining: float, reset_at: Optional[float], now: float):
+        self.limit = limit
+        self.level = remaining
+        self.updated = now
+        if reset_at is not None and reset_at > now and limit > remaining:
+            self.rate = (limit - remaining) / (reset_at - now)
+        elif limit > 0:
+            # reset不明: 1分で全回復とみなす
+            self.rate = limit / 60.0
+
+    def available(self, now: float) -> float:
+        if self.limit is None:
+            return float("inf")
+        return min(self.limit, self.level + self.rate * (now - self.updated))
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.limit is None or amount <= 0:
+            return 0.0
+        usable = self.limit * (1.0 - RATE_LIMIT_SAFETY_MARGIN)
+        # 1リクエストで上限を超える見積もりは上限に丸める（永久待機防止）
+        amount = min(amount, usable)
+        deficit = amount - (self.available(now) - self.limit * RATE_LIMIT_SAFETY_MARGIN)
+        if deficit <= 0:
+            return 0.0
+        if self.rate <= 0:
+            return RATE_LIMIT_MAX_WAIT
+        return deficit / self.rate
+
+    def consume(self, amount: float, now: float):
+        if self.limit is None:
+            return
+        self.level = self.available(now) - amount
+        self.updated = now
+
+
+class _ModelLimits:
+    def __init__(self):
+        self.buckets = {dim: _Bucket() for dim in DIMENSIONS}
+        self.blocked_until = 0.0
+        self.paced = 0
+        self.paced_seconds = 0.0
+
+
+class HeaderRateLimiter:
+    """モデル別のヘッダー駆動レートリミッター（スレッドセーフ・プロセス共有）"""
+
+    def __init__(self):
+        self._models: dict = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model: str) -> _ModelLimits:
+        m = self._models.get(model)
+        if m is None:
+            m = _ModelLimits()
+            self._models[model] = m
+        return m
+
+    # ------------------------------------------------------------
+    # 送信前ペーシング
+    # ------------------------------------------------------------
+
+    def reserve(self, model: str, input_tokens: int, output_tokens: int) -> float:
+        """予約を試み、送信まで待つべき秒数を返す（0なら予約済み）"""
+        now = time.monotonic()
+        with self._lock:
+            m = self._get(model)
+            wait = max(0.0, m.blocked_until - now)
+            need = {
+                "requests": 1,
+                "input-tokens": input_tokens,
+                "output-tokens": output_tokens,
+            }
+            for dim, amount in need.items():
+                wait = max(wait, m.buckets[dim].wait_time(amount, now))
+            if wait > 0:
+                return min(wait, RATE_LIMIT_MAX_WAIT)
+            for dim, amount in need.items():
+                m.buckets[dim].consume(amount, now)
+            return 0.0
+
+    async def acquire(self, model: str, input_tokens: int, output_tokens: int, callback=None):
+        """枠が空くまで await してから予約する"""
+        waited = 0.0
+        while True:
+            wait = self.reserve(model, input_tokens, output_tokens)
+            if wait <= 0:
+                break
+            if waited == 0.0:
+                logger.info(f"RateLimit [{model}] 送信前ペーシング: {wait:.1f}秒待機")
+                if callback:
+                    callback(f"レート制限枠の回復待ち ({wait:.0f}秒)...")
+            await asyncio.sleep(wait)
+            waited += wait
+        if waited:
+            with self._lock:
+                m = self._get(model)
+                m.paced += 1
+                m.paced_seconds += waited
+
+    # ------------------------------------------------------------
+    # ヘッダー反映
+    # ------------------------------------------------------------
+
+    def update_from_headers(self, model: str, headers) -> None:
+        """レスポンスヘッダー（成功・429いずれも）から残り枠を更新"""
+        if headers is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            m = self._get(model)
+            for dim in DIMENSIONS:
+                limit = headers.get(f"{HEADER_PREFIX}{dim}-limit")
+                remaining = headers.get(f"{HEADER_PREFIX}{dim}-remaining")
+                if limit is None or remaining is None:
+                    continue
+                try:
+                    limit_v = float(limit)
+                    remaining_v = float(remaining)
+                except ValueError:
+                    continue
+                reset_at = _parse_reset(headers.get(f"{HEADER_PREFIX}{dim}-reset", ""), now)
+                m.buckets[dim].observe(limit_v, remaining_v, reset_at, now)
+
+            retry_after = headers.get("retry-after")
+            if retry_after:
+                try:
+                    m.blocked_until = max(m.blocked_until, now + float(retry_after))
+                except ValueError:
+                    pass
+
+    def retry_after(self, model: str) -> float:
+        """429後の待機秒数（retry-after 未受信なら0）"""
+        with self._lock:
+            return max(0.0, self._get(model).blocked_until - time.monotonic())
+
+    # ------------------------------------------------------------
+    # 参照
+    # ------------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                model: {
+                    **{
+                        dim: (round(b.available(now)) if b.limit is not None else None)
+                        for dim, b in m.buckets.items()
+                    },
+                    "blocked": round(max(0.0, m.blocked_until - now), 1),
+                    "paced": m.paced,
+                    "paced_seconds": round(m.paced_seconds, 1),
+                }
+                for model, m in self._models.items()
+            }
+
+
+# ============================================================
+# Process-wide limiter
+# ============================================================
+
+_limiter: Optional[HeaderRateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> HeaderRateLimiter:
+    """プロセス共有のレートリミッターを返す"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = HeaderRateLimiter()
+        return _limiter
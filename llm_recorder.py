@@ -0,0 +1,142 @@
+"""
+LLM Traffic Recorder
+
+_call_api() を通る実トラフィック（system / user / 応答 / usage / レイテンシ）を
+フィクスチャディレクトリに1リクエスト1ファイルで保存する。
+保存したフィクスチャは mock_llm_server.py が Anthropic / OpenAI互換APIとして再生する。
+
+有効化:
+  - 環境変数 LLM_RECORD_DIR=<dir> を設定して gui.py / bench_llm.py を起動
+  - もしくは start_recording(<dir>) を呼ぶ
+
+フィクスチャのキーは (systemテキスト, userテキスト) のみから作る。
+モデル名・経路（ローカル/クラウド）に依存させないことで、同じ録画を
+anthropic.Anthropic と LocalLLMProvider のどちらからでも再生できる。
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+RECORD_DIR_ENV = "LLM_RECORD_DIR"
+LOCAL_NO_THINK_SUFFIX = " /no_think"   # LocalLLMProvider が user 末尾に付与する指示
+
+
+def system_text(system) -> str:
+    """system（str / ブロックlist）をテキストに正規化（LocalLLMProviderと同じ連結規則）"""
+    if not system:
+        return ""
+    if isinstance(system, str):
+        return system
+    return "\n".join(
+        b.get("text", "") for b in system if isinstance(b, dict) and b.get("type") == "text"
+    )
+
+
+def system_hash(system) -> str:
+    return hashlib.sha256(system_text(system).encode("utf-8")).hexdigest()[:16]
+
+
+def fixture_key(system, user: str) -> str:
+    """録画と再生で共通のフィクスチャキー"""
+    if user.endswith(LOCAL_NO_THINK_SUFFIX):
+        user = user[: -len(LOCAL_NO_THINK_SUFFIX)]
+    raw = json.dumps([system_text(system), user], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class FixtureRecorder:
+    """_call_api トラフィックをJSONフィクスチャとして書き出す（スレッドセーフ）"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._seq = len(list(self.directory.glob("*.json")))
+
+    def record(self, model: str, system, user: str, max_tokens: int, routing_hint: str,
+               response: str, usage_records: list, latency: float) -> Path:
+        key = fixture_key(system, user)
+        input_tokens = sum(r[1] + r[3] + r[4] for r in usage_records)
+        output_tokens = sum(r[2] for r in usage_records)
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        fixture = {
+            "seq": seq,
+            "key": key,
+            "system_hash": system_hash(system),
+            "model": model,
+            "routed_model": usage_records[-1][0] if usage_records else model,
+            "routing_hint": routing_hint,
+            "max_tokens": max_tokens,
+            "system": system_text(system),
+            "user": user,
+            "response": response,
+            "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            "latency": round(latency, 3),
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        path = self.directory / f"{seq:05d}_{key[:12]}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(fixture, f, ensure_ascii=False, indent=2)
+        return path
+
+
+def load_fixtures(directory) -> list:
+    """フィクスチャディレクトリを seq 順に読み込む"""
+    fixtures = []
+    for path in sorted(Path(directory).glob("*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                fx = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"フィクスチャ読込失敗: {path.name}: {e}")
+            continue
+        if "key" in fx and "response" in fx:
+            fixtures.append(fx)
+    fixtures.sort(key=lambda fx: fx.get("seq", 0))
+    return fixtures
+
+
+# ============================================================
+# Process-wide recorder
+# ============================================================
+
+_recorder: Optional[FixtureRecorder] = None
+_recorder_lock = threading.Lock()
+_env_checked = False
+
+
+def start_recording(directory) -> FixtureRecorder:
+    global _recorder
+    with _recorder_lock:
+        _recorder = FixtureRecorder(directory)
+        logger.info(f"LLMトラフィック録画開始: {directory}")
+        return _recorder
+
+
+def stop_recording() -> None:
+    global _recorder
+    with _recorder_lock:
+        _recorder = None
+
+
+def get_recorder() -> Optional[FixtureRecorder]:
+    """録画中なら FixtureRecorder を返す（初回のみ環境変数 LLM_RECORD_DIR を参照）"""
+    global _recorder, _env_checked
+    with _recorder_lock:
+        if not _env_checked:
+            _env_checked = True
+            env_dir = os.environ.get(RECORD_DIR_ENV, "").strip()
+            if env_dir and _recorder is None:
+                _recorder = FixtureRecorder(env_dir)
+                logger.info(f"LLMトラフィック録画開始: {env_dir}")
+        return _recorder
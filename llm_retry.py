@@ -0,0 +1,249 @@
+"""
+Deadline-aware Retry Policy
+
+API呼び出し（acall_claude）とシーン単位の再生成（_arun_scene_with_retry）が共有する
+リトライ方針。固定スリープの代わりに次を行う。
+
+- エラー分類（classify_error）ごとの再試行回数の予算（budgets）
+- 指数バックオフ + ジッター（同時に失敗した複数シーンが同じ瞬間に再送しない）。
+  429 の retry-after など呼び出し側の待ち時間ヒントがあればそれを下限にする
+- 実行全体の期限（deadline）。待っても期限内に再試行できない場合はあきらめる
+- 待機中の停止（should_stop が True を返せば InterruptedError）。asyncio のキャンセルにも即応する
+
+使い方:
+    state = policy.begin(CALL_RETRY_BUDGETS)
+    ...
+    delay = state.next_delay(kind, hint)
+    if delay is None:
+        raise            # 予算切れ or 期限切れ
+    await policy.sleep(delay)
+"""
+
+import time
+import random
+import asyncio
+import logging
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+ERR_RATE_LIMIT = "rate_limit"   # 429
+ERR_OVERLOADED = "overloaded"   # 529 / サーバー過負荷
+ERR_TIMEOUT = "timeout"
+ERR_API = "api"                 # その他のAPI・通信エラー
+ERR_REFUSAL = "refusal"         # コンテンツ拒否（シーン単位）
+ERR_JSON = "json"               # 応答がJSONとして解釈できない（シーン単位）
+ERR_FATAL = "fatal"             # 認証エラー等、再試行しても無駄なもの
+
+# API呼び出し1回あたりの再試行予算
+CALL_RETRY_BUDGETS = {
+    ERR_RATE_LIMIT: 6,
+    ERR_OVERLOADED: 5,
+    ERR_TIMEOUT: 2,
+    ERR_API: 2,
+}
+# シーン1つあたりの再生成予算（API呼び出し側の予算を使い切った後の再投入）
+SCENE_RETRY_BUDGETS = {
+    ERR_OVERLOADED: 1,
+    ERR_REFUSAL: 2,
+    ERR_JSON: 2,
+}
+
+# 分類ごとのバックオフ初期値(秒)。n回目の待ち時間は base * 2^(n-1)（上限 RETRY_MAX_DELAY）
+RETRY_BASE_DELAYS = {
+    ERR_RATE_LIMIT: 2.0,
+    ERR_OVERLOADED: 15.0,
+    ERR_TIMEOUT: 4.0,
+    ERR_API: 2.0,
+    ERR_REFUSAL: 0.0,
+    ERR_JSON: 0.0,
+}
+# シーン単位の過負荷はAPI呼び出し側のバックオフを使い切った後なので長めに空ける
+SCENE_RETRY_BASE_DELAYS = {
+    ERR_OVERLOADED: 60.0,
+}
+RETRY_MAX_DELAY = 60.0
+RETRY_JITTER = 0.5            # 待ち時間を [d*(1-jitter), d] から一様に選ぶ
+RETRY_RUN_DEADLINE = 3600.0   # 1回のパイプライン実行の期限(秒)。0/None で無期限
+RETRY_SLEEP_SLICE = 0.5       # should_stop を確認する間隔(秒)
+
+_OVERLOADED_KEYWORDS = ("サーバー過負荷", "529", "Overloaded")
+_REFUSAL_KEYWORDS = ("倫理", "対応することはできません", "拒否応答", "cannot", "inappropriate")
+_JSON_KEYWORDS = ("Invalid JSON", "No JSON", "Empty response", "JSONDecodeError")
+
+
+def classify_error(exc: BaseException) -> str:
+    """例外をリトライ分類に振り分ける
+
+    anthropic の例外は status_code / クラス名で、それ以外（シーン単位の ValueError 等）は
+    メッセージのキーワードで判定する。
+    """
+    status = getattr(exc, "status_code", None)
+    name = type(exc).__name__
+    if status == 401:
+        return ERR_FATAL
+    if status == 429 or name == "RateLimitError":
+        return ERR_RATE_LIMIT
+    if status == 529:
+        return ERR_OVERLOADED
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in name:
+        return ERR_TIMEOUT
+    msg = str(exc)
+    if any(kw in msg for kw in _OVERLOADED_KEYWORDS):
+        return ERR_OVERLOADED
+    if any(kw in msg for kw in _REFUSAL_KEYWORDS):
+        return ERR_REFUSAL
+    if any(kw in msg for kw in _JSON_KEYWORDS):
+        return ERR_JSON
+    return ERR_API
+
+
+class RetryState:
+    """1つの操作（API呼び出し・シーン生成）の再試行状況"""
+
+    def __init__(self, policy: "RetryPolicy", budgets: dict, base_delays: Optional[dict] = None):
+        self._policy = policy
+        self.budgets = budgets
+        self._base_delays = base_delays or {}
+        self.counts: dict = {}
+        self.last_kind: Optional[str] = None
+
+    @property
+    def attempts(self) -> int:
+        """これまでの再試行回数（全分類の合計）"""
+        return sum(self.counts.values())
+
+    def count(self, kind: str) -> int:
+        return self.counts.get(kind, 0)
+
+    def next_delay(self, kind: str, hint: Optional[float] = None) -> Optional[float]:
+        """kind の失敗を記録し、再試行までの待ち時間を返す（再試行しないなら None）"""
+        self.last_kind = kind
+        n = self.counts.get(kind, 0) + 1
+        if n > self.budgets.get(kind, 0):
+            self._policy._record_give_up(kind, "予算切れ")
+            return None
+        delay = self._policy.backoff(kind, n, hint, self._base_delays.get(kind))
+        remaining = self._policy.remaining()
+        if remaining is not None and delay >= remaining:
+            self._policy._record_give_up(kind, "期限切れ")
+            return None
+        self.counts[kind] = n
+        self._policy._record_retry(kind, delay)
+        return delay
+
+
+class RetryPolicy:
+    """ジッター付きバックオフ・分類別予算・実行期限を持つリトライ方針（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        deadline: Optional[float] = RETRY_RUN_DEADLINE,
+        base_delays: Optional[dict] = None,
+        max_delay: float = RETRY_MAX_DELAY,
+        jitter: float = RETRY_JITTER,
+        should_stop: Optional[Callable[[], bool]] = None,
+        rng: Optional[random.Random] = None,
+    ):
+        self._deadline_at = time.monotonic() + deadline if deadline else None
+        self._base = dict(RETRY_BASE_DELAYS, **(base_delays or {}))
+        self._max_delay = max_delay
+        self._jitter = jitter
+        self.should_stop = should_stop
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._retries: dict = {}
+        self._give_ups: dict = {}
+        self._waited = 0.0
+
+    def begin(self, budgets: dict, base_delays: Optional[dict] = None) -> RetryState:
+        """1つの操作の再試行を開始（base_delays で分類別の初期待ち時間を上書き）"""
+        return RetryState(self, budgets, base_delays)
+
+    # ------------------------------------------------------------
+    # 待ち時間・期限
+    # ------------------------------------------------------------
+
+    def remaining(self) -> Optional[float]:
+        """実行期限までの残り秒数（無期限なら None）"""
+        if self._deadline_at is None:
+            return None
+        return max(0.0, self._deadline_at - time.monotonic())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def backoff(self, kind: str, n: int, hint: Optional[float] = None, base: Optional[float] = None) -> float:
+        """n 回目の再試行までの待ち時間（指数バックオフ + ジッター、hint を下限とする）"""
+        if base is None:
+            base = self._base.get(kind, self._base[ERR_API])
+        delay = min(self._max_delay, base * 2 ** (n - 1))
+        with self._lock:
+            delay *= 1.0 - self._jitter * self._rng.random()
+        if hint:
+            delay = max(delay, hint)
+        return round(delay, 1)
+
+    async def sleep(self, delay: float):
+        """delay 秒待つ（should_stop が立てば InterruptedError、タスクのキャンセルにも即応）"""
+        with self._lock:
+            self._waited += delay
+        end = time.monotonic() + delay
+        while True:
+            if self.should_stop is not None and self.should_stop():
+                raise InterruptedError("ユーザーによる停止")
+            left = end - time.monotonic()
+            if left <= 0:
+                return
+            await asyncio.sleep(min(left, RETRY_SLEEP_SLICE) if self.should_stop else left)
+
+    # ------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------
+
+    def _record_retry(self, kind: str, delay: float):
+        with self._lock:
+            self._retries[kind] = self._retries.get(kind, 0) + 1
+
+    def _record_give_up(self, kind: str, reason: str):
+        with self._lock:
+            self._give_ups[kind] = self._give_ups.get(kind, 0) + 1
+        logger.info(f"リトライ断念: {kind} ({reason})")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "retries": dict(self._retries),
+                "give_ups": dict(self._give_ups),
+                "waited": round(self._waited, 1),
+                "remaining": None if self._deadline_at is None else round(self.remaining(), 1),
+            }
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        retries = ", ".join(f"{k}={v}" for k, v in sorted(snap["retries"].items())) or "なし"
+        give_ups = ", ".join(f"{k}={v}" for k, v in sorted(snap["give_ups"].items())) or "なし"
+        return f"RetryPolicy: 再試行 {retries} / 断念 {give_ups} / 待機計{snap['waited']}秒"
+
+
+# ============================================================
+# Process-wide default policy
+# ============================================================
+
+_default_policy: Optional[RetryPolicy] = None
+_default_lock = threading.Lock()
+
+
+def get_default_retry_policy() -> RetryPolicy:
+    """プロセス共有の既定リトライ方針を返す（パイプライン外からの呼び出し用、期限なし）"""
+    global _default_policy
+    with _default_lock:
+        if _default_policy is None:
+            _default_policy = RetryPolicy(deadline=None)
+        return _default_policy
@@ -0,0 +1,432 @@
+"""
+Streaming Monitor + Incremental JSON Validator
+
+ストリーミング応答を1チャンクずつ受け取り、JSONの構造をその場で検証する。
+構造の破綻・拒否応答を検出した時点で StreamAborted を送出し、呼び出し側は
+ストリームを閉じて残りの出力トークン分の課金を避ける。
+
+- IncrementalJSONValidator: 文字単位の状態機械（文字列・エスケープ・括弧スタック・区切り）
+  JSON開始前の前置き・```json フェンス・<think>…</think>・インラインthinking
+  （"Thinking Process:" 等）は許容し、拒否定型文や長すぎる前置きは中断対象とする。
+  ルート値が確定する（最初のキーの ':' を受け取る）までの構造エラーは前置きとして扱い直し、
+  確定後の構造エラーのみ中断する。json_extract が修復できる破損
+  （閉じ括弧直前の末尾カンマ・要素間のカンマ欠落）は中断せずに受け流す
+- StreamMonitor: 初回トークンまでのレイテンシ・トークンレート・進捗通知を1呼び出し単位で管理
+
+acall_claude() / LocalLLMProvider.acall() が monitor を受け取った場合のみストリーミングで呼び出す。
+"""
+
+import re
+import time
+import logging
+from typing import Callable, Optional
+
+from llm_rate_limit import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+STREAM_PROGRESS_INTERVAL = 1.0     # 進捗通知の最小間隔(秒)
+MAX_PREAMBLE_CHARS = 400           # JSON開始前に許容する前置きの長さ
+
+# <think> タグなしのインラインthinking（前置きがこれで始まれば長さ・拒否語の判定をしない）
+THINKING_PREFIXES = ("Thinking Process:", "Thinking:", "**Thinking")
+
+# 拒否応答の定型句（JSON開始前の前置きに現れた時点で中断）
+REFUSAL_PATTERNS = (
+    "申し訳ありません", "申し訳ございません", "対応することはできません", "お応えできません",
+    "I can't", "I cannot", "I'm not able", "I am not able", "I won't",
+)
+
+# StreamAborted.kind
+KIND_REFUSAL = "refusal"
+KIND_STRUCTURE = "structure"
+KIND_PREAMBLE = "preamble"
+
+_LITERAL_RE = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?|true|false|null")
+_LITERAL_CHARS = set("0123456789+-.eEtrufalsn")
+
+# 期待するトークン
+_EXPECT_VALUE = "value"
+_EXPECT_VALUE_OR_CLOSE = "value_or_close"    # '[' の直後
+_EXPECT_KEY_OR_CLOSE = "key_or_close"        # '{' の直後
+_EXPECT_KEY = "key"                          # オブジェクト内の ',' の後
+_EXPECT_COLON = "colon"
+_EXPECT_COMMA_OR_CLOSE = "comma_or_close"
+
+
+class StreamAborted(ValueError):
+    """ストリーミング中に応答の破綻を検出して中断した
+
+    メッセージには既存のリトライ判定（"Invalid JSON" / "No JSON" / 拒否語）に
+    一致する語を含める。
+    """
+
+    def __init__(self, kind: str, detail: str, partial: str = ""):
+        super().__init__(kind, detail)
+        self.kind = kind
+        self.detail = detail
+        self.partial = partial    # 中断までに受信したテキスト（StreamMonitorが設定）
+
+    def __str__(self):
+        if self.kind == KIND_REFUSAL:
+            return f"拒否応答を検出（ストリーム中断）: {self.partial[:150]}"
+        if self.kind == KIND_PREAMBLE:
+            return f"No JSON in response（ストリーム中断）: {self.partial[:150]}"
+        return f"Invalid JSON（ストリーム中断）: {self.detail} | {self.partial[-150:]}"
+
+
+# ============================================================
+# Incremental JSON Validator
+# ============================================================
+
+class IncrementalJSONValidator:
+    """チャンク単位で与えたテキストがJSONとして破綻していないかを逐次検証する
+
+    prefill: アシスタントprefill（例: "{"）。応答がそれに続く形で返る場合に指定する。
+    応答がprefillを繰り返して始まった場合（"{" から始まる）はprefillを無視する。
+    応答がprefillに続いていなかった場合（前置き・フェンス・インラインthinking）は、
+    ルート値の確定前の構造エラーとして prefill を捨てて前置きの扱いに戻す。
+
+    ルート値の確定: キーの ':'（オブジェクト）または最初の要素の完了（配列）。
+    確定前の構造エラーでは、それまでのルート値の文字を前置きとして扱い直し、次の '{' / '[' を待つ。
+    """
+
+    def __init__(self, prefill: str = ""):
+        self.text_len = 0
+        self.started = False       # ルート値の開始を検出した
+        self.complete = False      # ルート値が閉じた
+        self.top_keys: list = []   # 確定したルート直下のキー（オブジェクトの場合）
+        self.top_items = 0         # ルート直下の要素数（配列の場合）
+        self._stack: list = []
+        self._expect = _EXPECT_VALUE
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._key_buf: list = []
+        self._literal: list = []
+        self._after_comma = False  # 直前のトークンが ','（末尾カンマの判定用）
+        self._preamble: list = []
+        self._committed = False    # ルート値の確定（以後の構造エラーは中断）
+        self._root_chars: list = []   # ルート値の開始以降に受け取った文字（確定前の巻き戻し用。prefillは含めない）
+        self._feeding_prefill = False
+        self._inline_think = False
+        self._tag_buf = ""         # '<' から始まる <think> 候補
+        self._tail = ""            # </think> 検出用の直近テキスト
+        self._in_think = False
+        self._pending_prefill = prefill.strip()
+
+    @property
+    def depth(self) -> int:
+        return len(self._stack)
+
+    def feed(self, text: str) -> None:
+        for ch in text:
+            self.text_len += 1
+            self._feed_char(ch)
+
+    # ------------------------------------------------------------
+    # 内部処理
+    # ------------------------------------------------------------
+
+    def _fail(self, detail: str):
+        raise StreamAborted(KIND_STRUCTURE, f"{self.text_len}文字目: {detail}")
+
+    def _feed_char(self, ch: str):
+        try:
+            self._feed_char_inner(ch)
+        except StreamAborted as e:
+            if e.kind != KIND_STRUCTURE or (self._committed and not self._inline_think):
+                raise
+            # ルート値の確定前: JSONではなかったとみなして前置きに戻し、この文字から読み直す
+            self._backtrack()
+            self._feed_char_inner(ch)
+            return
+        if self.started and not self._committed and not self._feeding_prefill:
+            self._root_chars.append(ch)
+
+    def _backtrack(self):
+        chars, self._root_chars = self._root_chars, []
+        self.started = False
+        self.top_keys, self.top_items = [], 0
+        self._stack = []
+        self._expect = _EXPECT_VALUE
+        self._in_string = self._escape = self._string_is_key = False
+        self._key_buf, self._literal = [], []
+        self._after_comma = False
+        for c in chars:
+            self._feed_preamble(c)
+
+    def _feed_char_inner(self, ch: str):
+        if self.complete:
+            return
+        if self._in_think:
+            self._tail = (self._tail + ch)[-8:]
+            if self._tail == "</think>":
+                self._in_think = False
+                self._tail = ""
+            return
+        if self._in_string:
+            self._feed_string_char(ch)
+            return
+
+        if self._tag_buf:
+            # '<' 以降が <think> かどうか判定中
+            candidate = self._tag_buf + ch
+            if "<think>".startswith(candidate):
+                if candidate == "<think>":
+                    self._tag_buf, self._in_think = "", True
+                else:
+                    self._tag_buf = candidate
+                return
+            pending, self._tag_buf = self._tag_buf, ""
+            if self.started:
+                self._fail(f"予期しない文字 {pending!r}")
+            for p in pending:
+                self._feed_preamble(p)
+
+        if ch in " \t\r\n":
+            if self._literal:
+                self._end_literal()
+            elif not self.started and self._preamble:
+                # 前置きの空白も残す（"Thinking Process:" / "I can't" の判定用）
+                self._feed_preamble(ch)
+            return
+        if ch == "<":
+            self._tag_buf = "<"
+            return
+
+        if self._pending_prefill:
+            # 最初の非空白文字で prefill を補うか決める（応答がprefillを繰り返した場合は補わない）
+            prefill, self._pending_prefill = self._pending_prefill, ""
+            if ch != prefill[0]:
+                self._feeding_prefill = True
+                try:
+                    for p in prefill:
+                        self._feed_char_inner(p)
+                finally:
+                    self._feeding_prefill = False
+
+        if not self.started:
+            if ch in "{[":
+                self.started = True
+                self._open(ch)
+            else:
+                self._feed_preamble(ch)
+            return
+
+        self._feed_structure(ch)
+
+    def _feed_preamble(self, ch: str):
+        if self._inline_think:
+            return
+        self._preamble.append(ch)
+        preamble = "".join(self._preamble)
+        if preamble.lstrip().startswith(THINKING_PREFIXES):
+            # インラインthinking: <think> と同様に中身は検証しない（最終回答は後段の json_extract が選ぶ）
+            self._inline_think = True
+            return
+        for pattern in REFUSAL_PATTERNS:
+            if pattern in preamble:
+                raise StreamAborted(KIND_REFUSAL, pattern, preamble)
+        if len(preamble) > MAX_PREAMBLE_CHARS:
+            raise StreamAborted(KIND_PREAMBLE, "JSONが始まらない", preamble)
+
+    def _feed_string_char(self, ch: str):
+        if self._escape:
+            self._escape = False
+        elif ch == "\\":
+            self._escape = True
+        elif ch == '"':
+            self._in_string = False
+            if self._string_is_key:
+                if self.depth == 1:
+                    self.top_keys.append("".join(self._key_buf))
+                self._key_buf = []
+                self._expect = _EXPECT_COLON
+            else:
+                self._after_value()
+            return
+        elif ch in "\n\r" and self._string_is_key:
+            self._fail("キー文字列内の改行")
+        if self._string_is_key and self.depth == 1:
+            self._key_buf.append(ch)
+
+    def _feed_structure(self, ch: str):
+        if self._literal:
+            if ch in _LITERAL_CHARS:
+                self._literal.append(ch)
+                if len(self._literal) > 64:
+                    self._fail("長すぎるリテラル")
+                return
+            self._end_literal()
+
+        expect = self._expect
+        after_comma, self._after_comma = self._after_comma, False
+        if expect == _EXPECT_COMMA_OR_CLOSE and (ch in '"{[' or ch in _LITERAL_CHARS):
+            # カンマ欠落: json_extract が補完するので区切りがあったものとして続ける
+            expect = self._expect = _EXPECT_KEY if self._stack[-1] == "{" else _EXPECT_VALUE
+        if ch == '"':
+            if expect in (_EXPECT_KEY, _EXPECT_KEY_OR_CLOSE):
+                self._in_string, self._string_is_key = True, True
+            elif expect in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+                self._in_string, self._string_is_key = True, False
+            else:
+                self._fail(f"区切り文字の欠落（{expect}）")
+        elif ch in "{[":
+            if expect not in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+                self._fail(f"予期しない {ch!r}（{expect}）")
+            self._open(ch)
+        elif ch in "}]":
+            top = self._stack[-1] if self._stack else ""
+            if (ch == "}" and top != "{") or (ch == "]" and top != "["):
+                self._fail(f"括弧の対応不一致 {ch!r}")
+            # 末尾カンマ（{"a": 1,} / [1,]）は json_extract が除去するので許容
+            trailing_comma = after_comma and expect in (_EXPECT_KEY, _EXPECT_VALUE)
+            if not trailing_comma and expect not in (_EXPECT_COMMA_OR_CLOSE, _EXPECT_KEY_OR_CLOSE, _EXPECT_VALUE_OR_CLOSE):
+                self._fail(f"予期しない {ch!r}（{expect}）")
+            self._stack.pop()
+            if not self._stack:
+                self.complete = True
+                return
+            self._after_value()
+        elif ch == ":":
+            if expect != _EXPECT_COLON:
+                self._fail(f"予期しない ':'（{expect}）")
+            self._expect = _EXPECT_VALUE
+            self._commit()
+        elif ch == ",":
+            if expect != _EXPECT_COMMA_OR_CLOSE:
+                self._fail(f"予期しない ','（{expect}）")
+            self._expect = _EXPECT_KEY if self._stack[-1] == "{" else _EXPECT_VALUE
+            self._after_comma = True
+        elif ch in _LITERAL_CHARS and expect in (_EXPECT_VALUE, _EXPECT_VALUE_OR_CLOSE):
+            self._literal.append(ch)
+        else:
+            self._fail(f"予期しない文字 {ch!r}（{expect}）")
+
+    def _open(self, ch: str):
+        self._stack.append(ch)
+        self._expect = _EXPECT_KEY_OR_CLOSE if ch == "{" else _EXPECT_VALUE_OR_CLOSE
+
+    def _end_literal(self):
+        literal = "".join(self._literal)
+        self._literal = []
+        if not _LITERAL_RE.fullmatch(literal):
+            self._fail(f"不正なリテラル {literal[:20]!r}")
+        self._after_value()
+
+    def _after_value(self):
+        if self.depth == 1 and self._stack[0] == "[":
+            self.top_items += 1
+            self._commit()
+        self._expect = _EXPECT_COMMA_OR_CLOSE
+
+    def _commit(self):
+        if not self._committed:
+            self._committed = True
+            self._root_chars = []
+
+
+# ============================================================
+# Stream Monitor
+# ============================================================
+
+class StreamMonitor:
+    """1回のストリーミング呼び出しの検証・計測・進捗通知
+
+    on_progress(monitor) は STREAM_PROGRESS_INTERVAL ごとに呼ばれる
+    （GUIの停止要求で InterruptedError を送出すれば、そのままストリームが閉じられる）。
+    同じ monitor を順番に再利用してよい（begin() で状態をリセット）。
+    並行する2本の呼び出し（ヘッジ）には fork() で別インスタンスを渡すこと。
+    """
+
+    def __init__(self, label: str = "", expect_json: bool = True,
+                 on_progress: Optional[Callable] = None,
+                 progress_interval: float = STREAM_PROGRESS_INTERVAL):
+        self.label = label
+        self.expect_json = expect_json
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.begin()
+
+    def fork(self) -> "StreamMonitor":
+        return StreamMonitor(self.label, self.expect_json, self.on_progress, self.progress_interval)
+
+    def begin(self, prefill: str = ""):
+        """リクエスト送信直前に呼ぶ（計測・検証状態をリセット）"""
+        self.validator = IncrementalJSONValidator(prefill) if self.expect_json else None
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.ended_at: Optional[float] = None
+        self.chars = 0
+        self.output_tokens = 0        # ストリーム中は推定値、end() で実測値に置換
+        self.stop_reason = ""
+        self.aborted: Optional[StreamAborted] = None
+        self._parts: list = []
+        self._last_progress = self.started_at
+
+    def feed(self, text: str):
+        """受信したテキスト断片を検証（破綻していれば StreamAborted）"""
+        if not text:
+            return
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.chars += len(text)
+        self.output_tokens += estimate_tokens(text)
+        self._parts.append(text)
+        if self.validator is not None:
+            try:
+                self.validator.feed(text)
+            except StreamAborted as e:
+                e.partial = self.text
+                self.aborted = e
+                self.ended_at = now
+                raise
+        if self.on_progress and now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.on_progress(self)
+
+    def end(self, output_tokens: Optional[int] = None, stop_reason: str = ""):
+        self.ended_at = time.monotonic()
+        if output_tokens:
+            self.output_tokens = output_tokens
+        self.stop_reason = stop_reason or ""
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    @property
+    def first_token_latency(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def tokens_per_sec(self) -> float:
+        """初回トークン以降の出力レート"""
+        if self.first_token_at is None:
+            return 0.0
+        end = self.ended_at or time.monotonic()
+        span = end - self.first_token_at
+        return self.output_tokens / span if span > 0 else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "first_token_latency": round(self.first_token_latency, 2) if self.first_token_latency is not None else None,
+            "tokens_per_sec": round(self.tokens_per_sec, 1),
+            "output_tokens": self.output_tokens,
+            "chars": self.chars,
+            "stop_reason": self.stop_reason,
+            "aborted": self.aborted.kind if self.aborted else None,
+        }
+
+    def describe(self) -> str:
+        ftl = self.first_token_latency
+        ftl_text = f"{ftl:.1f}秒" if ftl is not None else "-"
+        return f"初回トークン{ftl_text}, {self.tokens_per_sec:.0f} tok/s"
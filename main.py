@@ -12,6 +12,8 @@ import time
 from datetime import datetime
 from pathlib import Path
 
+from json_extract import loads_tolerant
+
 try:
     import anthropic
 except ImportError:
@@ -151,16 +153,11 @@ def query_claude(client: anthropic.Anthropic, system_prompt: str, user_prompt: s
         response_text = response.content[0].text
         log_message(f"Response received: {len(response_text)} characters")
 
-        # JSONをパース
-        # マークダウンコードブロックを除去
-        if response_text.startswith("```"):
-            lines = response_text.split("\n")
-            response_text = "\n".join(lines[1:-1] if lines[-1] == "```" else lines[1:])
-
-        pages = json.loads(response_text)
+        # JSONをパース（コードブロック・前置き除去、末尾カンマ・打ち切りの修復込み）
+        pages = loads_tolerant(response_text, prefer_keys=("page",))
         return pages
 
-    except json.JSONDecodeError as e:
+    except ValueError as e:
         log_message(f"JSON parse error: {e}", also_print=True)
         if retry_count < MAX_RETRIES - 1:
             log_message(f"Retrying in {RETRY_DELAY} seconds...")
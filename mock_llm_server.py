@@ -0,0 +1,613 @@
+#!/usr/bin/env python3
+"""ローカル擬似LLMサーバー (CLI)
+
+llm_recorder.py で録画したフィクスチャを、Anthropic Messages API と
+OpenAI互換 /chat/completions の両方として再生する。API課金・ネットワーク遅延なしで
+generate_pipeline のスケジューラー・リトライ・後処理を再現性のある条件で計測するためのもの。
+
+  - POST /v1/messages           … anthropic.Anthropic(base_url=http://127.0.0.1:PORT)
+  - POST /v1/chat/completions   … LocalLLMProvider(base_url=http://127.0.0.1:PORT/v1)
+  - GET  /v1/models             … LocalLLMProvider.is_available()
+  - GET  /props                 … LocalLLMProvider.discover_slots()（--slots 指定時のみ）
+  - GET  /stats                 … リクエスト数・注入エラー数
+  - "stream": true              … 両APIともSSEで分割送信（--token-rate に応じてチャンク間隔を空ける）
+  - max_tokens / assistant prefill … 録画の出力トークンが max_tokens を超えれば打ち切り、
+                                  prefill が応答の先頭と一致すれば続きだけを返す
+  - cache_control              … /v1/messages のプロンプトキャッシュを模擬（ブレークポイントまでの
+                                  プレフィックスが既出なら cache_read、初出なら cache_creation として usage に反映）。
+                                  作成はプロンプト処理が終わった時点で有効になり（同時に送った同じ
+                                  プレフィックスはどちらも作成扱い）、cache_read 分はプロンプト処理時間に含めない
+  - フィクスチャが無い場合 … 最小限のシーンJSONを返す。複数シーンのバッチ要求（generate_scene_batch）には
+                                  要求された scene_id 分の配列を返す（--p-batch-short で末尾1シーンを欠落させる）
+
+シミュレーション:
+  --latency / --jitter   応答までの基本遅延（秒）
+  --token-rate           出力トークン/秒（出力量に比例した生成時間を加算）
+  --prefill-rate         入力トークン/秒（プロンプト長に比例した処理時間を最初の応答前に加算）
+  --p429 / --p529        確率的な 429 rate_limit_error / 529 overloaded_error 注入
+  --rpm                  分あたりリクエスト上限（超過で429、anthropic-ratelimit-* ヘッダー付与）
+  --slots                ローカル側の並列スロット数（llama-server の total_slots を模擬）
+  --no-json-schema       response_format 付きの /chat/completions を400で拒否（非対応サーバーを模擬）
+  --no-prompt-cache      cache_control を無視（usage の cache_* を常に0にする）
+  --p-batch-short        フィクスチャ無しのバッチ応答から末尾のシーンを欠落させる確率
+
+フィクスチャの照合: (system, user) 完全一致 → 同一system → 全フィクスチャ（順番に使い回し）
+
+使い方:
+  python mock_llm_server.py --fixtures fixtures/run1 --port 8765 --latency 0.8 --p529 0.02
+  ANTHROPIC_BASE_URL=http://127.0.0.1:8765 python gui.py
+"""
+import sys
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_recorder import fixture_key, system_hash, load_fixtures, LOCAL_NO_THINK_SUFFIX
+from llm_rate_limit import estimate_tokens
+
+# Windows console encoding fix
+if sys.platform == "win32":
+    sys.stdout.reconfigure(encoding="utf-8", errors="replace")
+    sys.stderr.reconfigure(encoding="utf-8", errors="replace")
+    os.environ.setdefault("PYTHONIOENCODING", "utf-8")
+
+# フィクスチャが1件も無い場合の応答（パイプラインが止まらない最小限のシーンJSON）
+FALLBACK_RESPONSE = json.dumps({
+    "scene_id": 1, "title": "mock", "description": "mock", "mood": "mock",
+    "bubbles": [], "onomatopoeia": [], "direction": "", "sd_prompt": "1girl",
+}, ensure_ascii=False)
+
+STREAM_CHUNK_CHARS = 16    # stream=true 時の1イベントあたりの文字数
+PROMPT_CACHE_MIN_TOKENS = 1024   # これより短いプレフィックスはキャッシュされない（実APIの最小長）
+PROMPT_CACHE_TTL = 300.0         # ephemeral キャッシュの寿命(秒)。ヒットするたびに延長
+# generate_scene_batch のプロンプト（「シーン情報: {...}」の scene_id を要求されたシーンとみなす）
+_BATCH_SCENE_RE = re.compile(r'^シーン情報: \{.*?"scene_id": (\d+)', re.MULTILINE)
+
+
+class MockConfig:
+    def __init__(self, latency=0.0, jitter=0.0, token_rate=0.0, p429=0.0, p529=0.0,
+                 rpm=0, retry_after=2.0, seed=None, slots=0, json_schema=True, prefill_rate=0.0,
+                 prompt_cache=True, p_batch_short=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.prefill_rate = prefill_rate  # 入力トークン/秒（0=プロンプト長に依存しない）
+        self.prompt_cache = prompt_cache  # False なら cache_control を無視
+        self.p429 = p429
+        self.p529 = p529
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.slots = slots      # ローカル側の並列スロット数（0=/props非対応・無制限）
+        self.json_schema = json_schema  # False なら response_format を400で拒否
+        self.p_batch_short = p_batch_short  # フィクスチャ無しのバッチ応答で末尾1シーンを欠落させる確率
+        self.rng = random.Random(seed)
+
+
+class FixtureStore:
+    """フィクスチャの照合（完全一致 → 同一system → 全体の順番使い回し）"""
+
+    def __init__(self, fixtures: list):
+        self._by_key = {}
+        self._by_system = {}
+        self._all = fixtures
+        for fx in fixtures:
+            self._by_key.setdefault(fx["key"], []).append(fx)
+            self._by_system.setdefault(fx.get("system_hash", ""), []).append(fx)
+        self._cursor = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._all)
+
+    def _next(self, bucket_id, items):
+        with self._lock:
+            n = self._cursor.get(bucket_id, 0)
+            self._cursor[bucket_id] = n + 1
+        return items[n % len(items)]
+
+    def lookup(self, system, user: str) -> tuple:
+        """(fixture_or_None, match_kind)"""
+        key = fixture_key(system, user)
+        if key in self._by_key:
+            return self._next(("key", key), self._by_key[key]), "exact"
+        sh = system_hash(system)
+        if sh in self._by_system:
+            return self._next(("system", sh), self._by_system[sh]), "system"
+        if self._all:
+            return self._next(("all",), self._all), "any"
+        return None, "none"
+
+
+class MockLLMServer:
+    """スレッドで動く擬似LLMサーバー（bench_llm.py からも起動する）"""
+
+    def __init__(self, fixtures_dir=None, host="127.0.0.1", port=0, config: MockConfig = None):
+        self.config = config or MockConfig()
+        self.store = FixtureStore(load_fixtures(fixtures_dir) if fixtures_dir else [])
+        self.stats = {
+            "messages": 0, "chat_completions": 0, "injected_429": 0, "injected_529": 0,
+            "rpm_429": 0, "match_exact": 0, "match_system": 0, "match_any": 0, "match_none": 0,
+            "stream_aborted": 0, "truncated": 0, "json_schema": 0, "json_schema_rejected": 0,
+            "cache_read_tokens": 0, "cache_creation_tokens": 0, "uncached_input_tokens": 0,
+            "batch_short": 0,
+        }
+        self._stats_lock = threading.Lock()
+        # プロンプトキャッシュ: (model, プレフィックスのハッシュ) → (有効になる時刻, 失効時刻)
+        self._prompt_cache = {}
+        self._prompt_cache_lock = threading.Lock()
+        # RPMスライディングウィンドウ
+        self._req_times = []
+        self._rpm_lock = threading.Lock()
+        # llama-server の並列スロットを模擬（超過分はスロットが空くまで待つ）
+        self._local_slots = threading.Semaphore(self.config.slots) if self.config.slots else None
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    @property
+    def anthropic_base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, name, n: int = 1):
+        with self._stats_lock:
+            self.stats[name] += n
+
+    # ------------------------------------------------------------
+    # シミュレーション
+    # ------------------------------------------------------------
+
+    def _rate_limit_state(self) -> tuple:
+        """(超過しているか, remaining, reset_iso)"""
+        cfg = self.config
+        now = time.time()
+        with self._rpm_lock:
+            self._req_times = [t for t in self._req_times if now - t < 60]
+            if cfg.rpm and len(self._req_times) >= cfg.rpm:
+                reset = self._req_times[0] + 60
+                return True, 0, _iso(reset)
+            self._req_times.append(now)
+            remaining = max(0, cfg.rpm - len(self._req_times)) if cfg.rpm else 0
+            reset = (self._req_times[0] + 60) if self._req_times else now + 60
+            return False, remaining, _iso(reset)
+
+    def _injected_error(self):
+        """確率的なエラー注入: None | 429 | 529"""
+        cfg = self.config
+        r = cfg.rng.random()
+        if r < cfg.p429:
+            return 429
+        if r < cfg.p429 + cfg.p529:
+            return 529
+        return None
+
+    def _prefill_time(self, prompt_tokens: int) -> float:
+        """プロンプト処理の時間（揺らぎなし）"""
+        cfg = self.config
+        return cfg.latency + (prompt_tokens / cfg.prefill_rate if cfg.prefill_rate > 0 else 0.0)
+
+    def _first_token_delay(self, prompt_tokens: int) -> float:
+        """最初のトークンまでの待ち時間（基本遅延 + 揺らぎ + プロンプト処理）"""
+        cfg = self.config
+        d = cfg.latency + (cfg.rng.uniform(0, cfg.jitter) if cfg.jitter else 0.0)
+        if cfg.prefill_rate > 0:
+            d += prompt_tokens / cfg.prefill_rate
+        return d
+
+    def _delay(self, output_tokens: int, prompt_tokens: int = 0):
+        cfg = self.config
+        d = self._first_token_delay(prompt_tokens)
+        if cfg.token_rate > 0:
+            d += output_tokens / cfg.token_rate
+        if d > 0:
+            time.sleep(d)
+
+    def _stream_chunks(self, text: str, output_tokens: int, prompt_tokens: int = 0):
+        """ストリーミング用に応答を分割し、(チャンク, 送出前の待ち時間) を返す"""
+        cfg = self.config
+        first = self._first_token_delay(prompt_tokens)
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        per_chunk = (output_tokens / cfg.token_rate / len(chunks)) if cfg.token_rate > 0 else 0.0
+        return [(c, (first if i == 0 else 0.0) + per_chunk) for i, c in enumerate(chunks)]
+
+    def _prompt_cache_usage(self, model: str, system, messages: list):
+        """cache_control のブレークポイントを実APIと同様に扱い (非キャッシュ入力, creation, read) を返す
+
+        ブレークポイントまでのプレフィックス（system → messages の順）が既出なら最長のものを
+        cache_read、残りの最後のブレークポイントまでを cache_creation とする。
+        ブレークポイントが無い・--no-prompt-cache なら None（録画の usage をそのまま使う）。
+        """
+        if not self.config.prompt_cache:
+            return None
+        blocks = []
+        for part in [system] + [m.get("content", "") for m in messages]:
+            if isinstance(part, str):
+                blocks.append({"text": part})
+            elif isinstance(part, list):
+                blocks.extend(b for b in part if isinstance(b, dict))
+        if not any(b.get("cache_control") for b in blocks):
+            return None
+        h = hashlib.sha256(str(model).encode("utf-8"))
+        total, prefixes = 0, []
+        for b in blocks:
+            text = b.get("text", "")
+            h.update(text.encode("utf-8") + b"\0")
+            total += estimate_tokens(text)
+            if b.get("cache_control") and total >= PROMPT_CACHE_MIN_TOKENS:
+                prefixes.append((h.hexdigest(), total))
+        now = time.monotonic()
+        read = 0
+        with self._prompt_cache_lock:
+            for key, size in prefixes:
+                ready_at, expires = self._prompt_cache.get(key, (0.0, 0.0))
+                if ready_at <= now < expires:
+                    read = max(read, size)
+            for key, size in prefixes:
+                ready_at, expires = self._prompt_cache.get(key, (0.0, 0.0))
+                # 未作成なら、このリクエストのプロンプト処理が終わった時点で読めるようになる
+                done_at = now + self._prefill_time(size - read)
+                ready_at = done_at if expires <= now else min(ready_at, done_at)
+                self._prompt_cache[key] = (ready_at, now + PROMPT_CACHE_TTL)
+        creation = max((size for _, size in prefixes), default=0) - read
+        creation = max(0, creation)
+        return total - read - creation, creation, read
+
+    def _fallback_response(self, user: str) -> str:
+        ids = [int(m) for m in _BATCH_SCENE_RE.findall(user or "")]
+        if len(ids) < 2:
+            return FALLBACK_RESPONSE
+        if self.config.rng.random() < self.config.p_batch_short:
+            ids = ids[:-1]
+            self._count("batch_short")
+        scene = json.loads(FALLBACK_RESPONSE)
+        return json.dumps([dict(scene, scene_id=sid) for sid in ids], ensure_ascii=False)
+
+    def _resolve(self, system, user):
+        fx, kind = self.store.lookup(system, user)
+        self._count(f"match_{kind}")
+        if fx is None:
+            text = self._fallback_response(user)
+            usage = {"input_tokens": len(user), "output_tokens": len(text)}
+        else:
+            text = fx["response"]
+            usage = fx.get("usage") or {}
+        return text, int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+
+    def _shape(self, text: str, output_tokens: int, prefill: str, max_tokens) -> tuple:
+        """assistant prefill と max_tokens を実APIと同様に反映する
+
+        prefill がフィクスチャ応答の先頭と一致すれば残りだけを返す（続き生成の再生）。
+        出力トークンが max_tokens を超える場合は比例配分で切り詰める。
+        戻り値: (テキスト, 出力トークン, 打ち切ったか)
+        """
+        if prefill:
+            for p in (prefill, prefill.rstrip()):
+                if p and text.startswith(p):
+                    rest = text[len(p):]
+                    output_tokens = max(1, output_tokens * len(rest) // max(len(text), 1))
+                    text = rest
+                    break
+        if max_tokens and output_tokens > int(max_tokens):
+            keep = len(text) * int(max_tokens) // output_tokens
+            self._count("truncated")
+            return text[:keep], int(max_tokens), True
+        return text, output_tokens, False
+
+    # ------------------------------------------------------------
+    # HTTP
+    # ------------------------------------------------------------
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt, *args):
+                pass
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, str(v))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_sse(self, events, headers=None):
+                """(event名 or None, 本体, 待ち時間) の列を Server-Sent Events で送る（接続は送信後に閉じる）"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                for k, v in (headers or {}).items():
+                    self.send_header(k, str(v))
+                self.end_headers()
+                self.close_connection = True
+                try:
+                    for event, payload, wait in events:
+                        if wait > 0:
+                            time.sleep(wait)
+                        data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+                        frame = (f"event: {event}\n" if event else "") + f"data: {data}\n\n"
+                        self.wfile.write(frame.encode("utf-8"))
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    server._count("stream_aborted")   # クライアントが途中で切断（早期中断）
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/models"):
+                    self._send_json(200, {"object": "list", "data": [{"id": "mock-llm", "object": "model"}]})
+                elif self.path.rstrip("/") == "/props" and server.config.slots:
+                    self._send_json(200, {"total_slots": server.config.slots})
+                elif self.path.rstrip("/") == "/stats":
+                    with server._stats_lock:
+                        self._send_json(200, dict(server.stats))
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    body = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                except json.JSONDecodeError:
+                    self._send_json(400, {"error": "invalid json"})
+                    return
+                path = self.path.split("?")[0].rstrip("/")
+                if path.endswith("/messages"):
+                    self._anthropic(body)
+                elif path.endswith("/chat/completions"):
+                    self._openai(body)
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def _anthropic(self, body):
+                server._count("messages")
+                over, remaining, reset = server._rate_limit_state()
+                rl_headers = {}
+                if server.config.rpm:
+                    rl_headers = {
+                        "anthropic-ratelimit-requests-limit": server.config.rpm,
+                        "anthropic-ratelimit-requests-remaining": remaining,
+                        "anthropic-ratelimit-requests-reset": reset,
+                    }
+                err = 429 if over else server._injected_error()
+                if err == 429:
+                    server._count("rpm_429" if over else "injected_429")
+                    self._send_json(429, {
+                        "type": "error",
+                        "error": {"type": "rate_limit_error", "message": "mock rate limit"},
+                    }, {**rl_headers, "retry-after": server.config.retry_after})
+                    return
+                if err == 529:
+                    server._count("injected_529")
+                    self._send_json(529, {
+                        "type": "error",
+                        "error": {"type": "overloaded_error", "message": "Overloaded"},
+                    }, rl_headers)
+                    return
+
+                messages = body.get("messages", [])
+                user = _content_text(messages[0].get("content", "")) if messages else ""
+                prefill = (_content_text(messages[-1].get("content", ""))
+                           if len(messages) > 1 and messages[-1].get("role") == "assistant" else "")
+                text, in_tok, out_tok = server._resolve(body.get("system"), user)
+                text, out_tok, truncated = server._shape(text, out_tok, prefill, body.get("max_tokens"))
+                prompt_tok = estimate_tokens(body.get("system")) + estimate_tokens(user)
+                stop_reason = "max_tokens" if truncated else "end_turn"
+                cc_tok = cr_tok = 0
+                cached = server._prompt_cache_usage(body.get("model", ""), body.get("system"), messages)
+                if cached is not None:
+                    in_tok, cc_tok, cr_tok = cached
+                    prompt_tok -= cr_tok   # キャッシュ読取分はプロンプト処理を省略
+                    server._count("cache_creation_tokens", cc_tok)
+                    server._count("cache_read_tokens", cr_tok)
+                server._count("uncached_input_tokens", in_tok)
+                usage = {
+                    "input_tokens": in_tok,
+                    "output_tokens": out_tok,
+                    "cache_creation_input_tokens": cc_tok,
+                    "cache_read_input_tokens": cr_tok,
+                }
+                if body.get("stream"):
+                    self._send_sse(self._anthropic_events(body, text, usage, stop_reason, prompt_tok), rl_headers)
+                    return
+                server._delay(out_tok, prompt_tok)
+                self._send_json(200, {
+                    "id": f"msg_mock_{int(time.time() * 1000)}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": body.get("model", "mock"),
+                    "content": [{"type": "text", "text": text}],
+                    "stop_reason": stop_reason,
+                    "stop_sequence": None,
+                    "usage": usage,
+                }, rl_headers)
+
+            def _anthropic_events(self, body, text, usage, stop_reason="end_turn", prompt_tokens=0):
+                message = {
+                    "id": f"msg_mock_{int(time.time() * 1000)}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": body.get("model", "mock"),
+                    "content": [],
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {**usage, "output_tokens": 1},
+                }
+                yield "message_start", {"type": "message_start", "message": message}, 0.0
+                yield "content_block_start", {
+                    "type": "content_block_start", "index": 0,
+                    "content_block": {"type": "text", "text": ""},
+                }, 0.0
+                for chunk, wait in server._stream_chunks(text, usage["output_tokens"], prompt_tokens):
+                    yield "content_block_delta", {
+                        "type": "content_block_delta", "index": 0,
+                        "delta": {"type": "text_delta", "text": chunk},
+                    }, wait
+                yield "content_block_stop", {"type": "content_block_stop", "index": 0}, 0.0
+                yield "message_delta", {
+                    "type": "message_delta",
+                    "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                    "usage": {"output_tokens": usage["output_tokens"]},
+                }, 0.0
+                yield "message_stop", {"type": "message_stop"}, 0.0
+
+            def _openai(self, body):
+                server._count("chat_completions")
+                if body.get("response_format"):
+                    if not server.config.json_schema:
+                        server._count("json_schema_rejected")
+                        self._send_json(400, {"error": {"message": "response_format is not supported"}})
+                        return
+                    server._count("json_schema")
+                err = server._injected_error()
+                if err:
+                    server._count(f"injected_{err}")
+                    self._send_json(err if err == 429 else 503, {"error": {"message": "mock overload"}})
+                    return
+                system, user, prefill = "", "", ""
+                for m in body.get("messages", []):
+                    if m.get("role") == "system":
+                        system = _content_text(m.get("content", ""))
+                    elif m.get("role") == "user":
+                        user = _content_text(m.get("content", ""))
+                    elif m.get("role") == "assistant":
+                        prefill = _content_text(m.get("content", ""))
+                if user.endswith(LOCAL_NO_THINK_SUFFIX):
+                    user = user[: -len(LOCAL_NO_THINK_SUFFIX)]
+                text, in_tok, out_tok = server._resolve(system, user)
+                text, out_tok, truncated = server._shape(text, out_tok, prefill, body.get("max_tokens"))
+                finish_reason = "length" if truncated else "stop"
+                prompt_tok = estimate_tokens(system) + estimate_tokens(user)
+                if body.get("stream"):
+                    events = self._openai_events(body, text, in_tok, out_tok, finish_reason, prompt_tok)
+                    if server._local_slots is not None:
+                        with server._local_slots:
+                            self._send_sse(events)
+                    else:
+                        self._send_sse(events)
+                    return
+                if server._local_slots is not None:
+                    with server._local_slots:
+                        server._delay(out_tok, prompt_tok)
+                else:
+                    server._delay(out_tok, prompt_tok)
+                self._send_json(200, {
+                    "id": f"chatcmpl-mock-{int(time.time() * 1000)}",
+                    "object": "chat.completion",
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": finish_reason,
+                    }],
+                    "usage": {"prompt_tokens": in_tok, "completion_tokens": out_tok},
+                })
+
+            def _openai_events(self, body, text, in_tok, out_tok, finish_reason="stop", prompt_tokens=0):
+                base = {
+                    "id": f"chatcmpl-mock-{int(time.time() * 1000)}",
+                    "object": "chat.completion.chunk",
+                    "model": body.get("model", "mock"),
+                }
+                for chunk, wait in server._stream_chunks(text, out_tok, prompt_tokens):
+                    yield None, {**base, "choices": [{
+                        "index": 0, "delta": {"content": chunk}, "finish_reason": None,
+                    }]}, wait
+                yield None, {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]}, 0.0
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield None, {**base, "choices": [],
+                                 "usage": {"prompt_tokens": in_tok, "completion_tokens": out_tok}}, 0.0
+                yield None, "[DONE]", 0.0
+
+        return Handler
+
+
+def _content_text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return "".join(b.get("text", "") for b in content if isinstance(b, dict))
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def add_simulation_args(parser: argparse.ArgumentParser):
+    """シミュレーション引数（bench_llm.py と共用）"""
+    parser.add_argument("--fixtures", help="録画フィクスチャのディレクトリ")
+    parser.add_argument("--latency", type=float, default=0.0, help="基本遅延(秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="遅延の揺らぎ上限(秒)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="出力トークン/秒（0=無制限）")
+    parser.add_argument("--prefill-rate", type=float, default=0.0, help="入力トークン/秒（0=プロンプト長に依存しない）")
+    parser.add_argument("--p429", type=float, default=0.0, help="429注入確率")
+    parser.add_argument("--p529", type=float, default=0.0, help="529注入確率")
+    parser.add_argument("--rpm", type=int, default=0, help="分あたりリクエスト上限（0=無制限）")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="429時のretry-after(秒)")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード（再現性用）")
+    parser.add_argument("--slots", type=int, default=0, help="ローカル側の並列スロット数（/props で公開、0=非対応）")
+    parser.add_argument("--no-json-schema", action="store_true", help="response_format（json_schema）を400で拒否")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="cache_control を無視（プロンプトキャッシュ無し）")
+    parser.add_argument("--p-batch-short", type=float, default=0.0,
+                        help="フィクスチャ無しのバッチ応答から末尾のシーンを欠落させる確率")
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(
+        latency=args.latency, jitter=args.jitter, token_rate=args.token_rate,
+        p429=args.p429, p529=args.p529, rpm=args.rpm,
+        retry_after=args.retry_after, seed=args.seed, slots=args.slots,
+        json_schema=not args.no_json_schema, prefill_rate=args.prefill_rate,
+        prompt_cache=not args.no_prompt_cache, p_batch_short=args.p_batch_short,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="録画フィクスチャを再生する擬似LLMサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    add_simulation_args(parser)
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.fixtures, args.host, args.port, config_from_args(args))
+    n = len(server.store)
+    print(f"擬似LLMサーバー起動: フィクスチャ {n}件")
+    print(f"  ANTHROPIC_BASE_URL={server.anthropic_base_url}")
+    print(f"  ローカルLLM URL   ={server.openai_base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n停止: {json.dumps(server.stats, ensure_ascii=False)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Rolling Outline Digest
+
+チャンク分割のアウトライン生成（_generate_outline_chunk）に渡す「確定済みシーン」の文脈。
+確定済みシーンをそのまま並べる代わりに、スクリプトの長さに関わらずほぼ一定の大きさに収まる
+ダイジェストを作る。
+
+- 幕ごとの要約: 直近ウィンドウより前のシーンを幕（導入/前戯/本番/余韻）単位で1行に要約
+  （シーン範囲・intensity・場所の移り変わり・代表タイトル・感情の始点→終点）
+- 直近シーン: 直前 recent 件はタイトル・状況・感情まで詳細に
+- 使用済みフィンガープリント: 全履歴の体位/行為キーワードの使用回数、場所×行為の組み合わせ、
+  直近で使ったキーワード、最近のタイトル（重複防止用、件数上限あり）
+
+generate_outline がチャンクごとに extend() し、render() の結果をチャンクのプロンプトに入れる。
+"""
+
+from collections import Counter, deque
+from typing import Optional
+
+# ============================================================
+# Constants
+# ============================================================
+
+DIGEST_RECENT_SCENES = 12        # 詳細に並べる直近シーン数
+DIGEST_RECENT_KEYWORD_SCENES = 10  # 「直近で使用済み」とする体位/行為の範囲
+DIGEST_ACT_TITLES = 6            # 幕要約に載せる代表タイトル数
+DIGEST_ACT_LOCATIONS = 5         # 幕要約に載せる場所の移り変わり数
+DIGEST_TITLES = 40               # 重複防止用に載せる最近のタイトル数
+DIGEST_TOP_KEYWORDS = 12         # 使用回数を載せる体位/行為キーワード数
+DIGEST_TOP_COMBOS = 8            # 使用回数を載せる場所×行為の組み合わせ数
+
+# 体位/行為キーワード（situation から抽出して繰り返しを検出する）
+POSITION_KEYWORDS = [
+    "騎乗位", "正常位", "バック", "立ちバック", "対面座位", "駅弁",
+    "四つん這い", "寝バック", "側位", "松葉崩し", "背面座位",
+    "膝立ち", "立位", "仰向け", "うつ伏せ", "跨が",
+    "フェラ", "パイズリ", "手コキ", "クンニ", "69", "素股",
+    "挿入", "中出し", "顔射", "口内射精", "二穴",
+]
+
+
+def scene_keywords(scene: dict) -> tuple:
+    """シーンの situation に含まれる体位/行為キーワード（POSITION_KEYWORDS の順）"""
+    sit = scene.get("situation", "") or ""
+    return tuple(kw for kw in POSITION_KEYWORDS if kw in sit)
+
+
+def _emotion(scene: dict, key: str) -> str:
+    ea = scene.get("emotional_arc", {})
+    return ea.get(key, "") if isinstance(ea, dict) else ""
+
+
+def _sample(items: list, n: int) -> list:
+    """items から先頭・末尾を含めて均等に n 件選ぶ"""
+    if len(items) <= n:
+        return list(items)
+    if n < 2:
+        return list(items[:n])
+    step = (len(items) - 1) / (n - 1)
+    return [items[round(i * step)] for i in range(n)]
+
+
+class OutlineDigest:
+    """確定済みアウトラインの有界サイズの要約（チャンクごとに extend する）"""
+
+    def __init__(self, acts: Optional[list] = None, recent: int = DIGEST_RECENT_SCENES):
+        """acts: [(幕の名前, 開始index, 終了index（含まない）), ...]。None なら幕で分けない"""
+        self.acts = acts or []
+        self.recent = recent
+        self.scenes: list = []
+        self._keyword_counts: Counter = Counter()
+        self._combo_counts: Counter = Counter()
+        self._titles: deque = deque(maxlen=DIGEST_TITLES)
+
+    @classmethod
+    def from_scenes(cls, scenes: list, acts: Optional[list] = None) -> "OutlineDigest":
+        digest = cls(acts)
+        digest.extend(scenes)
+        return digest
+
+    def extend(self, scenes: list):
+        """確定したシーンを追加"""
+        for s in scenes:
+            self.scenes.append(s)
+            kws = scene_keywords(s)
+            self._keyword_counts.update(kws)
+            loc = (s.get("location", "") or "")[:15]
+            if loc:
+                self._combo_counts.update(f"{loc}/{kw}" for kw in kws)
+            title = s.get("title", "")
+            if title:
+                self._titles.append(title)
+
+    def __len__(self):
+        return len(self.scenes)
+
+    # ------------------------------------------------------------
+    # 描画
+    # ------------------------------------------------------------
+
+    def _summarize(self, name: str, scenes: list, first_index: int, act_end: Optional[int] = None) -> str:
+        """幕（または省略部分）1つを1行に要約"""
+        last_index = first_index + len(scenes)
+        span = f"シーン{first_index + 1}〜{last_index}"
+        if act_end is not None and last_index < act_end:
+            span += f"（全{act_end - first_index}シーン中）"
+        levels = [s.get("intensity", 3) for s in scenes]
+        peaks = levels.count(5)
+        parts = [f"i={min(levels)}-{max(levels)}" + (f", i=5×{peaks}" if peaks else "")]
+
+        locations = []
+        for s in scenes:
+            loc = (s.get("location", "") or "")[:15]
+            if loc and (not locations or locations[-1] != loc):
+                locations.append(loc)
+        if locations:
+            parts.append("場所: " + "→".join(_sample(locations, DIGEST_ACT_LOCATIONS)))
+
+        titles = [s.get("title", "")[:15] for s in scenes if s.get("title")]
+        if titles:
+            parts.append("展開: " + " / ".join(_sample(titles, DIGEST_ACT_TITLES)))
+
+        emo_start, emo_end = _emotion(scenes[0], "start"), _emotion(scenes[-1], "end")
+        if emo_start or emo_end:
+            parts.append(f"感情: {emo_start}→{emo_end}")
+        return f"- {name}（{span}, {', '.join(parts)}）"
+
+    def _act_lines(self, upto: int) -> list:
+        """直近ウィンドウより前（index < upto）のシーンを幕ごとに要約"""
+        if upto <= 0:
+            return []
+        if not self.acts:
+            return [self._summarize("これまでの展開", self.scenes[:upto], 0)]
+        lines = []
+        for name, start, end in self.acts:
+            stop = min(end, upto)
+            if stop <= start:
+                continue
+            lines.append(self._summarize(name, self.scenes[start:stop], start, end))
+        return lines
+
+    def render(self) -> str:
+        """チャンクのプロンプトに入れる「確定済みシーン」セクション（シーンが無ければ空文字）"""
+        n = len(self.scenes)
+        if n == 0:
+            return ""
+        recent_start = max(0, n - self.recent)
+        sections = []
+
+        act_lines = self._act_lines(recent_start)
+        if act_lines:
+            sections.append("### これまでの流れ（幕ごとの要約）\n" + "\n".join(act_lines))
+
+        recent_lines = []
+        for s in self.scenes[recent_start:]:
+            sid = s.get("scene_id", "?")
+            title = s.get("title", "")[:20]
+            intensity = s.get("intensity", 3)
+            situation = s.get("situation", "")[:60]
+            loc = s.get("location", "")[:15]
+            emo = f'{_emotion(s, "start")}→{_emotion(s, "end")}'
+            recent_lines.append(f"[{sid}] {title} (i={intensity}, {loc}) {situation} ({emo})")
+        sections.append("### 直近シーン（詳細）\n" + "\n".join(recent_lines))
+
+        used = []
+        if self._keyword_counts:
+            top = self._keyword_counts.most_common(DIGEST_TOP_KEYWORDS)
+            used.append("体位/行為の使用回数（全体）: " + ", ".join(f"{kw}×{c}" for kw, c in top))
+        combos = [(k, c) for k, c in self._combo_counts.most_common(DIGEST_TOP_COMBOS) if c >= 2]
+        if combos:
+            used.append("繰り返し済みの場所×行為: " + ", ".join(f"{k}×{c}" for k, c in combos))
+        if self._titles:
+            used.append("使用済みtitle（直近）: " + "、".join(self._titles))
+        recent_keywords = sorted({kw for s in self.scenes[-DIGEST_RECENT_KEYWORD_SCENES:] for kw in scene_keywords(s)})
+
+        text = "## 確定済みシーン（これに続けて書くこと。重複禁止）\n" + "\n".join(sections) + "\n"
+        if used:
+            text += (
+                "\n## ⚠️ 使用済みパターン（以下と同一・類似のsituationやtitleは使用禁止）\n"
+                + "\n".join(f"❌ {u}" for u in used) + "\n"
+            )
+        if recent_keywords:
+            text += (
+                f"\n## ⚠️ 直近チャンクで使用済みの体位/行為（繰り返し厳禁）\n"
+                f"🔁 {', '.join(recent_keywords)}\n"
+                f"**上記の体位/行為は直近で使用済み。必ず異なる体位/行為で新しい展開にすること。**\n"
+            )
+        return text
@@ -0,0 +1,157 @@
+"""
+Streaming Outline Feed
+
+13シーン以上のアウトラインは10シーンずつのチャンクで順番に生成される。全チャンクの完了を
+待たずにシーン生成を始めるため、生成スレッド（generate_outline）から完了チャンクを受け取り、
+エンジンのループ上のローリングスケジューラーへ順番に渡す。
+
+- publish(): チャンク完了時に暫定正規化済みの既知シーン全体を受け取る。
+  末尾 holdback シーンは次チャンクによる intensity の平滑化で変わり得るため保留し、
+  それ以外を確定（解放）する。解放済みのシーンは以後変更しない
+- close(): 最終アウトラインを受け取る。解放済みシーンはそのまま、残りを最終値で確定する
+- fail(): アウトライン生成の中断を消費側に伝える
+- 消費側は `async for i, scene in stream` で解放順（scene_index順）に受け取る。
+  known() は保留中を含む既知の全シーン（後続シーンのロードマップを埋めるため）
+
+生成スレッド（publish/close/fail）とループ（反復）の間はスレッドセーフ。
+"""
+
+import time
+import asyncio
+import threading
+from typing import Optional
+
+# ============================================================
+# Constants
+# ============================================================
+
+OUTLINE_STREAM_HOLDBACK = 2   # チャンク完了時に確定を保留する末尾シーン数
+
+
+class OutlineStream:
+    """チャンク単位で伸びるアウトライン（確定済みプレフィックス + 暫定の既知シーン）"""
+
+    def __init__(self, expected_total: int, holdback: int = OUTLINE_STREAM_HOLDBACK):
+        self.total = expected_total       # 確定するまでは要求シーン数
+        self._holdback = holdback
+        self._lock = threading.Lock()
+        self._released: list = []         # 確定済み（スケジューラーに渡した）シーン
+        self._known: list = []            # 保留中を含む既知の全シーン
+        self._version = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._t0 = time.monotonic()
+        self.released_before_close = 0    # アウトライン完成前に解放したシーン数
+        self.first_release: Optional[float] = None   # 最初の解放までの秒数
+
+    @classmethod
+    def from_outline(cls, outline: list) -> "OutlineStream":
+        """完成済みのアウトラインをそのまま流す（ストリーミングしない経路用）"""
+        stream = cls(len(outline))
+        stream.close(outline)
+        return stream
+
+    # ------------------------------------------------------------
+    # 生成側（generate_outline のスレッド）
+    # ------------------------------------------------------------
+
+    def publish(self, provisional: list):
+        """暫定アウトライン（既知の全シーン）を受け取り、末尾 holdback を除いて確定する"""
+        with self._lock:
+            if self._closed:
+                return
+            self._known = list(self._released) + list(provisional[len(self._released):])
+            upto = len(provisional) - self._holdback
+            if upto > len(self._released):
+                self._released.extend(provisional[len(self._released):upto])
+                self.released_before_close = len(self._released)
+                if self.first_release is None:
+                    self.first_release = time.monotonic() - self._t0
+            self._version += 1
+        self._notify()
+
+    def close(self, outline: list) -> list:
+        """最終アウトラインで残りを確定し、解放済みシーンを含む最終アウトラインを返す"""
+        with self._lock:
+            if self._closed:
+                return list(self._released)
+            n = len(self._released)
+            self._released.extend(outline[n:])
+            if self.first_release is None and self._released:
+                self.first_release = time.monotonic() - self._t0
+            self._known = list(self._released)
+            self.total = len(self._released)
+            self._closed = True
+            self._version += 1
+            final = list(self._released)
+        self._notify()
+        return final
+
+    def fail(self, error: BaseException):
+        """アウトライン生成が中断した（消費側の反復で error を送出）"""
+        with self._lock:
+            if self._closed:
+                return
+            self._error = error
+            self._closed = True
+        self._notify()
+
+    def _notify(self):
+        loop, event = self._loop, self._event
+        if loop is not None and event is not None:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass   # ループ終了後
+
+    # ------------------------------------------------------------
+    # 消費側（エンジンのループ）
+    # ------------------------------------------------------------
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def version(self) -> int:
+        """既知シーンが更新されるたびに増える（ロードマップの再構築判定用）"""
+        return self._version
+
+    @property
+    def scenes(self) -> list:
+        """確定済みのシーン（scene_index順）"""
+        with self._lock:
+            return list(self._released)
+
+    def known(self) -> list:
+        """保留中を含む既知の全シーン"""
+        with self._lock:
+            return list(self._known)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._released)
+
+    async def __aiter__(self):
+        """確定したシーンを (scene_index, scene) で順に返す（アウトライン完成まで待つ）"""
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        i = 0
+        while True:
+            self._event.clear()
+            with self._lock:
+                pending = self._released[i:]
+                closed, error = self._closed, self._error
+            for scene in pending:
+                yield i, scene
+                i += 1
+            if error is not None:
+                raise error
+            if closed:
+                with self._lock:
+                    if i >= len(self._released):
+                        return
+                continue
+            await self._event.wait()
@@ -0,0 +1,201 @@
+"""
+Prompt Cache Pre-warming
+
+シーン生成（Phase 4）の system プロンプトのうち、全シーンで同一の先頭ブロック
+（_compile_scene_system の共通プレフィックス + 実行共通ブロック）を、あらすじ・アウトライン生成
+（Phase 2/3）の間に最小リクエスト（max_tokens=1）で送ってキャッシュに書き込んでおく。
+最初の Haiku / Sonnet シーンがキャッシュ作成（1.25倍課金 + プロンプト処理時間）を
+クリティカルパス上で払わずに済む。
+
+- warm(model, system): モデルごとの予熱対象を登録して送信する（任意のスレッドから呼べる）。
+  同じ system が登録済みなら何もしない。新しい system は前のものを置き換える
+- ready(model, system): シーン呼び出しの直前にループ上で await する。system の先頭が予熱対象と
+  一致すれば、送信中の予熱の完了を待ち（キャッシュ作成前に送ると同時作成になるため、
+  PREWARM_READY_TIMEOUT 秒まで）、そのモデルの最終利用時刻を更新する
+- 最終利用から PREWARM_REFRESH_AFTER 秒使われていないモデルは再送して TTL(5分) 切れを防ぐ。
+  PREWARM_MAX_IDLE 秒使われなければ再送をやめる（閉じ忘れ・中断時の歯止め）
+- close(): 実行終了時に再送を止める
+
+send は (model, system) を受け取る coroutine 関数。失敗は記録のみで、シーン生成は止めない。
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Constants
+# ============================================================
+
+PREWARM_REFRESH_AFTER = 240.0   # 最終利用からこの秒数で再送（ephemeral キャッシュの TTL 300秒より前）
+PREWARM_READY_TIMEOUT = 20.0    # シーン呼び出しが送信中の予熱を待つ上限(秒)
+PREWARM_MAX_IDLE = 1800.0       # これ以上使われないモデルは再送しない(秒)
+
+
+def _block_texts(system) -> tuple:
+    if isinstance(system, str):
+        return (system,)
+    return tuple(b.get("text", "") for b in system or [] if isinstance(b, dict))
+
+
+class _Entry:
+    """モデル1つ分の予熱対象"""
+
+    def __init__(self, system, now: float):
+        self.system = system
+        self.texts = _block_texts(system)
+        self.task: Optional[asyncio.Task] = None
+        self.last_used = now              # 最後にシーン呼び出しが使った時刻
+        self.sent_at = now                # 最後に予熱・再送を送った時刻
+        self.warmed_at: Optional[float] = None
+
+    def matches(self, system) -> bool:
+        texts = _block_texts(system)
+        return texts[:len(self.texts)] == self.texts
+
+
+class PromptCacheWarmer:
+    """モデル別の system プレフィックスを予熱し、使われない間は TTL 切れ前に再送する"""
+
+    def __init__(
+        self,
+        send: Callable[[str, object], Awaitable[None]],
+        loop: asyncio.AbstractEventLoop,
+        refresh_after: float = PREWARM_REFRESH_AFTER,
+        ready_timeout: float = PREWARM_READY_TIMEOUT,
+        max_idle: float = PREWARM_MAX_IDLE,
+    ):
+        self._send = send
+        self._loop = loop
+        self._refresh_after = refresh_after
+        self._ready_timeout = ready_timeout
+        self._max_idle = max_idle
+        # 以下はループ上でのみ触る
+        self._entries: dict = {}
+        self._refresher: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._closed = False
+        # 統計（summary 用）
+        self._lock = threading.Lock()
+        self._stats = {"warm": 0, "refresh": 0, "failed": 0, "waited": 0.0}
+
+    # ------------------------------------------------------------
+    # 生成スレッドから
+    # ------------------------------------------------------------
+
+    def warm(self, model: str, system):
+        """model の予熱対象を system にして送信する（ノンブロッキング）"""
+        self._loop.call_soon_threadsafe(self._register, model, system)
+
+    def close(self):
+        """再送を止め、送信中の予熱を打ち切る"""
+        try:
+            self._loop.call_soon_threadsafe(self._close)
+        except RuntimeError:
+            pass   # ループ終了後
+
+    # ------------------------------------------------------------
+    # ループ上
+    # ------------------------------------------------------------
+
+    def _register(self, model: str, system):
+        if self._closed:
+            return
+        entry = self._entries.get(model)
+        if entry is not None and entry.texts == _block_texts(system):
+            return
+        prev = entry.task if entry is not None and not self._closed else None
+        entry = _Entry(system, time.monotonic())
+        self._entries[model] = entry
+        self._start(model, entry, "warm", after=prev)
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        if self._refresher is None or self._refresher.done():
+            self._refresher = self._loop.create_task(self._refresh_loop())
+        self._wake.set()
+
+    def _start(self, model: str, entry: _Entry, kind: str, after: Optional[asyncio.Task] = None):
+        entry.sent_at = time.monotonic()
+        entry.task = self._loop.create_task(self._run(model, entry, kind, after))
+
+    async def _run(self, model: str, entry: _Entry, kind: str, after: Optional[asyncio.Task] = None):
+        try:
+            if after is not None and not after.done():
+                # 前の予熱（短いプレフィックス）の作成を待ってから送れば、その分は読取になる
+                await asyncio.wait({after}, timeout=self._ready_timeout)
+            await self._send(model, entry.system)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            with self._lock:
+                self._stats["failed"] += 1
+            logger.warning(f"プロンプトキャッシュ予熱に失敗 ({model}): {e!r}")
+            return
+        entry.warmed_at = time.monotonic()
+        with self._lock:
+            self._stats[kind] += 1
+
+    async def ready(self, model: str, system):
+        """シーン呼び出しの直前に呼ぶ（送信中の予熱を待ち、最終利用時刻を更新）"""
+        entry = self._entries.get(model)
+        if entry is None or self._closed or not entry.matches(system):
+            return
+        task = entry.task
+        if task is not None and not task.done():
+            t0 = time.monotonic()
+            try:
+                await asyncio.wait_for(asyncio.shield(task), self._ready_timeout)
+            except asyncio.TimeoutError:
+                pass
+            with self._lock:
+                self._stats["waited"] += time.monotonic() - t0
+        entry.last_used = time.monotonic()
+        if self._wake is not None:
+            self._wake.set()
+
+    async def _refresh_loop(self):
+        while not self._closed:
+            now = time.monotonic()
+            due = None
+            for model, entry in self._entries.items():
+                if now - entry.last_used > self._max_idle:
+                    continue
+                # 予熱・再送もキャッシュを延長するので、利用と同じに数える
+                at = max(entry.last_used, entry.sent_at) + self._refresh_after
+                if at <= now:
+                    if entry.task is None or entry.task.done():
+                        self._start(model, entry, "refresh")
+                    at = now + self._refresh_after
+                due = at if due is None else min(due, at)
+            if due is None:
+                return
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, due - time.monotonic()))
+            except asyncio.TimeoutError:
+                pass
+
+    def _close(self):
+        self._closed = True
+        for entry in self._entries.values():
+            if entry.task is not None and not entry.task.done():
+                entry.task.cancel()
+        if self._refresher is not None and not self._refresher.done():
+            self._refresher.cancel()
+
+    # ------------------------------------------------------------
+    # 統計
+    # ------------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._stats, waited=round(self._stats["waited"], 2))
+
+    def summary(self) -> str:
+        snap = self.snapshot()
+        return (f"PromptCache予熱: 予熱 {snap['warm']}回 / 再送 {snap['refresh']}回 / "
+                f"失敗 {snap['failed']}回 / シーン側の待ち計{snap['waited']}秒")
@@ -0,0 +1,179 @@
+"""
+Scene Patch Operations
+
+清書（polish_scene）・品質修正（apply_fix）でシーン全体の JSON を出し直させる代わりに、
+フィールド単位の編集操作のリストを返させ、ローカルで下書きに適用する。変更しない部分を
+出力し直す分の出力トークン（= 課金と生成時間の大半）が要らなくなる。
+
+  [{"op": "bubble", "index": 0, "text": "あんたのせいで…♡"},
+   {"op": "set", "field": "description", "value": "…"},
+   {"op": "drop_bubble", "index": 3}]
+
+- patch_format(): プロンプトに入れる出力形式セクション（操作の一覧）
+- apply_patch(): 操作を検証して下書きのコピーに適用し、(シーン, 適用数, 却下した操作) を返す
+- patch_from_response(): 応答（操作の配列 / {"ops": [...]} / シーン全体）から清書後のシーンを作る。
+  シーン全体で返ってきた場合（従来形式・wire 形式）はそれをそのまま使う。
+  max_tokens で打ち切られた応答は、操作の配列なら途切れた最後の操作を捨て、シーン全体なら採用しない
+"""
+
+import copy
+
+import scene_wire
+
+# ============================================================
+# Constants
+# ============================================================
+
+# "set" で置き換えられるフィールド（scene_id・sd_prompt は清書の対象外）
+PATCH_TEXT_FIELDS = ("title", "description", "location_detail", "mood", "direction", "story_flow")
+PATCH_LIST_FIELDS = ("onomatopoeia",)
+BUBBLE_TYPES = ("speech", "moan", "thought")
+MAX_BUBBLES = 3   # 1ページの吹き出し上限（ヒロイン1-2 + 男性0-1）
+
+
+class TruncatedSceneResponse(ValueError):
+    """シーン全体の応答が打ち切られていた（修復すると欠けたシーンになるため採用しない）"""
+
+
+def patch_format() -> str:
+    """polish_scene / apply_fix の「出力形式」セクション"""
+    fields = ", ".join(PATCH_TEXT_FIELDS)
+    return f"""## 出力形式（変更点のみのJSON配列。下書き全体は出力しない）
+
+変更する箇所だけを、以下の操作の配列で出力すること。変更が無ければ [] を出力。
+- {{"op": "set", "field": "description", "value": "新しい文"}} … 文字列フィールドの置き換え（{fields}）
+- {{"op": "set", "field": "onomatopoeia", "value": ["効果音1", "効果音2"]}} … 効果音の置き換え
+- {{"op": "feeling", "name": "キャラ名", "value": "心情"}} … character_feelings の1人分の置き換え
+- {{"op": "bubble", "index": 0, "text": "新しいセリフ"}} … bubbles[index] のセリフの置き換え（speaker/type も変えるときだけ書く）
+- {{"op": "drop_bubble", "index": 3}} … bubbles[index] の削除
+- {{"op": "add_bubble", "speaker": "キャラ名", "type": "speech", "text": "セリフ"}} … 吹き出しの追加
+
+index は下書きの bubbles の0始まりの番号（削除による繰り上げは考えない）。type は {"/".join(BUBBLE_TYPES)}。
+吹き出しは適用後に最大{MAX_BUBBLES}個。JSON配列のみ出力。"""
+
+
+# ============================================================
+# Apply
+# ============================================================
+
+def _bubble_type(value):
+    value = scene_wire.BUBBLE_TYPE_ALIASES.get(value, value)
+    return value if value in BUBBLE_TYPES else None
+
+
+def _nonempty_str(value) -> bool:
+    return isinstance(value, str) and bool(value.strip())
+
+
+def _edit_bubble(bubble: dict, op: dict) -> bool:
+    changed = False
+    for key in ("speaker", "text"):
+        if key in op:
+            if not _nonempty_str(op[key]):
+                return False
+            bubble[key] = op[key]
+            changed = True
+    if "type" in op:
+        btype = _bubble_type(op["type"])
+        if btype is None:
+            return False
+        bubble["type"] = btype
+        changed = True
+    return changed
+
+
+def apply_patch(scene: dict, ops) -> tuple:
+    """操作のリストを scene のコピーに適用する（scene 自体は変更しない）
+
+    bubble / drop_bubble の index は元の bubbles の番号として解釈し、編集 → 削除 → 追加の順に適用する。
+    不正な操作（未知の op・対象外のフィールド・範囲外の index・空文字）は却下して残りを適用する。
+    戻り値: (適用後のシーン, 適用した操作数, 却下した操作のリスト)
+    """
+    patched = copy.deepcopy(scene)
+    bubbles = patched.get("bubbles")
+    if not isinstance(bubbles, list):
+        bubbles = patched["bubbles"] = []
+    n_bubbles = len(bubbles)
+    drops, adds, rejected = set(), [], []
+    applied = 0
+
+    for op in ops if isinstance(ops, list) else []:
+        ok = False
+        kind = op.get("op") if isinstance(op, dict) else None
+        if kind == "set":
+            field, value = op.get("field"), op.get("value")
+            if field in PATCH_TEXT_FIELDS and _nonempty_str(value):
+                patched[field] = value
+                ok = True
+            elif field in PATCH_LIST_FIELDS and isinstance(value, list) and all(isinstance(v, str) for v in value):
+                patched[field] = value
+                ok = True
+        elif kind == "feeling":
+            name, value = op.get("name"), op.get("value")
+            if _nonempty_str(name) and _nonempty_str(value):
+                if not isinstance(patched.get("character_feelings"), dict):
+                    patched["character_feelings"] = {}
+                patched["character_feelings"][name] = value
+                ok = True
+        elif kind in ("bubble", "drop_bubble"):
+            index = op.get("index")
+            if isinstance(index, int) and not isinstance(index, bool) and 0 <= index < n_bubbles:
+                if kind == "drop_bubble":
+                    drops.add(index)
+                    ok = True
+                elif isinstance(bubbles[index], dict):
+                    ok = _edit_bubble(bubbles[index], op)
+        elif kind == "add_bubble":
+            btype = _bubble_type(op.get("type", "speech"))
+            if _nonempty_str(op.get("speaker")) and _nonempty_str(op.get("text")) and btype:
+                adds.append({"speaker": op["speaker"], "type": btype, "text": op["text"]})
+                ok = True
+        if ok:
+            applied += 1
+        else:
+            rejected.append(op)
+
+    if drops or adds:
+        kept = [b for i, b in enumerate(bubbles) if i not in drops]
+        room = max(0, MAX_BUBBLES - len(kept))
+        rejected.extend({"op": "add_bubble", **b} for b in adds[room:])
+        applied -= len(adds[room:])
+        patched["bubbles"] = kept + adds[:room]
+    return patched, applied, rejected
+
+
+def _ops_of(response):
+    if isinstance(response, list):
+        return response
+    if isinstance(response, dict):
+        for key in ("ops", "edits", "patch"):
+            if isinstance(response.get(key), list):
+                return response[key]
+        if "op" in response:
+            return [response]
+    return None
+
+
+def patch_from_response(scene: dict, response, truncated: bool = False) -> tuple:
+    """応答から清書後のシーンを作る
+
+    操作の配列なら apply_patch を適用する。シーン全体（従来形式・wire 形式）で返ってきた場合は
+    それを使う（scene_id は下書きのものを維持）。どちらでもなければ ValueError。
+    truncated: 応答が打ち切られていた（json_extract が閉じ括弧を補った）。操作の配列は途中で切れた
+    可能性のある最後の操作を却下し、シーン全体なら TruncatedSceneResponse を送出する。
+    戻り値: (シーン, 適用した操作数 or None（シーン全体のとき）, 却下した操作のリスト)
+    """
+    ops = _ops_of(response)
+    if ops is not None:
+        if truncated and ops:
+            patched, applied, rejected = apply_patch(scene, ops[:-1])
+            return patched, applied, rejected + ops[-1:]
+        return apply_patch(scene, ops)
+    full = scene_wire.expand_scene(response)
+    if isinstance(full, dict) and ("bubbles" in full or "description" in full):
+        if truncated:
+            raise TruncatedSceneResponse(f"Invalid JSON: 打ち切られたシーン全体の応答: {str(response)[:100]}")
+        if "scene_id" in scene:
+            full["scene_id"] = scene["scene_id"]
+        return full, None, []
+    raise ValueError(f"Invalid JSON: 編集操作でもシーンでもない応答: {str(response)[:100]}")
@@ -0,0 +1,123 @@
+"""
+Compact Scene Wire Format
+
+シーン生成（generate_scene_draft）の応答を短いキー + 配列の吹き出しで受け取り、parse 直後
+（validate_scene の前）に従来の dict 形式へ展開する。出力トークンは1回の呼び出しで最も遅く
+高い部分なので、キー名と吹き出しのオブジェクト構造の分を削る。
+
+  従来: {"scene_id": 3, "title": "…", "character_feelings": {"A": "…"},
+         "bubbles": [{"speaker": "A", "type": "moan", "text": "…"}], …}
+  wire: {"i": 3, "t": "…", "f": {"A": "…"}, "b": [["A", "moan", "…"]], …}
+
+- WIRE_KEYS: 従来キー → 短いキー（出力順もこの順）
+- output_format(): プロンプトに入れる出力形式セクション（キー対応表 + 1行の出力例）
+- expand_scene(): wire 形式なら従来形式に展開する。従来形式で返ってきた応答・未知のキーはそのまま
+- compact_scene(): 従来形式 → wire 形式（ベンチ用）
+- SCENE_WIRE_JSON_SCHEMA: ローカルLLM経路の response_format 用（SCENE_JSON_SCHEMA の短縮キー版）
+"""
+
+import json
+
+from schema_validator import SCENE_JSON_SCHEMA
+
+# ============================================================
+# Constants
+# ============================================================
+
+WIRE_KEYS = {
+    "scene_id": "i",
+    "title": "t",
+    "description": "d",
+    "location_detail": "l",
+    "mood": "m",
+    "character_feelings": "f",
+    "bubbles": "b",
+    "onomatopoeia": "o",
+    "direction": "dr",
+    "story_flow": "sf",
+    "sd_prompt": "sd",
+}
+_LONG_KEYS = {short: long for long, short in WIRE_KEYS.items()}
+
+BUBBLE_FIELDS = ("speaker", "type", "text")
+# 吹き出し type の1文字表記（プロンプトでは正式名を指示するが、略記で返ってきても受け付ける）
+BUBBLE_TYPE_ALIASES = {"s": "speech", "m": "moan", "t": "thought"}
+
+SCENE_WIRE_JSON_SCHEMA: dict = {
+    "title": "scene_wire",
+    "type": "object",
+    "properties": {
+        WIRE_KEYS[k]: (
+            {"type": "array", "minItems": 1, "maxItems": 3,
+             "items": {"type": "array", "items": {"type": "string"}, "minItems": 3, "maxItems": 3}}
+            if k == "bubbles" else v
+        )
+        for k, v in SCENE_JSON_SCHEMA["properties"].items()
+    },
+    "required": [WIRE_KEYS[k] for k in SCENE_JSON_SCHEMA["required"]],
+}
+
+
+def is_wire(obj) -> bool:
+    """wire 形式のシーンか（従来キーが1つも無く、短いキーがある）"""
+    if not isinstance(obj, dict):
+        return False
+    return not any(k in obj for k in WIRE_KEYS) and any(k in obj for k in _LONG_KEYS)
+
+
+def _expand_bubble(bubble):
+    if isinstance(bubble, (list, tuple)):
+        if len(bubble) == 2:
+            # type 省略は会話扱い
+            bubble = [bubble[0], "speech", bubble[1]]
+        if len(bubble) >= 3:
+            bubble = dict(zip(BUBBLE_FIELDS, bubble[:3]))
+    if isinstance(bubble, dict) and isinstance(bubble.get("type"), str):
+        bubble["type"] = BUBBLE_TYPE_ALIASES.get(bubble["type"], bubble["type"])
+    return bubble
+
+
+def expand_scene(obj):
+    """wire 形式のシーンを従来形式の dict に展開する（wire 形式でなければそのまま返す）"""
+    if not is_wire(obj):
+        return obj
+    scene = {_LONG_KEYS.get(k, k): v for k, v in obj.items()}
+    bubbles = scene.get("bubbles")
+    if isinstance(bubbles, list):
+        scene["bubbles"] = [_expand_bubble(b) for b in bubbles]
+    return scene
+
+
+def compact_scene(scene: dict) -> dict:
+    """従来形式のシーンを wire 形式にする（expand_scene の逆）"""
+    wire = {}
+    for k, v in scene.items():
+        if k == "bubbles" and isinstance(v, list):
+            v = [[b.get(f, "") for f in BUBBLE_FIELDS] if isinstance(b, dict) else b for b in v]
+        wire[WIRE_KEYS.get(k, k)] = v
+    return wire
+
+
+def output_format(scene_id, heroine: str, sd_example: str) -> str:
+    """generate_scene_draft の「出力形式」セクション（wire 形式）"""
+    example = {
+        "i": scene_id,
+        "t": "シーンタイトル",
+        "d": "このシーンの詳細説明。場所、状況、何が起きているか、画像として何が描かれるかを説明",
+        "l": "場所の具体的な描写",
+        "m": "シーンの空気感・雰囲気（15-30字の情景描写。1-2語のラベル禁止）",
+        "f": {heroine: "このシーンでの心情"},
+        "b": [[heroine, "speech", "短い一言"], [heroine, "moan", "あっ♡"], ["男性", "speech", "男のセリフ"]],
+        "o": ["効果音1", "効果音2"],
+        "dr": "演出・ト書き",
+        "sf": "次のシーンへの繋がり",
+        "sd": sd_example,
+    }
+    legend = ", ".join(f"{short}={long}" for long, short in WIRE_KEYS.items())
+    return f"""## 出力形式（短縮キーのJSON。この形式で出力してください）
+
+キー対応: {legend}
+以下のルールのフィールド名は上の短縮キーに読み替えること。
+bubbles(b) は [speaker, type, text] の配列で書く（オブジェクトにしない）。改行・インデントは不要。
+
+{json.dumps(example, ensure_ascii=False)}"""
@@ -533,3 +533,105 @@ def validate_pipeline_output(
         "phases": phases,
         "summary": summary,
     }
+
+
+# ---------------------------------------------------------------------------
+# JSON Schema（ローカルLLMの制約付きデコード用）
+# ---------------------------------------------------------------------------
+#
+# LocalLLMProvider が response_format（llama-server / LM Studio の json_schema）として送る。
+# 上の validate_* と同じ定義から作り、ローカル用シーンプロンプトの出力例とフィールド順を揃える。
+# "title" は response_format の name に使われる。
+
+_STR = {"type": "string"}
+_NONEMPTY_STR = {"type": "string", "minLength": 1}
+
+CONTEXT_JSON_SCHEMA: dict = {
+    "title": "story_context",
+    "type": "object",
+    "properties": {
+        "setting": _STR,
+        "chars": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {"name": _NONEMPTY_STR, "look": _STR, "voice": _STR},
+                "required": ["name", "look", "voice"],
+            },
+        },
+        "tone": _STR,
+        "theme": _STR,
+        "ng": {"type": "array", "items": _STR},
+    },
+    "required": ["setting", "chars", "tone", "theme"],
+}
+
+OUTLINE_SCENE_JSON_SCHEMA: dict = {
+    "type": "object",
+    "properties": {
+        "scene_id": {"type": "integer"},
+        "title": _NONEMPTY_STR,
+        "goal": _STR,
+        "location": _STR,
+        "time": _STR,
+        "situation": _STR,
+        "story_flow": _STR,
+        "emotional_arc": {
+            "type": "object",
+            "properties": {"start": _STR, "end": _STR},
+            "required": ["start", "end"],
+        },
+        "beats": {"type": "array", "items": _STR},
+        "intensity": {"type": "integer", "minimum": 1, "maximum": 5},
+        "erotic_level": {"type": "string", "enum": sorted(_EROTIC_LEVELS)},
+        "viewer_hook": _STR,
+    },
+    "required": ["scene_id", "title", "location", "situation", "intensity"],
+}
+
+OUTLINE_JSON_SCHEMA: dict = {
+    "title": "outline",
+    "type": "array",
+    "minItems": 1,
+    "items": OUTLINE_SCENE_JSON_SCHEMA,
+}
+
+BUBBLE_JSON_SCHEMA: dict = {
+    "type": "object",
+    "properties": {
+        "speaker": _NONEMPTY_STR,
+        "type": {"type": "string", "enum": sorted(_BUBBLE_TYPES)},
+        "text": _NONEMPTY_STR,
+    },
+    "required": ["speaker", "type", "text"],
+}
+
+SCENE_JSON_SCHEMA: dict = {
+    "title": "scene",
+    "type": "object",
+    "properties": {
+        "scene_id": {"type": "integer"},
+        "title": _NONEMPTY_STR,
+        "description": _NONEMPTY_STR,
+        "location_detail": _STR,
+        "mood": _NONEMPTY_STR,
+        "character_feelings": {"type": "object", "additionalProperties": _STR},
+        "bubbles": {"type": "array", "minItems": 1, "maxItems": 3, "items": BUBBLE_JSON_SCHEMA},
+        "onomatopoeia": {"type": "array", "items": _STR},
+        "direction": _NONEMPTY_STR,
+        "story_flow": _STR,
+        "sd_prompt": _STR,
+    },
+    "required": [
+        "scene_id", "title", "description", "location_detail", "mood", "character_feelings",
+        "bubbles", "onomatopoeia", "direction", "story_flow", "sd_prompt",
+    ],
+}
+
+SCENES_JSON_SCHEMA: dict = {
+    "title": "scenes",
+    "type": "array",
+    "minItems": 1,
+    "items": {k: v for k, v in SCENE_JSON_SCHEMA.items() if k != "title"},
+}